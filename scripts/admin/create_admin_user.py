@@ -26,6 +26,10 @@ import urllib.error
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import RetryPolicy
+from common.password_hash_cache import PasswordHashCache
+
 # Azure Table Storage の設定
 AZURITE_ACCOUNT_NAME = "devstoreaccount1"
 AZURITE_ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
@@ -51,6 +55,7 @@ class AzureTableStorageClient:
         self.account_name = account_name
         self.account_key = account_key
         self.endpoint = endpoint
+        self.retry = RetryPolicy()
         
     def _generate_shared_key_auth(self, method: str, url: str, content_type: str = "application/json", content_length: int = 0) -> str:
         """Shared Key認証ヘッダーを生成"""
@@ -116,29 +121,29 @@ class AzureTableStorageClient:
             json_data = None
             content_length = 0
             
-        headers = self._get_auth_headers(method, url, content_length=content_length)
-        
-        if data:
-            headers["Content-Length"] = str(content_length)
-            
-        request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
-        
-        try:
+        def send() -> Dict[str, Any]:
+            # 再試行のたびに日時と署名を作り直す
+            headers = self._get_auth_headers(method, url, content_length=content_length)
+            if data:
+                headers["Content-Length"] = str(content_length)
+            request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
             with urllib.request.urlopen(request) as response:
                 response_data = response.read().decode('utf-8')
                 if response_data:
                     return json.loads(response_data)
                 return {}
+        
+        try:
+            # 一時的なエラー（503 ServerBusy、500 タイムアウト、接続エラーなど）はバックオフして再試行する
+            return self.retry.call(send)
         except urllib.error.HTTPError as e:
             error_data = e.read().decode('utf-8')
             print(f"HTTP エラー {e.code}: {error_data}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
         except Exception as e:
             print(f"リクエストエラー: {e}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
     
     def create_table_if_not_exists(self, table_name: str) -> bool:
@@ -186,11 +191,11 @@ class AzureTableStorageClient:
             return False
 
 def hash_password(password: str) -> str:
-    """パスワードをハッシュ化（bcryptjs互換）"""
-    import bcrypt
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    """パスワードをハッシュ化（bcryptjs互換。キャッシュから再利用するのは既定のパスワードのみで、入力したパスワードはキャッシュしない）"""
+    cache = PasswordHashCache()
+    password_hash = cache.hash(password, cacheable=password == DEFAULT_ADMIN_USER['password'])
+    cache.save()
+    return password_hash
 
 def create_admin_user(non_interactive: bool = False):
     """管理者アカウントを作成"""
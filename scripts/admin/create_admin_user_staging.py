@@ -25,6 +25,9 @@ import urllib.error
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import RetryPolicy
+
 # .envファイルサポート
 try:
     from dotenv import load_dotenv
@@ -54,6 +57,7 @@ class AzureTableStorageClient:
     def __init__(self, connection_string: str):
         self.connection_string = connection_string
         self.account_name, self.account_key, self.endpoint = self._parse_connection_string()
+        self.retry = RetryPolicy()
         
     def _parse_connection_string(self) -> tuple[str, str, str]:
         """接続文字列を解析してアカウント情報を取得"""
@@ -136,29 +140,29 @@ class AzureTableStorageClient:
             json_data = None
             content_length = 0
             
-        headers = self._get_auth_headers(method, url, content_length=content_length)
-        
-        if data:
-            headers["Content-Length"] = str(content_length)
-            
-        request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
-        
-        try:
+        def send() -> Dict[str, Any]:
+            # 再試行のたびに日時と署名を作り直す
+            headers = self._get_auth_headers(method, url, content_length=content_length)
+            if data:
+                headers["Content-Length"] = str(content_length)
+            request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
             with urllib.request.urlopen(request) as response:
                 response_data = response.read().decode('utf-8')
                 if response_data:
                     return json.loads(response_data)
                 return {}
+        
+        try:
+            # 一時的なエラー（503 ServerBusy、500 タイムアウト、接続エラーなど）はバックオフして再試行する
+            return self.retry.call(send)
         except urllib.error.HTTPError as e:
             error_data = e.read().decode('utf-8')
             print(f"HTTP エラー {e.code}: {error_data}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
         except Exception as e:
             print(f"リクエストエラー: {e}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
     
     def create_table_if_not_exists(self, table_name: str) -> bool:
@@ -0,0 +1,748 @@
+#!/usr/bin/env python3
+"""
+Azure Functions ログ解析スクリプト（関数別レイテンシの内訳）
+
+エクスポートしたFunctionsのログから呼び出し（invocation id）ごとのタイムラインを再構成し、
+以下を CSV / JSON で出力します。
+
+- 関数別のレイテンシ分位点（p50 / p90 / p95 / p99 / 最大）と失敗件数
+- ログマーカー間の所要時間の内訳
+  （例: "GetGroupRankingFromSum: Starting JWT authentication" → "... JWT authentication successful"）
+- 最も遅かった呼び出しの一覧（最も時間のかかった区間つき）
+
+本番環境にプロファイラーを入れずに、既存のログからテールレイテンシの原因を調べるためのツールです。
+
+対応する入力形式:
+- Application Insights / Log Analytics の traces を JSON Lines または JSON 配列でエクスポートしたもの
+- 同じく CSV でエクスポートしたもの（customDimensions は JSON 文字列のままで可）
+- `func start` の出力やポータルのログストリームなどのテキストログ
+  （"Executing 'Functions.X' (Reason=..., Id=...)" / "Executed '...' (Succeeded, Id=..., Duration=Nms)" の行を使用）
+- .gz 圧縮ファイル、標準入力（"-"）
+
+ファイルは1行（1レコード）ずつ読み込むため、大きなログでもメモリに全件を載せません。
+呼び出しごとの状態は invocation id ごとに保持し、開始（Executing行）と終了（Executed行）の両方を読んだ時点、
+または --idle-timeout 秒以上ログが出ていない時点・入力の終端で集計に移します。
+新しい順（降順）にエクスポートしたログでも、1回の呼び出しを1件として集計します。
+
+テキストログで invocation id を含まない行は、以下の順で呼び出しに割り当てます。
+1. "関数名: メッセージ" 形式で、その関数の実行中の呼び出しが1件だけの場合はその呼び出し
+2. 実行中の呼び出しが全体で1件だけの場合はその呼び出し
+3. それ以外（同時実行中で判別できない場合）は割り当てずに件数のみ数える
+
+src/utils/metrics.ts が出力する {"type":"invocationMetrics", ...} の行があれば、
+呼び出しごとのストレージ時間・呼び出し回数・走査エンティティ数も集計に含めます。
+
+使用方法:
+    python analyze_function_logs.py exported_traces.json
+    python analyze_function_logs.py logs/*.log.gz --function GetGroupRankingFromSum --top 50
+    python analyze_function_logs.py query_data.csv --output-dir ./report --format json
+    az webapp log tail ... | python analyze_function_logs.py -
+"""
+
+import argparse
+import csv
+import gzip
+import heapq
+import io
+import json
+import os
+import re
+import sys
+from array import array
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+
+# 分位点として出力する値
+PERCENTILES = (50, 90, 95, 99)
+
+# 呼び出し開始・終了を表す疑似マーカー
+START_MARKER = '<start>'
+END_MARKER = '<end>'
+
+# マーカーとして扱うメッセージの最大長（長いメッセージは先頭のみ使用）
+MAX_MARKER_LENGTH = 120
+
+# 実行中の呼び出しのタイムアウト確認を行う間隔（レコード数）
+IDLE_CHECK_INTERVAL = 10000
+
+# 集計済みの invocation id を覚えておく件数（集計後に読んだ同じ呼び出しの行を別の呼び出しとして数えないため）
+FINALIZED_ID_LIMIT = 100000
+
+# テキストログの行頭（タイムスタンプとログレベル）
+TEXT_LINE_PATTERN = re.compile(
+    r'^\[?(?P<ts>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)\]?'
+    r'\s*(?:\[(?P<level>\w+)\]\s*)?(?P<message>.*)$'
+)
+EXECUTING_PATTERN = re.compile(
+    r"Executing '(?:Functions\.)?(?P<function>[^']+)' \(Reason='.*?', Id=(?P<id>[0-9a-fA-F-]{36})\)"
+)
+EXECUTED_PATTERN = re.compile(
+    r"Executed '(?:Functions\.)?(?P<function>[^']+)' \((?P<status>\w+), Id=(?P<id>[0-9a-fA-F-]{36})"
+    r"(?:, Duration=(?P<duration>\d+)ms)?\)"
+)
+# "関数名: メッセージ" 形式のマーカー（例: "GetGroupRankingFromSum: Starting JWT authentication"）
+FUNCTION_PREFIX_PATTERN = re.compile(r'^(?P<function>[A-Za-z][A-Za-z0-9_]*):\s')
+
+# マーカーの正規化（可変部分を置き換えて同じ種類のログを1つのマーカーにまとめる）
+NORMALIZE_RULES = (
+    (re.compile(r'https?://[^\s"\']+'), '<url>'),
+    (re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'), '<id>'),
+    (re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), '<email>'),
+    (re.compile(r'"[^"]*"'), '"<str>"'),
+    (re.compile(r"'[^']*'"), "'<str>'"),
+    (re.compile(r'\d+(?:\.\d+)?'), '<n>'),
+)
+
+# レコード（JSON/CSV）から各項目を探すときのキー候補
+TIMESTAMP_KEYS = ('timestamp', 'timestamp [UTC]', 'TimeGenerated', 'TimeGenerated [UTC]', 'time', 'Timestamp')
+MESSAGE_KEYS = ('message', 'Message', 'msg')
+INVOCATION_ID_KEYS = ('InvocationId', 'invocationId', 'prop__InvocationId', 'prop__invocationId')
+FUNCTION_NAME_KEYS = ('FunctionName', 'functionName', 'prop__functionName', 'LogLevel_FunctionName')
+OPERATION_NAME_KEYS = ('operation_Name', 'OperationName')
+OPERATION_ID_KEYS = ('operation_Id', 'OperationId')
+
+
+def parse_timestamp(value):
+    """タイムスタンプ文字列をUNIXエポックのミリ秒に変換（解析できない場合はNone）"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).strip()
+    if not text:
+        return None
+
+    # ISO 8601（Application Insights は小数部が7桁のため6桁に切り詰める）
+    iso = text.replace(' ', 'T', 1) if re.match(r'^\d{4}-\d{2}-\d{2} ', text) else text
+    iso = re.sub(r'(\.\d{6})\d+', r'\1', iso)
+    if iso.endswith('Z'):
+        iso = iso[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(iso)
+    except ValueError:
+        parsed = None
+
+    # ポータルのCSVエクスポート形式（例: "10/19/2025, 3:04:05.678 AM"）
+    if parsed is None:
+        for fmt in ('%m/%d/%Y, %I:%M:%S.%f %p', '%m/%d/%Y, %I:%M:%S %p', '%m/%d/%Y %H:%M:%S'):
+            try:
+                parsed = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+    if parsed is None:
+        return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() * 1000
+
+
+def format_timestamp(epoch_ms):
+    """UNIXエポックのミリ秒をISO 8601（UTC）に変換"""
+    if epoch_ms is None:
+        return ''
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).isoformat(timespec='milliseconds')
+
+
+def normalize_marker(message):
+    """ログメッセージからマーカー名を生成（ID・数値・文字列などの可変部分を置き換える）"""
+    marker = message.strip().splitlines()[0] if message.strip() else ''
+    for pattern, replacement in NORMALIZE_RULES:
+        marker = pattern.sub(replacement, marker)
+    return marker[:MAX_MARKER_LENGTH]
+
+
+def percentile(sorted_values, p):
+    """ソート済みの値から分位点を計算（線形補間）"""
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def round_ms(value):
+    """ミリ秒を小数2桁に丸める（Noneはそのまま）"""
+    return None if value is None else round(value, 2)
+
+
+# ---------------------------------------------------------------------------
+# 入力の読み込み（1レコードずつ返すジェネレータ）
+# ---------------------------------------------------------------------------
+
+def open_text(path):
+    """ファイル（.gz / 標準入力を含む）をテキストとして開く"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace', newline='')
+    return open(path, 'r', encoding='utf-8-sig', errors='replace', newline='')
+
+
+def iter_json_array(stream, chunk_size=1 << 20):
+    """JSON配列を要素ごとに読み込む（配列全体をメモリに載せない）"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        if not eof and len(buffer) < chunk_size:
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buffer += chunk
+            else:
+                eof = True
+
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer:
+                return
+            buffer = buffer[1:]  # 先頭の '['
+            started = True
+            continue
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']') or (eof and not buffer):
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # 要素の途中でチャンクが切れている場合は追加で読み込む
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buffer += chunk
+            else:
+                eof = True
+            continue
+        buffer = buffer[end:]
+        yield item
+
+
+def lookup(record, keys):
+    """レコードから候補キーのいずれかの値を取得"""
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def record_from_dict(item):
+    """JSON/CSVのレコードを (timestamp, invocation_id, function_name, message) に変換"""
+    if not isinstance(item, dict):
+        return None
+
+    dimensions = item.get('customDimensions') or item.get('Properties') or {}
+    if isinstance(dimensions, str):
+        try:
+            dimensions = json.loads(dimensions)
+        except ValueError:
+            dimensions = {}
+    if not isinstance(dimensions, dict):
+        dimensions = {}
+
+    message = lookup(item, MESSAGE_KEYS)
+    if message is None:
+        return None
+
+    invocation_id = lookup(dimensions, INVOCATION_ID_KEYS) or lookup(item, INVOCATION_ID_KEYS)
+    function_name = lookup(dimensions, FUNCTION_NAME_KEYS) or lookup(item, FUNCTION_NAME_KEYS)
+    if function_name is None:
+        # Category は "Function.<関数名>" または "Function.<関数名>.User"
+        category = lookup(dimensions, ('Category', 'prop__Category')) or lookup(item, ('Category',))
+        if isinstance(category, str) and category.startswith('Function.'):
+            function_name = category.split('.')[1]
+    if function_name is None:
+        function_name = lookup(item, OPERATION_NAME_KEYS)
+    if invocation_id is None:
+        # HTTPトリガーでは operation_Id が呼び出しごとに一意のため代わりに使用する
+        invocation_id = lookup(item, OPERATION_ID_KEYS)
+
+    return (
+        parse_timestamp(lookup(item, TIMESTAMP_KEYS)),
+        str(invocation_id) if invocation_id else None,
+        str(function_name) if function_name else None,
+        str(message),
+    )
+
+
+def record_from_text(line):
+    """テキストログの1行を (timestamp, invocation_id, function_name, message) に変換"""
+    match = TEXT_LINE_PATTERN.match(line.rstrip('\r\n'))
+    if not match:
+        return None
+    return parse_timestamp(match.group('ts')), None, None, match.group('message')
+
+
+def iter_records(path, stats):
+    """ファイルの形式を判別し、レコードを1件ずつ返す"""
+    with open_text(path) as stream:
+        first_line = stream.readline()
+        head = first_line.lstrip()
+
+        if head.startswith('['):
+            if TEXT_LINE_PATTERN.match(head):
+                # "[2025-10-19T...] Executing ..." 形式のテキストログ
+                lines = _chain_first(first_line, stream)
+                for line in lines:
+                    yield _count(record_from_text(line), stats)
+                return
+            json_stream = _PrefixedStream(first_line, stream)
+            for item in iter_json_array(json_stream):
+                yield _count(record_from_dict(item), stats)
+            return
+
+        if head.startswith('{'):
+            for line in _chain_first(first_line, stream):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    stats['skipped_lines'] += 1
+                    continue
+                yield _count(record_from_dict(item), stats)
+            return
+
+        if path.endswith(('.csv', '.csv.gz')) or ('message' in head.lower() and ',' in head):
+            reader = csv.DictReader(_chain_first(first_line, stream))
+            for row in reader:
+                yield _count(record_from_dict(row), stats)
+            return
+
+        for line in _chain_first(first_line, stream):
+            yield _count(record_from_text(line), stats)
+
+
+def _chain_first(first_line, stream):
+    """先読みした1行目とストリームの残りを連結"""
+    if first_line:
+        yield first_line
+    for line in stream:
+        yield line
+
+
+def _count(record, stats):
+    """読み込み件数を数える（変換できなかった行はスキップとして数える）"""
+    stats['lines'] += 1
+    if record is None:
+        stats['skipped_lines'] += 1
+    return record
+
+
+class _PrefixedStream:
+    """先読みした1行目を先頭に戻した read() 可能なストリーム"""
+
+    __slots__ = ('_prefix', '_stream')
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size):
+        if self._prefix:
+            data, self._prefix = self._prefix, ''
+            return data
+        return self._stream.read(size)
+
+
+# ---------------------------------------------------------------------------
+# 呼び出しごとのタイムライン再構成と集計
+# ---------------------------------------------------------------------------
+
+class Invocation:
+    """1回の関数呼び出しのタイムライン"""
+
+    __slots__ = ('invocation_id', 'function_name', 'started_at', 'ended_at', 'status',
+                 'host_duration_ms', 'markers', 'last_seen', 'metrics')
+
+    def __init__(self, invocation_id, function_name=None):
+        self.invocation_id = invocation_id
+        self.function_name = function_name
+        self.started_at = None
+        self.ended_at = None
+        self.status = None
+        self.host_duration_ms = None
+        self.markers = []
+        self.last_seen = None
+        self.metrics = None
+
+    def touch(self, timestamp):
+        if timestamp is not None:
+            self.last_seen = timestamp
+
+    def timeline(self):
+        """開始・終了の疑似マーカーを含めた時系列のマーカー一覧"""
+        points = sorted(self.markers, key=lambda point: point[0])
+        if self.started_at is not None:
+            points.insert(0, (self.started_at, START_MARKER))
+        if self.ended_at is not None:
+            points.append((self.ended_at, END_MARKER))
+        return points
+
+    def duration_ms(self, points):
+        """実行時間（ホストが出力した Duration を優先し、なければ最初と最後のログの差）"""
+        if self.host_duration_ms is not None:
+            return self.host_duration_ms
+        if self.metrics and self.metrics.get('wallTimeMs') is not None:
+            return float(self.metrics['wallTimeMs'])
+        if len(points) >= 2:
+            return points[-1][0] - points[0][0]
+        return None
+
+
+class LatencyAnalyzer:
+    """レコードを受け取り、呼び出しごとのタイムラインを組み立てて集計する"""
+
+    def __init__(self, function_filter=None, top=20, idle_timeout_ms=300000):
+        self.function_filter = set(function_filter or [])
+        self.top = top
+        self.idle_timeout_ms = idle_timeout_ms
+
+        self.open = {}
+        self.open_by_function = defaultdict(set)
+        self.durations = defaultdict(lambda: array('d'))
+        self.storage_times = defaultdict(lambda: array('d'))
+        self.status_counts = defaultdict(lambda: defaultdict(int))
+        self.incomplete_counts = defaultdict(int)
+        self.gaps = defaultdict(lambda: array('d'))
+        self.slowest = []
+        self.unattributed = 0
+        self.records_since_check = 0
+        self.latest_timestamp = None
+        self.finalized_ids = OrderedDict()
+        self._sequence = 0
+
+    # --- レコードの取り込み -------------------------------------------------
+
+    def add(self, record):
+        if record is None:
+            return
+        timestamp, invocation_id, function_name, message = record
+        if timestamp is not None:
+            self.latest_timestamp = timestamp
+
+        executing = EXECUTING_PATTERN.search(message)
+        executed = EXECUTED_PATTERN.search(message) if not executing else None
+
+        if executing:
+            invocation = self._get_or_create(executing.group('id'), executing.group('function'))
+            if invocation is not None:
+                invocation.started_at = timestamp
+                invocation.touch(timestamp)
+                self._finalize_if_complete(invocation)
+        elif executed:
+            invocation = self._get_or_create(executed.group('id'), executed.group('function'))
+            if invocation is not None:
+                invocation.ended_at = timestamp
+                invocation.status = executed.group('status')
+                if executed.group('duration') is not None:
+                    invocation.host_duration_ms = float(executed.group('duration'))
+                invocation.touch(timestamp)
+                self._finalize_if_complete(invocation)
+        elif message.startswith('{"type":"invocationMetrics"'):
+            self._add_metrics(message, invocation_id)
+        elif invocation_id and invocation_id in self.finalized_ids:
+            # 集計済みの呼び出しの行（開始・終了より外側に出力された行）は取り込まない
+            pass
+        else:
+            invocation = self._resolve(invocation_id, function_name, message)
+            if invocation is None:
+                self.unattributed += 1
+            elif timestamp is not None:
+                invocation.markers.append((timestamp, normalize_marker(message)))
+                invocation.touch(timestamp)
+
+        self.records_since_check += 1
+        if self.records_since_check >= IDLE_CHECK_INTERVAL:
+            self.records_since_check = 0
+            self._evict_idle()
+
+    def _get_or_create(self, invocation_id, function_name=None):
+        """invocation id の呼び出しを返す（集計済みの場合はNone）"""
+        if invocation_id in self.finalized_ids:
+            return None
+        invocation = self.open.get(invocation_id)
+        if invocation is None:
+            invocation = Invocation(invocation_id, function_name)
+            self.open[invocation_id] = invocation
+        if function_name and not invocation.function_name:
+            invocation.function_name = function_name
+        if invocation.function_name:
+            self.open_by_function[invocation.function_name].add(invocation_id)
+        return invocation
+
+    def _resolve(self, invocation_id, function_name, message):
+        """invocation id のない行を実行中の呼び出しに割り当てる"""
+        if invocation_id:
+            return self._get_or_create(invocation_id, function_name)
+
+        prefix = FUNCTION_PREFIX_PATTERN.match(message)
+        if prefix:
+            candidates = self.open_by_function.get(prefix.group('function'))
+            if candidates and len(candidates) == 1:
+                return self.open[next(iter(candidates))]
+        if len(self.open) == 1:
+            return next(iter(self.open.values()))
+        return None
+
+    def _add_metrics(self, message, invocation_id):
+        """src/utils/metrics.ts が出力する呼び出しごとの計測値を取り込む"""
+        try:
+            metrics = json.loads(message)
+        except ValueError:
+            return
+        target_id = metrics.get('invocationId') or invocation_id
+        if not target_id:
+            return
+        invocation = self._get_or_create(target_id, metrics.get('functionName'))
+        if invocation is not None:
+            invocation.metrics = metrics
+
+    def _evict_idle(self):
+        """一定時間ログが出ていない呼び出しを未完了として集計に移す（入力の昇順・降順どちらでも動作する）"""
+        if self.latest_timestamp is None:
+            return
+        idle = [
+            invocation for invocation in self.open.values()
+            if invocation.last_seen is not None
+            and abs(self.latest_timestamp - invocation.last_seen) > self.idle_timeout_ms
+        ]
+        for invocation in idle:
+            self._finalize(invocation)
+
+    def _finalize_if_complete(self, invocation):
+        """開始と終了の両方を読んだ呼び出しを集計に移す（入力の昇順・降順によらず、両端の行が揃った時点で確定する）"""
+        if invocation.started_at is not None and invocation.ended_at is not None:
+            self._finalize(invocation)
+
+    def finish(self):
+        """入力の終端で残っている呼び出しを集計に移す"""
+        for invocation in list(self.open.values()):
+            self._finalize(invocation)
+
+    # --- 集計 --------------------------------------------------------------
+
+    def _finalize(self, invocation):
+        self.open.pop(invocation.invocation_id, None)
+        self.finalized_ids[invocation.invocation_id] = None
+        if len(self.finalized_ids) > FINALIZED_ID_LIMIT:
+            self.finalized_ids.popitem(last=False)
+        if invocation.function_name:
+            ids = self.open_by_function.get(invocation.function_name)
+            if ids is not None:
+                ids.discard(invocation.invocation_id)
+                if not ids:
+                    del self.open_by_function[invocation.function_name]
+
+        function_name = invocation.function_name or '(unknown)'
+        if self.function_filter and function_name not in self.function_filter:
+            return
+
+        points = invocation.timeline()
+        duration = invocation.duration_ms(points)
+        if invocation.status is None:
+            self.incomplete_counts[function_name] += 1
+        if duration is None:
+            return
+
+        status = invocation.status or 'Incomplete'
+        self.durations[function_name].append(duration)
+        self.status_counts[function_name][status] += 1
+
+        storage_ms = None
+        if invocation.metrics and invocation.metrics.get('storageTimeMs') is not None:
+            storage_ms = float(invocation.metrics['storageTimeMs'])
+            self.storage_times[function_name].append(storage_ms)
+
+        slowest_step = None
+        for (previous_ts, previous_marker), (current_ts, current_marker) in zip(points, points[1:]):
+            gap = current_ts - previous_ts
+            self.gaps[(function_name, previous_marker, current_marker)].append(gap)
+            if slowest_step is None or gap > slowest_step[2]:
+                slowest_step = (previous_marker, current_marker, gap)
+
+        entry = {
+            'invocationId': invocation.invocation_id,
+            'functionName': function_name,
+            'startedAt': format_timestamp(points[0][0] if points else invocation.started_at),
+            'durationMs': round_ms(duration),
+            'status': status,
+            'storageTimeMs': round_ms(storage_ms),
+            'storageCalls': invocation.metrics.get('storageCalls') if invocation.metrics else None,
+            'entitiesScanned': invocation.metrics.get('entitiesScanned') if invocation.metrics else None,
+            'slowestStepFrom': slowest_step[0] if slowest_step else None,
+            'slowestStepTo': slowest_step[1] if slowest_step else None,
+            'slowestStepMs': round_ms(slowest_step[2]) if slowest_step else None,
+            'timeline': [
+                {'offsetMs': round_ms(ts - points[0][0]), 'marker': marker} for ts, marker in points
+            ],
+        }
+        # 上位N件のみ保持する（ヒープの先頭が最も速い呼び出し）
+        self._sequence += 1
+        item = (duration, self._sequence, entry)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def function_summary(self):
+        """関数別のレイテンシ分位点"""
+        rows = []
+        for function_name, durations in self.durations.items():
+            values = sorted(durations)
+            storage = self.storage_times.get(function_name)
+            statuses = self.status_counts[function_name]
+            row = {
+                'functionName': function_name,
+                'count': len(values),
+                'succeeded': statuses.get('Succeeded', 0),
+                'failed': statuses.get('Failed', 0),
+                'incomplete': self.incomplete_counts.get(function_name, 0),
+                'meanMs': round_ms(sum(values) / len(values)),
+            }
+            for p in PERCENTILES:
+                row[f'p{p}Ms'] = round_ms(percentile(values, p))
+            row['maxMs'] = round_ms(values[-1])
+            row['meanStorageMs'] = round_ms(sum(storage) / len(storage)) if storage else None
+            rows.append(row)
+        rows.sort(key=lambda row: row['p95Ms'] or 0, reverse=True)
+        return rows
+
+    def gap_summary(self, min_count=1):
+        """関数別・マーカー区間別の所要時間"""
+        rows = []
+        for (function_name, from_marker, to_marker), gaps in self.gaps.items():
+            if len(gaps) < min_count:
+                continue
+            values = sorted(gaps)
+            rows.append({
+                'functionName': function_name,
+                'fromMarker': from_marker,
+                'toMarker': to_marker,
+                'count': len(values),
+                'meanMs': round_ms(sum(values) / len(values)),
+                'p50Ms': round_ms(percentile(values, 50)),
+                'p95Ms': round_ms(percentile(values, 95)),
+                'p99Ms': round_ms(percentile(values, 99)),
+                'maxMs': round_ms(values[-1]),
+                'totalMs': round_ms(sum(values)),
+            })
+        # 合計時間の大きい区間（全体のレイテンシへの寄与が大きい区間）を先頭にする
+        rows.sort(key=lambda row: (row['functionName'], -row['totalMs']))
+        return rows
+
+    def slowest_invocations(self):
+        """最も遅かった呼び出し（遅い順）"""
+        return [entry for _, _, entry in sorted(self.slowest, key=lambda item: item[0], reverse=True)]
+
+
+# ---------------------------------------------------------------------------
+# 出力
+# ---------------------------------------------------------------------------
+
+def write_csv(path, rows, fieldnames):
+    """CSVファイルを出力"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✅ {path} ({len(rows)}行)")
+
+
+def write_reports(analyzer, stats, output_dir, output_format, min_count):
+    """集計結果をCSV / JSONで出力"""
+    os.makedirs(output_dir, exist_ok=True)
+    functions = analyzer.function_summary()
+    gaps = analyzer.gap_summary(min_count)
+    slowest = analyzer.slowest_invocations()
+
+    if output_format in ('csv', 'both'):
+        write_csv(os.path.join(output_dir, 'function_latency.csv'), functions,
+                  list(functions[0].keys()) if functions else ['functionName'])
+        write_csv(os.path.join(output_dir, 'marker_gaps.csv'), gaps,
+                  ['functionName', 'fromMarker', 'toMarker', 'count', 'meanMs',
+                   'p50Ms', 'p95Ms', 'p99Ms', 'maxMs', 'totalMs'])
+        write_csv(os.path.join(output_dir, 'slowest_invocations.csv'), slowest,
+                  ['invocationId', 'functionName', 'startedAt', 'durationMs', 'status',
+                   'storageTimeMs', 'storageCalls', 'entitiesScanned',
+                   'slowestStepFrom', 'slowestStepTo', 'slowestStepMs'])
+
+    if output_format in ('json', 'both'):
+        path = os.path.join(output_dir, 'latency_report.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generatedAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'input': {
+                    'records': stats['lines'],
+                    'skippedRecords': stats['skipped_lines'],
+                    'unattributedRecords': analyzer.unattributed,
+                },
+                'functions': functions,
+                'markerGaps': gaps,
+                'slowestInvocations': slowest,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"✅ {path}")
+
+    return functions
+
+
+def print_summary(functions):
+    """関数別のレイテンシを標準出力に表示"""
+    if not functions:
+        print("⚠️ 集計できる呼び出しがありませんでした（入力形式と invocation id を確認してください）")
+        return
+    name_width = max(len('関数名'), max(len(row['functionName']) for row in functions))
+    print()
+    print(f"{'関数名'.ljust(name_width)}  {'件数':>7}  {'失敗':>5}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'最大':>9}")
+    for row in functions:
+        print(f"{row['functionName'].ljust(name_width)}  {row['count']:>7}  {row['failed']:>5}  "
+              f"{row['p50Ms']:>9.1f}  {row['p95Ms']:>9.1f}  {row['p99Ms']:>9.1f}  {row['maxMs']:>9.1f}")
+    print("（単位: ミリ秒）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Azure Functionsのログから関数別のレイテンシ内訳を集計します')
+    parser.add_argument('inputs', nargs='+', help='ログファイル（JSON / JSON Lines / CSV / テキスト、.gz可、"-"で標準入力）')
+    parser.add_argument('--output-dir', default='log_analysis', help='出力先ディレクトリ')
+    parser.add_argument('--format', choices=['csv', 'json', 'both'], default='both', help='出力形式')
+    parser.add_argument('--function', action='append', help='集計対象の関数名（複数指定可）')
+    parser.add_argument('--top', type=int, default=20, help='出力する遅い呼び出しの件数')
+    parser.add_argument('--min-count', type=int, default=1, help='マーカー区間を出力する最小件数')
+    parser.add_argument('--idle-timeout', type=float, default=300,
+                        help='この秒数以上ログが出ていない呼び出しを未完了として集計する')
+    args = parser.parse_args()
+
+    analyzer = LatencyAnalyzer(args.function, args.top, args.idle_timeout * 1000)
+    stats = defaultdict(int)
+
+    for path in args.inputs:
+        if path != '-' and not os.path.exists(path):
+            print(f"❌ エラー: ファイルが見つかりません: {path}")
+            sys.exit(1)
+        print(f"🚀 読み込み中: {path}")
+        try:
+            for record in iter_records(path, stats):
+                analyzer.add(record)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"❌ エラー: {path} の読み込みに失敗しました: {e}")
+            sys.exit(1)
+    analyzer.finish()
+
+    print(f"読み込み: {stats['lines']}件（スキップ: {stats['skipped_lines']}件、"
+          f"呼び出しを特定できない行: {analyzer.unattributed}件）")
+    functions = write_reports(analyzer, stats, args.output_dir, args.format, args.min_count)
+    print_summary(functions)
+
+
+if __name__ == '__main__':
+    main()
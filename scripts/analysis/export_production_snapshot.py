@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+ProductionTable 列指向スナップショット作成スクリプト
+
+ProductionTable を1回走査し、分析用の列指向スナップショット（.npy ファイルの集まり）を作成します。
+集計は production_snapshot.py がスナップショットを mmap して行うため、分析のたびに本番のストレージを読みません。
+
+スナップショットの形式（出力ディレクトリ）:
+- CURRENT: 現在の版のディレクトリ名（作成のたびに新しい版のディレクトリを書き込み、CURRENT を os.replace で置き換える）
+- <版>/meta.json: 件数・作成日時・列の定義・辞書（コード → 値）・グループ名
+- <版>/date.npy: 生産日（1970-01-01 からの日数、int32。日付がない・解釈できない記録は -2147483648）
+- <版>/groupId.npy / materialType.npy / extinguishingMethod.npy: 辞書のコード（値の種類数に応じて int8 / int16 / int32、値がない記録は -1）
+- <版>/materialAmount.npy / charcoalProduced.npy / charcoalVolume.npy / co2Reduction.npy: float64（値がない記録は 0）
+
+- 必要な列のみを select で取得し、値は array に追記するため、走査中もエンティティは保持しません
+- 移行期間中に旧パーティション（Production）と新しいパーティションの両方にある記録は productionId で重複を除きます
+- 版の切り替えは CURRENT の置き換え1回で行うため、作成中・切り替え中に読み込んでも壊れた状態や版の混在は見えません
+- 読み込み中の処理が前の版を参照している可能性があるため、直前の版は KEEP_VERSIONS の範囲で残します
+
+使用方法:
+1. Azure Storage接続文字列を設定
+   export AZURE_STORAGE_CONNECTION_STRING='...'
+2. スナップショットの作成
+   python export_production_snapshot.py --output ./snapshots/production
+3. 集計（production_snapshot.py）
+   python production_snapshot.py ./snapshots/production yearly 2025
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from array import array
+from datetime import date, datetime, timezone
+
+import numpy as np
+from azure.data.tables import TableClient
+
+# Azure Storage接続文字列
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+PRODUCTION_TABLE_NAME = 'ProductionTable'
+GROUP_TABLE_NAME = 'GroupsTable'
+
+SNAPSHOT_FORMAT = 'production-snapshot'
+SNAPSHOT_VERSION = 1
+
+# 現在の版のディレクトリ名を書いたファイル
+CURRENT_FILE = 'CURRENT'
+# 残す版の数（現在の版を含む）
+KEEP_VERSIONS = 2
+_VERSION_DIR_PATTERN = re.compile(r'^v\d{8}T\d{12}Z-\d+$')
+# CURRENT のない旧形式（出力ディレクトリ直下に書き込んでいた）のファイル
+_LEGACY_FILE_PATTERN = re.compile(r'^(meta\.json|.+\.npy)$')
+
+# 日付がない・解釈できない記録の値
+MISSING_DATE = -2 ** 31
+# 辞書にない（値がない）記録のコード
+MISSING_CODE = -1
+
+NUMERIC_COLUMNS = ['materialAmount', 'charcoalProduced', 'charcoalVolume', 'co2Reduction']
+CATEGORY_COLUMNS = ['groupId', 'materialType', 'extinguishingMethod']
+
+# スナップショットに必要な列のみ取得する
+SELECT = ['PartitionKey', 'RowKey', 'productionId', 'date'] + CATEGORY_COLUMNS + NUMERIC_COLUMNS
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_DATE_PATTERN = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+
+
+def to_epoch_day(value):
+    """生産日を 1970-01-01 からの日数に変換（解釈できない場合は MISSING_DATE）"""
+    text = str(value or '')
+    match = _DATE_PATTERN.match(text)
+    try:
+        if match:
+            parsed = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        else:
+            parsed = datetime.fromisoformat(text.replace('Z', '+00:00')).date()
+    except ValueError:
+        return MISSING_DATE
+    return parsed.toordinal() - _EPOCH_ORDINAL
+
+
+def to_number(value):
+    """数値列の値を float に変換（値がない・解釈できない場合は0、src/utils/productionColumns.ts の toNumber と同じ）"""
+    if value is None or value == '':
+        return 0.0
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return parsed if parsed == parsed and parsed not in (float('inf'), float('-inf')) else 0.0
+
+
+class DictionaryColumn:
+    """値を出現順のコードに変換して保持する列"""
+
+    __slots__ = ('codes', 'values', 'index')
+
+    def __init__(self):
+        self.codes = array('i')
+        self.values = []
+        self.index = {}
+
+    def append(self, value):
+        if value is None or value == '':
+            self.codes.append(MISSING_CODE)
+            return
+        value = str(value)
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        self.codes.append(code)
+
+    def to_numpy(self):
+        """値の種類数に収まる最小の整数型に変換"""
+        size = len(self.values)
+        dtype = np.int8 if size <= np.iinfo(np.int8).max else np.int16 if size <= np.iinfo(np.int16).max else np.int32
+        return np.frombuffer(self.codes, dtype=np.intc).astype(dtype)
+
+
+class SnapshotBuilder:
+    """エンティティを列ごとの配列に追記する"""
+
+    def __init__(self):
+        self.dates = array('i')
+        self.numerics = {name: array('d') for name in NUMERIC_COLUMNS}
+        self.categories = {name: DictionaryColumn() for name in CATEGORY_COLUMNS}
+        self.seen = set()
+        self.rows = 0
+        self.duplicates = 0
+        self.invalid_dates = 0
+
+    def add(self, entity):
+        """エンティティを追記する（重複の場合はFalse）"""
+        # 移行期間中は同じ記録が旧パーティションと新しいパーティションにあるため、productionId で重複を除く
+        production_id = entity.get('productionId') or entity.get('RowKey')
+        if production_id in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen.add(production_id)
+
+        epoch_day = to_epoch_day(entity.get('date'))
+        if epoch_day == MISSING_DATE:
+            self.invalid_dates += 1
+        self.dates.append(epoch_day)
+        for name, values in self.numerics.items():
+            values.append(to_number(entity.get(name)))
+        for name, column in self.categories.items():
+            column.append(entity.get(name))
+        self.rows += 1
+        return True
+
+    def write(self, output_dir, group_names):
+        """output_dir に新しい版のディレクトリを書き込み、CURRENT を置き換えて切り替える（版のディレクトリを返す）"""
+        output_dir = os.path.abspath(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        version = f"v{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-{os.getpid()}"
+        temp_dir = os.path.join(output_dir, version)
+        os.makedirs(temp_dir)
+
+        columns = {}
+
+        def save(name, data, encoding):
+            file_name = f"{name}.npy"
+            np.save(os.path.join(temp_dir, file_name), data)
+            columns[name] = {'file': file_name, 'dtype': str(data.dtype), 'encoding': encoding}
+
+        save('date', np.frombuffer(self.dates, dtype=np.intc).astype(np.int32), 'epochDay')
+        for name, column in self.categories.items():
+            save(name, column.to_numpy(), 'dictionary')
+        for name, values in self.numerics.items():
+            save(name, np.frombuffer(values, dtype=np.float64), 'float')
+
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'source': PRODUCTION_TABLE_NAME,
+            'rows': self.rows,
+            'missingDate': MISSING_DATE,
+            'missingCode': MISSING_CODE,
+            'columns': columns,
+            'dictionaries': {name: column.values for name, column in self.categories.items()},
+            'groupNames': group_names,
+        }
+        with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # 同じディレクトリ内の一時ファイルを os.replace で置き換えるため、読み込み側には前の版か新しい版のどちらかが見える
+        pointer_temp = os.path.join(output_dir, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(pointer_temp, 'w', encoding='utf-8') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_temp, os.path.join(output_dir, CURRENT_FILE))
+
+        remove_old_versions(output_dir, version)
+        return temp_dir
+
+
+def remove_old_versions(output_dir, current):
+    """KEEP_VERSIONS より古い版と、旧形式で直下に書き込んだファイルを削除"""
+    versions = sorted(name for name in os.listdir(output_dir)
+                      if _VERSION_DIR_PATTERN.match(name) and name != current
+                      and os.path.isdir(os.path.join(output_dir, name)))
+    for name in versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+    for name in os.listdir(output_dir):
+        if _LEGACY_FILE_PATTERN.match(name) and os.path.isfile(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+
+
+def load_group_names():
+    """GroupsTable からグループ名を取得（groupId → name）"""
+    client = TableClient.from_connection_string(CONNECTION_STRING, GROUP_TABLE_NAME)
+    return {entity['RowKey']: entity.get('name') for entity in client.list_entities(select=['RowKey', 'name'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProductionTableの列指向スナップショットを作成します')
+    parser.add_argument('--output', default='./snapshots/production', help='出力ディレクトリ（既存のスナップショットは置き換える）')
+    args = parser.parse_args()
+
+    if not CONNECTION_STRING:
+        print("❌ エラー: AZURE_STORAGE_CONNECTION_STRING 環境変数が設定されていません")
+        sys.exit(1)
+
+    started = datetime.now()
+    print(f"🚀 スナップショット作成開始: {PRODUCTION_TABLE_NAME} → {args.output}")
+
+    group_names = load_group_names()
+    builder = SnapshotBuilder()
+    client = TableClient.from_connection_string(CONNECTION_STRING, PRODUCTION_TABLE_NAME)
+    for entity in client.list_entities(select=SELECT, results_per_page=1000):
+        if builder.add(entity) and builder.rows % 10000 == 0:
+            print(f"  ... {builder.rows}件読み込み")
+
+    version_dir = builder.write(args.output, group_names)
+
+    size = sum(os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir))
+    elapsed = (datetime.now() - started).total_seconds()
+    print("=" * 50)
+    print(f"記録: {builder.rows}件（重複除外: {builder.duplicates}件 / 日付なし: {builder.invalid_dates}件）")
+    print(f"グループ: {len(builder.categories['groupId'].values)}件 / 原料種別: {len(builder.categories['materialType'].values)}件")
+    print(f"サイズ: {size / 1024:.1f}KB")
+    print(f"所要時間: {elapsed:.1f}秒")
+    print(f"版: {os.path.basename(version_dir)}")
+    print("✅ スナップショットを作成しました")
+
+
+if __name__ == '__main__':
+    main()
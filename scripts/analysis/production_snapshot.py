@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+ProductionTable 列指向スナップショットの集計
+
+export_production_snapshot.py で作成したスナップショットを mmap で読み込み、
+年次レポート・消化方法別割合・グループランキングを NumPy で集計します。
+列は必要になった時点でページ単位に読み込まれるため、集計に使わない列はメモリに載りません。
+
+集計の規則はAPIと同じです。
+- yearly: 月別の合計（GetYearlyReport。原料量は materialAmount の合計）
+- ratio: water / oxygen の炭生産量と割合（GetExtinguishingMethodRatio）
+- ranking: グループ別の合計の降順（--year で年を指定、--metric で集計する列を指定）
+
+使用方法:
+    python production_snapshot.py ./snapshots/production yearly 2025
+    python production_snapshot.py ./snapshots/production yearly 2025 --group-id <groupId>
+    python production_snapshot.py ./snapshots/production ratio 2025
+    python production_snapshot.py ./snapshots/production ranking --year 2025 --metric charcoalProduced --top 10
+
+Pythonから:
+    snapshot = ProductionSnapshot('./snapshots/production')
+    snapshot.yearly_report(2025)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 'production-snapshot'
+SUPPORTED_VERSIONS = {1}
+CURRENT_FILE = 'CURRENT'
+
+NUMERIC_COLUMNS = ('materialAmount', 'charcoalProduced', 'charcoalVolume', 'co2Reduction')
+EXTINGUISHING_METHODS = ('water', 'oxygen')
+
+
+def resolve_snapshot_dir(path):
+    """CURRENT が指す版のディレクトリを返す（CURRENT のない旧形式は path をそのまま返す）"""
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(path, version)
+
+
+class ProductionSnapshot:
+    """mmap で読み込んだスナップショット"""
+
+    def __init__(self, path):
+        # 作成中に CURRENT が切り替わっても列の読み込みが別の版に混ざらないよう、版のディレクトリを最初に1回だけ解決する
+        self.path = resolve_snapshot_dir(path)
+        with open(os.path.join(self.path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != SNAPSHOT_FORMAT or self.meta.get('version') not in SUPPORTED_VERSIONS:
+            raise ValueError(f"対応していないスナップショットです: {path}")
+
+        self.rows = self.meta['rows']
+        self.dictionaries = self.meta['dictionaries']
+        self.group_names = self.meta.get('groupNames') or {}
+        self._columns = {}
+        self._years = None
+        self._months = None
+
+    def column(self, name):
+        """列を mmap で読み込む（初回のみ）"""
+        data = self._columns.get(name)
+        if data is None:
+            info = self.meta['columns'][name]
+            data = np.load(os.path.join(self.path, info['file']), mmap_mode='r')
+            self._columns[name] = data
+        return data
+
+    def code_of(self, column, value):
+        """辞書列の値のコードを返す（スナップショットにない値の場合はNone）"""
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return None
+
+    def _load_periods(self):
+        """生産日から年・月（1〜12）の列を計算する（日付がない記録は年・月とも0）"""
+        if self._years is not None:
+            return
+        dates = self.column('date')
+        valid = dates != self.meta['missingDate']
+        days = np.where(valid, dates, 0).astype('datetime64[D]')
+        months_since_epoch = days.astype('datetime64[M]').astype(np.int64)
+        self._years = np.where(valid, months_since_epoch // 12 + 1970, 0).astype(np.int32)
+        self._months = np.where(valid, months_since_epoch % 12 + 1, 0).astype(np.int8)
+
+    def years(self):
+        self._load_periods()
+        return self._years
+
+    def months(self):
+        self._load_periods()
+        return self._months
+
+    def mask(self, year=None, group_id=None):
+        """年・グループで絞り込む条件（該当する行が True）"""
+        mask = np.ones(self.rows, dtype=bool)
+        if year is not None:
+            mask &= self.years() == year
+        if group_id is not None:
+            code = self.code_of('groupId', group_id)
+            if code is None:
+                return np.zeros(self.rows, dtype=bool)
+            mask &= self.column('groupId') == code
+        return mask
+
+    def yearly_report(self, year, group_id=None):
+        """年次レポート（月別の合計）"""
+        mask = self.mask(year, group_id)
+        month_index = self.months()[mask].astype(np.intp) - 1
+        totals = {
+            name: np.bincount(month_index, weights=self.column(name)[mask], minlength=12)
+            for name in NUMERIC_COLUMNS
+        }
+        return [
+            {
+                'month': month + 1,
+                'materialAmount': float(totals['materialAmount'][month]),
+                'charcoalProduced': float(totals['charcoalProduced'][month]),
+                'charcoalVolume': float(totals['charcoalVolume'][month]),
+                'totalCO2Reduction': float(totals['co2Reduction'][month]),
+            }
+            for month in range(12)
+        ]
+
+    def extinguishing_method_ratio(self, year):
+        """消化方法別割合（炭生産量が正の記録のみ、water / oxygen 以外は除外）"""
+        mask = self.mask(year)
+        charcoal = self.column('charcoalProduced')
+        methods = self.column('extinguishingMethod')
+        mask &= charcoal > 0
+
+        totals = {}
+        for method in EXTINGUISHING_METHODS:
+            code = self.code_of('extinguishingMethod', method)
+            totals[method] = float(charcoal[mask & (methods == code)].sum()) if code is not None else 0.0
+        total = sum(totals.values())
+
+        ratios = {method: (totals[method] / total) * 100 if total > 0 else 0 for method in EXTINGUISHING_METHODS}
+        return {
+            'year': year,
+            'totalCharcoalProduced': total,
+            'extinguishingMethodTotals': totals,
+            'ratios': ratios,
+            'summary': {
+                method: {'amount': totals[method], 'percentage': round(ratios[method] * 100) / 100}
+                for method in EXTINGUISHING_METHODS
+            },
+        }
+
+    def group_ranking(self, year=None, metric='co2Reduction', top=None):
+        """グループ別の合計の降順（グループのない記録は除外）"""
+        if metric not in NUMERIC_COLUMNS:
+            raise ValueError(f"集計できない列です: {metric}")
+        groups = self.column('groupId')
+        mask = self.mask(year) & (groups >= 0)
+        group_ids = self.dictionaries['groupId']
+        totals = np.bincount(groups[mask].astype(np.intp), weights=self.column(metric)[mask], minlength=len(group_ids))
+        counts = np.bincount(groups[mask].astype(np.intp), minlength=len(group_ids))
+
+        order = np.argsort(-totals, kind='stable')
+        ranking = []
+        for code in order:
+            if counts[code] == 0:
+                continue
+            group_id = group_ids[code]
+            ranking.append({
+                'rank': len(ranking) + 1,
+                'groupId': group_id,
+                'groupName': self.group_names.get(group_id) or '不明なグループ',
+                metric: float(totals[code]),
+                'productions': int(counts[code]),
+            })
+            if top is not None and len(ranking) >= top:
+                break
+        return ranking
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProductionTableのスナップショットを集計します')
+    parser.add_argument('snapshot', help='export_production_snapshot.py の出力ディレクトリ')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+
+    yearly = subparsers.add_parser('yearly', help='年次レポート（月別の合計）')
+    yearly.add_argument('year', type=int)
+    yearly.add_argument('--group-id', help='グループで絞り込む')
+
+    ratio = subparsers.add_parser('ratio', help='消化方法別割合')
+    ratio.add_argument('year', type=int)
+
+    ranking = subparsers.add_parser('ranking', help='グループランキング')
+    ranking.add_argument('--year', type=int, help='対象年（省略時は全期間）')
+    ranking.add_argument('--metric', default='co2Reduction', choices=NUMERIC_COLUMNS, help='集計する列')
+    ranking.add_argument('--top', type=int, help='上位N件のみ表示')
+
+    args = parser.parse_args()
+
+    snapshot = ProductionSnapshot(args.snapshot)
+    started = time.perf_counter()
+    if args.query == 'yearly':
+        result = snapshot.yearly_report(args.year, args.group_id)
+    elif args.query == 'ratio':
+        result = snapshot.extinguishing_method_ratio(args.year)
+    else:
+        result = snapshot.group_ranking(args.year, args.metric, args.top)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    # 結果をパイプで渡せるよう、所要時間は標準エラー出力に表示する
+    print(f"⏱️ {snapshot.rows}件を{elapsed_ms:.1f}msで集計（作成日時: {snapshot.meta['createdAt']}）", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+ストレージアクセス記録プロキシ（クエリパターンの監査・レイテンシ注入）
+
+Functionsホストと Azurite の間に置くリバースプロキシです（標準ライブラリのみで動作）。
+ローカル環境で、テーブル全体の走査などのアクセスパターンの劣化を本番の負荷を待たずに検出するためのツールです。
+
+- Table / Blob へのすべてのリクエストを記録（テーブル名・$filter・$select・ページ番号・返したエンティティ数・Blob名・バイト数）
+- Table のクエリは条件で分類: point（PartitionKey と RowKey の一致）/ partition（PartitionKey の一致）/
+  range（PartitionKey の範囲）/ scan（PartitionKey の条件なし = テーブル全体の走査）
+- --api-port を指定すると、APIへのリクエストも中継し、ストレージへのリクエストを呼び出し元のエンドポイントに割り当てて集計
+  （実行中のAPIリクエストが1件だけの場合に割り当てる。0件は "(background)"、複数は "(concurrent)" として集計）
+- --latency / --latency-profile で、操作の種類ごとにレイテンシの分布を指定して注入
+  （クエリはページごとに遅延が加わるため、走査するページ数が多いほど応答が遅くなる = 本番と同じ増幅が起きる）
+- エンドポイント別の集計（1呼び出しあたりのリクエスト数・ページ数・エンティティ数・走査回数）をJSONで出力し、
+  check コマンドで予算（budget）と比較できる
+
+構成（Azurite の既定ポートの場合）:
+    Functionsホスト ──▶ プロキシ :20000 (Blob) / :20002 (Table) ──▶ Azurite :10000 / :10002
+    テスト ──▶ プロキシ :7072 (API) ──▶ Functionsホスト :7071
+
+    Functionsホストの AzureWebJobsStorage を起動時に表示される接続文字列に変更してください
+    （認証の署名にホスト名・ポートは含まれないため、Azurite の既定のアカウントキーのまま使えます）
+
+使用方法:
+    python storage_proxy.py --api-port 7072 --latency-profile azure --report storage_report.json --log requests.jsonl
+    python storage_proxy.py --latency table.query=lognormal:30,0.6 --latency blob.read=fixed:15
+
+    # テスト中の集計の取得・リセット（どのポートでも可）
+    curl http://127.0.0.1:7072/__proxy/report
+    curl -X POST http://127.0.0.1:7072/__proxy/reset
+
+    # 予算との比較（超過があれば終了コード1）
+    python storage_proxy.py check storage_report.json storage_budget.json
+
+予算ファイルの例（"*" はその他のエンドポイントの既定値）:
+    {
+      "GET /api/group-rankings": {"maxTableScansPerCall": 0, "maxEntitiesPerCall": 500},
+      "*": {"maxStorageRequestsPerCall": 20, "maxPagesPerCall": 10}
+    }
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACCOUNT_NAME = 'devstoreaccount1'
+ACCOUNT_KEY = 'Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=='
+
+CONTROL_PREFIX = '/__proxy/'
+
+# 中継しないヘッダー（hop-by-hop）
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'te', 'trailer', 'upgrade'}
+
+# 予算で指定できる項目（1呼び出しあたりの値）
+BUDGET_FIELDS = {
+    'maxStorageRequestsPerCall': 'storageRequests',
+    'maxPagesPerCall': 'tablePages',
+    'maxEntitiesPerCall': 'entities',
+    'maxTableScansPerCall': 'tableScans',
+    'maxBlobBytesPerCall': 'blobBytes',
+}
+
+# 実際のストレージ（同一リージョン）に近いレイテンシの分布（ミリ秒）
+LATENCY_PROFILES = {
+    'azure': {
+        'table.point': 'lognormal:8,0.4',
+        'table.query': 'lognormal:25,0.5',
+        'table.write': 'lognormal:12,0.4',
+        'table.batch': 'lognormal:30,0.5',
+        'blob.read': 'lognormal:15,0.5',
+        'blob.write': 'lognormal:25,0.5',
+        '*': 'lognormal:10,0.4',
+    },
+}
+
+# ルートのIDらしき部分（uuid・数値）を {param} に置き換える
+_ID_SEGMENT = re.compile(r'^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$')
+# Table のリソースパス（/アカウント/テーブル名(キー)）
+_TABLE_RESOURCE = re.compile(r'^/[^/]+/([^/(?]+)(\((.*)\))?$')
+
+
+def parse_distribution(spec):
+    """レイテンシの分布の指定（fixed:MS / uniform:MIN,MAX / normal:MEAN,SD / lognormal:MEDIAN,SIGMA）を関数に変換"""
+    name, _, params = spec.partition(':')
+    try:
+        values = [float(value) for value in params.split(',')] if params else []
+    except ValueError:
+        raise ValueError(f"レイテンシの指定が不正です: {spec}")
+
+    if name == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if name == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if name == 'normal' and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if name == 'lognormal' and len(values) == 2 and values[0] > 0:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"レイテンシの指定が不正です: {spec}")
+
+
+class LatencyInjector:
+    """操作の種類ごとのレイテンシの分布（"*" は指定のない操作の既定値）"""
+
+    def __init__(self, specs):
+        self.specs = dict(specs)
+        self.distributions = {operation: parse_distribution(spec) for operation, spec in self.specs.items()}
+
+    def delay_ms(self, operation):
+        distribution = self.distributions.get(operation) or self.distributions.get('*')
+        return distribution() if distribution else 0.0
+
+
+def normalize_route(method, path):
+    """APIのパスをエンドポイント名に変換（例: GET /api/production/<uuid> → GET /api/production/{param}）"""
+    segments = [('{param}' if _ID_SEGMENT.match(segment) else segment) for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+
+def classify_filter(filter_text, key_text):
+    """Table のクエリの種類（point / partition / range / scan）"""
+    if key_text:
+        return 'point'
+    if not filter_text:
+        return 'scan'
+    if re.search(r"PartitionKey\s+eq\s+'", filter_text):
+        return 'point' if re.search(r"RowKey\s+eq\s+'", filter_text) and ' or ' not in filter_text else 'partition'
+    if re.search(r'PartitionKey\s+(ge|gt|le|lt)\s+', filter_text):
+        return 'range'
+    return 'scan'
+
+
+def describe_table_request(method, path, query, request_body, response_body, status):
+    """Table のリクエストを記録用の辞書に変換"""
+    match = _TABLE_RESOURCE.match(urllib.parse.unquote(path))
+    table = match.group(1) if match else path
+    key_text = match.group(3) if match else None
+    record = {'service': 'table', 'table': table}
+
+    if table == '$batch':
+        record['operation'] = 'table.batch'
+        record['batchOperations'] = len(re.findall(rb'^(POST|PUT|PATCH|MERGE|DELETE|GET) ', request_body or b'', re.M))
+        return record
+    if table.startswith('Tables'):
+        record['operation'] = 'table.admin'
+        return record
+
+    if method in ('GET', 'HEAD'):
+        filter_text = query.get('$filter', [None])[0]
+        kind = classify_filter(filter_text, key_text)
+        record['operation'] = 'table.point' if kind == 'point' and key_text else 'table.query'
+        record['kind'] = kind
+        record['filter'] = filter_text if filter_text else (f"({key_text})" if key_text else None)
+        record['select'] = query.get('$select', [None])[0]
+        record['top'] = query.get('$top', [None])[0]
+        # 継続トークンがなければ新しいクエリの1ページ目
+        record['continuation'] = 'NextPartitionKey' in query
+        record['entities'] = count_entities(response_body, status)
+    else:
+        record['operation'] = 'table.write'
+    return record
+
+
+def count_entities(body, status):
+    """クエリのレスポンスに含まれるエンティティ数"""
+    if status != 200 or not body:
+        return 0
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 0
+    if isinstance(payload, dict) and isinstance(payload.get('value'), list):
+        return len(payload['value'])
+    return 1
+
+
+def describe_blob_request(method, path, query, request_body, response_body, status):
+    """Blob のリクエストを記録用の辞書に変換"""
+    parts = urllib.parse.unquote(path).lstrip('/').split('/', 2)
+    record = {
+        'service': 'blob',
+        'container': parts[1] if len(parts) > 1 else None,
+        'blob': parts[2] if len(parts) > 2 else None,
+        'comp': query.get('comp', [None])[0],
+    }
+    if method in ('GET', 'HEAD'):
+        record['operation'] = 'blob.read'
+        record['bytes'] = len(response_body or b'')
+    else:
+        record['operation'] = 'blob.write'
+        record['bytes'] = len(request_body or b'')
+    return record
+
+
+class EndpointStats:
+    """エンドポイント別の集計"""
+
+    __slots__ = ('calls', 'api_ms', 'storage_requests', 'table_pages', 'entities', 'table_scans',
+                 'blob_bytes', 'storage_ms', 'injected_ms', 'queries', 'blobs')
+
+    def __init__(self):
+        self.calls = 0
+        self.api_ms = 0.0
+        self.storage_requests = 0
+        self.table_pages = 0
+        self.entities = 0
+        self.table_scans = 0
+        self.blob_bytes = 0
+        self.storage_ms = 0.0
+        self.injected_ms = 0.0
+        # (テーブル, 種類, フィルタ) -> [クエリ数, ページ数, エンティティ数]
+        self.queries = defaultdict(lambda: [0, 0, 0])
+        # (操作, コンテナ) -> [リクエスト数, バイト数]
+        self.blobs = defaultdict(lambda: [0, 0])
+
+    def add(self, record):
+        self.storage_requests += 1
+        self.storage_ms += record['durationMs']
+        self.injected_ms += record['injectedMs']
+        if record['service'] == 'table' and record['operation'] in ('table.query', 'table.point'):
+            self.table_pages += 1
+            self.entities += record['entities']
+            query = self.queries[(record['table'], record['kind'], record['filter'] or '')]
+            query[1] += 1
+            query[2] += record['entities']
+            if not record['continuation']:
+                query[0] += 1
+                if record['kind'] == 'scan':
+                    self.table_scans += 1
+        elif record['service'] == 'blob':
+            self.blob_bytes += record['bytes']
+            blob = self.blobs[(record['operation'], record['container'] or '')]
+            blob[0] += 1
+            blob[1] += record['bytes']
+
+    def to_dict(self):
+        calls = max(self.calls, 1)
+        totals = {
+            'storageRequests': self.storage_requests,
+            'tablePages': self.table_pages,
+            'entities': self.entities,
+            'tableScans': self.table_scans,
+            'blobBytes': self.blob_bytes,
+        }
+        return {
+            'calls': self.calls,
+            'avgApiMs': round(self.api_ms / calls, 1) if self.calls else None,
+            **totals,
+            'perCall': {name: round(value / calls, 2) for name, value in totals.items()},
+            'storageMs': round(self.storage_ms, 1),
+            'injectedMs': round(self.injected_ms, 1),
+            'queries': sorted(
+                ({'table': table, 'kind': kind, 'filter': filter_text or None,
+                  'queries': counts[0], 'pages': counts[1], 'entities': counts[2]}
+                 for (table, kind, filter_text), counts in self.queries.items()),
+                key=lambda query: -query['entities']),
+            'blobs': [{'operation': operation, 'container': container or None, 'requests': counts[0], 'bytes': counts[1]}
+                      for (operation, container), counts in sorted(self.blobs.items())],
+        }
+
+
+class Recorder:
+    """APIリクエストの実行状況とストレージへのリクエストの集計"""
+
+    def __init__(self, latency, log_path=None):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._in_flight = {}
+        self._log = open(log_path, 'a', encoding='utf-8') if log_path else None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc).isoformat()
+            self.endpoints = defaultdict(EndpointStats)
+
+    def begin_api(self, endpoint):
+        with self._lock:
+            request_id = next(self._ids)
+            self._in_flight[request_id] = endpoint
+            return request_id
+
+    def end_api(self, request_id, duration_ms):
+        with self._lock:
+            endpoint = self._in_flight.pop(request_id)
+            stats = self.endpoints[endpoint]
+            stats.calls += 1
+            stats.api_ms += duration_ms
+
+    def current_endpoint(self):
+        """実行中のAPIリクエストが1件だけの場合はそのエンドポイント"""
+        with self._lock:
+            if not self._in_flight:
+                return '(background)'
+            if len(self._in_flight) == 1:
+                return next(iter(self._in_flight.values()))
+            endpoints = set(self._in_flight.values())
+            return endpoints.pop() if len(endpoints) == 1 else '(concurrent)'
+
+    def record_storage(self, endpoint, record):
+        with self._lock:
+            self.endpoints[endpoint].add(record)
+            if self._log:
+                self._log.write(json.dumps({'endpoint': endpoint, **record}, ensure_ascii=False) + '\n')
+                self._log.flush()
+
+    def report(self):
+        with self._lock:
+            return {
+                'startedAt': self.started_at,
+                'generatedAt': datetime.now(timezone.utc).isoformat(),
+                'latency': self.latency.specs,
+                'endpoints': {name: stats.to_dict() for name, stats in sorted(self.endpoints.items())},
+            }
+
+
+def make_handler(service, upstream_host, upstream_port, recorder):
+    """中継先ごとのリクエストハンドラーを生成"""
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            # アクセスログは --log のJSON Linesに出力するため、標準エラー出力には出さない
+            pass
+
+        def _read_body(self):
+            if 'chunked' in (self.headers.get('Transfer-Encoding') or '').lower():
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return b''.join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _send(self, status, headers, body):
+            self.send_response(status)
+            for name, value in headers:
+                if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != 'content-length':
+                    self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD' and body:
+                self.wfile.write(body)
+
+        def _control(self, path):
+            if path == CONTROL_PREFIX + 'report':
+                body = json.dumps(recorder.report(), ensure_ascii=False, indent=2).encode('utf-8')
+                self._send(200, [('Content-Type', 'application/json')], body)
+            elif path == CONTROL_PREFIX + 'reset' and self.command == 'POST':
+                recorder.reset()
+                self._send(204, [], b'')
+            else:
+                self._send(404, [('Content-Type', 'text/plain')], b'not found')
+
+        def _forward(self, body):
+            connection = http.client.HTTPConnection(upstream_host, upstream_port, timeout=300)
+            try:
+                headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+                headers['Host'] = f"{upstream_host}:{upstream_port}"
+                if body or self.command in ('POST', 'PUT', 'PATCH', 'MERGE'):
+                    headers['Content-Length'] = str(len(body))
+                connection.request(self.command, self.path, body=body or None, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.getheaders(), response.read()
+            finally:
+                connection.close()
+
+        def _proxy(self):
+            parsed = urllib.parse.urlsplit(self.path)
+            if parsed.path.startswith(CONTROL_PREFIX):
+                self._control(parsed.path)
+                return
+
+            body = self._read_body()
+            if service == 'api':
+                request_id = recorder.begin_api(normalize_route(self.command, parsed.path))
+                started = time.perf_counter()
+                try:
+                    status, headers, response_body = self._forward(body)
+                finally:
+                    recorder.end_api(request_id, (time.perf_counter() - started) * 1000)
+                self._send(status, headers, response_body)
+                return
+
+            # 呼び出し元は転送前に判定する（遅延の注入中にAPIの処理が終わっても割り当てが変わらないように）
+            endpoint = recorder.current_endpoint()
+            query = urllib.parse.parse_qs(parsed.query)
+            operation = describe_operation(service, self.command, parsed.path, query, body)
+            injected_ms = recorder.latency.delay_ms(operation)
+            if injected_ms > 0:
+                time.sleep(injected_ms / 1000)
+
+            started = time.perf_counter()
+            status, headers, response_body = self._forward(body)
+            duration_ms = (time.perf_counter() - started) * 1000
+
+            describe = describe_table_request if service == 'table' else describe_blob_request
+            record = describe(self.command, parsed.path, query, body, response_body, status)
+            record.update({
+                'method': self.command,
+                'status': status,
+                'durationMs': round(duration_ms + injected_ms, 2),
+                'injectedMs': round(injected_ms, 2),
+                'time': datetime.now(timezone.utc).isoformat(),
+            })
+            recorder.record_storage(endpoint, record)
+            self._send(status, headers, response_body)
+
+        do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = do_MERGE = do_OPTIONS = _proxy
+
+    return ProxyHandler
+
+
+def describe_operation(service, method, path, query, body):
+    """レイテンシの分布を選ぶための操作の種類（転送前に判定）"""
+    if service == 'blob':
+        return 'blob.read' if method in ('GET', 'HEAD') else 'blob.write'
+    if path.rstrip('/').endswith('$batch'):
+        return 'table.batch'
+    if method in ('GET', 'HEAD'):
+        match = _TABLE_RESOURCE.match(urllib.parse.unquote(path))
+        return 'table.point' if match and match.group(3) else 'table.query'
+    return 'table.write'
+
+
+def check_budget(report, budget):
+    """集計結果を予算と比較し、超過した項目の一覧を返す"""
+    violations = []
+    default = budget.get('*', {})
+    for endpoint, stats in report['endpoints'].items():
+        if endpoint.startswith('('):
+            continue
+        limits = {**default, **budget.get(endpoint, {})}
+        for field, limit in limits.items():
+            if field not in BUDGET_FIELDS:
+                raise ValueError(f"予算の項目が不正です: {field}")
+            actual = stats['perCall'][BUDGET_FIELDS[field]]
+            if actual > limit:
+                violations.append((endpoint, field, actual, limit))
+    return violations
+
+
+def run_check(args):
+    with open(args.report, encoding='utf-8') as f:
+        report = json.load(f)
+    with open(args.budget, encoding='utf-8') as f:
+        budget = json.load(f)
+
+    violations = check_budget(report, budget)
+    print(f"{'エンドポイント':<48} {'呼出':>5} {'ストレージ/回':>12} {'ページ/回':>9} {'エンティティ/回':>14} {'走査/回':>8}")
+    for endpoint, stats in report['endpoints'].items():
+        per_call = stats['perCall']
+        print(f"{endpoint:<48} {stats['calls']:>5} {per_call['storageRequests']:>12} {per_call['tablePages']:>9} "
+              f"{per_call['entities']:>14} {per_call['tableScans']:>8}")
+    print("=" * 50)
+    if violations:
+        for endpoint, field, actual, limit in violations:
+            print(f"❌ {endpoint}: {field} = {actual}（上限 {limit}）")
+        sys.exit(1)
+    print("✅ すべてのエンドポイントが予算内です")
+
+
+def run_proxy(args):
+    specs = dict(LATENCY_PROFILES.get(args.latency_profile, {})) if args.latency_profile else {}
+    for item in args.latency:
+        operation, _, spec = item.partition('=')
+        specs[operation] = spec
+    recorder = Recorder(LatencyInjector(specs), args.log)
+
+    targets = [('blob', args.blob_port, args.upstream_blob_port), ('table', args.table_port, args.upstream_table_port)]
+    if args.api_port:
+        targets.append(('api', args.api_port, args.upstream_api_port))
+
+    servers = []
+    for service, port, upstream_port in targets:
+        server = ThreadingHTTPServer((args.host, port), make_handler(service, args.upstream_host, upstream_port, recorder))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        print(f"🚀 {service}: http://{args.host}:{port} → http://{args.upstream_host}:{upstream_port}")
+
+    print("Functionsホストの AzureWebJobsStorage に以下を設定してください:")
+    print(f"  DefaultEndpointsProtocol=http;AccountName={ACCOUNT_NAME};AccountKey={ACCOUNT_KEY};"
+          f"BlobEndpoint=http://{args.host}:{args.blob_port}/{ACCOUNT_NAME};"
+          f"QueueEndpoint=http://{args.upstream_host}:10001/{ACCOUNT_NAME};"
+          f"TableEndpoint=http://{args.host}:{args.table_port}/{ACCOUNT_NAME};")
+    if specs:
+        print(f"⏱️ レイテンシ注入: {specs}")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+
+    for server in servers:
+        server.shutdown()
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(recorder.report(), f, ensure_ascii=False, indent=2)
+        print(f"✅ 集計を出力しました: {args.report}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'check':
+        parser = argparse.ArgumentParser(description='プロキシの集計結果を予算と比較します')
+        parser.add_argument('command')
+        parser.add_argument('report', help='プロキシが出力した集計（--report / /__proxy/report）')
+        parser.add_argument('budget', help='予算ファイル（エンドポイント → 1呼び出しあたりの上限）')
+        run_check(parser.parse_args())
+        return
+
+    parser = argparse.ArgumentParser(description='Azuriteへのリクエストを記録・遅延させるリバースプロキシ')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--blob-port', type=int, default=20000)
+    parser.add_argument('--table-port', type=int, default=20002)
+    parser.add_argument('--api-port', type=int, help='APIを中継するポート（指定した場合のみ。エンドポイント別の集計に使う）')
+    parser.add_argument('--upstream-host', default='127.0.0.1', help='Azurite / Functionsホストのアドレス')
+    parser.add_argument('--upstream-blob-port', type=int, default=10000)
+    parser.add_argument('--upstream-table-port', type=int, default=10002)
+    parser.add_argument('--upstream-api-port', type=int, default=7071)
+    parser.add_argument('--latency', action='append', default=[],
+                        help='操作ごとのレイテンシ（例: table.query=lognormal:25,0.5）。'
+                             '操作: table.point / table.query / table.write / table.batch / blob.read / blob.write / *')
+    parser.add_argument('--latency-profile', choices=sorted(LATENCY_PROFILES), help='レイテンシの分布の既定値')
+    parser.add_argument('--report', help='終了時に集計を出力するJSONファイル')
+    parser.add_argument('--log', help='ストレージへのリクエストを1行ずつ出力するJSON Linesファイル')
+    args = parser.parse_args()
+
+    try:
+        run_proxy(args)
+    except ValueError as e:
+        print(f"❌ エラー: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env node
+/**
+ * コールドスタートのベンチマークスクリプト
+ *
+ * ビルド済みの dist/ を使用して、以下を計測します。
+ *
+ * 1. 起動時のimport時間（新しいNodeプロセスで計測し、--runs 回の中央値を使用）
+ *    - index: dist/index.js（関数の登録のみ。ハンドラー本体は読み込まない）
+ *    - eager: すべての関数モジュールを起動時に読み込んだ場合（遅延読み込み導入前の構成に相当）
+ * 2. 関数ごとの初回読み込み時間（関数モジュールを新しいプロセスで読み込む時間 = 初回呼び出し時に加わる時間）
+ * 3. ルートごとの初回・2回目のリクエストのレイテンシ（--base-url または --start-host を指定した場合）
+ *    - 各関数を functionRegistry.ts に登録されたメソッドで呼び出します（GETを受け付ける関数はGET、それ以外は最初に登録されたメソッド）
+ *      GET以外のメソッドは --token を付けずに空のJSONで呼び出すため、認証・入力検証で拒否され副作用はありません
+ *      （OPTIONSは同じルートの別の関数に割り当てられていることがあり、対象の関数を計測できないため使用しません）
+ *    - ルートパラメータはダミー値に置き換えるため、404/401が返ることがありますが、ハンドラーの読み込みは計測できます
+ *    - 1つのホストで全ルートを呼び出すと共通の依存ライブラリは最初のルートでのみ読み込まれます。
+ *      ルートごとに完全なコールドスタートを計測する場合は --restart-per-route を指定します（時間がかかります）
+ *
+ * 使用方法:
+ *   npm run build
+ *   node scripts/benchmark/cold_start.js
+ *   node scripts/benchmark/cold_start.js --start-host --output bench.json
+ *   node scripts/benchmark/cold_start.js --base-url http://localhost:7071 --token <JWT>
+ *   node scripts/benchmark/cold_start.js --max-startup-ms 150   # 起動時のimport時間が上限を超えたら終了コード1
+ */
+
+const { execFileSync, spawn } = require('child_process');
+const fs = require('fs');
+const path = require('path');
+
+const ROOT_DIR = path.resolve(__dirname, '../..');
+const DIST_DIR = path.join(ROOT_DIR, 'dist');
+
+// GETでも副作用のあるルート（既定で呼び出さない）
+const DEFAULT_SKIP = ['CreateProductionSum'];
+
+function parseArgs(argv) {
+    const args = {
+        runs: 5,
+        baseUrl: null,
+        startHost: false,
+        restartPerRoute: false,
+        port: 7071,
+        token: null,
+        output: null,
+        maxStartupMs: null,
+        skipImport: false,
+        only: null,
+        skip: DEFAULT_SKIP,
+        hostTimeoutMs: 120000,
+    };
+    for (let i = 0; i < argv.length; i++) {
+        const arg = argv[i];
+        const next = () => argv[++i];
+        switch (arg) {
+            case '--runs': args.runs = parseInt(next(), 10); break;
+            case '--base-url': args.baseUrl = next().replace(/\/$/, ''); break;
+            case '--start-host': args.startHost = true; break;
+            case '--restart-per-route': args.restartPerRoute = true; args.startHost = true; break;
+            case '--port': args.port = parseInt(next(), 10); break;
+            case '--token': args.token = next(); break;
+            case '--output': args.output = next(); break;
+            case '--max-startup-ms': args.maxStartupMs = Number(next()); break;
+            case '--skip-import': args.skipImport = true; break;
+            case '--only': args.only = next().split(',').map((s) => s.trim()); break;
+            case '--skip': args.skip = next().split(',').map((s) => s.trim()).filter(Boolean); break;
+            case '--host-timeout-ms': args.hostTimeoutMs = Number(next()); break;
+            case '--help':
+                console.log('Usage: node scripts/benchmark/cold_start.js [--runs N] [--start-host | --base-url URL] '
+                    + '[--restart-per-route] [--port N] [--token JWT] [--only A,B] [--skip A,B] '
+                    + '[--output FILE] [--max-startup-ms N] [--skip-import]');
+                process.exit(0);
+            default:
+                console.error(`❌ 不明なオプション: ${arg}`);
+                process.exit(1);
+        }
+    }
+    return args;
+}
+
+function median(values) {
+    const sorted = [...values].sort((a, b) => a - b);
+    const mid = Math.floor(sorted.length / 2);
+    return sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+}
+
+function round(value) {
+    return Math.round(value * 10) / 10;
+}
+
+// ---------------------------------------------------------------------------
+// import時間の計測
+// ---------------------------------------------------------------------------
+
+/**
+ * 新しいNodeプロセスでモジュールを読み込み、所要時間と読み込まれたモジュール数を返す
+ */
+function measureRequire(modulePaths) {
+    const code = `
+        const start = process.hrtime.bigint();
+        for (const p of ${JSON.stringify(modulePaths)}) require(p);
+        const ms = Number(process.hrtime.bigint() - start) / 1e6;
+        process.stdout.write(JSON.stringify({ ms, modules: Object.keys(require.cache).length }));
+    `;
+    const output = execFileSync(process.execPath, ['-e', code], {
+        cwd: ROOT_DIR,
+        env: {
+            ...process.env,
+            AzureWebJobsStorage: process.env.AzureWebJobsStorage || 'UseDevelopmentStorage=true',
+        },
+        stdio: ['ignore', 'pipe', 'ignore'],
+    });
+    return JSON.parse(output.toString());
+}
+
+function measureRequireMedian(modulePaths, runs) {
+    const samples = [];
+    let modules = 0;
+    for (let i = 0; i < runs; i++) {
+        const result = measureRequire(modulePaths);
+        samples.push(result.ms);
+        modules = result.modules;
+    }
+    return { medianMs: round(median(samples)), minMs: round(Math.min(...samples)), modules };
+}
+
+function listFunctionModules() {
+    const functionsDir = path.join(DIST_DIR, 'functions');
+    return fs.readdirSync(functionsDir)
+        .filter((name) => fs.existsSync(path.join(functionsDir, name, 'index.js')))
+        .map((name) => ({ name, path: path.join(functionsDir, name, 'index.js') }));
+}
+
+function benchmarkImports(args) {
+    const indexPath = path.join(DIST_DIR, 'index.js');
+    const tableMetricsPath = path.join(DIST_DIR, 'utils', 'tableMetrics.js');
+    const modules = listFunctionModules();
+
+    console.log(`🚀 起動時のimport時間を計測中（${args.runs}回の中央値）...`);
+    const index = measureRequireMedian([indexPath], args.runs);
+    const eager = measureRequireMedian(modules.map((m) => m.path), args.runs);
+    console.log(`  index（遅延読み込み）: ${index.medianMs}ms（${index.modules}モジュール）`);
+    console.log(`  eager（全関数を読み込んだ場合）: ${eager.medianMs}ms（${eager.modules}モジュール）`);
+
+    console.log('🚀 関数ごとの初回読み込み時間を計測中...');
+    const perFunction = modules.map((m) => {
+        const result = measureRequireMedian([tableMetricsPath, m.path], args.runs);
+        return { module: m.name, ...result };
+    }).sort((a, b) => b.medianMs - a.medianMs);
+
+    console.log('');
+    console.log('関数モジュール'.padEnd(36) + '中央値(ms)'.padStart(12) + 'モジュール数'.padStart(10));
+    for (const row of perFunction) {
+        console.log(row.module.padEnd(40) + String(row.medianMs).padStart(12) + String(row.modules).padStart(14));
+    }
+    console.log('');
+
+    return { index, eager, perFunction };
+}
+
+// ---------------------------------------------------------------------------
+// リクエストのレイテンシ計測
+// ---------------------------------------------------------------------------
+
+function sleep(ms) {
+    return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+/**
+ * func start でホストを起動し、ホストの状態が Running になるまで待つ
+ */
+async function startHost(port, timeoutMs) {
+    const started = Date.now();
+    const host = spawn('func', ['start', '--port', String(port)], {
+        cwd: ROOT_DIR,
+        stdio: ['ignore', 'pipe', 'pipe'],
+        shell: process.platform === 'win32',
+    });
+    let exited = false;
+    host.on('exit', () => { exited = true; });
+    host.stdout.resume();
+    host.stderr.resume();
+
+    const statusUrl = `http://localhost:${port}/admin/host/status`;
+    while (Date.now() - started < timeoutMs) {
+        if (exited) throw new Error('func start が終了しました（Azure Functions Core Tools を確認してください）');
+        try {
+            const response = await fetch(statusUrl);
+            if (response.ok) {
+                const status = await response.json();
+                if (status.state === 'Running') {
+                    return { host, startupMs: Date.now() - started };
+                }
+            }
+        } catch {
+            // 起動中
+        }
+        await sleep(200);
+    }
+    host.kill();
+    throw new Error(`ホストが ${timeoutMs}ms 以内に起動しませんでした`);
+}
+
+async function stopHost(host) {
+    if (host.exitCode !== null) return;
+    await new Promise((resolve) => {
+        host.once('exit', resolve);
+        host.kill('SIGINT');
+        setTimeout(() => host.kill('SIGKILL'), 10000);
+    });
+}
+
+function buildUrl(baseUrl, route) {
+    const year = String(new Date().getFullYear());
+    const resolved = route.replace(/\{(\w+)\??\}/g, (_, name) => (name === 'year' ? year : 'benchmark'));
+    return `${baseUrl}/api/${resolved}`;
+}
+
+/**
+ * 関数に登録されたメソッドから呼び出しに使うメソッドを選ぶ（GETを優先し、OPTIONSは使用しない）
+ */
+function selectMethod(methods) {
+    if (methods.includes('GET')) return 'GET';
+    return methods.find((method) => method !== 'OPTIONS') || null;
+}
+
+async function timedRequest(url, method, token) {
+    const headers = { Origin: 'http://localhost:3000' };
+    let body;
+    if (method === 'GET') {
+        if (token) headers.Authorization = `Bearer ${token}`;
+    } else {
+        // 更新系のメソッドは認証なし・空のJSONで呼び出し、ハンドラーの読み込みのみを計測する
+        headers['Content-Type'] = 'application/json';
+        body = '{}';
+    }
+    const start = process.hrtime.bigint();
+    const response = await fetch(url, { method, headers, body });
+    await response.arrayBuffer();
+    return { status: response.status, ms: round(Number(process.hrtime.bigint() - start) / 1e6) };
+}
+
+async function benchmarkRequests(args) {
+    const { httpFunctions } = require(path.join(DIST_DIR, 'functionRegistry.js'));
+    const targets = httpFunctions
+        .filter((fn) => !args.only || args.only.includes(fn.name))
+        .filter((fn) => !args.skip.includes(fn.name));
+
+    const results = [];
+    let host = null;
+    let hostStartupMs = null;
+    let baseUrl = args.baseUrl || `http://localhost:${args.port}`;
+
+    if (args.startHost && !args.restartPerRoute) {
+        console.log('🚀 ホストを起動中...');
+        ({ host, startupMs: hostStartupMs } = await startHost(args.port, args.hostTimeoutMs));
+        console.log(`  ホスト起動: ${hostStartupMs}ms`);
+    }
+
+    try {
+        for (const fn of targets) {
+            const method = selectMethod(fn.methods);
+            if (!method) {
+                results.push({ name: fn.name, route: fn.route, skipped: 'OPTIONS 以外のメソッドが登録されていないため' });
+                continue;
+            }
+
+            let routeHostStartupMs;
+            if (args.restartPerRoute) {
+                const started = await startHost(args.port, args.hostTimeoutMs);
+                host = started.host;
+                routeHostStartupMs = started.startupMs;
+            }
+
+            const url = buildUrl(baseUrl, fn.route);
+            try {
+                const first = await timedRequest(url, method, args.token);
+                const second = await timedRequest(url, method, args.token);
+                results.push({
+                    name: fn.name,
+                    route: fn.route,
+                    method,
+                    status: first.status,
+                    firstMs: first.ms,
+                    secondMs: second.ms,
+                    ...(routeHostStartupMs !== undefined ? { hostStartupMs: routeHostStartupMs } : {}),
+                });
+                console.log(`  ${fn.name.padEnd(36)} ${method.padEnd(7)} ${String(first.status).padEnd(4)} `
+                    + `初回 ${String(first.ms).padStart(8)}ms / 2回目 ${String(second.ms).padStart(8)}ms`);
+            } catch (error) {
+                results.push({ name: fn.name, route: fn.route, method, error: String(error) });
+                console.log(`  ❌ ${fn.name}: ${error}`);
+            }
+
+            if (args.restartPerRoute) {
+                await stopHost(host);
+                host = null;
+            }
+        }
+    } finally {
+        if (host) await stopHost(host);
+    }
+
+    return { baseUrl, hostStartupMs, routes: results };
+}
+
+// ---------------------------------------------------------------------------
+
+async function main() {
+    const args = parseArgs(process.argv.slice(2));
+
+    if (!fs.existsSync(path.join(DIST_DIR, 'index.js'))) {
+        console.error('❌ dist/index.js が見つかりません。先に npm run build を実行してください');
+        process.exit(1);
+    }
+
+    const report = { measuredAt: new Date().toISOString(), node: process.version };
+
+    if (!args.skipImport) {
+        report.imports = benchmarkImports(args);
+    }
+    if (args.baseUrl || args.startHost) {
+        console.log('🚀 ルートごとの初回リクエストを計測中...');
+        report.requests = await benchmarkRequests(args);
+    }
+
+    if (args.output) {
+        fs.writeFileSync(args.output, JSON.stringify(report, null, 2));
+        console.log(`✅ 結果を保存しました: ${args.output}`);
+    }
+
+    if (args.maxStartupMs !== null && report.imports && report.imports.index.medianMs > args.maxStartupMs) {
+        console.error(`❌ 起動時のimport時間 ${report.imports.index.medianMs}ms が上限 ${args.maxStartupMs}ms を超えています`);
+        process.exit(1);
+    }
+    console.log('✅ ベンチマークが完了しました');
+}
+
+main().catch((error) => {
+    console.error('❌ ベンチマークに失敗しました:', error);
+    process.exit(1);
+});
@@ -0,0 +1,7 @@
+"""
+スクリプト共通モジュール
+
+各スクリプトからは以下のように読み込みます（scripts/ をパスに追加）:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from common.table_stream import iter_table_entities, UserRecord
+"""
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+テストデータ用パスワードハッシュのローカルキャッシュ
+
+bcrypt はハッシュ化のたびに意図的に時間がかかるため（コスト10で約0.1秒、既定のコスト12で約0.3秒）、
+テストユーザー・ローカル管理者の作成のたびに同じパスワードをハッシュ化し直すと、環境の作り直しに数秒かかります。
+（パスワード, コスト）→ ハッシュをローカルのJSONファイルに保存し、2回目以降はbcryptを呼び出しません。
+
+- キーは (コスト, パスワード) のHMAC-SHA256。HMACの鍵はキャッシュとは別のファイル（権限 0600）に乱数で作成するため、
+  キャッシュファイルだけが漏れてもキーから辞書攻撃でパスワードを調べることはできません
+- 固定のテスト用パスワード以外（管理者作成スクリプトで入力したパスワードなど）は hash(password, cacheable=False) でキャッシュしません
+- 保存したハッシュはコストの接頭辞（例: $2b$10$）を確認してから使い、一致しない場合は作り直します
+- 書き込みは一時ファイルからの置き換えで行うため、途中で止まってもキャッシュは壊れません
+- ローカル・CI のテストデータ専用です。検証環境・本番環境のアカウントには使わないでください
+
+キャッシュファイルの場所は環境変数 PASSWORD_HASH_CACHE で変更できます（既定値: scripts/.cache/password_hashes.json）。
+鍵のファイルは PASSWORD_HASH_CACHE_KEY で変更できます（既定値: キャッシュファイルと同じディレクトリの password_hashes.key）。
+
+使用例:
+    cache = PasswordHashCache()
+    password_hash = cache.hash('testpassword')
+    cache.save()
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+
+# APIのユーザー作成・パスワード変更（bcrypt.hash(password, 10)）と同じコスト
+DEFAULT_COST = 10
+
+DEFAULT_CACHE_PATH = os.getenv(
+    'PASSWORD_HASH_CACHE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'password_hashes.json'),
+)
+
+DEFAULT_KEY_PATH = os.getenv(
+    'PASSWORD_HASH_CACHE_KEY',
+    os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), 'password_hashes.key'),
+)
+
+# 2: キーを鍵付きのHMACに変更（バージョン1の鍵なしのSHA-256のキャッシュは読み込まずに作り直す）
+CACHE_VERSION = 2
+
+
+def cache_key(password, cost, secret):
+    """キャッシュのキー（鍵付きのHMAC-SHA256。平文のパスワードも、鍵なしで照合できる値も保存しない）"""
+    return hmac.new(secret, f"{cost}:{password}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def load_secret(path):
+    """HMACの鍵を読み込む（ない場合は乱数で作成し、所有者のみ読み書きできる権限で保存する）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return bytes.fromhex(f.read().strip())
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    secret = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 同時に実行した別のプロセスが作成した鍵を使う
+        return load_secret(path)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(secret.hex())
+    return secret
+
+
+class PasswordHashCache:
+    """（パスワード, コスト）→ bcrypt ハッシュのキャッシュ"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, cost=DEFAULT_COST, enabled=True, key_path=DEFAULT_KEY_PATH):
+        self.path = path
+        self.key_path = key_path
+        self.cost = cost
+        self.enabled = enabled
+        self.secret = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        if enabled:
+            self._load()
+
+    def _load(self):
+        try:
+            self.secret = load_secret(self.key_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ パスワードハッシュのキャッシュの鍵を読み込めませんでした（キャッシュを使いません）: {e}")
+            self.enabled = False
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ パスワードハッシュのキャッシュを読み込めませんでした（作り直します）: {e}")
+            return
+        if data.get('version') == CACHE_VERSION:
+            self.entries = data.get('entries') or {}
+
+    def hash(self, password, cacheable=True):
+        """
+        パスワードのハッシュを返す（キャッシュにない場合のみ bcrypt でハッシュ化する）
+
+        cacheable=False の場合はキャッシュを読み書きせずにハッシュ化する（固定のテスト用パスワード以外に使う）
+        """
+        use_cache = self.enabled and cacheable
+        key = cache_key(password, self.cost, self.secret) if use_cache else None
+        cached = self.entries.get(key) if use_cache else None
+        # コストの接頭辞（$2a$ / $2b$ の後の2桁）が一致するもののみ使う
+        if cached and cached[4:7] == f"{self.cost:02d}$":
+            self.hits += 1
+            return cached
+
+        # bcrypt はキャッシュにない場合のみ読み込む（ImportError は呼び出し側で処理する）
+        import bcrypt
+        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.cost)).decode('utf-8')
+        self.misses += 1
+        if use_cache:
+            self.entries[key] = password_hash
+            self._dirty = True
+        return password_hash
+
+    def save(self):
+        """追加したハッシュがあればキャッシュファイルに書き込む"""
+        if not self.enabled or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f, indent=2)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+    def stats(self):
+        return f"キャッシュ: ヒット {self.hits}件 / ハッシュ化 {self.misses}件"
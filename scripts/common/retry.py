@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+一時的なエラーの再試行と同時実行数の自動調整（標準ライブラリのみ）
+
+- RetryPolicy: 再試行できるエラー（429 / 500 / 503 などのHTTPエラー、接続エラー）を判定し、
+  ジッター付きの指数バックオフで再試行する。Retry-After / x-ms-retry-after-ms ヘッダーがあればその時間以上待つ
+- AdaptiveLimiter: 同時に実行中のリクエスト数の上限をAIMD方式で調整する
+  成功するたびに上限を少しずつ（上限1回分につき+1）増やし、スロットリング（429 / 503 ServerBusy / 500 OperationTimedOut）を
+  受けたら半分にする。ストレージアカウントが処理できる範囲で最大のスループットに収束する
+
+urllib の HTTPError と azure-core の HttpResponseError の両方を扱えます（azure パッケージは読み込みません）。
+
+使用例:
+    limiter = AdaptiveLimiter(initial=8, maximum=64)
+    retry = RetryPolicy(limiter=limiter)
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+        for batch in batches:
+            limiter.acquire()
+            future = executor.submit(retry.call, lambda b=batch: table_client.submit_transaction(b))
+            future.add_done_callback(lambda _: limiter.release())
+
+    print(retry.stats())
+"""
+
+import email.utils
+import random
+import socket
+import threading
+import time
+import urllib.error
+
+# 再試行するHTTPステータス
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# スロットリング（同時実行数を減らすべき状態）とみなすHTTPステータス・エラーコード
+THROTTLE_STATUS = {429, 503}
+THROTTLE_ERROR_CODES = {'ServerBusy', 'OperationTimedOut', 'TooManyRequests'}
+
+# 接続エラーなど、応答がないまま失敗したときの例外（azure-core の例外はクラス名で判定する）
+TRANSIENT_EXCEPTION_NAMES = {'ServiceRequestError', 'ServiceResponseError', 'IncompleteRead', 'RemoteDisconnected'}
+
+
+def get_status(error):
+    """エラーのHTTPステータスを返す（HTTPエラーでない場合はNone）"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code
+    return getattr(error, 'status_code', None)
+
+
+def _get_headers(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.headers
+    response = getattr(error, 'response', None)
+    return getattr(response, 'headers', None)
+
+
+def classify(error):
+    """
+    エラーを分類する
+
+    Returns:
+        (再試行できるか, スロットリングか)
+    """
+    status = get_status(error)
+    if status is not None:
+        error_code = getattr(error, 'error_code', None)
+        headers = _get_headers(error)
+        if not error_code and headers is not None:
+            error_code = headers.get('x-ms-error-code')
+        throttled = status in THROTTLE_STATUS or error_code in THROTTLE_ERROR_CODES
+        return status in RETRYABLE_STATUS, throttled
+
+    if isinstance(error, (urllib.error.URLError, ConnectionError, TimeoutError, socket.timeout)):
+        return True, False
+    if type(error).__name__ in TRANSIENT_EXCEPTION_NAMES:
+        return True, False
+    return False, False
+
+
+def get_retry_after(error):
+    """Retry-After / x-ms-retry-after-ms ヘッダーの待ち時間（秒）を返す（ない場合はNone）"""
+    headers = _get_headers(error)
+    if headers is None:
+        return None
+
+    for name in ('x-ms-retry-after-ms', 'retry-after-ms'):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) / 1000)
+            except ValueError:
+                pass
+
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """同時実行数の上限をAIMD方式（成功で加算、スロットリングで半減）で調整するセマフォ"""
+
+    def __init__(self, initial=8, minimum=1, maximum=64, decrease_factor=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._decrease_factor = decrease_factor
+        # 同時に実行中のリクエストがまとめてスロットリングを受けても、1回だけ減らすための間隔（秒）
+        self._cooldown = cooldown
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self.peak_limit = int(self._limit)
+        self.decreases = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def on_success(self):
+        with self._condition:
+            if self._limit < self.maximum:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                self.peak_limit = max(self.peak_limit, int(self._limit))
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < self._cooldown:
+                return
+            self._last_decrease = now
+            self._limit = max(self.minimum, self._limit * self._decrease_factor)
+            self.decreases += 1
+
+
+class RetryPolicy:
+    """一時的なエラーをジッター付き指数バックオフで再試行する"""
+
+    def __init__(self, max_attempts=8, base_delay=0.5, max_delay=30.0, limiter=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self.failures = 0
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def backoff(self, attempt, retry_after=None):
+        """attempt 回目（0始まり）の失敗後の待ち時間（フルジッター、Retry-After があればそれ以上）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """fn を実行し、再試行できるエラーの場合は待ってから再実行する（再試行できない・回数超過の場合は例外を送出）"""
+        self._count(calls=1)
+        attempt = 0
+        while True:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as error:
+                retryable, throttled = classify(error)
+                if throttled:
+                    self._count(throttles=1)
+                    if self.limiter is not None:
+                        self.limiter.on_throttle()
+                if not retryable or attempt + 1 >= self.max_attempts:
+                    self._count(failures=1)
+                    raise
+                self._count(retries=1)
+                time.sleep(self.backoff(attempt, get_retry_after(error)))
+                attempt += 1
+                continue
+
+            if self.limiter is not None:
+                self.limiter.on_success()
+            return result
+
+    def stats(self):
+        """再試行・スロットリングの件数"""
+        stats = {
+            'calls': self.calls,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'failures': self.failures,
+        }
+        if self.limiter is not None:
+            stats['concurrency'] = self.limiter.limit
+            stats['peakConcurrency'] = self.limiter.peak_limit
+            stats['concurrencyDecreases'] = self.limiter.decreases
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        text = f"再試行: {stats['retries']}回 / スロットリング: {stats['throttles']}回 / 失敗: {stats['failures']}件"
+        if self.limiter is not None:
+            text += f" / 同時実行数: {stats['concurrency']}（最大 {stats['peakConcurrency']}、減少 {stats['concurrencyDecreases']}回）"
+        return text
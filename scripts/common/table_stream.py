@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Table Storage クエリ結果のストリーミング読み込み（標準ライブラリのみ）
+
+レスポンス全体を文字列として読み込んで json.loads するのではなく、
+受信したバイト列を少しずつデコードし、"value" 配列の要素を1件ずつ返します。
+各エンティティは取得した列のみを持つ __slots__ のレコード（UserRecord など）に変換するため、
+10万件規模の走査でも、メモリに載るのは受信中のチャンクと呼び出し側が保持するレコードのみです。
+
+使用例:
+    def open_url(url):
+        return urllib.request.urlopen(urllib.request.Request(url, headers=client._get_auth_headers("GET", url)))
+
+    for user in iter_table_entities(open_url, f"{endpoint}/{account}/UsersTable()", UserRecord):
+        print(user.email, user.role)
+"""
+
+import codecs
+import json
+import re
+import urllib.parse
+
+# 1回に読み込むバイト数
+CHUNK_SIZE = 64 * 1024
+
+# 1ページの最大件数（Table Storageの上限）
+MAX_PAGE_SIZE = 1000
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+class _StreamBuffer:
+    """バイトストリームを少しずつ読み込み、未処理部分のみを保持するバッファ"""
+
+    __slots__ = ('_stream', '_decoder', '_chunk_size', 'text', 'pos', 'eof')
+
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._chunk_size = chunk_size
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """次のチャンクを読み込む（処理済みの部分は捨てる）。終端に達した場合はFalse"""
+        if self.eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            self.text = self.text[self.pos:] + self._decoder.decode(b'', final=True)
+            self.pos = 0
+            return False
+        self.text = self.text[self.pos:] + self._decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """空白を読み飛ばし、次の1文字を返す（終端の場合は空文字列）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSONの形式が不正です: '{char}' が必要です (位置 {self.pos})")
+        self.pos += 1
+
+    def decode_value(self, decoder):
+        """次のJSON値を1つデコードする。値がチャンクの境界をまたぐ場合は読み足して再試行する"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                # 数値などは末尾が切れていても成功するため、終端以外では後続の文字を確認してから確定する
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_array(stream, key='value', chunk_size=CHUNK_SIZE):
+    """
+    {"key": [...], ...} 形式のJSONをストリームから読み込み、配列の要素を1件ずつ返す
+
+    Args:
+        stream: read(n) でバイト列を返すオブジェクト（HTTPレスポンス、ファイルなど）
+        key: 要素を取り出す配列のキー
+        chunk_size: 1回に読み込むバイト数
+    """
+    buffer = _StreamBuffer(stream, chunk_size)
+    decoder = json.JSONDecoder()
+
+    buffer.expect('{')
+    while True:
+        char = buffer.peek()
+        if char == '}' or char == '':
+            return
+        if char == ',':
+            buffer.pos += 1
+            continue
+
+        name = buffer.decode_value(decoder)
+        buffer.expect(':')
+        if name != key:
+            # 対象外のキー（odata.metadata など）の値は読み捨てる
+            buffer.decode_value(decoder)
+            continue
+
+        buffer.expect('[')
+        while True:
+            char = buffer.peek()
+            if char == ']':
+                return
+            if char == ',':
+                buffer.pos += 1
+                continue
+            if char == '':
+                raise ValueError("JSONの形式が不正です: 配列が閉じられていません")
+            yield buffer.decode_value(decoder)
+
+
+class Record:
+    """取得した列のみを保持するレコードの基底クラス（サブクラスの __slots__ が取得する列になる）"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_entity(cls, entity):
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, entity.get(name))
+        return record
+
+    def get(self, name, default=None):
+        """dict と同じ使い方ができるように、値がない列は default を返す"""
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class UserRecord(Record):
+    """UsersTable のレコード（passwordHash は取得しない）"""
+
+    __slots__ = ('PartitionKey', 'RowKey', 'username', 'email', 'firstName', 'lastName',
+                 'role', 'isActive', 'createdAt', 'updatedAt')
+
+
+class GroupRecord(Record):
+    """GroupsTable のレコード"""
+
+    __slots__ = ('PartitionKey', 'RowKey', 'name', 'description', 'createdAt', 'updatedAt')
+
+
+class ProductionRecord(Record):
+    """ProductionTable のレコード（集計・検証に使う列）"""
+
+    __slots__ = ('PartitionKey', 'RowKey', 'productionId', 'groupId', 'userId', 'date', 'year', 'yearMonth',
+                 'materialType', 'materialAmount', 'charcoalProduced', 'charcoalVolume', 'co2Reduction',
+                 'extinguishingMethod')
+
+
+def iter_table_entities(open_url, table_url, record_cls=None, filter=None, page_size=MAX_PAGE_SIZE):
+    """
+    テーブルのクエリ結果を継続トークンをたどりながら1件ずつ返す
+
+    Args:
+        open_url: URLを受け取り、HTTPレスポンス（read / headers を持つ）を返す関数（認証ヘッダーの付与は呼び出し側で行う）
+        table_url: テーブルのURL（例: http://127.0.0.1:10002/devstoreaccount1/UsersTable()）
+        record_cls: Record のサブクラス。指定した場合はその列のみを $select で取得し、レコードに変換する
+        filter: ODataフィルタ
+        page_size: 1ページの最大件数
+    """
+    params = {'$top': str(min(page_size, MAX_PAGE_SIZE))}
+    if filter:
+        params['$filter'] = filter
+    if record_cls is not None:
+        params['$select'] = ','.join(record_cls.__slots__)
+
+    continuation = {}
+    while True:
+        query = urllib.parse.urlencode({**params, **continuation}, quote_via=urllib.parse.quote)
+        with open_url(f"{table_url}?{query}") as response:
+            for entity in iter_json_array(response):
+                yield record_cls.from_entity(entity) if record_cls is not None else entity
+            next_partition_key = response.headers.get('x-ms-continuation-NextPartitionKey')
+            next_row_key = response.headers.get('x-ms-continuation-NextRowKey')
+
+        if not next_partition_key:
+            return
+        continuation = {'NextPartitionKey': next_partition_key}
+        if next_row_key:
+            continuation['NextRowKey'] = next_row_key
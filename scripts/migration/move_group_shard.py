@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+グループのシャード移動スクリプト
+
+グループの生産データを、割り当てられたストレージアカウント（シャード）から別のシャードへ移動します。
+（シャードの割り当ては src/utils/shardMap.ts を参照）
+
+移動するデータ:
+- ProductionTable: グループのパーティション（groupId / groupId_YYYY）と旧パーティション（Production）のグループの記録
+- ProductionSumTable: グループの行
+- ProductionRollupTable: グループのパーティション（全体合計 "_all" は移動元から減算し、移動先に加算）
+- dashboards コンテナ: グループのドキュメント（移動元から削除し、移動先ではAPIが初回のリクエストで作り直す）
+
+手順:
+1. ShardMapTable のグループの行を moving にする（APIはグループへの書き込みに503を返す）
+2. 各インスタンスの割り当てのキャッシュ（SHARD_MAP_REFRESH_MS）が切れるまで待つ
+3. 移動先へコピーし、"_all" を付け替える
+4. 割り当てを移動先に切り替える（active）
+5. キャッシュが切れるまで待ってから、移動元のデータを削除する
+6. ランキングの世代スタンプを更新する
+
+- 全シャードを走査するAPI（ランキング・レポートなど）は、割り当て先でないシャードの行を数えないため、コピー中も二重に数えません
+- コピーは upsert のため、途中で失敗した場合は同じコマンドを再実行できます
+- "_all" の付け替えは行ごとに、差分と進捗の行（RowKey = "~move_<moveId>_<add|sub>_<RowKey>"）を同じ "_all" パーティションへ
+  1つのトランザクションで書き込むため、再実行・取り消しで同じ行を二重に付け替えません（進捗の行は割り当ての切り替え後に削除します）
+- グループのパーティションに保留中の差分の行（"~pending_"）がある間は、ApplyRollupDeltasTimer が加算するのを待ってからコピーします
+- 失敗が続く場合は --abort で割り当てを移動元に戻し、CreateProductionSum を実行して集計を作り直してください
+
+使用方法:
+1. 接続文字列を設定（APIの PRODUCTION_SHARDS と同じ形式）
+   export AZURE_STORAGE_CONNECTION_STRING='...'          # primary（ShardMapTable のあるアカウント）
+   export PRODUCTION_SHARDS='shard2=SHARD2_STORAGE'
+   export SHARD2_STORAGE='...'
+2. 割り当ての一覧
+   python move_group_shard.py --list
+3. 件数の確認（書き込みなし）
+   python move_group_shard.py --group-id <groupId> --to shard2 --dry-run
+4. 移動の実行
+   python move_group_shard.py --group-id <groupId> --to shard2
+5. 中断した移動を取り消す（割り当てを移動元に戻す）
+   python move_group_shard.py --group-id <groupId> --abort
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.data.tables import TableClient, UpdateMode
+from azure.storage.blob import BlobServiceClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import AdaptiveLimiter, RetryPolicy
+
+# primary の接続文字列（ShardMapTable・ランキングの世代スタンプ）
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+PRIMARY_SHARD_NAME = 'primary'
+
+SHARD_MAP_TABLE_NAME = 'ShardMapTable'
+SHARD_MAP_PARTITION_KEY = 'ShardMap'
+PRODUCTION_TABLE_NAME = 'ProductionTable'
+PRODUCTION_SUM_TABLE_NAME = 'ProductionSumTable'
+ROLLUP_TABLE_NAME = 'ProductionRollupTable'
+META_TABLE_NAME = 'ProductionSumMetaTable'
+DASHBOARD_CONTAINER_NAME = 'dashboards'
+LEGACY_PARTITION_KEY = 'Production'
+ALL_GROUPS_PARTITION_KEY = '_all'
+
+# APIの割り当てのキャッシュの有効期限（SHARD_MAP_REFRESH_MS の既定値）の2倍に余裕を加えた待ち時間
+DEFAULT_WAIT_SECONDS = 65
+
+# エンティティグループトランザクションの上限件数
+MAX_BATCH_SIZE = 100
+
+# "_all" の付け替えで ETag が競合した場合の再試行回数（超えた場合も付け替え済みの行は進捗の行でわかるため、再実行できる）
+MAX_UPDATE_ATTEMPTS = 5
+
+# "_all" の付け替えの進捗の行の RowKey の接頭辞（"~" は期間別集計の RowKey（D_ / M_ / Y_）より後に並ぶため、期間の範囲の検索には含まれない）
+MOVE_MARKER_PREFIX = '~move_'
+# 進捗の行にのみある列（"_all" の行を作り直すときは除く）
+MARKER_COLUMNS = ('target', 'movedGroupId', 'applied', 'createdAt')
+
+# 保留中の差分の行の RowKey の接頭辞（src/utils/productionRollups.ts の PENDING_DELTA_PREFIX）
+PENDING_DELTA_PREFIX = '~pending_'
+# 保留中の差分が加算されるのを待つ時間（ApplyRollupDeltasTimer は1分ごとに実行される）
+PENDING_DELTA_WAIT_SECONDS = 300
+PENDING_DELTA_POLL_SECONDS = 15
+
+ROLLUP_VALUE_COLUMNS = ['materialAmount', 'charcoalProduced', 'charcoalVolume', 'co2Reduction', 'count']
+
+
+def load_shards():
+    """シャード名 → 接続文字列（APIと同じ PRODUCTION_SHARDS の形式）"""
+    shards = {PRIMARY_SHARD_NAME: CONNECTION_STRING}
+    for pair in (os.getenv('PRODUCTION_SHARDS') or '').split(','):
+        if '=' not in pair:
+            continue
+        name, setting = (part.strip() for part in pair.split('=', 1))
+        if not name or not setting or name == PRIMARY_SHARD_NAME:
+            continue
+        connection_string = os.getenv(setting)
+        if not connection_string:
+            print(f"❌ エラー: シャード {name} の接続文字列（{setting} 環境変数）が設定されていません")
+            sys.exit(1)
+        shards[name] = connection_string
+    return shards
+
+
+def escape(value):
+    """OData文字列リテラル用にシングルクォートをエスケープ"""
+    return value.replace("'", "''")
+
+
+def production_filters(group_id):
+    """グループの生産記録のフィルタ（group / groupYear / 旧パーティション、キー体系に関係なくすべて検索する）"""
+    escaped = escape(group_id)
+    return [
+        f"PartitionKey eq '{escaped}'",
+        # groupId_0000 〜 groupId_9999 の範囲（':' は '9' の次の文字）
+        f"PartitionKey ge '{escaped}_0' and PartitionKey lt '{escaped}_:'",
+        f"PartitionKey eq '{LEGACY_PARTITION_KEY}' and groupId eq '{escaped}'",
+    ]
+
+
+def to_number(value):
+    """数値列の値を float に変換（値がない・解釈できない場合は0）"""
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return parsed if parsed == parsed else 0.0
+
+
+class GroupMove:
+    """1つのグループの移動"""
+
+    def __init__(self, shards, group_id, limiter, retry, dry_run=False):
+        self.shards = shards
+        self.group_id = group_id
+        self.limiter = limiter
+        self.retry = retry
+        self.dry_run = dry_run
+        self.map_client = TableClient.from_connection_string(shards[PRIMARY_SHARD_NAME], SHARD_MAP_TABLE_NAME)
+        self.counts = defaultdict(int)
+
+    def table(self, shard, table_name, write=False):
+        # 書き込みはSDKの再試行を無効にし、RetryPolicy でスロットリングを検知して同時実行数を調整する
+        options = {'retry_total': 0} if write else {}
+        return TableClient.from_connection_string(self.shards[shard], table_name, **options)
+
+    # ------------------------------------------------------------------
+    # 割り当て
+    # ------------------------------------------------------------------
+
+    def read_assignment(self):
+        """割り当ての行（ない場合はNone）"""
+        try:
+            return self.map_client.get_entity(SHARD_MAP_PARTITION_KEY, self.group_id)
+        except ResourceNotFoundError:
+            return None
+
+    def write_assignment(self, entity):
+        entity = dict(entity)
+        entity['PartitionKey'] = SHARD_MAP_PARTITION_KEY
+        entity['RowKey'] = self.group_id
+        entity['updatedAt'] = datetime.now(timezone.utc).isoformat()
+        self.retry.call(self.map_client.upsert_entity, entity, mode=UpdateMode.REPLACE)
+
+    # ------------------------------------------------------------------
+    # コピー・削除
+    # ------------------------------------------------------------------
+
+    def _submit_batches(self, client, operations_by_partition, label):
+        """パーティションごとに最大100件のトランザクションを並列に送信"""
+        batches = []
+        for operations in operations_by_partition.values():
+            for i in range(0, len(operations), MAX_BATCH_SIZE):
+                batches.append(operations[i:i + MAX_BATCH_SIZE])
+        if self.dry_run or not batches:
+            return
+
+        failed = []
+
+        def send(batch):
+            try:
+                self.retry.call(client.submit_transaction, batch)
+            except Exception as e:
+                print(f"❌ {label}失敗 (PartitionKey={batch[0][1]['PartitionKey']}, {len(batch)}件): {e}")
+                failed.append(batch)
+
+        with ThreadPoolExecutor(max_workers=self.limiter.maximum) as executor:
+            for batch in batches:
+                self.limiter.acquire()
+                executor.submit(send, batch).add_done_callback(lambda _: self.limiter.release())
+
+        if failed:
+            raise RuntimeError(f"{label}に失敗したバッチがあります（{len(failed)}件）。再実行してください")
+
+    def _query(self, client, filters):
+        for query_filter in filters:
+            try:
+                yield from client.query_entities(query_filter, results_per_page=1000)
+            except ResourceNotFoundError:
+                # テーブルがない場合は対象なし
+                return
+
+    def _group_entities(self, shard):
+        """移動するテーブルごとのエンティティ（テーブル名 → エンティティの一覧）"""
+        escaped = escape(self.group_id)
+        return {
+            PRODUCTION_TABLE_NAME: list(self._query(self.table(shard, PRODUCTION_TABLE_NAME), production_filters(self.group_id))),
+            PRODUCTION_SUM_TABLE_NAME: list(self._query(self.table(shard, PRODUCTION_SUM_TABLE_NAME), [f"groupId eq '{escaped}'"])),
+            ROLLUP_TABLE_NAME: list(self._query(self.table(shard, ROLLUP_TABLE_NAME), [f"PartitionKey eq '{escaped}'"])),
+        }
+
+    def copy(self, source, target):
+        """移動元のグループのデータを移動先へupsert"""
+        for table_name, entities in self._group_entities(source).items():
+            self.counts[f"copy:{table_name}"] = len(entities)
+            if not self.dry_run and entities:
+                try:
+                    self.table(target, table_name).create_table()
+                except ResourceExistsError:
+                    pass
+            operations = defaultdict(list)
+            for entity in entities:
+                operations[entity['PartitionKey']].append(('upsert', dict(entity), {'mode': 'replace'}))
+            self._submit_batches(self.table(target, table_name, write=True), operations, f"{table_name} のコピー")
+            print(f"  📋 {table_name}: {len(entities)}件{'（予定）' if self.dry_run else ''}")
+
+    def delete_source(self, source):
+        """移動元のグループのデータとダッシュボードのドキュメントを削除"""
+        for table_name, entities in self._group_entities(source).items():
+            self.counts[f"delete:{table_name}"] = len(entities)
+            operations = defaultdict(list)
+            for entity in entities:
+                operations[entity['PartitionKey']].append(
+                    ('delete', {'PartitionKey': entity['PartitionKey'], 'RowKey': entity['RowKey']}))
+            self._submit_batches(self.table(source, table_name, write=True), operations, f"{table_name} の削除")
+            print(f"  🗑️ {table_name}: {len(entities)}件{'（予定）' if self.dry_run else ''}")
+
+        if self.dry_run:
+            return
+        blob_name = f"{quote(self.group_id, safe='')}.json"
+        try:
+            BlobServiceClient.from_connection_string(self.shards[source]) \
+                .get_blob_client(DASHBOARD_CONTAINER_NAME, blob_name).delete_blob()
+            print(f"  🗑️ {DASHBOARD_CONTAINER_NAME}/{blob_name}")
+        except ResourceNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # 全体合計（"_all"）の付け替え
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _marker_key(move_id, direction, row_key):
+        return f"{MOVE_MARKER_PREFIX}{move_id}_{direction}_{row_key}"
+
+    @staticmethod
+    def _row_operations(current, row_key, delta, template):
+        """"_all" の1行に差分を加算する操作（件数が0以下になる行は削除、加算する行がない場合は空）"""
+        now = datetime.now(timezone.utc).isoformat()
+        if current is None:
+            if delta['count'] <= 0:
+                return []
+            entity = {k: v for k, v in template.items() if k not in MARKER_COLUMNS}
+            entity.update(delta)
+            entity['PartitionKey'] = ALL_GROUPS_PARTITION_KEY
+            entity['RowKey'] = row_key
+            entity['groupId'] = ALL_GROUPS_PARTITION_KEY
+            entity['updatedAt'] = now
+            return [('create', entity)]
+        condition = {'etag': current.metadata['etag'], 'match_condition': MatchConditions.IfNotModified}
+        count = to_number(current.get('count')) + delta['count']
+        if count <= 0:
+            return [('delete', {'PartitionKey': ALL_GROUPS_PARTITION_KEY, 'RowKey': row_key}, condition)]
+        entity = dict(current)
+        for column in ROLLUP_VALUE_COLUMNS:
+            entity[column] = to_number(current.get(column)) + delta[column]
+        entity['count'] = count
+        entity['updatedAt'] = now
+        return [('update', entity, dict(condition, mode=UpdateMode.REPLACE))]
+
+    def _get_or_none(self, client, row_key):
+        try:
+            return client.get_entity(ALL_GROUPS_PARTITION_KEY, row_key)
+        except ResourceNotFoundError:
+            return None
+
+    def _apply_all_delta(self, client, marker_key, row_key, delta, template):
+        """"_all" の1行に差分を加算し、同じトランザクションで進捗の行を作成（進捗の行がある場合は付け替え済み）"""
+        for attempt in range(1, MAX_UPDATE_ATTEMPTS + 1):
+            if self._get_or_none(client, marker_key) is not None:
+                return False
+            operations = self._row_operations(self._get_or_none(client, row_key), row_key, delta, template)
+            # 取り消しで "_all" の行を作り直せるよう、期間・原料種別などの列と差分を進捗の行に残す
+            marker = {k: v for k, v in template.items() if k not in ('updatedAt',)}
+            marker.update(delta)
+            marker.update({
+                'PartitionKey': ALL_GROUPS_PARTITION_KEY,
+                'RowKey': marker_key,
+                'groupId': ALL_GROUPS_PARTITION_KEY,
+                'target': row_key,
+                'movedGroupId': self.group_id,
+                'applied': bool(operations),
+                'createdAt': datetime.now(timezone.utc).isoformat(),
+            })
+            try:
+                self.retry.call(client.submit_transaction, operations + [('create', marker)])
+                return True
+            except Exception as e:
+                # 409（同時に作成された・進捗の行が既にある）/ 412（ETag不一致）は読み直して再試行
+                if getattr(e, 'status_code', None) not in (409, 412) or attempt >= MAX_UPDATE_ATTEMPTS:
+                    raise
+
+    def _undo_all_delta(self, client, marker):
+        """進捗の行の差分を "_all" から戻し、同じトランザクションで進捗の行を削除"""
+        row_key = marker['target']
+        delta = {column: -to_number(marker.get(column)) for column in ROLLUP_VALUE_COLUMNS}
+        for attempt in range(1, MAX_UPDATE_ATTEMPTS + 1):
+            current_marker = self._get_or_none(client, marker['RowKey'])
+            if current_marker is None:
+                return
+            operations = []
+            if current_marker.get('applied', True):
+                operations = self._row_operations(self._get_or_none(client, row_key), row_key, delta, current_marker)
+            operations.append(('delete', {'PartitionKey': ALL_GROUPS_PARTITION_KEY, 'RowKey': marker['RowKey']},
+                               {'etag': current_marker.metadata['etag'], 'match_condition': MatchConditions.IfNotModified}))
+            try:
+                self.retry.call(client.submit_transaction, operations)
+                return
+            except Exception as e:
+                if getattr(e, 'status_code', None) not in (409, 412) or attempt >= MAX_UPDATE_ATTEMPTS:
+                    raise
+
+    def _markers(self, shard, move_id):
+        """移動の進捗の行の一覧"""
+        prefix = f"{MOVE_MARKER_PREFIX}{move_id}_"
+        return list(self._query(self.table(shard, ROLLUP_TABLE_NAME), [
+            f"PartitionKey eq '{ALL_GROUPS_PARTITION_KEY}' and RowKey ge '{prefix}' and RowKey lt '{prefix}~'"]))
+
+    def move_all_rollups(self, source, target, move_id):
+        """グループの期間別集計の値を、移動元の "_all" から減算し、移動先の "_all" に加算（付け替え済みの行は飛ばす）"""
+        # 期間別集計の行のみ（"~" で始まる保留行などは除く）
+        rows = list(self._query(self.table(source, ROLLUP_TABLE_NAME),
+                                [f"PartitionKey eq '{escape(self.group_id)}' and RowKey lt '~'"]))
+        self.counts['allRollupRows'] = len(rows)
+        if self.dry_run:
+            print(f"  ➗ \"{ALL_GROUPS_PARTITION_KEY}\" の付け替え: {len(rows)}行（予定）")
+            return
+
+        source_client = self.table(source, ROLLUP_TABLE_NAME)
+        target_client = self.table(target, ROLLUP_TABLE_NAME)
+        applied = 0
+        for row in rows:
+            row_key = row['RowKey']
+            delta = {column: to_number(row.get(column)) for column in ROLLUP_VALUE_COLUMNS}
+            if self._apply_all_delta(source_client, self._marker_key(move_id, 'sub', row_key), row_key,
+                                     {k: -v for k, v in delta.items()}, row):
+                applied += 1
+            if self._apply_all_delta(target_client, self._marker_key(move_id, 'add', row_key), row_key, delta, row):
+                applied += 1
+        self.counts['allRollupDeltas'] = applied
+        print(f"  ➗ \"{ALL_GROUPS_PARTITION_KEY}\" の付け替え: {len(rows)}行（今回の適用: {applied}件）")
+
+    def wait_for_pending_deltas(self, shard):
+        """グループのパーティションの保留中の差分が加算されるまで待つ（待っても残る場合はFalse）"""
+        escaped = escape(self.group_id)
+        query_filter = (f"PartitionKey eq '{escaped}' and RowKey ge '{PENDING_DELTA_PREFIX}'"
+                        f" and RowKey lt '{PENDING_DELTA_PREFIX[:-1]}`'")
+        deadline = time.monotonic() + PENDING_DELTA_WAIT_SECONDS
+        while True:
+            pending = len(list(self._query(self.table(shard, ROLLUP_TABLE_NAME), [query_filter])))
+            if pending == 0:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            print(f"  ⏳ 保留中の差分が{pending}行あります。加算されるのを待っています")
+            time.sleep(PENDING_DELTA_POLL_SECONDS)
+
+    def undo_all_rollups(self, source, target, move_id):
+        """進捗の行が残っている付け替えを両方のシャードで戻す"""
+        undone = 0
+        for shard in (source, target):
+            client = self.table(shard, ROLLUP_TABLE_NAME)
+            for marker in self._markers(shard, move_id):
+                self._undo_all_delta(client, marker)
+                undone += 1
+        print(f"  ↩️ \"{ALL_GROUPS_PARTITION_KEY}\" の付け替えの取り消し: {undone}件")
+
+    def remove_markers(self, shards, move_id):
+        """割り当ての切り替え後に、移動の進捗の行を削除"""
+        for shard in shards:
+            operations = {ALL_GROUPS_PARTITION_KEY: [
+                ('delete', {'PartitionKey': ALL_GROUPS_PARTITION_KEY, 'RowKey': marker['RowKey']})
+                for marker in self._markers(shard, move_id)]}
+            self._submit_batches(self.table(shard, ROLLUP_TABLE_NAME, write=True), operations, "進捗の行の削除")
+
+    # ------------------------------------------------------------------
+
+    def bump_ranking_generation(self):
+        """ランキングのスナップショットを再読み込みさせる（src/utils/rankingSnapshot.ts と同じ形式）"""
+        client = TableClient.from_connection_string(self.shards[PRIMARY_SHARD_NAME], META_TABLE_NAME)
+        try:
+            client.create_table()
+        except ResourceExistsError:
+            pass
+        now = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        client.upsert_entity({
+            'PartitionKey': 'Meta',
+            'RowKey': 'generation',
+            'generation': f"{now}_{uuid.uuid4()}",
+            'reason': f"move_group_shard:{self.group_id}",
+            'updatedAt': now,
+        }, mode=UpdateMode.REPLACE)
+
+
+def wait_for_caches(seconds, message):
+    print(f"⏳ {message}（{seconds}秒）")
+    time.sleep(seconds)
+
+
+def move(group_move, target, wait_seconds, keep_source):
+    """グループを target へ移動（中断した移動の再開を含む）"""
+    assignment = group_move.read_assignment() or {}
+    source = assignment.get('shard') or PRIMARY_SHARD_NAME
+    status = assignment.get('status') or 'active'
+
+    if status == 'moving' and assignment.get('movingTo') != target:
+        print(f"❌ エラー: 別のシャード（{assignment.get('movingTo')}）への移動が中断されています。--abort で取り消してください")
+        sys.exit(1)
+    if status != 'moving' and source == target:
+        moved_from = assignment.get('movedFrom')
+        if moved_from and moved_from != target and not keep_source and not group_move.dry_run:
+            # 移動元の削除の前に中断した場合は、残っている移動元のデータと進捗の行を削除する
+            print(f"🧹 移動元（{moved_from}）に残っているデータを削除します")
+            if assignment.get('moveId'):
+                group_move.remove_markers([moved_from, target], assignment['moveId'])
+            group_move.delete_source(moved_from)
+            group_move.write_assignment({'shard': target, 'status': 'active'})
+        print(f"✅ グループ {group_move.group_id} は {target} に割り当てられています")
+        return
+
+    print(f"🚀 移動開始: {group_move.group_id} {source} → {target}{'（dry-run）' if group_move.dry_run else ''}")
+
+    if group_move.dry_run:
+        group_move.copy(source, target)
+        group_move.move_all_rollups(source, target, None)
+        return
+
+    # 1. 書き込みを止める（再開の場合は既に moving）
+    move_id = assignment.get('moveId') if status == 'moving' else None
+    if not move_id:
+        move_id = uuid.uuid4().hex
+        group_move.write_assignment({'shard': source, 'status': 'moving', 'movingTo': target, 'moveId': move_id,
+                                     'allRollupsMoved': bool(assignment.get('allRollupsMoved')) and status == 'moving'})
+    if status != 'moving':
+        wait_for_caches(wait_seconds, "各インスタンスの割り当てのキャッシュが切れるのを待っています")
+
+    # 2. コピーと "_all" の付け替え（付け替え済みの行は進捗の行で飛ばす）
+    if not group_move.wait_for_pending_deltas(source):
+        print("❌ エラー: 保留中の差分が加算されません。ApplyRollupDeltasTimer の実行を確認してから再実行してください")
+        sys.exit(1)
+    group_move.copy(source, target)
+    if not assignment.get('allRollupsMoved'):
+        group_move.move_all_rollups(source, target, move_id)
+        group_move.write_assignment({'shard': source, 'status': 'moving', 'movingTo': target,
+                                     'moveId': move_id, 'allRollupsMoved': True})
+
+    # 3. 割り当てを切り替える（移動元の削除が終わるまで movedFrom を残す）
+    group_move.write_assignment({'shard': target, 'status': 'active', 'movedFrom': source, 'moveId': move_id})
+    print(f"🔀 割り当てを {target} に切り替えました")
+    group_move.bump_ranking_generation()
+    # 取り消しができなくなったため、進捗の行は不要
+    group_move.remove_markers([source, target], move_id)
+
+    # 4. 移動元を削除（古い割り当てをキャッシュしているインスタンスが移動元を読まなくなってから）
+    if keep_source:
+        print(f"⚠️ 移動元（{source}）のデータを残しました。集計は割り当て先の行のみ数えるため重複はしません")
+        return
+    wait_for_caches(wait_seconds, "移動元を読むインスタンスがなくなるのを待っています")
+    group_move.delete_source(source)
+    group_move.write_assignment({'shard': target, 'status': 'active'})
+
+
+def abort(group_move):
+    """中断した移動を取り消し、割り当てを移動元に戻す（移動先のコピーは削除する）"""
+    assignment = group_move.read_assignment()
+    if not assignment or assignment.get('status') != 'moving':
+        print("✅ 移動中ではありません")
+        return
+    source = assignment.get('shard') or PRIMARY_SHARD_NAME
+    target = assignment.get('movingTo')
+    print(f"↩️ 移動の取り消し: {group_move.group_id} {source} ← {target}")
+    if assignment.get('moveId') and target:
+        # "_all" を元に戻す（付け替えた行ごとの進捗の行の差分を戻す）
+        group_move.undo_all_rollups(source, target, assignment['moveId'])
+    if target:
+        group_move.delete_source(target)
+    group_move.write_assignment({'shard': source, 'status': 'active'})
+    group_move.bump_ranking_generation()
+
+
+def list_assignments(shards):
+    client = TableClient.from_connection_string(shards[PRIMARY_SHARD_NAME], SHARD_MAP_TABLE_NAME)
+    counts = defaultdict(int)
+    try:
+        for entity in client.query_entities(f"PartitionKey eq '{SHARD_MAP_PARTITION_KEY}'"):
+            counts[entity.get('shard')] += 1
+            status = entity.get('status') or 'active'
+            moving = f" → {entity.get('movingTo')}" if status == 'moving' else ''
+            print(f"  {entity['RowKey']}: {entity.get('shard')} ({status}{moving})")
+    except ResourceNotFoundError:
+        pass
+    print("=" * 50)
+    for name in shards:
+        print(f"{name}: {counts.get(name, 0)}グループ（割り当てのないグループは {PRIMARY_SHARD_NAME}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='グループの生産データを別のストレージアカウント（シャード）へ移動します')
+    parser.add_argument('--group-id', help='移動するグループID')
+    parser.add_argument('--to', help='移動先のシャード名（primary または PRODUCTION_SHARDS のシャード名）')
+    parser.add_argument('--wait', type=int, default=DEFAULT_WAIT_SECONDS,
+                        help='割り当ての変更後に各インスタンスのキャッシュが切れるのを待つ秒数')
+    parser.add_argument('--workers', type=int, default=8, help='並列に送信するバッチ数の初期値')
+    parser.add_argument('--max-workers', type=int, default=32, help='並列に送信するバッチ数の上限')
+    parser.add_argument('--keep-source', action='store_true', help='移動後も移動元のデータを残す')
+    parser.add_argument('--abort', action='store_true', help='中断した移動を取り消す')
+    parser.add_argument('--list', action='store_true', help='割り当ての一覧を表示する')
+    parser.add_argument('--dry-run', action='store_true', help='書き込みを行わず件数のみ表示する')
+    args = parser.parse_args()
+
+    if not CONNECTION_STRING:
+        print("❌ エラー: AZURE_STORAGE_CONNECTION_STRING 環境変数が設定されていません")
+        sys.exit(1)
+
+    shards = load_shards()
+    if args.list:
+        list_assignments(shards)
+        return
+    if not args.group_id or (not args.abort and not args.to):
+        parser.error('--group-id と --to（または --abort）を指定してください')
+    if args.to and args.to not in shards:
+        print(f"❌ エラー: シャード {args.to} は設定されていません（{', '.join(shards)}）")
+        sys.exit(1)
+
+    limiter = AdaptiveLimiter(initial=args.workers, maximum=max(args.workers, args.max_workers))
+    retry = RetryPolicy(limiter=limiter)
+    group_move = GroupMove(shards, args.group_id, limiter, retry, dry_run=args.dry_run)
+    started = datetime.now()
+
+    try:
+        if args.abort:
+            abort(group_move)
+        else:
+            move(group_move, args.to, args.wait, args.keep_source)
+    except Exception as e:
+        print(f"❌ 移動に失敗しました: {e}")
+        print("⚠️ 同じコマンドを再実行すると続きから再開します（--abort で取り消し）")
+        sys.exit(1)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print("=" * 50)
+    print(retry.format_stats())
+    print(f"所要時間: {elapsed:.1f}秒")
+    print("✅ 完了しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+ProductionTable 再パーティション移行スクリプト
+
+旧キー体系（PartitionKey = "Production"、RowKey = uuid）の生産記録を、
+新キー体系（PartitionKey = groupId または groupId_YYYY、RowKey = YYYYMMDD_uuid）へコピーします。
+
+- 新パーティションごとに最大100件のエンティティグループトランザクションでupsertします
+- 複数のバッチを並列に送信します（同時実行数はスロットリングの状況に応じて自動調整）
+- 一時的なエラー（503 ServerBusy、500 OperationTimedOut、接続エラーなど）はバックオフして再試行します
+- APIは移行期間中、旧パーティションも併読します（PRODUCTION_DUAL_READ=true）
+  コピーが完了したバッチから旧エンティティを削除するため、移行中もAPIから記録が欠けることはありません
+- 再実行しても安全です（upsertのため、同じ記録は上書きされます）
+
+使用方法:
+1. Azure Storage接続文字列を設定
+   export AZURE_STORAGE_CONNECTION_STRING='...'
+2. 件数の確認（書き込みなし）
+   python repartition_production_table.py --dry-run
+3. 移行の実行
+   python repartition_production_table.py --scheme group --workers 8 --max-workers 64
+4. 旧パーティションを残したまま移行する場合（後で --delete-source-only で削除）
+   python repartition_production_table.py --keep-source
+5. 移行完了後、APIの設定で PRODUCTION_DUAL_READ=false にして併読を終了
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from azure.data.tables import TableClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import AdaptiveLimiter, RetryPolicy
+
+# Azure Storage接続文字列
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+TABLE_NAME = 'ProductionTable'
+LEGACY_PARTITION_KEY = 'Production'
+
+# エンティティグループトランザクションの上限件数
+MAX_BATCH_SIZE = 100
+
+
+def to_date_prefix(date_value):
+    """生産日からRowKeyの日付プレフィックス（YYYYMMDD）を生成（src/utils/productionKeys.ts と同じ規則）"""
+    match = re.match(r'^(\d{4})-(\d{2})-(\d{2})', str(date_value or ''))
+    if match:
+        return f"{match.group(1)}{match.group(2)}{match.group(3)}"
+    try:
+        parsed = datetime.fromisoformat(str(date_value).replace('Z', '+00:00'))
+        return parsed.strftime('%Y%m%d')
+    except ValueError:
+        return '00000000'
+
+
+def create_new_keys(entity, scheme):
+    """旧エンティティから新しいPartitionKey/RowKeyを生成"""
+    production_id = entity.get('productionId') or entity['RowKey']
+    date_prefix = to_date_prefix(entity.get('date'))
+    group_id = entity.get('groupId')
+    if scheme == 'groupYear':
+        partition_key = f"{group_id}_{date_prefix[:4]}"
+    else:
+        partition_key = group_id
+    return partition_key, f"{date_prefix}_{production_id}", production_id
+
+
+class Stats:
+    """スレッド間で共有する進捗カウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.read = 0
+        self.copied = 0
+        self.deleted = 0
+        self.skipped = 0
+        self.failed_batches = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+def copy_batch(table_client, partition_key, items, keep_source, stats, retry):
+    """1パーティション分（最大100件）をupsertし、成功したら旧エンティティを削除"""
+    operations = []
+    for source, new_row_key, production_id in items:
+        entity = dict(source)
+        entity['PartitionKey'] = partition_key
+        entity['RowKey'] = new_row_key
+        entity['productionId'] = production_id
+        operations.append(('upsert', entity, {'mode': 'replace'}))
+
+    try:
+        retry.call(table_client.submit_transaction, operations)
+    except Exception as e:
+        print(f"❌ コピー失敗 (PartitionKey={partition_key}, {len(items)}件): {e}")
+        stats.add(failed_batches=1)
+        return
+
+    stats.add(copied=len(items))
+
+    if keep_source:
+        return
+
+    # 旧エンティティはすべて同じパーティションのため、まとめて削除できる
+    delete_operations = [
+        ('delete', {'PartitionKey': source['PartitionKey'], 'RowKey': source['RowKey']})
+        for source, _, _ in items
+    ]
+    try:
+        retry.call(table_client.submit_transaction, delete_operations)
+        stats.add(deleted=len(items))
+    except Exception as e:
+        # コピーは完了しているため、旧エンティティは --delete-source-only で後から削除できる
+        print(f"⚠️ 旧エンティティの削除失敗 (PartitionKey={partition_key}, {len(items)}件): {e}")
+
+
+def delete_source_only(table_client, write_client, scheme, limiter, retry, stats):
+    """コピー済み（新パーティションに存在する）旧エンティティのみを削除"""
+    batch = []
+
+    def flush(entities):
+        operations = [('delete', {'PartitionKey': e['PartitionKey'], 'RowKey': e['RowKey']}) for e in entities]
+        try:
+            retry.call(write_client.submit_transaction, operations)
+            stats.add(deleted=len(entities))
+        except Exception as e:
+            print(f"❌ 削除失敗 ({len(entities)}件): {e}")
+            stats.add(failed_batches=1)
+
+    def submit(executor, entities):
+        # 同時実行数の上限に達している場合は、空きが出るまで読み込みを止める
+        limiter.acquire()
+        executor.submit(flush, entities).add_done_callback(lambda _: limiter.release())
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+        for entity in table_client.query_entities(f"PartitionKey eq '{LEGACY_PARTITION_KEY}'", results_per_page=1000):
+            stats.add(read=1)
+            if not entity.get('groupId'):
+                stats.add(skipped=1)
+                continue
+            partition_key, row_key, _ = create_new_keys(entity, scheme)
+            try:
+                table_client.get_entity(partition_key, row_key, select=['RowKey'])
+            except Exception:
+                # 未コピーの記録は削除しない
+                stats.add(skipped=1)
+                continue
+
+            batch.append(entity)
+            if len(batch) >= MAX_BATCH_SIZE:
+                submit(executor, batch)
+                batch = []
+
+        if batch:
+            submit(executor, batch)
+
+
+def migrate(table_client, write_client, scheme, limiter, retry, keep_source, dry_run, stats):
+    """旧パーティションを読み込み、新パーティションごとにバッチを組んで並列にコピー"""
+    buckets = defaultdict(list)
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+        def submit(partition_key, items):
+            if dry_run:
+                stats.add(copied=len(items))
+                return
+            # 読み込みが書き込みより先行しすぎないよう、同時実行数の上限に達している場合は空きが出るまで待つ
+            limiter.acquire()
+            future = executor.submit(copy_batch, write_client, partition_key, items, keep_source, stats, retry)
+            future.add_done_callback(lambda _: limiter.release())
+
+        for entity in table_client.query_entities(f"PartitionKey eq '{LEGACY_PARTITION_KEY}'", results_per_page=1000):
+            stats.add(read=1)
+            if not entity.get('groupId'):
+                # groupIdのない記録は移行先が決まらないため旧パーティションに残す
+                print(f"⚠️ groupIdがないためスキップ: RowKey={entity['RowKey']}")
+                stats.add(skipped=1)
+                continue
+
+            partition_key, row_key, production_id = create_new_keys(entity, scheme)
+            bucket = buckets[partition_key]
+            bucket.append((entity, row_key, production_id))
+            if len(bucket) >= MAX_BATCH_SIZE:
+                submit(partition_key, buckets.pop(partition_key))
+
+            if stats.read % 1000 == 0:
+                print(f"  ... {stats.read}件読み込み / {stats.copied}件コピー済み")
+
+        for partition_key, items in list(buckets.items()):
+            submit(partition_key, items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProductionTableを groupId 単位のパーティションへ移行します')
+    parser.add_argument('--scheme', choices=['group', 'groupYear'], default='group',
+                        help='新しいキー体系（APIの PRODUCTION_KEY_SCHEME と合わせる）')
+    parser.add_argument('--workers', type=int, default=8, help='並列に送信するバッチ数の初期値（スロットリングの状況に応じて自動調整）')
+    parser.add_argument('--max-workers', type=int, default=64, help='並列に送信するバッチ数の上限')
+    parser.add_argument('--keep-source', action='store_true', help='コピー後も旧パーティションのエンティティを残す')
+    parser.add_argument('--delete-source-only', action='store_true', help='コピー済みの旧エンティティのみを削除する')
+    parser.add_argument('--dry-run', action='store_true', help='書き込みを行わず件数のみ表示する')
+    args = parser.parse_args()
+
+    if not CONNECTION_STRING:
+        print("❌ エラー: AZURE_STORAGE_CONNECTION_STRING 環境変数が設定されていません")
+        sys.exit(1)
+
+    table_client = TableClient.from_connection_string(CONNECTION_STRING, TABLE_NAME)
+    # 書き込みはSDKの再試行を無効にし、RetryPolicy でスロットリングを検知して同時実行数を調整する
+    write_client = TableClient.from_connection_string(CONNECTION_STRING, TABLE_NAME, retry_total=0)
+    limiter = AdaptiveLimiter(initial=args.workers, maximum=max(args.workers, args.max_workers))
+    retry = RetryPolicy(limiter=limiter)
+    stats = Stats()
+    started = datetime.now()
+
+    print(f"🚀 移行開始: scheme={args.scheme}, workers={args.workers}〜{limiter.maximum}"
+          f"{', dry-run' if args.dry_run else ''}{', keep-source' if args.keep_source else ''}")
+
+    if args.delete_source_only:
+        delete_source_only(table_client, write_client, args.scheme, limiter, retry, stats)
+    else:
+        migrate(table_client, write_client, args.scheme, limiter, retry, args.keep_source, args.dry_run, stats)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print("=" * 50)
+    print(f"読み込み: {stats.read}件")
+    print(f"コピー{'（予定）' if args.dry_run else ''}: {stats.copied}件")
+    print(f"旧エンティティ削除: {stats.deleted}件")
+    print(f"スキップ: {stats.skipped}件")
+    print(f"失敗したバッチ: {stats.failed_batches}件")
+    print(retry.format_stats())
+    print(f"所要時間: {elapsed:.1f}秒")
+
+    if stats.failed_batches:
+        print("⚠️ 失敗したバッチがあります。再実行してください（upsertのため重複は発生しません）")
+        sys.exit(1)
+    print("✅ 移行が完了しました")
+
+
+if __name__ == '__main__':
+    main()
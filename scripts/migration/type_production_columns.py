@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+ProductionTable 型付き列 移行スクリプト
+
+旧形式の生産記録（数値列が文字列、year / yearMonth 列なし）を、APIが書き込む形式に変換します。
+（src/utils/productionColumns.ts と同じ規則）
+
+- materialAmount / charcoalProduced / charcoalVolume / charcoalScaleInput / co2Reduction を Edm.Double に変換
+- 生産日から year（例: 2025）と yearMonth（例: 202510）を Edm.Int32 で付与
+- パーティションごとに最大100件のエンティティグループトランザクションでmerge更新し、複数のバッチを並列に送信します
+  （同時実行数はスロットリングの状況に応じて自動調整し、一時的なエラーはバックオフして再試行します）
+- 読み込み時のETagを指定して更新するため、移行中にAPIから更新された記録は上書きしません
+  （そのバッチは失敗として数え、再実行で変換されます）
+- 変換済みの記録はスキップするため、再実行しても安全です
+
+使用方法:
+1. Azure Storage接続文字列を設定
+   export AZURE_STORAGE_CONNECTION_STRING='...'
+2. 件数の確認（書き込みなし）
+   python type_production_columns.py --dry-run
+3. 移行の実行
+   python type_production_columns.py --workers 8 --max-workers 64
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from azure.core import MatchConditions
+from azure.data.tables import TableClient, EntityProperty, EdmType
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import AdaptiveLimiter, RetryPolicy
+
+# Azure Storage接続文字列
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+TABLE_NAME = 'ProductionTable'
+
+# エンティティグループトランザクションの上限件数
+MAX_BATCH_SIZE = 100
+
+# Edm.Double で保存する数値列
+NUMERIC_FIELDS = ['materialAmount', 'charcoalProduced', 'charcoalVolume', 'charcoalScaleInput', 'co2Reduction']
+
+# 変換に必要な列のみ取得する
+SELECT = ['PartitionKey', 'RowKey', 'date', 'year', 'yearMonth'] + NUMERIC_FIELDS
+
+
+def to_year_month(date_value):
+    """生産日から yearMonth（YYYYMM）を生成（解釈できない場合はNone）"""
+    match = re.match(r'^(\d{4})-(\d{2})', str(date_value or ''))
+    if match:
+        return int(match.group(1) + match.group(2))
+    try:
+        parsed = datetime.fromisoformat(str(date_value).replace('Z', '+00:00'))
+        return parsed.year * 100 + parsed.month
+    except ValueError:
+        return None
+
+
+def to_double(value):
+    """数値列の値を float に変換（値がない・解釈できない場合はNone）"""
+    if value is None or value == '':
+        return None
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed == parsed and parsed not in (float('inf'), float('-inf')) else None
+
+
+def build_patch(entity):
+    """変換が必要な列のみを含むmerge用のエンティティを生成（変換不要の場合はNone）"""
+    patch = {}
+    for field in NUMERIC_FIELDS:
+        value = entity.get(field)
+        # Edm.Double の列は float で返る。文字列・Edm.Int32（int）の列を変換する
+        if value is None or isinstance(value, float):
+            continue
+        double = to_double(value)
+        if double is not None:
+            patch[field] = EntityProperty(double, EdmType.DOUBLE)
+
+    year_month = to_year_month(entity.get('date'))
+    if year_month is not None and entity.get('yearMonth') != year_month:
+        patch['yearMonth'] = EntityProperty(year_month, EdmType.INT32)
+        patch['year'] = EntityProperty(year_month // 100, EdmType.INT32)
+
+    if not patch:
+        return None
+    patch['PartitionKey'] = entity['PartitionKey']
+    patch['RowKey'] = entity['RowKey']
+    return patch
+
+
+class Stats:
+    """スレッド間で共有する進捗カウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.read = 0
+        self.converted = 0
+        self.skipped = 0
+        self.failed_batches = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+def update_batch(table_client, partition_key, items, stats, retry):
+    """1パーティション分（最大100件）をETag付きでmerge更新"""
+    operations = [
+        ('update', patch, {'mode': 'merge', 'etag': etag, 'match_condition': MatchConditions.IfNotModified})
+        for patch, etag in items
+    ]
+    try:
+        retry.call(table_client.submit_transaction, operations)
+        stats.add(converted=len(items))
+    except Exception as e:
+        # 1件でも更新されていればバッチ全体が失敗する。再実行すると変換されていない記録のみ処理される
+        print(f"❌ 変換失敗 (PartitionKey={partition_key}, {len(items)}件): {e}")
+        stats.add(failed_batches=1)
+
+
+def migrate(table_client, write_client, limiter, retry, dry_run, stats):
+    """テーブル全体を読み込み、パーティションごとにバッチを組んで並列に更新"""
+    buckets = defaultdict(list)
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+        def submit(partition_key, items):
+            if dry_run:
+                stats.add(converted=len(items))
+                return
+            # 読み込みが書き込みより先行しすぎないよう、同時実行数の上限に達している場合は空きが出るまで待つ
+            limiter.acquire()
+            future = executor.submit(update_batch, write_client, partition_key, items, stats, retry)
+            future.add_done_callback(lambda _: limiter.release())
+
+        for entity in table_client.list_entities(select=SELECT, results_per_page=1000):
+            stats.add(read=1)
+            patch = build_patch(entity)
+            if patch is None:
+                stats.add(skipped=1)
+                continue
+
+            partition_key = entity['PartitionKey']
+            bucket = buckets[partition_key]
+            bucket.append((patch, entity.metadata['etag']))
+            if len(bucket) >= MAX_BATCH_SIZE:
+                submit(partition_key, buckets.pop(partition_key))
+
+            if stats.read % 1000 == 0:
+                print(f"  ... {stats.read}件読み込み / {stats.converted}件変換済み")
+
+        for partition_key, items in list(buckets.items()):
+            submit(partition_key, items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProductionTableの数値列をEdm.Doubleに変換し、year/yearMonth列を付与します')
+    parser.add_argument('--workers', type=int, default=8, help='並列に送信するバッチ数の初期値（スロットリングの状況に応じて自動調整）')
+    parser.add_argument('--max-workers', type=int, default=64, help='並列に送信するバッチ数の上限')
+    parser.add_argument('--dry-run', action='store_true', help='書き込みを行わず件数のみ表示する')
+    args = parser.parse_args()
+
+    if not CONNECTION_STRING:
+        print("❌ エラー: AZURE_STORAGE_CONNECTION_STRING 環境変数が設定されていません")
+        sys.exit(1)
+
+    table_client = TableClient.from_connection_string(CONNECTION_STRING, TABLE_NAME)
+    # 書き込みはSDKの再試行を無効にし、RetryPolicy でスロットリングを検知して同時実行数を調整する
+    write_client = TableClient.from_connection_string(CONNECTION_STRING, TABLE_NAME, retry_total=0)
+    limiter = AdaptiveLimiter(initial=args.workers, maximum=max(args.workers, args.max_workers))
+    retry = RetryPolicy(limiter=limiter)
+    stats = Stats()
+    started = datetime.now()
+
+    print(f"🚀 変換開始: workers={args.workers}〜{limiter.maximum}{', dry-run' if args.dry_run else ''}")
+    migrate(table_client, write_client, limiter, retry, args.dry_run, stats)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print("=" * 50)
+    print(f"読み込み: {stats.read}件")
+    print(f"変換{'（予定）' if args.dry_run else ''}: {stats.converted}件")
+    print(f"変換済み・対象外: {stats.skipped}件")
+    print(f"失敗したバッチ: {stats.failed_batches}件")
+    print(retry.format_stats())
+    print(f"所要時間: {elapsed:.1f}秒")
+
+    if stats.failed_batches:
+        print("⚠️ 失敗したバッチがあります。再実行してください（変換済みの記録はスキップされます）")
+        sys.exit(1)
+    print("✅ 変換が完了しました")
+
+
+if __name__ == '__main__':
+    main()
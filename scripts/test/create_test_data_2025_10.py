@@ -136,24 +136,29 @@ def verify_test_data():
         table_client = TableClient.from_connection_string(CONNECTION_STRING, TABLE_NAME)
         
         # 2025年10月のデータを取得
+        # 検証に使う列のみを取得し、エンティティを保持せずに合計する
         entities = table_client.list_entities(
-            filter=f"PartitionKey eq '{PARTITION_KEY}'"
+            filter=f"PartitionKey eq '{PARTITION_KEY}'",
+            select=['date', 'bambooAmount', 'charcoalProduced', 'co2Reduction'],
+            results_per_page=1000
         )
         
-        october_2025_data = []
+        october_2025_count = 0
+        total_bamboo = 0.0
+        total_charcoal = 0.0
+        total_co2 = 0.0
         for entity in entities:
             if entity.get('date'):
                 date = datetime.fromisoformat(entity['date'].replace('Z', '+00:00'))
                 if date.year == 2025 and date.month == 10:
-                    october_2025_data.append(entity)
+                    october_2025_count += 1
+                    total_bamboo += float(entity.get('bambooAmount') or 0)
+                    total_charcoal += float(entity.get('charcoalProduced') or 0)
+                    total_co2 += float(entity.get('co2Reduction') or 0)
         
-        print(f"✅ 2025年10月のデータ: {len(october_2025_data)}件")
+        print(f"✅ 2025年10月のデータ: {october_2025_count}件")
         
-        if october_2025_data:
-            total_bamboo = sum(float(d.get('bambooAmount', 0)) for d in october_2025_data)
-            total_charcoal = sum(float(d.get('charcoalProduced', 0)) for d in october_2025_data)
-            total_co2 = sum(float(d.get('co2Reduction', 0)) for d in october_2025_data)
-            
+        if october_2025_count:
             print(f"📊 検証結果:")
             print(f"  - 竹材量: {total_bamboo} kg")
             print(f"  - 炭生産量: {total_charcoal} kg")
@@ -23,7 +23,11 @@ import urllib.parse
 import urllib.request
 import urllib.error
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import RetryPolicy
+from common.table_stream import iter_table_entities, GroupRecord
 
 # Azure Table Storage の設定
 AZURITE_ACCOUNT_NAME = "devstoreaccount1"
@@ -58,6 +62,7 @@ class AzureTableStorageClient:
         self.account_name = account_name
         self.account_key = account_key
         self.endpoint = endpoint
+        self.retry = RetryPolicy()
         
     def _generate_shared_key_auth(self, method: str, url: str, content_type: str = "application/json", content_length: int = 0) -> str:
         """Shared Key認証ヘッダーを生成"""
@@ -124,29 +129,29 @@ class AzureTableStorageClient:
             json_data = None
             content_length = 0
             
-        headers = self._get_auth_headers(method, url, content_length=content_length)
-        
-        if data:
-            headers["Content-Length"] = str(content_length)
-            
-        request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
-        
-        try:
+        def send() -> Dict[str, Any]:
+            # 再試行のたびに日時と署名を作り直す
+            headers = self._get_auth_headers(method, url, content_length=content_length)
+            if data:
+                headers["Content-Length"] = str(content_length)
+            request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
             with urllib.request.urlopen(request) as response:
                 response_data = response.read().decode('utf-8')
                 if response_data:
                     return json.loads(response_data)
                 return {}
+        
+        try:
+            # 一時的なエラー（503 ServerBusy、500 タイムアウト、接続エラーなど）はバックオフして再試行する
+            return self.retry.call(send)
         except urllib.error.HTTPError as e:
             error_data = e.read().decode('utf-8')
             print(f"HTTP エラー {e.code}: {error_data}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
         except Exception as e:
             print(f"リクエストエラー: {e}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
     
     def create_table_if_not_exists(self, table_name: str) -> bool:
@@ -199,16 +204,17 @@ class AzureTableStorageClient:
             print(f"グループ検索エラー: {e}")
             return None
     
-    def list_all_groups(self) -> list:
-        """すべてのグループを取得"""
+    def _open(self, url: str):
+        """GETリクエストを送信してレスポンスを返す（本文は呼び出し側でストリーミングで読み込む）"""
+        def send():
+            headers = self._get_auth_headers("GET", url)
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+        return self.retry.call(send)
+
+    def iter_groups(self) -> Iterator[GroupRecord]:
+        """すべてのグループを1件ずつ取得（表示に使う列のみ、ページ単位でストリーミング）"""
         url = f"{self.endpoint}/{self.account_name}/{TABLE_NAME}()"
-        
-        try:
-            response = self._make_request("GET", url)
-            return response.get('value', [])
-        except Exception as e:
-            print(f"グループ一覧取得エラー: {e}")
-            return []
+        return iter_table_entities(self._open, url, GroupRecord)
     
     def create_group(self, group_data: Dict[str, Any]) -> bool:
         """グループを作成"""
@@ -243,17 +249,22 @@ def main() -> bool:
 
     # 既存グループの確認と表示
     print("既存グループの確認中...")
-    existing_groups = client.list_all_groups()
-
-    if existing_groups:
-        print(f"既存グループ数: {len(existing_groups)}")
-        print("既存グループ一覧:")
-        for group in existing_groups:
+    existing_count = 0
+    try:
+        for group in client.iter_groups():
+            if existing_count == 0:
+                print("既存グループ一覧:")
+            existing_count += 1
             group_id = group.get('RowKey', 'N/A')
             name = group.get('name', 'N/A')
             description = group.get('description', 'N/A')
             created_at = group.get('createdAt', 'N/A')
             print(f"  📁 {name} ({group_id}) - {description} - 作成日: {created_at}")
+    except Exception as e:
+        print(f"グループ一覧取得エラー: {e}")
+
+    if existing_count:
+        print(f"既存グループ数: {existing_count}")
         print()
 
     # 各テストグループを確認・作成
@@ -4,17 +4,27 @@ Carbon Tracker API - テストユーザー作成スクリプト
 
 このスクリプトは、テスト用のユーザーアカウントを作成するためのものです。
 
+すでに登録されているユーザーは作成しません（何度実行しても同じ状態になります）。
+1. 既存ユーザーを1回の走査（表示に使う列のみ）で取得し、TEST_USERS と比べて作成するユーザーを決める（plan）
+2. 不足しているユーザーのみを1回のバッチ（Entity Group Transaction）で作成する（apply）
+パスワードのハッシュは common/password_hash_cache.py のローカルキャッシュを使うため、
+2回目以降はbcryptでのハッシュ化を行いません。すべて登録済みの場合はハッシュ化も書き込みも行いません。
+
 使用方法:
-    python create_test_user.py
+    python create_test_user.py              # 不足しているユーザーを作成
+    python create_test_user.py --plan       # 作成するユーザーの表示のみ（書き込みなし）
+    python create_test_user.py --no-cache   # ハッシュのキャッシュを使わない
 
 注意:
     - Azuriteが起動している必要があります
     - ローカル開発環境でのみ使用してください
 """
 
+import argparse
 import os
 import sys
 import json
+import time
 import uuid
 import hashlib
 import hmac
@@ -23,7 +33,12 @@ import urllib.parse
 import urllib.request
 import urllib.error
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import RetryPolicy
+from common.table_stream import iter_table_entities, UserRecord
+from common.password_hash_cache import PasswordHashCache
 
 # Azure Table Storage の設定
 AZURITE_ACCOUNT_NAME = "devstoreaccount1"
@@ -32,6 +47,9 @@ AZURITE_TABLE_ENDPOINT = "http://127.0.0.1:10002"
 TABLE_NAME = "UsersTable"
 PARTITION_KEY = "User"
 
+# 1回のバッチで作成できる最大件数（Entity Group Transaction の上限）
+MAX_BATCH_SIZE = 100
+
 # テスト用ユーザー情報
 TEST_USERS = [
     {
@@ -67,6 +85,7 @@ class AzureTableStorageClient:
         self.account_name = account_name
         self.account_key = account_key
         self.endpoint = endpoint
+        self.retry = RetryPolicy()
         
     def _generate_shared_key_auth(self, method: str, url: str, content_type: str = "application/json", content_length: int = 0) -> str:
         """Shared Key認証ヘッダーを生成"""
@@ -132,29 +151,29 @@ class AzureTableStorageClient:
             json_data = None
             content_length = 0
             
-        headers = self._get_auth_headers(method, url, content_length=content_length)
-        
-        if data:
-            headers["Content-Length"] = str(content_length)
-            
-        request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
-        
-        try:
+        def send() -> Dict[str, Any]:
+            # 再試行のたびに日時と署名を作り直す
+            headers = self._get_auth_headers(method, url, content_length=content_length)
+            if data:
+                headers["Content-Length"] = str(content_length)
+            request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
             with urllib.request.urlopen(request) as response:
                 response_data = response.read().decode('utf-8')
                 if response_data:
                     return json.loads(response_data)
                 return {}
+        
+        try:
+            # 一時的なエラー（503 ServerBusy、500 タイムアウト、接続エラーなど）はバックオフして再試行する
+            return self.retry.call(send)
         except urllib.error.HTTPError as e:
             error_data = e.read().decode('utf-8')
             print(f"HTTP エラー {e.code}: {error_data}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
         except Exception as e:
             print(f"リクエストエラー: {e}")
             print(f"リクエストURL: {url}")
-            print(f"リクエストヘッダー: {headers}")
             raise
 
     def create_table_if_not_exists(self, table_name: str) -> bool:
@@ -219,33 +238,17 @@ class AzureTableStorageClient:
             print(f"テーブル作成エラー: {e}")
             return False
     
-    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """メールアドレスでユーザーを検索"""
-        # URLエンコード（スペースも含めて適切にエンコード）
-        encoded_email = urllib.parse.quote(email, safe='')
-        filter_query = f"$filter=email eq '{encoded_email}'"
-        # クエリパラメータ全体をエンコード
-        encoded_query = urllib.parse.quote(filter_query, safe='=')
-        url = f"{self.endpoint}/{self.account_name}/{TABLE_NAME}()?{encoded_query}"
-        
-        try:
-            response = self._make_request("GET", url)
-            users = response.get('value', [])
-            return users[0] if users else None
-        except Exception as e:
-            print(f"ユーザー検索エラー: {e}")
-            return None
-    
-    def list_all_users(self) -> list:
-        """すべてのユーザーを取得"""
+    def _open(self, url: str):
+        """GETリクエストを送信してレスポンスを返す（本文は呼び出し側でストリーミングで読み込む）"""
+        def send():
+            headers = self._get_auth_headers("GET", url)
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+        return self.retry.call(send)
+
+    def iter_users(self) -> Iterator[UserRecord]:
+        """すべてのユーザーを1件ずつ取得（表示に使う列のみ、ページ単位でストリーミング）"""
         url = f"{self.endpoint}/{self.account_name}/{TABLE_NAME}()"
-        
-        try:
-            response = self._make_request("GET", url)
-            return response.get('value', [])
-        except Exception as e:
-            print(f"ユーザー一覧取得エラー: {e}")
-            return []
+        return iter_table_entities(self._open, url, UserRecord)
     
     def create_entity(self, table_name: str, entity: Dict[str, Any]) -> bool:
         """エンティティを作成"""
@@ -258,19 +261,100 @@ class AzureTableStorageClient:
             print(f"エンティティ作成エラー: {e}")
             return False
 
-def hash_password(password: str) -> str:
-    """パスワードをハッシュ化"""
-    try:
-        import bcrypt
-        # ソルトを生成してハッシュ化
-        salt = bcrypt.gensalt()
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return password_hash.decode('utf-8')
-    except ImportError:
-        raise ImportError("bcrypt ライブラリがインストールされていません")
+    def insert_batch(self, table_name: str, entities: List[Dict[str, Any]]) -> Tuple[bool, str]:
+        """
+        同じパーティションのエンティティを1回のバッチ（Entity Group Transaction）で作成
+
+        バッチは全件成功するか全件失敗するため、途中まで作成された状態にはなりません。
+        RowKey は呼び出し側で決めたものを再試行でも同じ本文で送るため、再試行で 409（既に存在する）が返った場合は
+        前回の送信が応答の前に反映されたものとして成功とみなします。
+        戻り値は (成功したか, 失敗した場合のエラー内容)
+        """
+        batch_boundary = f"batch_{uuid.uuid4()}"
+        changeset_boundary = f"changeset_{uuid.uuid4()}"
+        entity_url = f"{self.endpoint}/{self.account_name}/{table_name}"
+
+        lines = [f"--{batch_boundary}", f"Content-Type: multipart/mixed; boundary={changeset_boundary}", ""]
+        for entity in entities:
+            lines += [
+                f"--{changeset_boundary}",
+                "Content-Type: application/http",
+                "Content-Transfer-Encoding: binary",
+                "",
+                f"POST {entity_url} HTTP/1.1",
+                "Content-Type: application/json",
+                "Accept: application/json;odata=nometadata",
+                "Prefer: return-no-content",
+                "DataServiceVersion: 3.0;",
+                "",
+                json.dumps(entity),
+            ]
+        lines += [f"--{changeset_boundary}--", f"--{batch_boundary}--", ""]
+        body = "\r\n".join(lines).encode('utf-8')
+
+        url = f"{self.endpoint}/{self.account_name}/$batch"
+        content_type = f"multipart/mixed; boundary={batch_boundary}"
+
+        attempts = 0
+
+        def send() -> str:
+            nonlocal attempts
+            attempts += 1
+            headers = self._get_auth_headers("POST", url, content_type, len(body))
+            headers["Content-Length"] = str(len(body))
+            headers["DataServiceVersion"] = "3.0;"
+            request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+            with urllib.request.urlopen(request) as response:
+                return response.read().decode('utf-8')
+
+        try:
+            response_text = self.retry.call(send)
+        except urllib.error.HTTPError as e:
+            if e.code == 409 and attempts > 1:
+                return True, ""
+            return False, f"HTTP エラー {e.code}: {e.read().decode('utf-8')}"
+        except Exception as e:
+            return False, str(e)
+
+        # バッチ自体は202を返し、各操作の結果は本文の "HTTP/1.1 <status>" 行に入る（失敗時は失敗した操作の1件のみ）
+        for line in response_text.splitlines():
+            if line.startswith("HTTP/1.1 "):
+                status = int(line.split()[1])
+                if status == 409 and attempts > 1:
+                    return True, ""
+                if status >= 400:
+                    return False, response_text
+        return True, ""
+
+def build_user_entity(user_data: Dict[str, Any], row_key: str, password_hash: str) -> Dict[str, Any]:
+    """テストユーザーのエンティティを作成"""
+    timestamp = datetime.now(timezone.utc).isoformat()
+    return {
+        "PartitionKey": PARTITION_KEY,
+        "RowKey": row_key,
+        "username": user_data['username'],
+        "email": user_data['email'],
+        "firstName": user_data['firstName'],
+        "lastName": user_data['lastName'],
+        "role": user_data['role'],
+        "isActive": True,
+        "passwordHash": password_hash,
+        "createdAt": timestamp,
+        "updatedAt": timestamp
+    }
+
+def plan_users(existing_users: Dict[str, UserRecord]) -> List[Tuple[Dict[str, Any], str]]:
+    """TEST_USERS のうち、まだ登録されていないユーザーと、作成するエンティティの RowKey を返す（RowKey は計画時に1回だけ決める）"""
+    return [(user_data, str(uuid.uuid4())) for user_data in TEST_USERS if user_data['email'] not in existing_users]
 
 def main():
     """メイン関数"""
+    parser = argparse.ArgumentParser(description='テスト用のユーザーアカウントを作成します')
+    parser.add_argument('--plan', action='store_true', help='作成するユーザーを表示のみ（書き込みなし）')
+    parser.add_argument('--no-cache', action='store_true', help='パスワードハッシュのキャッシュを使わない')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
     print("=" * 60)
     print("Carbon Tracker API - テストユーザー作成スクリプト")
     print("=" * 60)
@@ -285,103 +369,83 @@ def main():
         print("エラー: テーブルの確認に失敗しました")
         return False
     
-    # パスワードのハッシュ化
-    print("パスワードをハッシュ化中...")
+    # 既存ユーザーを1回の走査で取得（表示に使う列のみ、passwordHash は取得しない）
+    print("既存ユーザーの確認中...")
+    existing_users: Dict[str, UserRecord] = {}
     try:
-        for user_data in TEST_USERS:
-            user_data['passwordHash'] = hash_password(user_data['password'])
-    except ImportError:
-        print("エラー: bcrypt ライブラリがインストールされていません")
-        print("以下のコマンドでインストールしてください:")
-        print("  pip install bcrypt")
+        for user in client.iter_users():
+            if not existing_users:
+                print("既存ユーザー一覧:")
+            email = user.get('email', 'N/A')
+            existing_users[email] = user
+            print(f"  📧 {email} ({user.get('username', 'N/A')}) - {user.get('role', 'N/A')} - 作成日: {user.get('createdAt', 'N/A')}")
+    except Exception as e:
+        print(f"ユーザー一覧取得エラー: {e}")
         return False
-    
-    # 既存ユーザーの確認と表示
-    print("既存ユーザーの確認中...")
-    existing_users = client.list_all_users()
-    
+
     if existing_users:
         print(f"既存ユーザー数: {len(existing_users)}")
-        print("既存ユーザー一覧:")
-        for user in existing_users:
-            email = user.get('email', 'N/A')
-            username = user.get('username', 'N/A')
-            role = user.get('role', 'N/A')
-            created_at = user.get('createdAt', 'N/A')
-            print(f"  📧 {email} ({username}) - {role} - 作成日: {created_at}")
-        print()
-    
-    # 各テストユーザーを確認・作成
-    created_count = 0
-    skipped_count = 0
-    
+    print()
+
+    # plan: 作成するユーザーを決める
+    missing_users = plan_users(existing_users)
+    missing_emails = {user_data['email'] for user_data, _ in missing_users}
+    print("計画:")
     for user_data in TEST_USERS:
-        email = user_data['email']
-        print(f"ユーザー '{email}' の確認中...")
-        
-        # 既存ユーザーの確認
-        existing_user = client.get_user_by_email(email)
-        if existing_user:
-            print(f"  ✅ ユーザー '{email}' は既に存在します。")
-            print(f"     ユーザー名: {existing_user.get('username', 'N/A')}")
-            print(f"     権限: {existing_user.get('role', 'N/A')}")
-            print(f"     作成日: {existing_user.get('createdAt', 'N/A')}")
-            print(f"     更新日: {existing_user.get('updatedAt', 'N/A')}")
-            skipped_count += 1
-            continue
-        
-        # ユーザーエンティティの作成
-        user_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-        
-        user_entity = {
-            "PartitionKey": PARTITION_KEY,
-            "RowKey": user_id,
-            "username": user_data['username'],
-            "email": user_data['email'],
-            "firstName": user_data['firstName'],
-            "lastName": user_data['lastName'],
-            "role": user_data['role'],
-            "isActive": True,
-            "passwordHash": user_data['passwordHash'],
-            "createdAt": timestamp,
-            "updatedAt": timestamp
-        }
-        
-        # ユーザーを作成
-        print(f"  ユーザー '{email}' を作成中...")
-        if client.create_entity(TABLE_NAME, user_entity):
-            print(f"  ✅ ユーザー '{email}' を作成しました")
-            created_count += 1
-        else:
-            print(f"  ❌ ユーザー '{email}' の作成に失敗しました")
+        mark = "➕ 作成" if user_data['email'] in missing_emails else "✅ 登録済み"
+        print(f"  {mark}: {user_data['email']} ({user_data['role']})")
+    print()
+
+    created_emails = set()
+    if args.plan:
+        print("--plan が指定されたため、書き込みは行いません。")
+    elif missing_users:
+        # apply: 不足しているユーザーのみハッシュ化し、1回のバッチで作成する
+        cache = PasswordHashCache(enabled=not args.no_cache)
+        try:
+            entities = [build_user_entity(user_data, row_key, cache.hash(user_data['password']))
+                        for user_data, row_key in missing_users]
+        except ImportError:
+            print("エラー: bcrypt ライブラリがインストールされていません")
+            print("以下のコマンドでインストールしてください:")
+            print("  pip install bcrypt")
+            return False
+        cache.save()
+        print(f"パスワードをハッシュ化しました（{cache.stats()}）")
+
+        for start in range(0, len(entities), MAX_BATCH_SIZE):
+            chunk = entities[start:start + MAX_BATCH_SIZE]
+            print(f"  {len(chunk)}件のユーザーを作成中...")
+            ok, error = client.insert_batch(TABLE_NAME, chunk)
+            if ok:
+                created_emails.update(entity['email'] for entity in chunk)
+            else:
+                print(f"  ❌ ユーザーの作成に失敗しました: {error}")
+    else:
+        print("すべてのテストユーザーが登録済みです。")
     
     print()
     print("=" * 60)
     print("テストユーザー確認・作成完了")
     print("=" * 60)
-    print(f"作成されたユーザー数: {created_count}")
-    print(f"スキップされたユーザー数: {skipped_count}")
+    print(f"作成されたユーザー数: {len(created_emails)}")
+    print(f"スキップされたユーザー数: {len(TEST_USERS) - len(missing_users)}")
     print(f"対象ユーザー数: {len(TEST_USERS)}")
+    print(f"所要時間: {(time.perf_counter() - started) * 1000:.0f}ms")
     print()
     
-    # 利用可能なテストユーザーを表示
+    # 利用可能なテストユーザーを表示（走査結果と作成結果から判定し、再度の問い合わせは行わない）
     print("利用可能なテストユーザー:")
     for user_data in TEST_USERS:
         email = user_data['email']
-        password = user_data['password']
-        role = user_data['role']
-        
-        # 既存ユーザーかどうかを確認
-        existing_user = client.get_user_by_email(email)
-        status = "✅ 登録済み" if existing_user else "❌ 未登録"
-        
-        print(f"  📧 {email} (パスワード: {password}, 権限: {role}) - {status}")
+        registered = email in existing_users or email in created_emails
+        status = "✅ 登録済み" if registered else "❌ 未登録"
+        print(f"  📧 {email} (パスワード: {user_data['password']}, 権限: {user_data['role']}) - {status}")
     
     print()
     print("登録済みのユーザーでログインテストを実行できます。")
     
-    return True  # 既存ユーザーがあれば成功とする
+    return args.plan or len(created_emails) == len(missing_users)
 
 if __name__ == "__main__":
     try:
@@ -23,7 +23,11 @@ import urllib.parse
 import urllib.request
 import urllib.error
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import RetryPolicy
+from common.table_stream import iter_table_entities, UserRecord
 
 # Azure Table Storage の設定
 AZURITE_ACCOUNT_NAME = "devstoreaccount1"
@@ -39,6 +43,7 @@ class AzureTableStorageClient:
         self.account_name = account_name
         self.account_key = account_key
         self.endpoint = endpoint
+        self.retry = RetryPolicy()
         
     def _generate_shared_key_auth(self, method: str, url: str, content_type: str = "application/json", content_length: int = 0) -> str:
         """Shared Key認証ヘッダーを生成"""
@@ -127,19 +132,17 @@ class AzureTableStorageClient:
             print(f"テーブル作成エラー: {e}")
             return False
     
-    def list_users(self) -> List[Dict[str, Any]]:
-        """すべてのユーザーを取得"""
+    def _open(self, url: str):
+        """GETリクエストを送信してレスポンスを返す（本文は呼び出し側でストリーミングで読み込む）"""
+        def send():
+            headers = self._get_auth_headers("GET", url)
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+        return self.retry.call(send)
+
+    def iter_users(self) -> Iterator[UserRecord]:
+        """すべてのユーザーを1件ずつ取得（表示に使う列のみ、ページ単位でストリーミング）"""
         url = f"{self.endpoint}/{TABLE_NAME}()"
-        headers = self._get_auth_headers("GET", url)
-        
-        try:
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                return data.get('value', [])
-        except Exception as e:
-            print(f"ユーザー一覧取得エラー: {e}")
-            return []
+        return iter_table_entities(self._open, url, UserRecord)
     
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """メールアドレスでユーザーを検索"""
@@ -159,24 +162,20 @@ class AzureTableStorageClient:
             print(f"ユーザー検索エラー: {e}")
             return None
     
-    def update_user_password(self, user: Dict[str, Any], new_password_hash: str) -> bool:
+    def update_user_password(self, user: UserRecord, new_password_hash: str) -> bool:
         """ユーザーのパスワードを更新"""
-        # エンティティの更新
-        user['passwordHash'] = new_password_hash
-        user['updatedAt'] = datetime.now(timezone.utc).isoformat()
-        
-        # 不要なフィールドを削除
-        user.pop('odata.etag', None)
-        user.pop('odata.metadata', None)
-        user.pop('Timestamp', None)
-        
-        # MERGEリクエストで更新
-        partition_key = user['PartitionKey']
-        row_key = user['RowKey']
+        # MERGEリクエストで更新（変更する列のみを送信し、それ以外の列はそのまま残す）
+        partition_key = user.PartitionKey
+        row_key = user.RowKey
         url = f"{self.endpoint}/{TABLE_NAME}(PartitionKey='{partition_key}',RowKey='{row_key}')"
         
         # エンティティをJSONに変換
-        entity_json = json.dumps(user)
+        entity_json = json.dumps({
+            'PartitionKey': partition_key,
+            'RowKey': row_key,
+            'passwordHash': new_password_hash,
+            'updatedAt': datetime.now(timezone.utc).isoformat(),
+        })
         content_length = len(entity_json.encode('utf-8'))
         headers = self._get_auth_headers("MERGE", url, "application/json", content_length)
         
@@ -220,7 +219,11 @@ def main():
     
     # 既存のユーザー一覧を取得
     print("既存のユーザーを取得中...")
-    users = client.list_users()
+    try:
+        users = list(client.iter_users())
+    except Exception as e:
+        print(f"ユーザー一覧取得エラー: {e}")
+        users = []
     
     if not users:
         print("エラー: ユーザーが見つかりません")
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Azurite のテーブルのスナップショット作成・復元スクリプト
+
+テスト環境を作るたびに create_admin_user.py / create_test_user.py / create_test_group.py /
+create_test_data_2025_10.py を順に実行する代わりに、作成済みの状態を名前付きのスナップショット
+（baseline、scale-1M など）として1つのファイルに保存し、空の Azurite へ1回で復元します。
+
+スナップショットの形式（<名前>.jsonl.gz）:
+- 1行目: ヘッダー（形式・作成日時・作成元のテーブル）
+- 2行目以降: {"t": テーブル名, "e": エンティティ}（1行1件）
+- 最終行: テーブルごとの件数（最終行がない・件数が一致しないファイルは途中で切れたものとして復元しない）
+
+- 作成・復元ともに1行ずつ処理するため、100万件規模でもメモリに載るのはパーティションごとの未送信のバッチのみです
+- Edm.Double / Edm.Int32 は JSON の数値のまま、Edm.Int64 / Edm.DateTime / Edm.Guid / Edm.Binary は型付きの値（{"@t": 型, "v": 値}）で保存し、復元時に同じ型で書き込みます
+- 復元はパーティションごとに最大100件のバッチ（upsert）を並列に送信し、common/retry.py で再試行・同時実行数を調整します
+- 復元先のテーブルにデータがある場合は中止します（--clear で削除してから復元）
+- ローカルの Azurite 専用です。それ以外の接続文字列では --allow-remote を指定しない限り実行しません
+
+スナップショットの保存先は環境変数 TABLE_SNAPSHOT_DIR で変更できます（既定値: scripts/.cache/table_snapshots）。
+
+使用方法:
+    python table_snapshot.py save baseline                                  # すべてのテーブル
+    python table_snapshot.py save baseline --tables UsersTable GroupsTable  # 指定したテーブルのみ
+    python table_snapshot.py restore baseline
+    python table_snapshot.py restore scale-1M --clear --workers 16
+    python table_snapshot.py list
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from azure.core.exceptions import ResourceExistsError
+from azure.data.tables import EdmType, EntityProperty, TableClient, TableServiceClient, UpdateMode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import AdaptiveLimiter, RetryPolicy
+
+# Azurite の既定の接続文字列
+AZURITE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "TableEndpoint=http://127.0.0.1:10002/devstoreaccount1;"
+)
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING') or AZURITE_CONNECTION_STRING
+
+SNAPSHOT_DIR = os.getenv(
+    'TABLE_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'table_snapshots'),
+)
+SNAPSHOT_FORMAT = 'table-snapshot'
+SNAPSHOT_VERSION = 1
+
+# 1回のトランザクションの最大件数
+MAX_BATCH_SIZE = 100
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+def snapshot_path(name):
+    if not _NAME_PATTERN.match(name):
+        raise ValueError(f"スナップショット名に使えない文字が含まれています: {name}")
+    return os.path.join(SNAPSHOT_DIR, f"{name}.jsonl.gz")
+
+
+def is_local(connection_string):
+    """Azurite（ローカル）の接続文字列か"""
+    return 'devstoreaccount1' in connection_string or 'UseDevelopmentStorage=true' in connection_string
+
+
+# ----------------------------------------------------------------------
+# 値の変換
+# ----------------------------------------------------------------------
+
+def encode_value(value):
+    """エンティティの値をJSONで保存できる形にする（JSONの型で区別できない値は型付きにする）"""
+    if isinstance(value, EntityProperty):
+        edm_type = value.edm_type.value if isinstance(value.edm_type, EdmType) else str(value.edm_type)
+        return {'@t': edm_type, 'v': encode_value(value.value)}
+    if isinstance(value, datetime):
+        return {'@t': 'Edm.DateTime', 'v': value.astimezone(timezone.utc).isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {'@t': 'Edm.Guid', 'v': str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {'@t': 'Edm.Binary', 'v': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def decode_value(value):
+    """encode_value の逆変換"""
+    if not isinstance(value, dict):
+        return value
+    edm_type, raw = value.get('@t'), value.get('v')
+    if isinstance(raw, dict):
+        raw = decode_value(raw)
+    if edm_type == 'Edm.DateTime':
+        return datetime.fromisoformat(raw) if isinstance(raw, str) else raw
+    if edm_type == 'Edm.Guid':
+        return uuid.UUID(raw) if isinstance(raw, str) else raw
+    if edm_type == 'Edm.Binary':
+        return base64.b64decode(raw) if isinstance(raw, str) else raw
+    if edm_type == 'Edm.Int64':
+        return EntityProperty(int(raw), EdmType.INT64)
+    return EntityProperty(raw, EdmType(edm_type))
+
+
+def encode_entity(entity):
+    return {key: encode_value(value) for key, value in entity.items()}
+
+
+def decode_entity(entity):
+    return {key: decode_value(value) for key, value in entity.items()}
+
+
+# ----------------------------------------------------------------------
+# 作成
+# ----------------------------------------------------------------------
+
+def list_table_names(service):
+    return sorted(table.name for table in service.list_tables())
+
+
+def save_snapshot(name, tables):
+    """テーブルの内容を1つのファイルに保存する（一時ファイルに書き込んでから置き換える）"""
+    service = TableServiceClient.from_connection_string(CONNECTION_STRING)
+    existing = list_table_names(service)
+    if tables:
+        missing = [table for table in tables if table not in existing]
+        if missing:
+            print(f"⚠️ 存在しないテーブルは空として保存します: {', '.join(missing)}")
+    else:
+        tables = existing
+
+    path = snapshot_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    counts = {}
+
+    print(f"🚀 スナップショット作成開始: {name}（{len(tables)}テーブル）")
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'tables': tables,
+        }
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for table in tables:
+            counts[table] = 0
+            if table not in existing:
+                continue
+            client = TableClient.from_connection_string(CONNECTION_STRING, table)
+            for entity in client.list_entities(results_per_page=1000):
+                f.write(json.dumps({'t': table, 'e': encode_entity(entity)}, ensure_ascii=False, separators=(',', ':')) + '\n')
+                counts[table] += 1
+            print(f"  📋 {table}: {counts[table]}件")
+        f.write(json.dumps({'counts': counts}) + '\n')
+
+    os.replace(temp_path, path)
+    print(f"✅ 保存しました: {path}（{os.path.getsize(path) / 1024:.1f}KB）")
+
+
+# ----------------------------------------------------------------------
+# 復元
+# ----------------------------------------------------------------------
+
+def read_snapshot(path):
+    """ヘッダーと、(テーブル名, エンティティ) を1件ずつ返すイテレータを返す"""
+    f = gzip.open(path, 'rt', encoding='utf-8')
+    header = json.loads(f.readline() or '{}')
+    if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+        f.close()
+        raise ValueError(f"対応していないスナップショットです: {path}")
+
+    result = {'counts': None}
+
+    def rows():
+        with f:
+            for line in f:
+                record = json.loads(line)
+                if 'counts' in record:
+                    result['counts'] = record['counts']
+                    return
+                yield record['t'], decode_entity(record['e'])
+
+    return header, rows(), result
+
+
+def prepare_tables(service, tables, clear):
+    """復元先のテーブルを用意する（データがある場合は --clear がなければ中止）"""
+    existing = set(list_table_names(service))
+    not_empty = []
+    for table in tables:
+        if table in existing:
+            client = service.get_table_client(table)
+            if next(iter(client.list_entities(results_per_page=1, select=['PartitionKey'])), None) is not None:
+                not_empty.append(table)
+    if not_empty and not clear:
+        print(f"❌ エラー: データがあるテーブルがあります: {', '.join(not_empty)}")
+        print("   --clear を指定すると削除してから復元します")
+        return False
+
+    for table in tables:
+        if table in not_empty:
+            service.delete_table(table)
+            print(f"  🗑️ {table} を削除しました")
+        # Azurite は削除直後に同じ名前で作成できる（Azure では削除完了まで 409 が返る）
+        for attempt in range(30):
+            try:
+                service.create_table(table)
+                break
+            except ResourceExistsError:
+                if table not in not_empty:
+                    break
+                time.sleep(1)
+    return True
+
+
+class Restorer:
+    """(テーブル, パーティション) ごとに最大100件のバッチにまとめて並列に送信する"""
+
+    def __init__(self, limiter, retry):
+        self.limiter = limiter
+        self.retry = retry
+        self.clients = {}
+        self.pending = {}
+        self.failed = []
+        self.restored = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=limiter.maximum)
+
+    def client(self, table):
+        client = self.clients.get(table)
+        if client is None:
+            # SDKの再試行を無効にし、RetryPolicy でスロットリングを検知して同時実行数を調整する
+            client = TableClient.from_connection_string(CONNECTION_STRING, table, retry_total=0)
+            self.clients[table] = client
+        return client
+
+    def add(self, table, entity):
+        key = (table, entity['PartitionKey'])
+        batch = self.pending.setdefault(key, [])
+        batch.append(('upsert', entity, {'mode': UpdateMode.REPLACE}))
+        if len(batch) >= MAX_BATCH_SIZE:
+            del self.pending[key]
+            self._submit(table, batch)
+
+    def _submit(self, table, batch):
+        def send():
+            try:
+                self.retry.call(self.client(table).submit_transaction, batch)
+                with self._lock:
+                    self.restored[table] = self.restored.get(table, 0) + len(batch)
+            except Exception as e:
+                print(f"❌ 復元失敗 ({table}, PartitionKey={batch[0][1]['PartitionKey']}, {len(batch)}件): {e}")
+                with self._lock:
+                    self.failed.append((table, len(batch)))
+
+        self.limiter.acquire()
+        self.executor.submit(send).add_done_callback(lambda _: self.limiter.release())
+
+    def finish(self):
+        for (table, _), batch in self.pending.items():
+            self._submit(table, batch)
+        self.pending = {}
+        self.executor.shutdown(wait=True)
+
+
+def restore_snapshot(name, clear, limiter, retry):
+    path = snapshot_path(name)
+    if not os.path.exists(path):
+        print(f"❌ エラー: スナップショットがありません: {path}")
+        return False
+
+    header, rows, result = read_snapshot(path)
+    tables = header['tables']
+    print(f"🚀 復元開始: {name}（{len(tables)}テーブル、作成日時: {header['createdAt']}）")
+
+    service = TableServiceClient.from_connection_string(CONNECTION_STRING)
+    if not prepare_tables(service, tables, clear):
+        return False
+
+    restorer = Restorer(limiter, retry)
+    read = 0
+    try:
+        for table, entity in rows:
+            restorer.add(table, entity)
+            read += 1
+            if read % 100000 == 0:
+                print(f"  ... {read}件読み込み")
+    finally:
+        restorer.finish()
+
+    counts = result['counts']
+    if counts is None:
+        print("❌ エラー: スナップショットが途中で切れています（最終行がありません）")
+        return False
+    for table in tables:
+        print(f"  📋 {table}: {restorer.restored.get(table, 0)}件 / {counts.get(table, 0)}件")
+    if restorer.failed:
+        print(f"❌ 失敗したバッチがあります（{len(restorer.failed)}件）。--clear を指定して再実行してください")
+        return False
+    if any(restorer.restored.get(table, 0) != counts.get(table, 0) for table in tables):
+        print("❌ エラー: 復元した件数がスナップショットの件数と一致しません")
+        return False
+    return True
+
+
+def list_snapshots():
+    if not os.path.isdir(SNAPSHOT_DIR):
+        print(f"スナップショットはありません（{SNAPSHOT_DIR}）")
+        return
+    for file_name in sorted(os.listdir(SNAPSHOT_DIR)):
+        if not file_name.endswith('.jsonl.gz'):
+            continue
+        path = os.path.join(SNAPSHOT_DIR, file_name)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline() or '{}')
+        name = file_name[:-len('.jsonl.gz')]
+        print(f"  {name}: {len(header.get('tables', []))}テーブル / {os.path.getsize(path) / 1024:.1f}KB / 作成日時: {header.get('createdAt')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Azuriteのテーブルのスナップショットを作成・復元します')
+    parser.add_argument('--allow-remote', action='store_true', help='Azurite 以外の接続文字列でも実行する')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    save = subparsers.add_parser('save', help='スナップショットを作成')
+    save.add_argument('name', help='スナップショット名（例: baseline、scale-1M）')
+    save.add_argument('--tables', nargs='+', help='対象のテーブル（省略時はすべてのテーブル）')
+
+    restore = subparsers.add_parser('restore', help='スナップショットを復元')
+    restore.add_argument('name', help='スナップショット名')
+    restore.add_argument('--clear', action='store_true', help='データがあるテーブルを削除してから復元する')
+    restore.add_argument('--workers', type=int, default=8, help='並列に送信するバッチ数の初期値')
+    restore.add_argument('--max-workers', type=int, default=64, help='並列に送信するバッチ数の上限')
+
+    subparsers.add_parser('list', help='スナップショットの一覧')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_snapshots()
+        return
+
+    if not is_local(CONNECTION_STRING) and not args.allow_remote:
+        print("❌ エラー: Azurite 以外の接続文字列が設定されています（実行する場合は --allow-remote を指定）")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    try:
+        if args.command == 'save':
+            save_snapshot(args.name, args.tables)
+            success = True
+        else:
+            limiter = AdaptiveLimiter(initial=args.workers, maximum=max(args.workers, args.max_workers))
+            retry = RetryPolicy(limiter=limiter)
+            success = restore_snapshot(args.name, args.clear, limiter, retry)
+            print("=" * 50)
+            print(retry.format_stats())
+    except ValueError as e:
+        print(f"❌ エラー: {e}")
+        sys.exit(1)
+
+    print(f"所要時間: {time.perf_counter() - started:.1f}秒")
+    if not success:
+        sys.exit(1)
+    print("✅ 完了しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+ProductionSumTable 整合性検証スクリプト
+
+ProductionTable の生データから、CreateProductionSum / CreateProductionSumTimer と同じ規則で
+年・groupId・materialType 別の合計を計算し、ProductionSumTable の内容と比較します。
+（src/utils/productionSum.ts と同じ規則）
+
+- ProductionTable はキー範囲（PartitionKey / 旧パーティションはRowKey）で分割し、並列に走査します
+- 集計は キー → 番号 の辞書と array('d') の配列で行い、エンティティは保持しません
+- 計算には calc-settings/setting.json の係数を使います（取得できない場合は既定値、--settings でファイルを指定可能）
+- 浮動小数点の誤差は --rel-tol / --abs-tol の範囲で一致とみなします
+- --repair を指定すると、ずれている行・不足している行をバッチでupsertし、余分な行を削除します
+
+使用方法:
+1. Azure Storage接続文字列を設定
+   export AZURE_STORAGE_CONNECTION_STRING='...'
+2. 検証（書き込みなし）
+   python verify_production_sum.py
+3. ずれている行の修復
+   python verify_production_sum.py --repair
+4. 移行完了後など、旧パーティション（Production）を併読しない設定の場合
+   python verify_production_sum.py --no-legacy
+
+終了コード: 一致（または修復完了）の場合は0、ずれがある場合は1
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from azure.data.tables import TableClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.retry import AdaptiveLimiter, RetryPolicy
+
+# Azure Storage接続文字列
+CONNECTION_STRING = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+PRODUCTION_TABLE_NAME = 'ProductionTable'
+PRODUCTION_SUM_TABLE_NAME = 'ProductionSumTable'
+PRODUCTION_SUM_PARTITION_KEY = 'ProductionSum'
+LEGACY_PARTITION_KEY = 'Production'
+
+# エンティティグループトランザクションの上限件数
+MAX_BATCH_SIZE = 100
+
+# キー範囲の境界（uuidの先頭文字、src/utils/productionSum.ts と同じ）
+SHARD_BOUNDARIES = ['1', '2', '3', '4', '5', '6', '7', '8', '9', 'a', 'b', 'c', 'd', 'e', 'f']
+
+# 集計に必要な列のみ取得する
+PRODUCTION_SELECT = ['RowKey', 'productionId', 'date', 'year', 'groupId', 'materialType',
+                     'materialAmount', 'charcoalProduced', 'charcoalVolume']
+
+# 比較する列（ProductionSumTable の列名）
+SUM_FIELDS = ['materialAmount', 'charcoalProduced', 'charcoalVolume', 'co2Reduction', 'carbonContent', 'ipccLongTerm']
+
+DEFAULT_CALC_SETTINGS = {
+    'carbonContentFactors': {'bamboo': 0.8, 'pruning': 0.8, 'herbaceous': 0.65, 'other': 0.8},
+    'co2ConversionFactor': 3.67,
+    'ipccLongTermFactors': {'bamboo': 0.8, 'pruning': 0.8, 'herbaceous': 0.65, 'other': 0.8},
+}
+
+
+def load_calc_settings(settings_path):
+    """計算設定を取得（--settings のファイル → calc-settings/setting.json → 既定値の順）"""
+    if settings_path:
+        with open(settings_path, encoding='utf-8') as f:
+            return json.load(f)
+    try:
+        from azure.storage.blob import BlobClient
+    except ImportError:
+        print("⚠️ azure-storage-blob がインストールされていないため、既定の係数を使用します")
+        return DEFAULT_CALC_SETTINGS
+    try:
+        blob = BlobClient.from_connection_string(CONNECTION_STRING, 'calc-settings', 'setting.json')
+        return json.loads(blob.download_blob().readall())
+    except Exception as e:
+        print(f"⚠️ calc-settings を取得できないため、既定の係数を使用します: {e}")
+        return DEFAULT_CALC_SETTINGS
+
+
+def build_range_filters(column):
+    """境界の一覧から、重ならずに全体を覆う範囲フィルタを生成"""
+    ranges = []
+    bounds = [None] + SHARD_BOUNDARIES + [None]
+    for lower, upper in zip(bounds, bounds[1:]):
+        conditions = []
+        if lower is not None:
+            conditions.append(f"{column} ge '{lower}'")
+        if upper is not None:
+            conditions.append(f"{column} lt '{upper}'")
+        ranges.append((f"{column}[{lower or ''},{upper or ''})", ' and '.join(conditions)))
+    return ranges
+
+
+def build_scan_shards(include_legacy):
+    """ProductionTable の走査範囲（シャード）を生成"""
+    shards = [
+        (name, f"{condition} and PartitionKey ne '{LEGACY_PARTITION_KEY}'")
+        for name, condition in build_range_filters('PartitionKey')
+    ]
+    if include_legacy:
+        shards += [
+            (f"{LEGACY_PARTITION_KEY}/{name}", f"PartitionKey eq '{LEGACY_PARTITION_KEY}' and {condition}")
+            for name, condition in build_range_filters('RowKey')
+        ]
+    return shards
+
+
+def to_number(value):
+    """列の値を数値に変換（型付きの行は変換しない、値がない・解釈できない場合は0）"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if math.isfinite(value) else 0.0
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return parsed if math.isfinite(parsed) else 0.0
+
+
+class Accumulator:
+    """キー（年, groupId, materialType）ごとの合計（キー → 番号の辞書と列ごとの array('d')）"""
+
+    __slots__ = ('index', 'keys', 'material_amount', 'charcoal_produced', 'charcoal_volume')
+
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+        self.material_amount = array('d')
+        self.charcoal_produced = array('d')
+        self.charcoal_volume = array('d')
+
+    def slot(self, key):
+        i = self.index.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.index[key] = i
+            self.keys.append(key)
+            self.material_amount.append(0.0)
+            self.charcoal_produced.append(0.0)
+            self.charcoal_volume.append(0.0)
+        return i
+
+    def merge(self, other):
+        for j, key in enumerate(other.keys):
+            i = self.slot(key)
+            self.material_amount[i] += other.material_amount[j]
+            self.charcoal_produced[i] += other.charcoal_produced[j]
+            self.charcoal_volume[i] += other.charcoal_volume[j]
+
+
+class Deduper:
+    """移行期間中に旧パーティションと新パーティションの両方にある記録を1件として扱う（全シャードで共有）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = set()
+
+    def is_first(self, production_id):
+        with self._lock:
+            if production_id in self._seen:
+                return False
+            self._seen.add(production_id)
+            return True
+
+
+def scan_shard(table_client, name, condition, deduper):
+    """1つのシャードを走査し、年・groupId・materialType別の部分合計を作成"""
+    started = time.perf_counter()
+    acc = Accumulator()
+    scanned = 0
+    for entity in table_client.query_entities(condition, select=PRODUCTION_SELECT, results_per_page=1000):
+        scanned += 1
+        date = entity.get('date')
+        group_id = entity.get('groupId')
+        material_type = entity.get('materialType')
+        if not date or not group_id or not material_type:
+            continue
+        if not deduper.is_first(entity.get('productionId') or entity['RowKey']):
+            continue
+
+        # 年（year 列がない移行前の行は日付から抽出）
+        year = str(entity['year']) if entity.get('year') else str(date).split('-')[0]
+        i = acc.slot((year, group_id, material_type))
+        acc.material_amount[i] += to_number(entity.get('materialAmount'))
+        acc.charcoal_produced[i] += to_number(entity.get('charcoalProduced'))
+        acc.charcoal_volume[i] += to_number(entity.get('charcoalVolume'))
+    return name, acc, scanned, time.perf_counter() - started
+
+
+def load_production_sums(sum_client):
+    """ProductionSumTable の行を RowKey ごとに取得（比較する列のみ）"""
+    return {
+        entity['RowKey']: entity
+        for entity in sum_client.query_entities(
+            f"PartitionKey eq '{PRODUCTION_SUM_PARTITION_KEY}'", select=['RowKey'] + SUM_FIELDS, results_per_page=1000)
+    }
+
+
+def compute_expected(acc, settings):
+    """部分合計から ProductionSumTable の期待値を計算"""
+    carbon_factors = settings['carbonContentFactors']
+    ipcc_factors = settings['ipccLongTermFactors']
+    co2_factor = settings['co2ConversionFactor']
+
+    expected = {}
+    for i, (year, group_id, material_type) in enumerate(acc.keys):
+        charcoal_produced = acc.charcoal_produced[i]
+        carbon_content = charcoal_produced * (carbon_factors.get(material_type) or carbon_factors['other'])
+        co2_reduction = carbon_content * co2_factor
+        # RowKey = 年-groupId-materialType
+        expected[f"{year}-{group_id}-{material_type}"] = {
+            'year': year,
+            'groupId': group_id,
+            'materialAmount': acc.material_amount[i],
+            'charcoalProduced': charcoal_produced,
+            'charcoalVolume': acc.charcoal_volume[i],
+            'co2Reduction': co2_reduction,
+            'carbonContent': carbon_content,
+            'ipccLongTerm': co2_reduction * (ipcc_factors.get(material_type) or ipcc_factors['other']),
+        }
+    return expected
+
+
+def compare(expected, actual, rel_tol, abs_tol):
+    """期待値と ProductionSumTable を比較し、ずれ・不足・余分な行を返す"""
+    drifted = []
+    for key, values in expected.items():
+        row = actual.get(key)
+        if row is None:
+            continue
+        diffs = {
+            field: (to_number(row.get(field)), values[field])
+            for field in SUM_FIELDS
+            if not math.isclose(to_number(row.get(field)), values[field], rel_tol=rel_tol, abs_tol=abs_tol)
+        }
+        if diffs:
+            drifted.append((key, diffs))
+    missing = [key for key in expected if key not in actual]
+    extra = [key for key in actual if key not in expected]
+    return drifted, missing, extra
+
+
+def repair(sum_client, expected, drifted, missing, extra, workers):
+    """ずれている行・不足している行をupsertし、余分な行を削除（すべて同じパーティションのため100件ずつのバッチ）"""
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    for key, _ in drifted:
+        operations.append(('upsert', {
+            'PartitionKey': PRODUCTION_SUM_PARTITION_KEY, 'RowKey': key, **expected[key], 'updatedAt': now,
+        }, {'mode': 'merge'}))
+    for key in missing:
+        operations.append(('upsert', {
+            'PartitionKey': PRODUCTION_SUM_PARTITION_KEY, 'RowKey': key, **expected[key], 'createdAt': now, 'updatedAt': now,
+        }, {'mode': 'merge'}))
+    for key in extra:
+        operations.append(('delete', {'PartitionKey': PRODUCTION_SUM_PARTITION_KEY, 'RowKey': key}))
+
+    limiter = AdaptiveLimiter(initial=workers, maximum=max(workers, 32))
+    retry = RetryPolicy(limiter=limiter)
+    failed = []
+
+    def submit_batch(batch):
+        try:
+            retry.call(sum_client.submit_transaction, batch)
+        except Exception as e:
+            print(f"❌ 修復失敗 ({len(batch)}件): {e}")
+            failed.append(len(batch))
+
+    with ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+        for start in range(0, len(operations), MAX_BATCH_SIZE):
+            limiter.acquire()
+            future = executor.submit(submit_batch, operations[start:start + MAX_BATCH_SIZE])
+            future.add_done_callback(lambda _: limiter.release())
+
+    print(f"🔧 修復: upsert {len(drifted) + len(missing)}件 / 削除 {len(extra)}件 ({retry.format_stats()})")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ProductionSumTable が ProductionTable の生データと一致するか検証します')
+    parser.add_argument('--workers', type=int, default=16, help='並列に走査するキー範囲の数')
+    parser.add_argument('--no-legacy', action='store_true',
+                        help='旧パーティション（Production）を集計に含めない（APIの PRODUCTION_DUAL_READ=false に合わせる）')
+    parser.add_argument('--settings', help='計算設定のJSONファイル（省略時は calc-settings/setting.json）')
+    parser.add_argument('--rel-tol', type=float, default=1e-9, help='一致とみなす相対誤差')
+    parser.add_argument('--abs-tol', type=float, default=1e-6, help='一致とみなす絶対誤差')
+    parser.add_argument('--show', type=int, default=20, help='表示するずれの件数')
+    parser.add_argument('--repair', action='store_true', help='ずれている行・不足している行・余分な行を修復する')
+    args = parser.parse_args()
+
+    if not CONNECTION_STRING:
+        print("❌ エラー: AZURE_STORAGE_CONNECTION_STRING 環境変数が設定されていません")
+        sys.exit(1)
+
+    production_client = TableClient.from_connection_string(CONNECTION_STRING, PRODUCTION_TABLE_NAME)
+    sum_client = TableClient.from_connection_string(CONNECTION_STRING, PRODUCTION_SUM_TABLE_NAME)
+    started = time.perf_counter()
+
+    shards = build_scan_shards(include_legacy=not args.no_legacy)
+    print(f"🚀 検証開始: {len(shards)}範囲, workers={args.workers}")
+
+    deduper = Deduper()
+    total = Accumulator()
+    scanned = 0
+    timings = []
+    # calc-settings と ProductionSumTable の取得は、ProductionTable の走査と並行して行う
+    with ThreadPoolExecutor(max_workers=2) as loader, ThreadPoolExecutor(max_workers=args.workers) as scanner:
+        settings_future = loader.submit(load_calc_settings, args.settings)
+        sums_future = loader.submit(load_production_sums, sum_client)
+        futures = [scanner.submit(scan_shard, production_client, name, condition, deduper) for name, condition in shards]
+        for future in futures:
+            name, acc, count, elapsed = future.result()
+            total.merge(acc)
+            scanned += count
+            timings.append((elapsed, name, count))
+        settings = settings_future.result()
+        actual = sums_future.result()
+
+    scan_elapsed = time.perf_counter() - started
+    slowest = max(timings) if timings else (0, '-', 0)
+    print(f"📥 ProductionTable: {scanned}件を{scan_elapsed:.1f}秒で走査（最も遅い範囲: {slowest[1]} {slowest[2]}件 {slowest[0]:.1f}秒）")
+
+    expected = compute_expected(total, settings)
+    drifted, missing, extra = compare(expected, actual, args.rel_tol, args.abs_tol)
+    matched = len(expected) - len(drifted) - len(missing)
+
+    print("=" * 50)
+    print(f"集計キー: {len(expected)}件 / ProductionSumTable: {len(actual)}件")
+    print(f"一致: {matched}件")
+    print(f"ずれ: {len(drifted)}件")
+    print(f"不足（ProductionSumTableにない）: {len(missing)}件")
+    print(f"余分（ProductionTableに対応する記録がない）: {len(extra)}件")
+
+    for key, diffs in drifted[:args.show]:
+        detail = ', '.join(f"{field}: {stored:.6g} → {value:.6g}" for field, (stored, value) in diffs.items())
+        print(f"  ⚠️ {key}: {detail}")
+    for key in missing[:args.show]:
+        print(f"  ➕ {key}")
+    for key in extra[:args.show]:
+        print(f"  ➖ {key}")
+
+    ok = not (drifted or missing or extra)
+    if not ok and args.repair:
+        # 書き込みはSDKの再試行を無効にし、RetryPolicy でスロットリングを検知して同時実行数を調整する
+        write_client = TableClient.from_connection_string(CONNECTION_STRING, PRODUCTION_SUM_TABLE_NAME, retry_total=0)
+        ok = repair(write_client, expected, drifted, missing, extra, args.workers)
+
+    print(f"所要時間: {time.perf_counter() - started:.1f}秒")
+    if ok:
+        print("✅ ProductionSumTable は ProductionTable と一致しています" if matched == len(actual) else "✅ 修復が完了しました")
+        return
+    print("❌ ProductionSumTable にずれがあります" + ("" if args.repair else "（--repair で修復できます）"))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,10 @@ try {
     corsOrigins: "http://localhost:5000,http://localhost:3000",
     jwtSecret: "default-jwt-secret",
     tableName: "ProductionTable",
-    partitionKey: "Production"
+    partitionKey: "Production",
+    productionKeyScheme: "group",
+    productionDualRead: true,
+    productionSumScanParallelism: 8
   };
 }
 
@@ -30,3 +33,23 @@ export const partitionKey = config.partitionKey;
 export const corsOrigins = config.corsOrigins;
 export const jwtSecret = config.jwtSecret;
 export const currentEnvironment = config.environment;
+// ProductionTableのキー体系（legacy / group / groupYear）と移行期間中の旧パーティション併読フラグ
+export const productionKeyScheme: string = process.env.PRODUCTION_KEY_SCHEME || config.productionKeyScheme || "group";
+export const productionDualRead: boolean = (process.env.PRODUCTION_DUAL_READ ?? String(config.productionDualRead ?? true)) !== "false";
+// ProductionSum再集計時のProductionTable走査の並列数（キー範囲ごとの同時クエリ数）
+export const productionSumScanParallelism: number =
+  parseInt(process.env.PRODUCTION_SUM_SCAN_PARALLELISM || String(config.productionSumScanParallelism ?? 8)) || 8;
+// 生産データの追加シャード（シャード名 → 接続文字列のアプリ設定名）。既定のアカウント（primary）は常に含まれる
+// 環境変数の場合は "shard2=SHARD2_STORAGE,shard3=SHARD3_STORAGE" の形式
+export const productionShards: Record<string, string> = process.env.PRODUCTION_SHARDS
+  ? Object.fromEntries(
+      process.env.PRODUCTION_SHARDS.split(",")
+        .map((pair) => pair.split("=").map((part) => part.trim()))
+        .filter(([name, setting]) => name && setting)
+    )
+  : config.productionShards ?? {};
+// 新しいグループを割り当てるシャード名（省略時はすべてのシャード）
+export const productionShardPlacement: string[] = (process.env.PRODUCTION_SHARD_PLACEMENT ?? (config.productionShardPlacement ?? []).join(","))
+  .split(",")
+  .map((name: string) => name.trim())
+  .filter((name: string) => name !== "");
@@ -0,0 +1,347 @@
+import { HttpHandler, HttpMethod, TimerHandler } from "@azure/functions";
+
+/**
+ * 関数の登録情報
+ *
+ * 各関数のモジュールは @azure/data-tables や @azure/storage-blob などを読み込むため、起動時にまとめて読み込むとコールドスタートが遅くなる。
+ * ここではルートとメソッドのみを定義し、ハンドラー本体は load() で初回呼び出し時に読み込む（src/utils/lazyHandler.ts）。
+ * 新しい関数を追加する場合は、関数のモジュールでハンドラーをexportし、この一覧に追加する。
+ * このファイルは app を呼び出さないため、ベンチマークスクリプトからルート一覧として読み込むこともできる。
+ */
+
+export interface LazyHttpFunction {
+  name: string;
+  route: string;
+  methods: HttpMethod[];
+  load: () => Promise<HttpHandler>;
+}
+
+export interface LazyTimerFunction {
+  name: string;
+  schedule: string;
+  load: () => Promise<TimerHandler>;
+}
+
+// HTTPトリガー（すべて authLevel: "anonymous" で登録し、認証は各ハンドラーでJWTを検証する）
+// GetProductionSum は CreateProductionSum と同じルート（GET production-sum）のため登録していない
+export const httpFunctions: LazyHttpFunction[] = [
+  {
+    name: "AddUserGroup",
+    route: "groups/{groupId}/users/{userId}",
+    methods: ["POST"],
+    load: async () => (await import("./functions/TestFunction")).AddUserGroup,
+  },
+  {
+    name: "CheckUserRole",
+    route: "check-user-role",
+    methods: ["GET"],
+    load: async () => (await import("./functions/CheckUserRole")).CheckUserRole,
+  },
+  {
+    name: "CreateGroup",
+    route: "group",
+    methods: ["POST"],
+    load: async () => (await import("./functions/CreateGroup")).CreateGroup,
+  },
+  {
+    name: "GetGroups",
+    route: "groups",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetGroups")).GetGroups,
+  },
+  {
+    name: "CreateProduction",
+    route: "production",
+    methods: ["GET", "POST"],
+    load: async () => (await import("./functions/CreateProduction")).CreateProduction,
+  },
+  {
+    name: "CreateProductions",
+    route: "productions/bulk",
+    methods: ["POST"],
+    load: async () => (await import("./functions/CreateProductions")).CreateProductions,
+  },
+  {
+    name: "GetProductions",
+    route: "productions",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetProductions")).GetProductions,
+  },
+  {
+    name: "DeleteGroup",
+    route: "group/{id}",
+    methods: ["DELETE"],
+    load: async () => (await import("./functions/DeleteGroup")).DeleteGroup,
+  },
+  {
+    name: "UpdateGroup",
+    route: "groups/{id}",
+    methods: ["PUT"],
+    load: async () => (await import("./functions/UpdateGroup")).UpdateGroup,
+  },
+  {
+    name: "Dashboard",
+    route: "dashboard",
+    methods: ["GET"],
+    load: async () => (await import("./functions/Dashboard")).Dashboard,
+  },
+  {
+    name: "CreateUser",
+    route: "users",
+    methods: ["POST", "OPTIONS"],
+    load: async () => (await import("./functions/CreateUser")).CreateUser,
+  },
+  {
+    name: "LoginUser",
+    route: "auth/login",
+    methods: ["POST", "OPTIONS"],
+    load: async () => (await import("./functions/LoginUser")).LoginUser,
+  },
+  {
+    name: "GetProductionById",
+    route: "productions/{id}",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetProductionById")).GetProductionById,
+  },
+  {
+    name: "UpdateProduction",
+    route: "productions/{id}",
+    methods: ["PUT"],
+    load: async () => (await import("./functions/UpdateProduction")).UpdateProduction,
+  },
+  {
+    name: "DeleteProduction",
+    route: "productions/{id}",
+    methods: ["DELETE", "OPTIONS"],
+    load: async () => (await import("./functions/DeleteProduction")).DeleteProduction,
+  },
+  {
+    name: "ListUsers",
+    route: "listusers",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/ListUsers")).ListUsers,
+  },
+  {
+    name: "GetUserById",
+    route: "users/{id}",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetUserById")).GetUserById,
+  },
+  {
+    name: "UpdateUser",
+    route: "users/update/{id}",
+    methods: ["PUT", "OPTIONS"],
+    load: async () => (await import("./functions/UpdateUser")).UpdateUser,
+  },
+  {
+    name: "DeleteUser",
+    route: "users/delete/{id}",
+    methods: ["DELETE", "OPTIONS"],
+    load: async () => (await import("./functions/DeleteUser")).DeleteUser,
+  },
+  {
+    name: "GetMe",
+    route: "me",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetMe")).GetMe,
+  },
+  {
+    name: "LogoutUser",
+    route: "auth/logout",
+    methods: ["POST", "OPTIONS"],
+    load: async () => (await import("./functions/LogoutUser")).LogoutUser,
+  },
+  {
+    name: "RemoveUserFromGroup",
+    route: "groups/{groupId}/users/{userId}",
+    methods: ["DELETE"],
+    load: async () => (await import("./functions/RemoveUserFromGroup")).RemoveUserFromGroup,
+  },
+  {
+    name: "GetUserGroups",
+    route: "users/{userId}/groups",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetUserGroups")).GetUserGroups,
+  },
+  {
+    name: "GetGroup",
+    route: "groups/{groupId}",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetGroup")).GetGroup,
+  },
+  {
+    name: "ExportData",
+    route: "export-data",
+    methods: ["GET"],
+    load: async () => (await import("./functions/ExportData")).ExportData,
+  },
+  {
+    name: "ImportData",
+    route: "import-data",
+    methods: ["POST"],
+    load: async () => (await import("./functions/ImportData")).ImportData,
+  },
+  {
+    name: "GetUserByJWT",
+    route: "auth/getuserjwt",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetUserByJWT")).GetUserByJWT,
+  },
+  {
+    name: "GetGroupsById",
+    route: "groups/{id}",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetGroupsById")).GetGroupsById,
+  },
+  {
+    name: "GetYearlyReport",
+    route: "reports/yearly/{year}",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetYearlyReport")).GetYearlyReport,
+  },
+  {
+    name: "GetRangeReport",
+    route: "reports/range",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetRangeReport")).GetRangeReport,
+  },
+  {
+    name: "GetCalcSettings",
+    route: "get-calc-settings",
+    methods: ["GET", "POST"],
+    load: async () => (await import("./functions/GetCalcSettings")).GetCalcSettings,
+  },
+  {
+    name: "SaveCalcSettings",
+    route: "save-calc-settings",
+    methods: ["POST"],
+    load: async () => (await import("./functions/SaveCalcSettings")).SaveCalcSettings,
+  },
+  {
+    name: "CalculateCarbonizationVolume",
+    route: "production/calculate-volume",
+    methods: ["POST"],
+    load: async () => (await import("./functions/CalculateCarbonizationVolume")).CalculateCarbonizationVolume,
+  },
+  {
+    name: "CalculateCarbonizationVolumeBatch",
+    route: "production/calculate-volume/batch",
+    methods: ["POST"],
+    load: async () => (await import("./functions/CalculateCarbonizationVolumeBatch")).CalculateCarbonizationVolumeBatch,
+  },
+  {
+    name: "UploadPhoto",
+    route: "upload-photo",
+    methods: ["POST"],
+    load: async () => (await import("./functions/UploadPhoto")).UploadPhoto,
+  },
+  {
+    name: "GetPhoto",
+    route: "get-photo",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetPhoto")).GetPhoto,
+  },
+  {
+    name: "UploadPdf",
+    route: "upload-pdf",
+    methods: ["POST"],
+    load: async () => (await import("./functions/UploadPdf")).UploadPdf,
+  },
+  {
+    name: "GetUploadSasUrl",
+    route: "upload-sas-url",
+    methods: ["POST", "OPTIONS"],
+    load: async () => (await import("./functions/GetUploadSasUrl")).GetUploadSasUrl,
+  },
+  {
+    name: "CompleteUpload",
+    route: "upload-sas-url/complete",
+    methods: ["POST", "OPTIONS"],
+    load: async () => (await import("./functions/CompleteUpload")).CompleteUpload,
+  },
+  {
+    name: "GetPdf",
+    route: "get-pdf",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetPdf")).GetPdf,
+  },
+  {
+    name: "group-ranking",
+    route: "group-ranking",
+    methods: ["GET"],
+    load: async () => (await import("./functions/group-ranking")).GroupRanking,
+  },
+  {
+    name: "group-rankings",
+    route: "group-rankings",
+    methods: ["GET"],
+    load: async () => (await import("./functions/group-rankings")).GroupRankings,
+  },
+  {
+    name: "GetExtinguishingMethodRatio",
+    route: "reports/extinguishing-method-ratio/{year}",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetExtinguishingMethodRatio")).GetExtinguishingMethodRatio,
+  },
+  {
+    name: "CreateProductionSum",
+    route: "production-sum",
+    methods: ["GET", "POST"],
+    load: async () => (await import("./functions/CreateProductionSum")).CreateProductionSum,
+  },
+  {
+    name: "UpdateUserPassword",
+    route: "users/update-password/{id}",
+    methods: ["PUT", "OPTIONS"],
+    load: async () => (await import("./functions/UpdateUserPassword")).UpdateUserPassword,
+  },
+  {
+    name: "GetUserByEmail",
+    route: "users/email/{email}",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetUserByEmail")).GetUserByEmail,
+  },
+  {
+    name: "Health",
+    route: "health",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/Health")).Health,
+  },
+  {
+    name: "GetMetrics",
+    route: "system/metrics",
+    methods: ["GET", "OPTIONS"],
+    load: async () => (await import("./functions/GetMetrics")).GetMetrics,
+  },
+  {
+    name: "GetGroupRankingFromSum",
+    route: "group-ranking-from-sum",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetGroupRankingFromSum")).GetGroupRankingFromSum,
+  },
+  {
+    name: "GetYearlyGroupRankingFromSum",
+    route: "yearly-group-ranking-from-sum",
+    methods: ["GET"],
+    load: async () => (await import("./functions/GetYearlyGroupRankingFromSum")).GetYearlyGroupRankingFromSum,
+  },
+];
+
+// タイマートリガー
+export const timerFunctions: LazyTimerFunction[] = [
+  {
+    name: "ApplyRollupDeltasTimer",
+    schedule: "0 * * * * *", // 1分ごとにロールアップの保留中の差分を加算
+    load: async () => (await import("./functions/ApplyRollupDeltasTimer")).ApplyRollupDeltasTimer,
+  },
+  {
+    name: "CleanupPendingUploadsTimer",
+    schedule: "0 30 * * * *", // 毎時30分に確定されなかった検証前のアップロードを削除
+    load: async () => (await import("./functions/CleanupPendingUploadsTimer")).CleanupPendingUploadsTimer,
+  },
+  {
+    name: "CreateProductionSumTimer",
+    schedule: "0 0 15 * * *", // 日本時間0:00 = UTC時間15:00（前日）に実行
+    load: async () => (await import("./functions/CreateProductionSumTimer")).CreateProductionSumTimer,
+  },
+];
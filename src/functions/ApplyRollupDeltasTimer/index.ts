@@ -0,0 +1,29 @@
+import { Timer, InvocationContext } from "@azure/functions";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import { drainPendingRollupDeltas } from "../../utils/productionRollups";
+import { getProductionSumRebuildStatus } from "../../utils/productionSumRebuild";
+
+async function ApplyRollupDeltasTimer(myTimer: Timer, context: InvocationContext): Promise<void> {
+    try {
+        // 再集計の実行中は保留行を再集計が処理するため加算しない（次回の実行で残りを加算する）
+        const status = await getProductionSumRebuildStatus();
+        if (status?.state === "running") {
+            context.log(`Pending rollup deltas skipped: production sum rebuild is running (started ${status.startedAt ?? "unknown"})`);
+            return;
+        }
+
+        const { groupIds } = await drainPendingRollupDeltas(context);
+        // 書き込み時に加算できなかったグループの行を加算した場合は、そのグループのダッシュボードも作り直す
+        await invalidateDashboards(context, groupIds);
+    } catch (error) {
+        if (error instanceof Error) {
+            context.log(`Error: ${error.message}`);
+            context.log(`Stack Trace: ${error.stack}`);
+        } else {
+            context.log(`Unknown error: ${JSON.stringify(error)}`);
+        }
+        throw error; // Timer Triggerではエラーを再スローして失敗を通知
+    }
+}
+
+export { ApplyRollupDeltasTimer };
@@ -0,0 +1,95 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+
+import { calculateCarbonization, CarbonizationResult, isDeviceModel } from "../../utils/carbonizationVolume";
+
+// 1リクエストで計算できる最大件数
+const MAX_BATCH_ITEMS = 1000;
+
+interface CalculateVolumeBatchInput {
+  items: Array<{ model: unknown; height: unknown }>;
+}
+
+type BatchItemResult =
+  | ({ index: number } & CarbonizationResult)
+  | { index: number; error: string };
+
+/**
+ * 複数の {model, height} をまとめて計算する
+ * フォーム1画面分の入力を1回の呼び出しで計算できるようにし、HTTP往復を削減する
+ * 不正な要素があっても他の要素の計算は継続し、その要素のみ error を返す
+ */
+async function calculateCarbonizationVolumeBatch(
+  request: HttpRequest,
+  context: InvocationContext
+): Promise<HttpResponseInit> {
+  try {
+    const body = await request.json() as CalculateVolumeBatchInput | CalculateVolumeBatchInput['items'];
+
+    // { items: [...] } と配列そのものの両方を受け付ける
+    const items = Array.isArray(body) ? body : body?.items;
+
+    if (!Array.isArray(items) || items.length === 0) {
+      return {
+        status: 400,
+        body: JSON.stringify({ error: 'Invalid items. Must be a non-empty array of { model, height }' }),
+        headers: {
+          'Content-Type': 'application/json',
+          'Access-Control-Allow-Origin': '*'
+        }
+      };
+    }
+
+    if (items.length > MAX_BATCH_ITEMS) {
+      return {
+        status: 400,
+        body: JSON.stringify({ error: `Too many items. Maximum is ${MAX_BATCH_ITEMS}` }),
+        headers: {
+          'Content-Type': 'application/json',
+          'Access-Control-Allow-Origin': '*'
+        }
+      };
+    }
+
+    let errorCount = 0;
+    const results: BatchItemResult[] = items.map((item, index) => {
+      const model = item?.model;
+      const height = item?.height;
+
+      if (!isDeviceModel(model)) {
+        errorCount++;
+        return { index, error: 'Invalid model. Must be L500, L180, or L40' };
+      }
+      if (typeof height !== 'number' || !Number.isFinite(height) || height <= 0) {
+        errorCount++;
+        return { index, error: 'Invalid height. Must be a positive number' };
+      }
+
+      return { index, ...calculateCarbonization(model, height) };
+    });
+
+    return {
+      status: 200,
+      body: JSON.stringify({
+        count: results.length,
+        errorCount,
+        results,
+      }),
+      headers: {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+      }
+    };
+  } catch (error) {
+    context.error('Error calculating volume batch:', error);
+    return {
+      status: 500,
+      body: JSON.stringify({ error: 'Internal server error' }),
+      headers: {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+      }
+    };
+  }
+}
+
+export { calculateCarbonizationVolumeBatch as CalculateCarbonizationVolumeBatch };
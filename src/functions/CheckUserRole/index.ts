@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 
 // Azure Table Storage 接続設定
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -24,7 +24,7 @@ async function CheckUserRole(request: HttpRequest, context: InvocationContext):
     }
 
     try {
-        const client = TableClient.fromConnectionString(connectionString, userTableName);
+        const client = createTableClient(connectionString, userTableName);
 
         // ユーザーを検索
         const user = await client.getEntity("User", userId);
@@ -74,11 +74,4 @@ async function CheckUserRole(request: HttpRequest, context: InvocationContext):
     }
 }
 
-app.http('CheckUserRole', {
-    methods: ['GET'],
-    authLevel: 'anonymous',
-    route: "check-user-role",
-    handler: CheckUserRole
-});
-
 export { CheckUserRole };
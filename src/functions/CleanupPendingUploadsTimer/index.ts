@@ -0,0 +1,54 @@
+import { Timer, InvocationContext } from "@azure/functions";
+import { BlobServiceClient } from "@azure/storage-blob";
+import { PENDING_UPLOAD_CONTAINER_NAME, PENDING_UPLOAD_RETENTION_HOURS } from "../../utils/uploadValidation";
+
+/**
+ * 確定されなかった検証前のアップロード（uploads-pending）を削除する
+ * SAS URLでアップロードした後に CompleteUpload が呼ばれなかったBlobや、確認後に上書きされたBlobが対象
+ * 最終更新から PENDING_UPLOAD_RETENTION_HOURS 時間を過ぎたBlobを、読んだETagを条件に削除する（削除の直前に上書きされたBlobは残す）
+ */
+async function CleanupPendingUploadsTimer(myTimer: Timer, context: InvocationContext): Promise<void> {
+    const connectionString = process.env.AZURE_STORAGE_CONNECTION_STRING ||
+                            process.env.AzureWebJobsStorage ||
+                            process.env.STORAGE_CONNECTION_STRING;
+    if (!connectionString) {
+        context.error("Azure Storage接続文字列が設定されていません");
+        return;
+    }
+
+    try {
+        const containerClient = BlobServiceClient.fromConnectionString(connectionString)
+            .getContainerClient(PENDING_UPLOAD_CONTAINER_NAME);
+        if (!(await containerClient.exists())) {
+            return;
+        }
+
+        const cutoff = Date.now() - PENDING_UPLOAD_RETENTION_HOURS * 60 * 60 * 1000;
+        let deleted = 0;
+        for await (const blob of containerClient.listBlobsFlat()) {
+            if (blob.properties.lastModified.getTime() >= cutoff) {
+                continue;
+            }
+            try {
+                await containerClient.deleteBlob(blob.name, { conditions: { ifMatch: blob.properties.etag } });
+                deleted++;
+            } catch (error: any) {
+                // 同時に確定・削除・上書きされた場合は次回の実行で判定する
+                if (error?.statusCode !== 404 && error?.statusCode !== 412) {
+                    throw error;
+                }
+            }
+        }
+        context.log(`Deleted ${deleted} pending uploads older than ${PENDING_UPLOAD_RETENTION_HOURS} hours`);
+    } catch (error) {
+        if (error instanceof Error) {
+            context.log(`Error: ${error.message}`);
+            context.log(`Stack Trace: ${error.stack}`);
+        } else {
+            context.log(`Unknown error: ${JSON.stringify(error)}`);
+        }
+        throw error; // Timer Triggerではエラーを再スローして失敗を通知
+    }
+}
+
+export { CleanupPendingUploadsTimer };
@@ -0,0 +1,212 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { BlobServiceClient } from "@azure/storage-blob";
+import { authenticateJWT, createForbiddenResponse } from "../../utils/auth";
+import { corsOrigins } from "../../config";
+import {
+  canUploadFor,
+  getUploadExtension,
+  isUploadFileType,
+  PENDING_UPLOAD_CONTAINER_NAME,
+  UploadFileType,
+  UPLOAD_FILE_TYPES,
+  verifyUploadedBlob,
+} from "../../utils/uploadValidation";
+
+interface CompleteUploadRequest {
+  fileType: UploadFileType;
+  fileName: string;
+}
+
+// GetUploadSasUrl が発行するBlob名（userId/groupId/uuid.拡張子）
+const PENDING_FILE_NAME_PATTERN = /^([A-Za-z0-9_-]{1,128})\/([A-Za-z0-9_-]{1,128})\/[0-9a-f-]{36}\.[a-z]+$/;
+
+/**
+ * SAS URLで直接アップロードしたファイルを確定する
+ * 検証前のコンテナ（uploads-pending）のBlobのサイズと先頭バイトを確認し、問題がなければ photos / pdfs へ移す
+ * 問題がある場合はBlobを削除して400を返す
+ * コピーは確認したBlobのETagを条件に行うため、確認後に（SASの有効期間内に）上書きされた内容は保存先へ移さない
+ * 確定されなかったBlobは CleanupPendingUploadsTimer が削除する
+ */
+async function CompleteUpload(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
+  // CORS設定
+  const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
+  const origin = request.headers.get("Origin") || "";
+  const corsOrigin = allowedOrigins.includes(origin) ? origin : allowedOrigins[0];
+
+  const headers = {
+    "Access-Control-Allow-Origin": corsOrigin,
+    "Access-Control-Allow-Credentials": "true",
+    "Content-Type": "application/json"
+  };
+
+  // OPTIONS リクエストの処理
+  if (request.method === "OPTIONS") {
+    return {
+      status: 204,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "POST, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+        "Access-Control-Max-Age": "86400"
+      }
+    };
+  }
+
+  // JWT認証
+  const authResult = authenticateJWT(request, context);
+  if (!authResult.success) {
+    return authResult.response!;
+  }
+  const userPayload = authResult.payload!;
+
+  let body: CompleteUploadRequest;
+  try {
+    body = await request.json() as CompleteUploadRequest;
+  } catch (error) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "Invalid JSON format" })
+    };
+  }
+
+  const { fileType, fileName } = body;
+  const match = typeof fileName === "string" ? PENDING_FILE_NAME_PATTERN.exec(fileName) : null;
+  if (!isUploadFileType(fileType) || !match || getUploadExtension(fileName, fileType) === null) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "Valid fileType and fileName issued by /api/upload-sas-url are required" })
+    };
+  }
+  const [, userId, groupId] = match;
+
+  try {
+    if (!(await canUploadFor(userPayload, userId, groupId))) {
+      return createForbiddenResponse(corsOrigin, "Forbidden: You can only upload files for yourself in your own groups");
+    }
+  } catch (error) {
+    context.error("所属グループの確認エラー:", error);
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({ error: "Failed to verify group membership" })
+    };
+  }
+
+  // Azure Storage接続文字列を取得
+  const connectionString = process.env.AZURE_STORAGE_CONNECTION_STRING ||
+                          process.env.AzureWebJobsStorage ||
+                          process.env.STORAGE_CONNECTION_STRING;
+
+  if (!connectionString) {
+    context.error("Azure Storage接続文字列が設定されていません");
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({ error: "ストレージ設定エラー: 接続文字列が設定されていません" })
+    };
+  }
+
+  try {
+    let blobServiceClient: BlobServiceClient;
+    if (connectionString === "UseDevelopmentStorage=true") {
+      // Azurite用の明示的な接続文字列を使用
+      const azuriteConnectionString = "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;";
+      blobServiceClient = BlobServiceClient.fromConnectionString(azuriteConnectionString);
+    } else {
+      blobServiceClient = BlobServiceClient.fromConnectionString(connectionString);
+    }
+
+    const pendingBlob = blobServiceClient.getContainerClient(PENDING_UPLOAD_CONTAINER_NAME).getBlockBlobClient(fileName);
+    if (!(await pendingBlob.exists())) {
+      return {
+        status: 404,
+        headers,
+        body: JSON.stringify({ error: "Uploaded file not found" })
+      };
+    }
+
+    // 確認中・確認後に上書きされた場合（ETagの条件が一致しない場合）は、もう一度確定してもらう
+    const modifiedResponse = (): HttpResponseInit => {
+      context.warn(`確認中にファイルが上書きされたため確定しませんでした: ${fileName}`);
+      return {
+        status: 409,
+        headers,
+        body: JSON.stringify({ error: "Uploaded file was modified during verification. Please complete the upload again" })
+      };
+    };
+
+    // サイズと形式を確認し、問題がある場合は削除する
+    let verified: Awaited<ReturnType<typeof verifyUploadedBlob>>;
+    try {
+      verified = await verifyUploadedBlob(pendingBlob, fileType);
+    } catch (error: any) {
+      if (error?.statusCode === 412) {
+        return modifiedResponse();
+      }
+      throw error;
+    }
+    if ("error" in verified) {
+      await pendingBlob.deleteIfExists();
+      context.warn(`アップロードされたファイルを破棄しました: ${fileName} (${verified.error})`);
+      return {
+        status: 400,
+        headers,
+        body: JSON.stringify({ error: verified.error })
+      };
+    }
+
+    // 保存先のコンテナへ移す（同じアカウント内のコピー）
+    const containerClient = blobServiceClient.getContainerClient(UPLOAD_FILE_TYPES[fileType].containerName);
+    await containerClient.createIfNotExists();
+    const blockBlobClient = containerClient.getBlockBlobClient(fileName);
+    try {
+      const poller = await blockBlobClient.beginCopyFromURL(pendingBlob.url, {
+        sourceConditions: { ifMatch: verified.etag }
+      });
+      await poller.pollUntilDone();
+    } catch (error: any) {
+      if (error?.statusCode === 412) {
+        return modifiedResponse();
+      }
+      throw error;
+    }
+    await blockBlobClient.setHTTPHeaders({ blobContentType: verified.contentType });
+    try {
+      // コピーした内容のままの場合のみ削除する（上書きされたBlobは CleanupPendingUploadsTimer が削除する）
+      await pendingBlob.deleteIfExists({ conditions: { ifMatch: verified.etag } });
+    } catch (error: any) {
+      if (error?.statusCode !== 412) {
+        throw error;
+      }
+    }
+
+    context.log(`直接アップロードを確定しました: ${containerClient.containerName}/${fileName}, サイズ: ${verified.size} bytes`);
+
+    return {
+      status: 200,
+      headers,
+      body: JSON.stringify({
+        success: true,
+        fileName,
+        blobUrl: blockBlobClient.url,
+        contentType: verified.contentType,
+        size: verified.size
+      })
+    };
+  } catch (error) {
+    context.error("アップロード確定エラー:", error);
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({
+        error: "アップロードの確定に失敗しました",
+        details: error instanceof Error ? error.message : "Unknown error"
+      })
+    };
+  }
+}
+
+export { CompleteUpload };
@@ -1,8 +1,11 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient, AzureNamedKeyCredential } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { AzureNamedKeyCredential } from "@azure/data-tables";
+import { createTableClient } from "../../utils/tableClient";
 import { v4 as uuidv4 } from "uuid";
 import { authenticateJWT, JWTPayload, isAdminOrOperator } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { tryBumpRankingGeneration } from "../../utils/rankingSnapshot";
+import { assignGroupShard } from "../../utils/shardMap";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "GroupsTable";
@@ -99,9 +102,15 @@ async function CreateGroup(request: HttpRequest, context: InvocationContext): Pr
         createdAt: new Date().toISOString(),
     };
 
-    const tableClient = TableClient.fromConnectionString(connectionString, tableName);
+    const tableClient = createTableClient(connectionString, tableName);
     try {
+        // 生産データを保存するストレージアカウントを割り当ててからグループを作成する
+        // （グループの作成前に割り当てることで、最初の生産記録から割り当て先に保存される）
+        const shard = await assignGroupShard(id);
+        context.log(`Group ${id} assigned to production shard ${shard.name}`);
         await tableClient.createEntity(groupEntity);
+        // ランキングのスナップショットにはグループ情報が含まれるため世代を更新
+        await tryBumpRankingGeneration(context, "CreateGroup");
         return {
             status: 201,
             headers: {
@@ -129,11 +138,4 @@ async function CreateGroup(request: HttpRequest, context: InvocationContext): Pr
     }
 }
 
-app.http('CreateGroup', {
-    methods: ['POST'],
-    authLevel: 'anonymous',
-    route: "group",
-    handler: CreateGroup
-});
-
 export { CreateGroup };
@@ -1,13 +1,10 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient, AzureNamedKeyCredential } from "@azure/data-tables";
-import { v4 as uuidv4 } from "uuid";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
-
-// Azure Table Storage 接続設定
-const connectionString = process.env.AzureWebJobsStorage!;
-const tableName = "ProductionTable";
-const partitionKey = "Production"; // 固定値でもユーザー別でもOK
+import { tryApplyProductionChange } from "../../utils/productionRollups";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import { createProductionRecord, insertProduction, ProductionInput, validateProductionInput } from "../../utils/productionWrites";
+import { createShardMovingResponse, ShardMovingError } from "../../utils/shardMap";
 
 async function CreateProduction(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
     // CORS設定
@@ -25,27 +22,9 @@ async function CreateProduction(request: HttpRequest, context: InvocationContext
     context.log(`Http function processed request for url "${request.url}" by user: ${userPayload.email}`);
         
     try {
-        interface ProductionRequestBody {
-            date: string;
-            materialType: string;
-            materialAmount?: number;
-            charcoalProduced?: number;
-            charcoalVolume?: number;
-            charcoalScale?: string;
-            charcoalScaleInput?: number;
-            inputMethod?: string;
-            extinguishingMethod: string;
-            co2Reduction?: number;
-            batchNumber?: string;
-            notes?: string;
-            photoUrl?: string;
-            userId: string;
-            groupId: string;
-        }
-
-        let body: ProductionRequestBody;
+        let body: ProductionInput;
         try {
-            body = await request.json() as ProductionRequestBody;
+            body = await request.json() as ProductionInput;
         } catch (error) {
             if (error instanceof Error) {
                 context.log(`Failed to parse request body: ${error.message}`);
@@ -64,25 +43,8 @@ async function CreateProduction(request: HttpRequest, context: InvocationContext
             };
         }
 
-        const {
-            date,
-            materialType,
-            materialAmount,
-            charcoalProduced,
-            charcoalVolume,
-            charcoalScale,
-            charcoalScaleInput,
-            inputMethod,
-            extinguishingMethod,
-            co2Reduction,
-            batchNumber,
-            notes,
-            photoUrl,
-            userId,
-            groupId
-        } = body;
-
-        if (!date || !materialType || !extinguishingMethod || !userId || !groupId) {
+        const validationError = validateProductionInput(body);
+        if (validationError !== null) {
             return {
               status: 400,
               headers: {
@@ -91,35 +53,20 @@ async function CreateProduction(request: HttpRequest, context: InvocationContext
                 "Access-Control-Allow-Headers": "Content-Type",
                 "Content-Type": "application/json",
               },
-              body: "Missing required fields"
+              body: validationError
             };
         }
 
-        const id = uuidv4();
-
-        const production = {
-            partitionKey,
-            rowKey: id,
-            date,
-            materialType,
-            materialAmount: materialAmount?.toString() || null,
-            charcoalProduced: charcoalProduced?.toString() || null,
-            charcoalVolume: charcoalVolume?.toString() || null,
-            charcoalScale: charcoalScale || null,
-            charcoalScaleInput: charcoalScaleInput?.toString() || null,
-            inputMethod: inputMethod || null,
-            extinguishingMethod,
-            co2Reduction: co2Reduction?.toString() || null,
-            batchNumber: batchNumber || null,
-            notes: notes || null,
-            photoUrl: photoUrl || null,
-            userId,
-            groupId,
-            createdAt: new Date().toISOString(),
-            updatedAt: null
-        };
-        const client = TableClient.fromConnectionString(connectionString, tableName);
-        await client.createEntity(production);
+        // PartitionKey = groupId（設定により groupId_年）、RowKey = 生産日_uuid
+        const production = createProductionRecord(body);
+        const id = production.rowKey;
+        // グループに割り当てられたストレージアカウントに保存する（移動中のグループは503）
+        // 同時に届いた同じパーティションへの作成は1回のトランザクションにまとめて書き込まれる
+        await insertProduction(production);
+        // 期間別集計（日・月・年）に加算
+        await tryApplyProductionChange(context, null, production);
+        // グループのダッシュボードを無効にする（次のリクエストで作り直される）
+        await invalidateDashboards(context, [production.groupId]);
 
         context.log(`Entity created with ID: ${id}`);
         return {
@@ -137,6 +84,13 @@ async function CreateProduction(request: HttpRequest, context: InvocationContext
             })
         };
     } catch (error) {
+        if (error instanceof ShardMovingError) {
+            return createShardMovingResponse(error, {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type",
+            });
+        }
         if (error instanceof Error) {
             context.log(`Error: ${error.message}`);
             context.log(`Stack Trace: ${error.stack}`); // スタックトレースを追加
@@ -156,11 +110,4 @@ async function CreateProduction(request: HttpRequest, context: InvocationContext
     };
 }
 
-app.http('CreateProduction', {
-    methods: ['GET', 'POST'],
-    authLevel: 'anonymous',
-    route: "production",
-    handler: CreateProduction
-});
-
 export { CreateProduction };
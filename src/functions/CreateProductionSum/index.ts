@@ -1,72 +1,13 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
-import { BlobServiceClient } from "@azure/storage-blob";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import {
+    getProductionSumRebuildStatus,
+    ProductionSumLeaseLostError,
+    REBUILD_RETRY_AFTER_SECONDS,
+    runProductionSumRebuild,
+} from "../../utils/productionSumRebuild";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
 
-// Azure Table Storage 接続設定
-const connectionString = process.env.AzureWebJobsStorage!;
-const productionTableName = "ProductionTable";
-const productionSumTableName = "ProductionSumTable";
-const partitionKey = "ProductionSum";
-
-interface ProductionData {
-    partitionKey: string;
-    rowKey: string;
-    date: string;
-    materialType: string;
-    materialAmount?: string;
-    charcoalProduced?: string;
-    charcoalVolume?: string;
-    co2Reduction?: string;
-    groupId: string;
-}
-
-interface ProductionSumData {
-    partitionKey: string;
-    rowKey: string;
-    year: string;
-    groupId: string;
-    materialAmount: number;
-    charcoalProduced: number;
-    charcoalVolume: number;
-    co2Reduction: number;
-    carbonContent: number;
-    ipccLongTerm: number;
-    createdAt: string;
-    updatedAt: string;
-}
-
-interface CalcSettings {
-    carbonContentFactors: {
-        bamboo: number;
-        pruning: number;
-        herbaceous: number;
-        other: number;
-    };
-    co2ConversionFactor: number;
-    ipccLongTermFactors: {
-        bamboo: number;
-        pruning: number;
-        herbaceous: number;
-        other: number;
-    };
-}
-
-// ストリームを文字列に変換するヘルパー関数
-async function streamToString(readableStream: NodeJS.ReadableStream): Promise<string> {
-    return new Promise((resolve, reject) => {
-        const chunks: Buffer[] = [];
-        readableStream.on('data', (data) => {
-            chunks.push(data instanceof Buffer ? data : Buffer.from(data));
-        });
-        readableStream.on('end', () => {
-            resolve(Buffer.concat(chunks).toString('utf8'));
-        });
-        readableStream.on('error', reject);
-    });
-}
-
 async function CreateProductionSum(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
     // CORS設定
     const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
@@ -82,178 +23,65 @@ async function CreateProductionSum(request: HttpRequest, context: InvocationCont
     const userPayload = authResult.payload!;
     context.log(`Http function processed request for url "${request.url}" by user: ${userPayload.email}`);
 
+    const headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type",
+        "Content-Type": "application/json"
+    };
+
     try {
-        // calc-settingsから設定値を取得
-        const blobServiceClient = BlobServiceClient.fromConnectionString(connectionString);
-        const containerClient = blobServiceClient.getContainerClient("calc-settings");
-        const blobClient = containerClient.getBlobClient("setting.json");
-        
-        let calcSettings: CalcSettings;
-        try {
-            const downloadResponse = await blobClient.download();
-            const settingsText = await streamToString(downloadResponse.readableStreamBody!);
-            calcSettings = JSON.parse(settingsText);
-        } catch (error) {
-            context.log(`Warning: Could not load calc settings, using defaults: ${error}`);
-            // デフォルト値を使用
-            calcSettings = {
-                carbonContentFactors: {
-                    bamboo: 0.8,
-                    pruning: 0.8,
-                    herbaceous: 0.65,
-                    other: 0.8
-                },
-                co2ConversionFactor: 3.67,
-                ipccLongTermFactors: {
-                    bamboo: 0.8,
-                    pruning: 0.8,
-                    herbaceous: 0.65,
-                    other: 0.8
-                }
+        // ?status=true の場合は再集計せずに実行状況のみ返す
+        if (request.query.get("status") === "true") {
+            return {
+                status: 200,
+                headers,
+                body: JSON.stringify({ rebuild: await getProductionSumRebuildStatus() })
             };
         }
 
-        // ProductionTableからデータを取得
-        const productionClient = TableClient.fromConnectionString(connectionString, productionTableName);
-        const productionEntities = productionClient.listEntities<ProductionData>();
-
-        // データを年、groupId、materialTypeでグループ化
-        const groupedData = new Map<string, {
-            year: string;
-            groupId: string;
-            materialType: string;
-            materialAmount: number;
-            charcoalProduced: number;
-            charcoalVolume: number;
-            co2Reduction: number;
-            carbonContent: number;
-            ipccLongTerm: number;
-        }>();
-
-        for await (const entity of productionEntities) {
-            if (!entity.date || !entity.groupId || !entity.materialType) continue;
-
-            // 日付から年を抽出
-            const year = entity.date.split('-')[0];
-            const groupKey = `${year}-${entity.groupId}-${entity.materialType}`;
-
-            // 数値変換用のヘルパー関数
-            const parseNumber = (value: string | undefined): number => {
-                if (!value) return 0;
-                const parsed = parseFloat(value);
-                return isNaN(parsed) ? 0 : parsed;
+        // 再集計は同時に1つのみ実行する（同じインスタンスで実行中の場合はその結果を待つ）
+        const outcome = await runProductionSumRebuild(context, "CreateProductionSum");
+
+        // 別のインスタンスで実行中の場合は実行状況を返す
+        if (outcome.kind === "busy") {
+            return {
+                status: 202,
+                headers: { ...headers, "Retry-After": String(REBUILD_RETRY_AFTER_SECONDS) },
+                body: JSON.stringify({
+                    message: "Production sum rebuild is already running",
+                    rebuild: outcome.status
+                })
             };
-
-            if (!groupedData.has(groupKey)) {
-                groupedData.set(groupKey, {
-                    year,
-                    groupId: entity.groupId,
-                    materialType: entity.materialType,
-                    materialAmount: 0,
-                    charcoalProduced: 0,
-                    charcoalVolume: 0,
-                    co2Reduction: 0,
-                    carbonContent: 0,
-                    ipccLongTerm: 0
-                });
-            }
-
-            const group = groupedData.get(groupKey)!;
-            group.materialAmount += parseNumber(entity.materialAmount);
-            group.charcoalProduced += parseNumber(entity.charcoalProduced);
-            group.charcoalVolume += parseNumber(entity.charcoalVolume);
-            group.co2Reduction += parseNumber(entity.co2Reduction);
         }
 
-        // 各グループの計算を実行
-        for (const [groupKey, data] of groupedData) {
-            // carbonContent量の計算
-            const carbonContentFactor = calcSettings.carbonContentFactors[data.materialType as keyof typeof calcSettings.carbonContentFactors] || calcSettings.carbonContentFactors.other;
-            data.carbonContent = data.charcoalProduced * carbonContentFactor;
-
-            // co2Reduction量の計算
-            data.co2Reduction = data.carbonContent * calcSettings.co2ConversionFactor;
-
-            // ipccLongTerm量の計算
-            const ipccLongTermFactor = calcSettings.ipccLongTermFactors[data.materialType as keyof typeof calcSettings.ipccLongTermFactors] || calcSettings.ipccLongTermFactors.other;
-            data.ipccLongTerm = data.co2Reduction * ipccLongTermFactor;
-        }
-
-        // ProductionSumテーブルの作成と既存データの削除（洗い替え）
-        const productionSumClient = TableClient.fromConnectionString(connectionString, productionSumTableName);
-        
-        try {
-            // テーブルが存在するかチェックし、存在しない場合は作成
-            await productionSumClient.createTable();
-            context.log(`Created ProductionSumTable`);
-        } catch (error) {
-            // テーブルが既に存在する場合は無視
-            context.log(`ProductionSumTable already exists or creation failed: ${error}`);
-        }
-        
-        try {
-            // 既存のエンティティを取得して削除
-            const existingEntities = productionSumClient.listEntities<ProductionSumData>();
-            const deletePromises: Promise<void>[] = [];
-
-            for await (const entity of existingEntities) {
-                deletePromises.push(
-                    productionSumClient.deleteEntity(entity.partitionKey, entity.rowKey).then(() => {})
-                );
-            }
-
-            await Promise.all(deletePromises);
-            context.log(`Deleted ${deletePromises.length} existing entities from ProductionSumTable`);
-        } catch (error) {
-            context.log(`Warning: Could not delete existing entities: ${error}`);
-            // テーブルが存在しない場合は無視
-        }
-
-        // 新しいデータをProductionSumテーブルに保存
-        const savePromises: Promise<void>[] = [];
-        const currentTime = new Date().toISOString();
-
-        for (const [groupKey, data] of groupedData) {
-            const productionSumData: ProductionSumData = {
-                partitionKey,
-                rowKey: groupKey,
-                year: data.year,
-                groupId: data.groupId,
-                materialAmount: data.materialAmount,
-                charcoalProduced: data.charcoalProduced,
-                charcoalVolume: data.charcoalVolume,
-                co2Reduction: data.co2Reduction,
-                carbonContent: data.carbonContent,
-                ipccLongTerm: data.ipccLongTerm,
-                createdAt: currentTime,
-                updatedAt: currentTime
-            };
-
-            savePromises.push(
-                productionSumClient.createEntity(productionSumData).then(() => {})
-            );
-        }
-
-        await Promise.all(savePromises);
-
-        context.log(`Created ${savePromises.length} production sum entities`);
-
+        const { groupedData } = outcome.result;
         return {
             status: 200,
-            headers: {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
+            headers,
             body: JSON.stringify({
                 message: "Production sum data created successfully",
                 totalGroups: groupedData.size,
+                joined: outcome.joined,
+                rebuild: outcome.status,
                 data: Array.from(groupedData.values())
             })
         };
 
     } catch (error) {
+        // 再集計中にリースを失った場合は中止した実行状況を返す（別のインスタンスの再集計が続いている可能性がある）
+        if (error instanceof ProductionSumLeaseLostError) {
+            context.warn(error.message);
+            return {
+                status: 409,
+                headers: { ...headers, "Retry-After": String(REBUILD_RETRY_AFTER_SECONDS) },
+                body: JSON.stringify({
+                    error: "Production sum rebuild lost its lease and was aborted",
+                    rebuild: error.status
+                })
+            };
+        }
+
         if (error instanceof Error) {
             context.log(`Error: ${error.message}`);
             context.log(`Stack Trace: ${error.stack}`);
@@ -263,22 +91,10 @@ async function CreateProductionSum(request: HttpRequest, context: InvocationCont
 
         return {
             status: 500,
-            headers: {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
+            headers,
             body: JSON.stringify({ error: "Internal Server Error" })
         };
     }
 }
 
-app.http('CreateProductionSum', {
-    methods: ['GET', 'POST'],
-    authLevel: 'anonymous',
-    route: "production-sum",
-    handler: CreateProductionSum
-});
-
 export { CreateProductionSum };
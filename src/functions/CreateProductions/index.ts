@@ -0,0 +1,111 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { authenticateJWT } from "../../utils/auth";
+import { tryApplyProductionChanges } from "../../utils/productionRollups";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import { createProductionRecord, insertProductions, ProductionInput, validateProductionInput } from "../../utils/productionWrites";
+import { ShardMovingError } from "../../utils/shardMap";
+
+// 1リクエストで作成できる最大件数
+const MAX_BULK_ITEMS = 1000;
+
+type BulkItemResult =
+  | { index: number; id: string }
+  | { index: number; error: string };
+
+const headers = {
+  "Access-Control-Allow-Origin": "*",
+  "Access-Control-Allow-Methods": "POST, OPTIONS",
+  "Access-Control-Allow-Headers": "Content-Type",
+  "Content-Type": "application/json",
+};
+
+/**
+ * 生産記録をまとめて作成する
+ * 表計算ソフトからの取り込みなどで、数百件の記録を1回の呼び出しで登録できるようにする
+ * - 全件を先に検証し、不正な要素があれば1件も作成せずに 400 と要素ごとのエラーを返す
+ * - 書き込みはパーティションごとに最大100件のトランザクションで行い、期間別集計とダッシュボードはまとめて1回更新する
+ * - 書き込みに失敗した要素（移動中のグループなど）があれば 207 を返し、その要素のみ error を返す
+ */
+async function CreateProductions(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
+  // JWT認証
+  const authResult = authenticateJWT(request, context);
+  if (!authResult.success) {
+    return authResult.response!;
+  }
+  context.log(`Http function processed request for url "${request.url}" by user: ${authResult.payload!.email}`);
+
+  try {
+    let body: { productions: unknown[] } | unknown[];
+    try {
+      body = await request.json() as { productions: unknown[] } | unknown[];
+    } catch {
+      return { status: 400, headers, body: JSON.stringify({ error: "Invalid JSON format" }) };
+    }
+
+    // { productions: [...] } と配列そのものの両方を受け付ける
+    const items = Array.isArray(body) ? body : body?.productions;
+    if (!Array.isArray(items) || items.length === 0) {
+      return { status: 400, headers, body: JSON.stringify({ error: "Invalid productions. Must be a non-empty array" }) };
+    }
+    if (items.length > MAX_BULK_ITEMS) {
+      return { status: 400, headers, body: JSON.stringify({ error: `Too many productions. Maximum is ${MAX_BULK_ITEMS}` }) };
+    }
+
+    // 全件を検証してから書き込む（途中まで登録された状態にしない）
+    const invalid = items
+      .map((item, index) => ({ index, error: validateProductionInput(item) }))
+      .filter((item): item is { index: number; error: string } => item.error !== null);
+    if (invalid.length > 0) {
+      return {
+        status: 400,
+        headers,
+        body: JSON.stringify({ error: "Invalid productions", errorCount: invalid.length, errors: invalid }),
+      };
+    }
+
+    const productions = (items as ProductionInput[]).map(createProductionRecord);
+    const writes = await insertProductions(productions);
+
+    const created = writes.filter((write) => write.error === undefined).map((write) => write.production);
+    // 期間別集計（日・月・年）は同じ行への加算をまとめて1回で反映する
+    await tryApplyProductionChanges(context, created.map((production) => ({ before: null, after: production })));
+    // 記録を作成したグループのダッシュボードを無効にする（次のリクエストで作り直される）
+    await invalidateDashboards(context, new Set(created.map((production) => production.groupId)));
+
+    let errorCount = 0;
+    const results: BulkItemResult[] = writes.map((write, index) => {
+      if (write.error === undefined) {
+        return { index, id: write.production.rowKey };
+      }
+      errorCount++;
+      if (write.error instanceof ShardMovingError) {
+        return { index, error: write.error.message };
+      }
+      context.log(`Error creating production ${index}: ${write.error}`);
+      return { index, error: "Failed to create production" };
+    });
+
+    context.log(`Bulk created ${created.length} of ${productions.length} productions`);
+    return {
+      status: errorCount > 0 ? 207 : 201,
+      headers,
+      body: JSON.stringify({
+        message: errorCount > 0 ? "Some productions could not be created" : "Productions created successfully",
+        count: results.length,
+        createdCount: created.length,
+        errorCount,
+        results,
+      }),
+    };
+  } catch (error) {
+    if (error instanceof Error) {
+      context.log(`Error: ${error.message}`);
+      context.log(`Stack Trace: ${error.stack}`);
+    } else {
+      context.log(`Unknown error: ${JSON.stringify(error)}`);
+    }
+    return { status: 500, headers, body: JSON.stringify({ error: "Internal Server Error" }) };
+  }
+}
+
+export { CreateProductions };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { v4 as uuidv4 } from "uuid";
 import bcrypt from "bcryptjs";
 import jwt from "jsonwebtoken";
@@ -124,7 +124,7 @@ async function CreateUser(request: HttpRequest, context: InvocationContext): Pro
   }
 
   try {
-    const client = TableClient.fromConnectionString(connectionString, tableName);
+    const client = createTableClient(connectionString, tableName);
     const rowKey = uuidv4();
     const hashedPassword = await bcrypt.hash(input.password, 10);
     const timestamp = new Date().toISOString();
@@ -171,11 +171,4 @@ async function CreateUser(request: HttpRequest, context: InvocationContext): Pro
   }
 }
 
-app.http("CreateUser", {
-  methods: ["POST", "OPTIONS"],
-  authLevel: "anonymous",
-  route: "users",
-  handler: CreateUser,
-});
-
 export { CreateUser };
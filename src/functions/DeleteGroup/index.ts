@@ -1,7 +1,8 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload, isAdminOrOperator } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { tryBumpRankingGeneration } from "../../utils/rankingSnapshot";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "GroupsTable";
@@ -48,10 +49,12 @@ async function DeleteGroup(request: HttpRequest, context: InvocationContext): Pr
         };
     }
     
-    const client = TableClient.fromConnectionString(connectionString, tableName);
+    const client = createTableClient(connectionString, tableName);
     
     try {
         await client.deleteEntity(partitionKey, id);
+        // ランキングのスナップショットにはグループ情報が含まれるため世代を更新
+        await tryBumpRankingGeneration(context, "DeleteGroup");
         return { 
             status: 204, // No Content
             headers: {
@@ -71,11 +74,4 @@ async function DeleteGroup(request: HttpRequest, context: InvocationContext): Pr
     }
 }
 
-app.http("DeleteGroup", {
-    methods: ["DELETE"],
-    route: "group/{id}",
-    authLevel: "anonymous",
-    handler: DeleteGroup,
-});
-
 export { DeleteGroup };
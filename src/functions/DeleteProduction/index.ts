@@ -1,7 +1,16 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import jwt from "jsonwebtoken";
-import { connectionString, tableName, partitionKey, jwtSecret, corsOrigins } from "../../config";
+import { tableName, jwtSecret, corsOrigins } from "../../config";
+import { isGroupIdRequiredForLookup } from "../../utils/productionKeys";
+import { tryApplyProductionChange } from "../../utils/productionRollups";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import {
+  createShardMovingResponse,
+  findProductionInShards,
+  getShardTableClient,
+  resolveGroupShardForWrite,
+  ShardMovingError,
+} from "../../utils/shardMap";
 
 async function DeleteProduction(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
   const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
@@ -83,10 +92,44 @@ async function DeleteProduction(request: HttpRequest, context: InvocationContext
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
-
   try {
-    await client.deleteEntity(partitionKey, id);
+    // groupIdからそのグループのストレージアカウント・パーティションを特定して検索
+    // （groupIdなしで検索できるのは旧パーティションの記録のみ）
+    const groupId = new URL(request.url).searchParams.get("groupId");
+    if (!groupId && isGroupIdRequiredForLookup(id)) {
+      return {
+        status: 400,
+        headers: {
+          "Access-Control-Allow-Origin": corsOrigin,
+          "Access-Control-Allow-Credentials": "true",
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({ error: "groupId is required" }),
+      };
+    }
+    const found = await findProductionInShards(tableName, id, groupId);
+    if (!found) {
+      return {
+        status: 404,
+        headers: {
+          "Access-Control-Allow-Origin": corsOrigin,
+          "Access-Control-Allow-Credentials": "true",
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({ error: "Production not found or already deleted" }),
+      };
+    }
+
+    const entity = found.entity;
+    // 移動中のグループの記録は削除しない（503）
+    if (typeof entity.groupId === "string") {
+      await resolveGroupShardForWrite(entity.groupId);
+    }
+    await getShardTableClient(found.shard, tableName).deleteEntity(entity.partitionKey!, entity.rowKey!);
+    // 期間別集計（日・月・年）から減算
+    await tryApplyProductionChange(context, entity, null);
+    // グループのダッシュボードを無効にする（次のリクエストで作り直される）
+    await invalidateDashboards(context, [entity.groupId]);
     return {
       status: 204,
       headers: {
@@ -96,6 +139,12 @@ async function DeleteProduction(request: HttpRequest, context: InvocationContext
       },
     };
   } catch (error: any) {
+    if (error instanceof ShardMovingError) {
+      return createShardMovingResponse(error, {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+      });
+    }
     context.log(`Error deleting entity: ${error?.message || JSON.stringify(error)}`);
     // 存在しない場合は 404、それ以外は 500
     const notFound = (error?.statusCode === 404) || (error?.code === "ResourceNotFound");
@@ -111,11 +160,4 @@ async function DeleteProduction(request: HttpRequest, context: InvocationContext
   }
 }
 
-app.http("DeleteProduction", {
-  methods: ["DELETE", "OPTIONS"],
-  route: "productions/{id}",
-  authLevel: "anonymous",
-  handler: DeleteProduction,
-});
-
 export { DeleteProduction };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import { jwtSecret, corsOrigins } from "../../config";
 
@@ -100,7 +100,7 @@ async function DeleteUser(
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   try {
     await client.deleteEntity(partitionKey, rowKey);
@@ -127,11 +127,4 @@ async function DeleteUser(
   }
 }
 
-app.http("DeleteUser", {
-  methods: ["DELETE", "OPTIONS"],
-  authLevel: "anonymous",
-  route: "users/delete/{id}",
-  handler: DeleteUser,
-});
-
 export { DeleteUser };
@@ -1,7 +1,9 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload, isAdminOrOperator } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { createProductionDeduper } from "../../utils/productionKeys";
+import { createShardOwnershipFilter, forEachShard, getShardTableClient } from "../../utils/shardMap";
 
 // Azure Table Storage 接続設定
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -73,16 +75,24 @@ async function ExportData(request: HttpRequest, context: InvocationContext): Pro
             version: "1.0.0"
         };
 
-        // 生産データをエクスポート（すべて）
-        const productionClient = TableClient.fromConnectionString(connectionString, productionTableName);
-        const productionEntities = productionClient.listEntities();
-
-        for await (const entity of productionEntities) {
-            exportData.productions.push(entity);
-        }
+        // 生産データをエクスポート（すべてのストレージアカウントから並列に読み込み、シャードの順に並べる）
+        const isOwned = await createShardOwnershipFilter();
+        const isFirst = createProductionDeduper();
+        const shardProductions = await forEachShard(async (shard) => {
+            const productions: any[] = [];
+            const productionClient = getShardTableClient(shard, productionTableName);
+            for await (const entity of productionClient.listEntities()) {
+                // 移動中のグループのコピー・キー移行中の旧キーのコピーを二重に出力しない
+                if (isOwned(shard, entity.groupId) && isFirst(entity)) {
+                    productions.push(entity);
+                }
+            }
+            return productions;
+        });
+        exportData.productions = shardProductions.flat();
 
         // ユーザーデータをエクスポート（すべて）
-        const userClient = TableClient.fromConnectionString(connectionString, userTableName);
+        const userClient = createTableClient(connectionString, userTableName);
         const userEntities = userClient.listEntities();
 
         for await (const entity of userEntities) {
@@ -90,7 +100,7 @@ async function ExportData(request: HttpRequest, context: InvocationContext): Pro
         }
 
         // グループデータをエクスポート（すべて）
-        const groupClient = TableClient.fromConnectionString(connectionString, groupTableName);
+        const groupClient = createTableClient(connectionString, groupTableName);
         const groupEntities = groupClient.listEntities();
 
         for await (const entity of groupEntities) {
@@ -127,11 +137,4 @@ async function ExportData(request: HttpRequest, context: InvocationContext): Pro
     }
 }
 
-app.http('ExportData', {
-    methods: ['GET'],
-    authLevel: 'anonymous',
-    route: "export-data",
-    handler: ExportData
-});
-
 export { ExportData };
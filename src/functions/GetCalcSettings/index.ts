@@ -1,4 +1,4 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { BlobServiceClient } from "@azure/storage-blob";
 
 // 計算パラメータ用のインターフェース
@@ -263,11 +263,4 @@ async function streamToString(readableStream: NodeJS.ReadableStream): Promise<st
   });
 }
 
-app.http('GetCalcSettings', {
-  methods: ['GET', 'POST'],
-  authLevel: 'anonymous',
-  route: 'get-calc-settings',
-  handler: GetCalcSettings
-});
-
 export { GetCalcSettings };
@@ -1,24 +1,25 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
-import { connectionString, tableName, partitionKey } from "../../config";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { tableName } from "../../config";
+import { createProductionDeduper } from "../../utils/productionKeys";
+import {
+  buildProductionYearFilter,
+  ProductionColumns,
+  selectProductionColumns,
+  toNumber,
+} from "../../utils/productionColumns";
+import { recordDiscarded } from "../../utils/metrics";
+import { coalesce, createCoalesceKey } from "../../utils/singleFlight";
+import { createShardOwnershipFilter, forEachShard, getShardTableClient } from "../../utils/shardMap";
 
-async function GetExtinguishingMethodRatio(
-  request: HttpRequest,
-  context: InvocationContext
-): Promise<HttpResponseInit> {
-  context.log("Processing GET /reports/extinguishing-method-ratio/:year");
-
-  const yearParam = request.params.year;
-  if (!yearParam || isNaN(Number(yearParam))) {
-    return {
-      status: 400,
-      body: "Invalid or missing year parameter",
-    };
-  }
-  const year = Number(yearParam);
-
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+// 集計に必要な列
+const RATIO_COLUMNS = selectProductionColumns("productionId", "groupId", "charcoalProduced", "extinguishingMethod");
 
+/**
+ * 指定年の生産記録を消化方法別に集計する関数
+ * @param year 対象年
+ * @returns 消化方法別の生産量合計と割合
+ */
+async function aggregateExtinguishingMethodRatio(year: number) {
   // 消化方法別の生産量合計を格納するオブジェクト
   const extinguishingMethodTotals: { [key: string]: number } = {
     water: 0,
@@ -27,18 +28,27 @@ async function GetExtinguishingMethodRatio(
 
   let totalCharcoalProduced = 0;
 
-  try {
-    const entities = client.listEntities<Record<string, any>>({
+  const isFirst = createProductionDeduper();
+  const isOwned = await createShardOwnershipFilter();
+
+  // 生産記録はストレージアカウント・グループ別のパーティションに分散しているため、全アカウントの全パーティションを並列に走査する
+  // 対象年の絞り込みはサーバー側で行い、集計に必要な列のみ取得する
+  await forEachShard(async (shard) => {
+    const client = getShardTableClient(shard, tableName);
+    const entities = client.listEntities<ProductionColumns<typeof RATIO_COLUMNS[number]>>({
       queryOptions: {
-        filter: `PartitionKey eq '${partitionKey}'`,
+        filter: buildProductionYearFilter(year),
+        select: RATIO_COLUMNS,
       },
     });
 
     for await (const entity of entities) {
-      const date = new Date(entity.date);
-      if (date.getFullYear() !== year) continue;
-
-      const charcoalProduced = Number(entity.charcoalProduced || 0);
+      // 移動中のグループのコピーは割り当て先のアカウントの行のみ数える
+      if (!isOwned(shard, entity.groupId) || !isFirst(entity)) {
+        recordDiscarded();
+        continue;
+      }
+      const charcoalProduced = toNumber(entity.charcoalProduced);
       const extinguishingMethod = entity.extinguishingMethod;
 
       if (charcoalProduced > 0 && extinguishingMethod) {
@@ -49,29 +59,53 @@ async function GetExtinguishingMethodRatio(
         }
       }
     }
+  });
 
-    // 割合を計算
-    const ratios = {
-      water: totalCharcoalProduced > 0 ? (extinguishingMethodTotals.water / totalCharcoalProduced) * 100 : 0,
-      oxygen: totalCharcoalProduced > 0 ? (extinguishingMethodTotals.oxygen / totalCharcoalProduced) * 100 : 0,
-    };
+  // 割合を計算
+  const ratios = {
+    water: totalCharcoalProduced > 0 ? (extinguishingMethodTotals.water / totalCharcoalProduced) * 100 : 0,
+    oxygen: totalCharcoalProduced > 0 ? (extinguishingMethodTotals.oxygen / totalCharcoalProduced) * 100 : 0,
+  };
 
-    const result = {
-      year,
-      totalCharcoalProduced,
-      extinguishingMethodTotals,
-      ratios,
-      summary: {
-        water: {
-          amount: extinguishingMethodTotals.water,
-          percentage: Math.round(ratios.water * 100) / 100
-        },
-        oxygen: {
-          amount: extinguishingMethodTotals.oxygen,
-          percentage: Math.round(ratios.oxygen * 100) / 100
-        }
+  return {
+    year,
+    totalCharcoalProduced,
+    extinguishingMethodTotals,
+    ratios,
+    summary: {
+      water: {
+        amount: extinguishingMethodTotals.water,
+        percentage: Math.round(ratios.water * 100) / 100
+      },
+      oxygen: {
+        amount: extinguishingMethodTotals.oxygen,
+        percentage: Math.round(ratios.oxygen * 100) / 100
       }
+    }
+  };
+}
+
+async function GetExtinguishingMethodRatio(
+  request: HttpRequest,
+  context: InvocationContext
+): Promise<HttpResponseInit> {
+  context.log("Processing GET /reports/extinguishing-method-ratio/:year");
+
+  const yearParam = request.params.year;
+  if (!yearParam || !Number.isInteger(Number(yearParam))) {
+    return {
+      status: 400,
+      body: "Invalid or missing year parameter",
     };
+  }
+  const year = Number(yearParam);
+
+  try {
+    // 同じ年のリクエストが同時に来た場合は1回の走査を共有し、結果を短時間キャッシュする
+    const result = await coalesce(
+      createCoalesceKey("reports/extinguishing-method-ratio", { year }),
+      () => aggregateExtinguishingMethodRatio(year)
+    );
 
     return {
       status: 200,
@@ -91,11 +125,4 @@ async function GetExtinguishingMethodRatio(
   }
 }
 
-app.http("GetExtinguishingMethodRatio", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "reports/extinguishing-method-ratio/{year}",
-  handler: GetExtinguishingMethodRatio,
-});
-
 export { GetExtinguishingMethodRatio };
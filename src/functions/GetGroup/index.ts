@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
 
@@ -36,7 +36,7 @@ async function GetGroup(request: HttpRequest, context: InvocationContext): Promi
     context.log(`Http function processed request for url "${request.url}" by user: ${userPayload.email}`);
 
     try {
-        const client = TableClient.fromConnectionString(connectionString, tableName);
+        const client = createTableClient(connectionString, tableName);
 
         const groupId = request.params.groupId;
         if (!groupId) {
@@ -96,11 +96,4 @@ async function GetGroup(request: HttpRequest, context: InvocationContext): Promi
     }
 }
 
-app.http("GetGroup", {
-    route: "groups/{groupId}",
-    methods: ["GET", "OPTIONS"],
-    authLevel: "anonymous",
-    handler: GetGroup
-});
-
 export { GetGroup };
@@ -1,27 +1,8 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
-
-const connectionString = process.env.AzureWebJobsStorage!;
-const productionSumTableName = "ProductionSumTable";
-const groupTableName = "GroupsTable";
-
-interface ProductionSumEntity {
-  partitionKey: string;
-  rowKey: string;
-  year: string;
-  groupId: string;
-  materialAmount: number;
-  charcoalProduced: number;
-  charcoalVolume: number;
-  co2Reduction: number;
-  carbonContent: number;
-  ipccLongTerm: number;
-  createdAt: string;
-  updatedAt: string;
-  [key: string]: any;
-}
+import { createGenerationETag, createJsonResponse, createNotModifiedResponse } from "../../utils/httpResponse";
+import { getRankingSnapshot } from "../../utils/rankingSnapshot";
 
 interface GroupRankingData {
   groupId: string;
@@ -58,7 +39,7 @@ async function GetGroupRankingFromSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Access-Control-Max-Age": "86400"
       }
     };
@@ -82,22 +63,26 @@ async function GetGroupRankingFromSum(
     const currentYear = now.getFullYear();
     const currentMonth = now.getMonth() + 1;
 
-    // グループ情報を取得
-    const groupClient = TableClient.fromConnectionString(connectionString, groupTableName);
-    const groupMap = new Map<string, { name: string; introductionPdfUrl?: string | null }>();
-    
-    for await (const group of groupClient.listEntities()) {
-      const groupId = group.rowKey as string;
-      const groupName = group.name as string;
-      const introductionPdfUrl = group.introductionPdfUrl as string | null | undefined;
-      groupMap.set(groupId, { name: groupName, introductionPdfUrl });
-    }
+    const responseHeaders = {
+      "Access-Control-Allow-Origin": corsOrigin,
+      "Access-Control-Allow-Credentials": "true",
+      "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+      "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match"
+    };
+
+    // インスタンス内で共有しているスナップショット（世代スタンプが変わった場合のみ再読み込み）
+    const snapshot = await getRankingSnapshot(context);
 
-    // ProductionSumTableからデータを取得
-    const productionSumClient = TableClient.fromConnectionString(connectionString, productionSumTableName);
-    const productionSumEntities = productionSumClient.listEntities<ProductionSumEntity>();
+    // ランキングの世代スタンプと今年からETagを作り、変更がなければ集計せずに304を返す
+    const etag = snapshot.generation
+      ? createGenerationETag(snapshot.generation, "ranking", currentYear)
+      : undefined;
+    const notModified = etag ? createNotModifiedResponse(request, etag, responseHeaders) : null;
+    if (notModified) {
+      return notModified;
+    }
 
-    // グループ別のデータを集計
+    // グループ別のデータを集計（スナップショットの年別合計から計算するためテーブルの走査は不要）
     const groupDataMap = new Map<string, {
       yearlyCharcoal: number;
       yearlyCharcoalVolume: number;
@@ -111,56 +96,45 @@ async function GetGroupRankingFromSum(
       totalCharcoalVolume: number;
     }>();
 
-    for await (const entity of productionSumEntities) {
-      const groupId = entity.groupId;
-      const year = parseInt(entity.year);
-      const charcoalProduced = entity.charcoalProduced || 0;
-      const charcoalVolume = entity.charcoalVolume || 0;
-      const co2Reduction = entity.co2Reduction || 0;
-      const ipccLongTerm = entity.ipccLongTerm || 0;
-
-      if (!groupDataMap.has(groupId)) {
-        groupDataMap.set(groupId, {
-          yearlyCharcoal: 0,
-          yearlyCharcoalVolume: 0,
-          yearlyCO2Reduction: 0,
-          yearlyCO2ReductionShortTerm: 0,
-          yearlyCO2ReductionLongTerm: 0,
-          thisYearCO2Reduction: 0,
-          totalCO2ReductionShortTerm: 0,
-          totalCO2ReductionLongTerm: 0,
-          totalCharcoal: 0,
-          totalCharcoalVolume: 0,
-        });
+    for (const [groupId, years] of snapshot.totals) {
+      const groupData = {
+        yearlyCharcoal: 0,
+        yearlyCharcoalVolume: 0,
+        yearlyCO2Reduction: 0,
+        yearlyCO2ReductionShortTerm: 0,
+        yearlyCO2ReductionLongTerm: 0,
+        thisYearCO2Reduction: 0,
+        totalCO2ReductionShortTerm: 0,
+        totalCO2ReductionLongTerm: 0,
+        totalCharcoal: 0,
+        totalCharcoalVolume: 0,
+      };
+
+      for (const [year, totals] of years) {
+        // 累積データ
+        groupData.totalCO2ReductionShortTerm += totals.co2Reduction;
+        groupData.totalCO2ReductionLongTerm += totals.ipccLongTerm;
+        groupData.totalCharcoal += totals.charcoalProduced;
+        groupData.totalCharcoalVolume += totals.charcoalVolume;
+
+        // 今年のデータ（ProductionSumTableは年次で合計されたデータ）
+        if (year === currentYear) {
+          groupData.thisYearCO2Reduction += totals.co2Reduction;
+          groupData.yearlyCharcoal += totals.charcoalProduced;
+          groupData.yearlyCharcoalVolume += totals.charcoalVolume;
+          groupData.yearlyCO2Reduction += totals.co2Reduction;
+          groupData.yearlyCO2ReductionShortTerm += totals.co2Reduction;
+          groupData.yearlyCO2ReductionLongTerm += totals.ipccLongTerm;
+        }
       }
 
-      const groupData = groupDataMap.get(groupId)!;
-
-      // 累積データ
-      groupData.totalCO2ReductionShortTerm += co2Reduction;
-      groupData.totalCO2ReductionLongTerm += ipccLongTerm;
-      groupData.totalCharcoal += charcoalProduced;
-      groupData.totalCharcoalVolume += charcoalVolume;
-
-      // 今年のデータ
-      if (year === currentYear) {
-        groupData.thisYearCO2Reduction += co2Reduction;
-      }
-
-      // 今年のデータ（ProductionSumTableは年次で合計されたデータ）
-      if (year === currentYear) {
-        groupData.yearlyCharcoal += charcoalProduced;
-        groupData.yearlyCharcoalVolume += charcoalVolume;
-        groupData.yearlyCO2Reduction += co2Reduction;
-        groupData.yearlyCO2ReductionShortTerm += co2Reduction;
-        groupData.yearlyCO2ReductionLongTerm += ipccLongTerm;
-      }
+      groupDataMap.set(groupId, groupData);
     }
 
     // 結果を配列に変換
     const result: GroupRankingData[] = [];
     for (const [groupId, data] of groupDataMap) {
-      const groupInfo = groupMap.get(groupId);
+      const groupInfo = snapshot.groups.get(groupId);
       const groupName = groupInfo?.name || "不明なグループ";
       const introductionPdfUrl = groupInfo?.introductionPdfUrl || null;
       
@@ -184,17 +158,8 @@ async function GetGroupRankingFromSum(
     // 累積炭素固定量でソート（降順）
     result.sort((a, b) => b.totalCO2ReductionShortTerm - a.totalCO2ReductionShortTerm);
 
-    return {
-      status: 200,
-      headers: {
-        "Access-Control-Allow-Origin": corsOrigin,
-        "Access-Control-Allow-Credentials": "true",
-        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
-        "Content-Type": "application/json"
-      },
-      body: JSON.stringify(result)
-    };
+    // ETag/304と圧縮に対応したレスポンスを返す
+    return await createJsonResponse(request, result, responseHeaders, 200, etag);
 
   } catch (error) {
     context.log(`Error retrieving group ranking data: ${error}`);
@@ -205,7 +170,7 @@ async function GetGroupRankingFromSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Content-Type": "application/json"
       },
       body: JSON.stringify({ 
@@ -216,11 +181,4 @@ async function GetGroupRankingFromSum(
   }
 }
 
-app.http("GetGroupRankingFromSum", {
-  methods: ["GET"],
-  route: "group-ranking-from-sum",
-  authLevel: "anonymous",
-  handler: GetGroupRankingFromSum
-});
-
 export { GetGroupRankingFromSum };
\ No newline at end of file
@@ -4,7 +4,7 @@ import {
   HttpResponseInit,
   InvocationContext,
 } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
 
@@ -50,7 +50,7 @@ async function GetGroups(
     timestamp: string; // 作成/更新日時
   }
   try {
-    const client = TableClient.fromConnectionString(
+    const client = createTableClient(
       connectionString,
       tableName
     );
@@ -88,11 +88,4 @@ async function GetGroups(
   };
 }
 
-app.http("GetGroups", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "groups",
-  handler: GetGroups,
-});
-
 export { GetGroups };
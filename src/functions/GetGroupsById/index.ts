@@ -4,7 +4,8 @@ import {
   HttpResponseInit,
   InvocationContext,
 } from "@azure/functions";
-import { TableClient, RestError } from "@azure/data-tables";
+import { RestError } from "@azure/data-tables";
+import { createTableClient } from "../../utils/tableClient";
 
 // Azure Table Storage 接続設定
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -34,7 +35,7 @@ async function GetGroupsById(
   }
 
   try {
-    const tableClient = TableClient.fromConnectionString(
+    const tableClient = createTableClient(
       connectionString,
       tableName
     );
@@ -85,11 +86,4 @@ async function GetGroupsById(
   }
 }
 
-app.http("GetGroupsById", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "groups/{id}",
-  handler: GetGroupsById,
-});
-
 export { GetGroupsById };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import { jwtSecret, corsOrigins } from "../../config";
 
@@ -27,7 +27,7 @@ async function GetMe(request: HttpRequest, context: InvocationContext): Promise<
     }
 
     try {
-        const client = TableClient.fromConnectionString(connectionString, tableName);
+        const client = createTableClient(connectionString, tableName);
 
         // 認証情報から userId を取得（JWTより）
         const token = request.headers.get("Authorization")?.replace("Bearer ", "");
@@ -136,11 +136,4 @@ async function GetMe(request: HttpRequest, context: InvocationContext): Promise<
     }
 }
 
-app.http("GetMe", {
-    route: "me",
-    methods: ["GET", "OPTIONS"],
-    authLevel: "anonymous",
-    handler: GetMe
-});
-
 export { GetMe };
@@ -0,0 +1,70 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { authenticateJWT, isAdmin, createForbiddenResponse } from "../../utils/auth";
+import { corsOrigins } from "../../config";
+import { getMetricsSnapshot, resetMetrics } from "../../utils/metrics";
+import { getCoalesceStats } from "../../utils/singleFlight";
+import { getShardMapStats } from "../../utils/shardMap";
+import { getProductionWriteStats } from "../../utils/productionWrites";
+
+/**
+ * 関数別の実行時間・ストレージ呼び出し・走査エンティティ数のヒストグラムを返す（管理者のみ）
+ * 値はインスタンスごとの集計のため、スケールアウト時はインスタンスIDと合わせて確認する
+ * reset=true を指定すると取得後に集計をリセットする
+ */
+async function GetMetrics(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
+  // CORS設定
+  const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
+  const origin = request.headers.get("Origin") || "";
+  const corsOrigin = allowedOrigins.includes(origin) ? origin : allowedOrigins[0];
+
+  // OPTIONS リクエストの処理
+  if (request.method === "OPTIONS") {
+    return {
+      status: 204,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "GET, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+        "Access-Control-Max-Age": "86400"
+      }
+    };
+  }
+
+  // JWT認証
+  const authResult = authenticateJWT(request, context);
+  if (!authResult.success) {
+    return authResult.response!;
+  }
+
+  const userPayload = authResult.payload!;
+  if (!isAdmin(userPayload)) {
+    return createForbiddenResponse(corsOrigin, "Forbidden: Admin role required");
+  }
+
+  const url = new URL(request.url);
+  const metrics = {
+    instanceId: process.env.WEBSITE_INSTANCE_ID || "local",
+    ...getMetricsSnapshot(),
+    reportCoalescing: getCoalesceStats(),
+    shardMap: getShardMapStats(),
+    productionWrites: getProductionWriteStats()
+  };
+
+  if (url.searchParams.get("reset") === "true") {
+    resetMetrics();
+    context.log(`Metrics reset by user: ${userPayload.email}`);
+  }
+
+  return {
+    status: 200,
+    headers: {
+      "Access-Control-Allow-Origin": corsOrigin,
+      "Access-Control-Allow-Credentials": "true",
+      "Content-Type": "application/json"
+    },
+    body: JSON.stringify(metrics)
+  };
+}
+
+export { GetMetrics };
@@ -1,5 +1,6 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { BlobServiceClient } from "@azure/storage-blob";
+import { trackStorageCall } from "../../utils/metrics";
 
 async function GetPdf(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
   try {
@@ -134,12 +135,15 @@ async function GetPdf(request: HttpRequest, context: InvocationContext): Promise
     // Blobの内容をダウンロード
     let blobData;
     try {
-      const downloadResponse = await blockBlobClient.download();
-      const chunks: Buffer[] = [];
-      for await (const chunk of downloadResponse.readableStreamBody!) {
-        chunks.push(Buffer.from(chunk));
-      }
-      blobData = Buffer.concat(chunks);
+      // 本文の読み込みまでを計測
+      blobData = await trackStorageCall("blob.download", async () => {
+        const downloadResponse = await blockBlobClient.download();
+        const chunks: Buffer[] = [];
+        for await (const chunk of downloadResponse.readableStreamBody!) {
+          chunks.push(Buffer.from(chunk));
+        }
+        return Buffer.concat(chunks);
+      }, (buffer) => buffer.length);
     } catch (downloadError) {
       context.error('Blobダウンロードエラー:', downloadError);
       return {
@@ -183,11 +187,4 @@ async function GetPdf(request: HttpRequest, context: InvocationContext): Promise
   }
 }
 
-app.http('GetPdf', {
-  methods: ['GET'],
-  authLevel: 'anonymous',
-  route: 'get-pdf',
-  handler: GetPdf
-});
-
 export { GetPdf };
@@ -1,6 +1,27 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { BlobServiceClient } from "@azure/storage-blob";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { BlobServiceClient, BlockBlobClient } from "@azure/storage-blob";
+import { createPhotoVariant, getVariantBlobName, isPhotoSize, PHOTO_VARIANT_CONTENT_TYPE } from "../../utils/photoVariants";
+import { trackStorageCall } from "../../utils/metrics";
 
+// Blobをバッファとしてダウンロードするヘルパー関数（本文の読み込みまでを計測）
+async function downloadToBuffer(blockBlobClient: BlockBlobClient): Promise<Buffer> {
+  return trackStorageCall("blob.download", async () => {
+    const downloadResponse = await blockBlobClient.download();
+    const chunks: Uint8Array[] = [];
+
+    for await (const chunk of downloadResponse.readableStreamBody!) {
+      if (typeof chunk === 'string') {
+        chunks.push(new TextEncoder().encode(chunk));
+      } else if (Buffer.isBuffer(chunk)) {
+        chunks.push(new Uint8Array(chunk));
+      } else {
+        chunks.push(chunk);
+      }
+    }
+
+    return Buffer.concat(chunks);
+  }, (buffer) => buffer.length);
+}
 async function GetPhoto(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
   try {
     // CORSヘッダーを設定
@@ -36,6 +57,21 @@ async function GetPhoto(request: HttpRequest, context: InvocationContext): Promi
       };
     }
 
+    // サイズ指定（thumbnail / medium / original）、未指定の場合はオリジナル
+    const size = url.searchParams.get('size') || 'original';
+    if (!isPhotoSize(size)) {
+      return {
+        status: 400,
+        headers: {
+          ...headers,
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+          error: 'sizeパラメータは thumbnail, medium, original のいずれかを指定してください'
+        })
+      };
+    }
+
     // Azure Storage接続文字列を取得
     const connectionString = process.env.AZURE_STORAGE_CONNECTION_STRING || 
                             process.env.AzureWebJobsStorage ||
@@ -87,6 +123,31 @@ async function GetPhoto(request: HttpRequest, context: InvocationContext): Promi
     const containerClient = blobServiceClient.getContainerClient(containerName);
     const blockBlobClient = containerClient.getBlockBlobClient(fileName);
 
+    // 縮小版が要求され、既に生成済みであればそれを返す
+    if (size !== 'original') {
+      const variantBlobClient = containerClient.getBlockBlobClient(getVariantBlobName(fileName, size));
+      try {
+        if (await variantBlobClient.exists()) {
+          const buffer = await downloadToBuffer(variantBlobClient);
+
+          context.log(`写真（${size}）を取得しました: ${fileName}, サイズ: ${buffer.length} bytes`);
+
+          return {
+            status: 200,
+            headers: {
+              ...headers,
+              'Content-Type': PHOTO_VARIANT_CONTENT_TYPE,
+              'Content-Length': buffer.length.toString(),
+              'Cache-Control': 'public, max-age=86400' // 縮小版は内容が変わらないため1日キャッシュ
+            },
+            body: buffer
+          };
+        }
+      } catch (variantError) {
+        context.log(`縮小版の取得に失敗しました。オリジナルから生成します: ${variantError}`);
+      }
+    }
+
     // Blobが存在するかチェック
     try {
       const exists = await blockBlobClient.exists();
@@ -127,23 +188,38 @@ async function GetPhoto(request: HttpRequest, context: InvocationContext): Promi
 
     // Blobをダウンロード
     try {
-      const downloadResponse = await blockBlobClient.download();
-      const chunks: Uint8Array[] = [];
-      
-      for await (const chunk of downloadResponse.readableStreamBody!) {
-        if (typeof chunk === 'string') {
-          chunks.push(new TextEncoder().encode(chunk));
-        } else if (Buffer.isBuffer(chunk)) {
-          chunks.push(new Uint8Array(chunk));
-        } else {
-          chunks.push(chunk);
-        }
-      }
-      
-      const buffer = Buffer.concat(chunks);
+      const buffer = await downloadToBuffer(blockBlobClient);
 
       context.log(`写真を取得しました: ${fileName}, サイズ: ${buffer.length} bytes`);
 
+      // 既存の写真で縮小版が未生成の場合は、ここで生成して保存する（遅延バックフィル）
+      if (size !== 'original') {
+        try {
+          const variantBuffer = await createPhotoVariant(buffer, size);
+          const variantFileName = getVariantBlobName(fileName, size);
+          await containerClient.getBlockBlobClient(variantFileName).upload(variantBuffer, variantBuffer.length, {
+            blobHTTPHeaders: {
+              blobContentType: PHOTO_VARIANT_CONTENT_TYPE,
+            }
+          });
+          context.log(`縮小版を生成しました: ${variantFileName}, サイズ: ${variantBuffer.length} bytes`);
+
+          return {
+            status: 200,
+            headers: {
+              ...headers,
+              'Content-Type': PHOTO_VARIANT_CONTENT_TYPE,
+              'Content-Length': variantBuffer.length.toString(),
+              'Cache-Control': 'public, max-age=86400'
+            },
+            body: variantBuffer
+          };
+        } catch (variantError) {
+          // 画像として解釈できない場合などはオリジナルを返す
+          context.warn('縮小版の生成に失敗しました。オリジナルを返します:', variantError);
+        }
+      }
+
       return {
         status: 200,
         headers: {
@@ -185,11 +261,4 @@ async function GetPhoto(request: HttpRequest, context: InvocationContext): Promi
   }
 }
 
-app.http('GetPhoto', {
-  methods: ['GET'],
-  authLevel: 'anonymous',
-  route: 'get-photo',
-  handler: GetPhoto
-});
-
 export { GetPhoto };
@@ -1,10 +1,10 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient, RestError } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { RestError } from "@azure/data-tables";
+import { isGroupIdRequiredForLookup } from "../../utils/productionKeys";
+import { findProductionInShards } from "../../utils/shardMap";
 
 // Azure Table Storage 接続設定
-const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "ProductionTable";
-const partitionKey = "Production"; // 固定値でもユーザー別でもOK
 
 async function GetProductionById(
     request: HttpRequest, 
@@ -28,12 +28,32 @@ async function GetProductionById(
   }
 
   try {
-    const client = TableClient.fromConnectionString(
-      connectionString,
-      tableName
-    );
+    // groupIdからストレージアカウント・パーティションを特定してポイント読み取り
+    // （groupIdなしで検索できるのは旧パーティションの記録のみ）
+    const groupId = new URL(request.url).searchParams.get("groupId");
+    if (!groupId && isGroupIdRequiredForLookup(id)) {
+      return {
+        status: 400,
+        body: JSON.stringify({ error: "groupId is required" }),
+        headers: {
+          "Content-Type": "application/json",
+          "Access-Control-Allow-Origin": "*"
+        }
+      };
+    }
+    const entity = (await findProductionInShards(tableName, id, groupId))?.entity ?? null;
 
-    const entity = await client.getEntity(partitionKey, id);
+    if (!entity) {
+      context.log(`Entity with ID ${id} not found.`);
+      return {
+        status: 404,
+        body: JSON.stringify({ error: `Production with ID ${id} not found` }),
+        headers: {
+          "Content-Type": "application/json",
+          "Access-Control-Allow-Origin": "*"
+        }
+      };
+    }
 
     return {
       status: 200,
@@ -80,11 +100,4 @@ async function GetProductionById(
   }
 }
 
-app.http('GetProductionById', {
-    methods: ['GET'],
-    authLevel: 'anonymous',
-    route: "productions/{id}",
-    handler: GetProductionById
-});
-
 export { GetProductionById };
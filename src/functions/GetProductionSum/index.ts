@@ -1,9 +1,10 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { createGenerationETag, createJsonResponse, createNotModifiedResponse } from "../../utils/httpResponse";
+import { readProductionDataGeneration } from "../../utils/dataGeneration";
+import { getGroupTableClient } from "../../utils/shardMap";
 
-const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "ProductionSumTable";
 
 interface ProductionSumEntity {
@@ -41,7 +42,7 @@ async function GetProductionSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Access-Control-Max-Age": "86400"
       }
     };
@@ -59,8 +60,6 @@ async function GetProductionSum(
   const userPayload = authResult.payload!;
   context.log(`Http function processed request for url "${request.url}" by user: ${userPayload.email}`);
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
-
   // クエリパラメータからgroupIdを取得
   const url = new URL(request.url);
   const groupId = url.searchParams.get('groupId');
@@ -72,15 +71,32 @@ async function GetProductionSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Content-Type": "application/json"
       },
       body: JSON.stringify({ error: "groupId parameter is required" })
     };
   }
 
+  const headers = {
+    "Access-Control-Allow-Origin": corsOrigin,
+    "Access-Control-Allow-Credentials": "true",
+    "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match"
+  };
+
   try {
-    // グループIDでフィルタリング
+    // ProductionSumTable は再集計でのみ変わり、再集計は生産データの世代を更新するため、世代からETagを作る
+    // （変更がなければテーブルを読まずに304を返す）
+    const generation = await readProductionDataGeneration();
+    const etag = generation ? createGenerationETag(generation, "production-sum", groupId) : undefined;
+    const notModified = etag ? createNotModifiedResponse(request, etag, headers) : null;
+    if (notModified) {
+      return notModified;
+    }
+
+    // グループに割り当てられたストレージアカウントの ProductionSumTable をグループIDでフィルタリング
+    const client = await getGroupTableClient(groupId, tableName);
     const entities = client.listEntities<ProductionSumEntity>({
       queryOptions: { filter: `groupId eq '${groupId}'` }
     });
@@ -121,17 +137,8 @@ async function GetProductionSum(
       }))
     };
 
-    return {
-      status: 200,
-      headers: {
-        "Access-Control-Allow-Origin": corsOrigin,
-        "Access-Control-Allow-Credentials": "true",
-        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
-        "Content-Type": "application/json"
-      },
-      body: JSON.stringify(response)
-    };
+    // ETag/304と圧縮に対応したレスポンスを返す
+    return await createJsonResponse(request, response, headers, 200, etag);
 
   } catch (error) {
     context.log(`Error retrieving production sum data: ${error}`);
@@ -142,7 +149,7 @@ async function GetProductionSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Content-Type": "application/json"
       },
       body: JSON.stringify({ 
@@ -153,11 +160,4 @@ async function GetProductionSum(
   }
 }
 
-app.http("GetProductionSum", {
-  methods: ["GET"],
-  route: "production-sum",
-  authLevel: "anonymous",
-  handler: GetProductionSum
-});
-
 export { GetProductionSum };
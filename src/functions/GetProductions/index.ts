@@ -1,10 +1,11 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { listGroupProductions, listGroupProductionsPage } from "../../utils/productionKeys";
+import { InvalidContinuationTokenError, parsePaginationParams } from "../../utils/pagination";
+import { getGroupTableClient } from "../../utils/shardMap";
 
 // Azure Table Storage 接続設定
-const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "ProductionTable";
 
 async function GetProductions(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
@@ -38,22 +39,54 @@ async function GetProductions(request: HttpRequest, context: InvocationContext):
         };
     }
 
+    // ページング設定（pageSize / continuationToken、all=true で全件）
+    const pagination = parsePaginationParams(url);
+    if (!pagination.params) {
+        return {
+            status: 400,
+            body: JSON.stringify({ error: pagination.error }),
+            headers: {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": corsOrigin,
+                "Access-Control-Allow-Credentials": "true"
+            }
+        };
+    }
+    const { all, pageSize, continuationToken } = pagination.params;
+
     try {
-        const client = TableClient.fromConnectionString(connectionString, tableName);
+        // グループに割り当てられたストレージアカウントから読み込む
+        const client = await getGroupTableClient(groupId, tableName);
 
-        // グループIDでフィルタリング
-        const entities = client.listEntities({
-            queryOptions: { filter: `groupId eq '${groupId}'` }
-        });
+        if (all) {
+            // 従来どおり全件を返す（生産日順、同日の場合はRowKey順で安定ソート）
+            const productionEntities = await listGroupProductions(client, groupId);
+            productionEntities.sort((a, b) =>
+                String(a.date ?? "").localeCompare(String(b.date ?? "")) ||
+                String(a.rowKey ?? "").localeCompare(String(b.rowKey ?? ""))
+            );
 
-        const productionEntities = [];
-        for await (const entity of entities) {
-          productionEntities.push(entity);
+            return {
+                status: 200,
+                body: JSON.stringify(productionEntities),
+                headers: {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": corsOrigin,
+                    "Access-Control-Allow-Credentials": "true"
+                }
+            };
         }
 
+        // グループIDのパーティションを1ページ分検索（RowKey = 生産日_uuid のため生産日順）
+        const page = await listGroupProductionsPage(client, groupId, pageSize, continuationToken);
+
         return {
             status: 200,
-            body: JSON.stringify(productionEntities),
+            body: JSON.stringify({
+                items: page.items,
+                pageSize,
+                continuationToken: page.continuationToken
+            }),
             headers: {
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": corsOrigin,
@@ -61,6 +94,17 @@ async function GetProductions(request: HttpRequest, context: InvocationContext):
             }
         };
     } catch (error) {
+        if (error instanceof InvalidContinuationTokenError) {
+            return {
+                status: 400,
+                body: JSON.stringify({ error: error.message }),
+                headers: {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": corsOrigin,
+                    "Access-Control-Allow-Credentials": "true"
+                }
+            };
+        }
         if (error instanceof Error) {
             context.log(`Error: ${error.message}`);
             context.log(`Stack Trace: ${error.stack}`);
@@ -79,11 +123,4 @@ async function GetProductions(request: HttpRequest, context: InvocationContext):
     };
 }
 
-app.http('GetProductions', {
-    methods: ['GET'],
-    authLevel: 'anonymous',
-    route: "productions",
-    handler: GetProductions
-});
-
 export { GetProductions };
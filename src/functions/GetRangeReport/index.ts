@@ -0,0 +1,239 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
+import { authenticateJWT } from "../../utils/auth";
+import { corsOrigins } from "../../config";
+import { createGenerationETag, createJsonResponse, createNotModifiedResponse } from "../../utils/httpResponse";
+import { readProductionDataGeneration } from "../../utils/dataGeneration";
+import {
+  accumulateProductionYears,
+  ALL_GROUPS_PARTITION_KEY,
+  areRollupsReady,
+  decomposeRange,
+  emptyValues,
+  getRollupClient,
+  readRollupRange,
+  RollupRow,
+  RollupValues,
+} from "../../utils/productionRollups";
+import { forEachShard, resolveGroupShard, StorageShard } from "../../utils/shardMap";
+
+const connectionString = process.env.AzureWebJobsStorage!;
+const groupTableName = "GroupsTable";
+
+// groupBy に指定できる値
+const GROUP_BY_VALUES = ["none", "group", "material", "groupMaterial"] as const;
+type GroupBy = typeof GROUP_BY_VALUES[number];
+
+// 全グループを対象にグループ別集計する場合の同時クエリ数
+const GROUP_QUERY_PARALLELISM = 8;
+
+/**
+ * YYYY-MM-DD 形式の日付をUTCの日付として解釈する関数
+ * @param value 日付文字列
+ * @returns Date（不正な場合はnull）
+ */
+function parseDateParam(value: string | null): Date | null {
+  const match = /^(\d{4})-(\d{2})-(\d{2})$/.exec(value || "");
+  if (!match) return null;
+  const date = new Date(Date.UTC(Number(match[1]), Number(match[2]) - 1, Number(match[3])));
+  // 2025-02-30 などの存在しない日付を除外
+  return date.toISOString().startsWith(value!) ? date : null;
+}
+
+/**
+ * ロールアップ行を groupBy に応じて合計する関数
+ * @param rows ロールアップ行
+ * @param groupBy 集計単位
+ * @returns 集計結果
+ */
+function summarize(rows: RollupRow[], groupBy: GroupBy) {
+  const totals = new Map<string, { groupId?: string; materialType?: string } & RollupValues>();
+  for (const row of rows) {
+    const groupId = groupBy === "group" || groupBy === "groupMaterial" ? row.groupId : undefined;
+    const materialType = groupBy === "material" || groupBy === "groupMaterial" ? row.materialType : undefined;
+    const key = `${groupId ?? ""}\u0000${materialType ?? ""}`;
+
+    let total = totals.get(key);
+    if (!total) {
+      total = {
+        ...(groupId !== undefined ? { groupId } : {}),
+        ...(materialType !== undefined ? { materialType } : {}),
+        ...emptyValues(),
+      };
+      totals.set(key, total);
+    }
+    total.materialAmount += Number(row.materialAmount) || 0;
+    total.charcoalProduced += Number(row.charcoalProduced) || 0;
+    total.charcoalVolume += Number(row.charcoalVolume) || 0;
+    total.co2Reduction += Number(row.co2Reduction) || 0;
+    total.count += Number(row.count) || 0;
+  }
+  return Array.from(totals.values());
+}
+
+/**
+ * 全グループのIDを取得する関数
+ * @returns groupIdの配列
+ */
+async function listGroupIds(): Promise<string[]> {
+  const client = createTableClient(connectionString, groupTableName);
+  const ids: string[] = [];
+  for await (const group of client.listEntities({ queryOptions: { select: ["RowKey"] } })) {
+    ids.push(group.rowKey as string);
+  }
+  return ids;
+}
+
+/**
+ * ロールアップが作成済みでない間に、期間内の生産記録から日単位のロールアップ行を作る関数
+ * @param from 開始日
+ * @param to 終了日
+ * @param partitionKey 対象のパーティション（groupId、"_all"、またはグループ別の全パーティションの場合はnull）
+ * @returns ロールアップ行
+ */
+async function readRowsFromProductions(from: Date, to: Date, partitionKey: string | null): Promise<RollupRow[]> {
+  const years: number[] = [];
+  for (let year = from.getUTCFullYear(); year <= to.getUTCFullYear(); year++) {
+    years.push(year);
+  }
+  const start = from.toISOString().substring(0, 10).replace(/-/g, "");
+  const end = to.toISOString().substring(0, 10).replace(/-/g, "");
+  return Array.from((await accumulateProductionYears(years)).values()).filter((row) =>
+    row.level === "D" && row.period >= start && row.period <= end
+    && (partitionKey === null ? row.partitionKey !== ALL_GROUPS_PARTITION_KEY : row.partitionKey === partitionKey));
+}
+
+/**
+ * 任意の期間の生産実績を返すAPI
+ * GET /reports/range?from=YYYY-MM-DD&to=YYYY-MM-DD&groupId=&groupBy=none|group|material|groupMaterial
+ * ProductionRollupTable の年・月・日単位の合計を、期間に収まる最も粗い単位から組み合わせて集計する
+ * グループ別のパーティションはグループに割り当てられたストレージアカウントから、全体の合計は全アカウントの "_all" から読み込む
+ * ロールアップが作成済みでない間は、期間内の年の生産記録を走査して集計する
+ */
+async function GetRangeReport(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
+  // CORS設定
+  const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
+  const origin = request.headers.get("Origin") || "";
+  const corsOrigin = allowedOrigins.includes(origin) ? origin : allowedOrigins[0];
+
+  // OPTIONS リクエストの処理
+  if (request.method === "OPTIONS") {
+    return {
+      status: 204,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "GET, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, If-None-Match",
+        "Access-Control-Max-Age": "86400"
+      }
+    };
+  }
+
+  // JWT認証
+  const authResult = authenticateJWT(request, context);
+  if (!authResult.success) {
+    return authResult.response!;
+  }
+
+  const errorResponse = (message: string): HttpResponseInit => ({
+    status: 400,
+    headers: {
+      "Access-Control-Allow-Origin": corsOrigin,
+      "Access-Control-Allow-Credentials": "true",
+      "Content-Type": "application/json"
+    },
+    body: JSON.stringify({ error: message })
+  });
+
+  const url = new URL(request.url);
+  const from = parseDateParam(url.searchParams.get("from"));
+  const to = parseDateParam(url.searchParams.get("to"));
+  const groupId = url.searchParams.get("groupId");
+  const groupBy = (url.searchParams.get("groupBy") || "none") as GroupBy;
+
+  if (!from || !to) {
+    return errorResponse("from and to parameters are required (YYYY-MM-DD)");
+  }
+  if (from > to) {
+    return errorResponse("from must be on or before to");
+  }
+  if (!GROUP_BY_VALUES.includes(groupBy)) {
+    return errorResponse(`groupBy must be one of: ${GROUP_BY_VALUES.join(", ")}`);
+  }
+
+  const headers = {
+    "Access-Control-Allow-Origin": corsOrigin,
+    "Access-Control-Allow-Credentials": "true"
+  };
+
+  try {
+    // 生産データの世代とパラメータからETagを作り、変更がなければロールアップを読まずに304を返す
+    const generation = await readProductionDataGeneration();
+    const etag = generation
+      ? createGenerationETag(generation, "reports/range", url.searchParams.get("from"), url.searchParams.get("to"), groupId, groupBy)
+      : undefined;
+    const notModified = etag ? createNotModifiedResponse(request, etag, headers) : null;
+    if (notModified) {
+      return notModified;
+    }
+
+    const segments = decomposeRange(from, to);
+
+    let rows: RollupRow[] = [];
+    let source: string;
+    if (!(await areRollupsReady())) {
+      const partitionKey = groupId || (groupBy === "group" || groupBy === "groupMaterial" ? null : ALL_GROUPS_PARTITION_KEY);
+      rows = await readRowsFromProductions(from, to, partitionKey);
+      source = "production scan (rollups not ready)";
+    } else {
+      // グループ別の集計が必要な場合のみグループごとのパーティションを読み込み、それ以外は全体合計のパーティションを使う
+      let targets: Array<{ shard: StorageShard; partitionKey: string }>;
+      if (groupId) {
+        targets = [{ shard: await resolveGroupShard(groupId), partitionKey: groupId }];
+      } else if (groupBy === "group" || groupBy === "groupMaterial") {
+        const groupIds = await listGroupIds();
+        targets = await Promise.all(groupIds.map(async (id) => ({ shard: await resolveGroupShard(id), partitionKey: id })));
+      } else {
+        // "_all" はストレージアカウントごとの合計のため、全アカウントの行を合計する
+        targets = await forEachShard(async (shard) => ({ shard, partitionKey: ALL_GROUPS_PARTITION_KEY }));
+      }
+
+      let next = 0;
+      const workers = Array.from({ length: Math.max(1, Math.min(GROUP_QUERY_PARALLELISM, targets.length)) }, async () => {
+        while (next < targets.length) {
+          const target = targets[next++];
+          rows.push(...await readRollupRange(await getRollupClient(target.shard), target.partitionKey, segments));
+        }
+      });
+      await Promise.all(workers);
+      source = `${targets.length} partitions`;
+    }
+
+    context.log(`Range report ${url.searchParams.get("from")}..${url.searchParams.get("to")}: ${segments.length} segments, ${source}, ${rows.length} rollup rows`);
+
+    // ETag/304と圧縮に対応したレスポンスを返す
+    return await createJsonResponse(request, {
+      from: url.searchParams.get("from"),
+      to: url.searchParams.get("to"),
+      groupId: groupId || null,
+      groupBy,
+      segments,
+      rowsRead: rows.length,
+      results: summarize(rows, groupBy),
+    }, headers, 200, etag);
+  } catch (error: any) {
+    context.error(`Error building range report: ${error?.message || error}`);
+    return {
+      status: 500,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Content-Type": "application/json"
+      },
+      body: JSON.stringify({ error: "Internal Server Error" })
+    };
+  }
+}
+
+export { GetRangeReport };
@@ -0,0 +1,207 @@
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { BlobSASPermissions, BlobServiceClient } from "@azure/storage-blob";
+import { v4 as uuidv4 } from "uuid";
+import { authenticateJWT, createForbiddenResponse } from "../../utils/auth";
+import { corsOrigins } from "../../config";
+import { DEFAULT_BLOCK_SIZE } from "../../utils/blockUpload";
+import {
+  canUploadFor,
+  getUploadExtension,
+  isSafePathSegment,
+  isUploadFileType,
+  PENDING_UPLOAD_CONTAINER_NAME,
+  UploadFileType,
+  UPLOAD_FILE_TYPES,
+} from "../../utils/uploadValidation";
+
+// SAS URLの有効期限（分）
+const SAS_EXPIRY_MINUTES = 15;
+
+interface UploadSasRequest {
+  fileType: UploadFileType;
+  fileName: string;
+  contentType: string;
+  userId: string;
+  groupId: string;
+}
+
+/**
+ * クライアントからBlobへ直接アップロードするための短期SAS URLを発行する
+ * クライアントはPut Block / Put Block Listでチャンク単位にアップロードでき、失敗したブロックのみ再送できる
+ * - 本人かつ所属グループ（admin / operator は任意のユーザー・グループ）のみ発行する
+ * - SASは検証前のコンテナ（uploads-pending）のBlobに対して発行し、アップロード後に CompleteUpload で
+ *   サイズと形式を確認してから photos / pdfs へ移す（SASの contentType ではアップロード内容を制限できないため）
+ */
+async function GetUploadSasUrl(request: HttpRequest, context: InvocationContext): Promise<HttpResponseInit> {
+  // CORS設定
+  const allowedOrigins = corsOrigins.split(",").map((origin: string) => origin.trim());
+  const origin = request.headers.get("Origin") || "";
+  const corsOrigin = allowedOrigins.includes(origin) ? origin : allowedOrigins[0];
+
+  const headers = {
+    "Access-Control-Allow-Origin": corsOrigin,
+    "Access-Control-Allow-Credentials": "true",
+    "Content-Type": "application/json"
+  };
+
+  // OPTIONS リクエストの処理
+  if (request.method === "OPTIONS") {
+    return {
+      status: 204,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "POST, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+        "Access-Control-Max-Age": "86400"
+      }
+    };
+  }
+
+  // JWT認証（書き込み権限を付与するため認証必須）
+  const authResult = authenticateJWT(request, context);
+  if (!authResult.success) {
+    return authResult.response!;
+  }
+
+  const userPayload = authResult.payload!;
+  context.log(`Http function processed request for url "${request.url}" by user: ${userPayload.email}`);
+
+  let body: UploadSasRequest;
+  try {
+    body = await request.json() as UploadSasRequest;
+  } catch (error) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "Invalid JSON format" })
+    };
+  }
+
+  const { fileType, fileName, contentType, userId, groupId } = body;
+  if (!fileType || !fileName || !contentType || !userId || !groupId) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "fileType, fileName, contentType, userId and groupId are required" })
+    };
+  }
+
+  if (!isUploadFileType(fileType)) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "fileType must be photo or pdf" })
+    };
+  }
+  const target = UPLOAD_FILE_TYPES[fileType];
+
+  if (!target.isAllowedContentType(contentType)) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: `Content type ${contentType} is not allowed for ${fileType}` })
+    };
+  }
+
+  const fileExtension = getUploadExtension(fileName, fileType);
+  if (!fileExtension) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: `File extension must be one of: ${target.extensions.join(", ")}` })
+    };
+  }
+
+  if (!isSafePathSegment(userId) || !isSafePathSegment(groupId)) {
+    return {
+      status: 400,
+      headers,
+      body: JSON.stringify({ error: "Invalid userId or groupId" })
+    };
+  }
+
+  try {
+    if (!(await canUploadFor(userPayload, userId, groupId))) {
+      return createForbiddenResponse(corsOrigin, "Forbidden: You can only upload files for yourself in your own groups");
+    }
+  } catch (error) {
+    context.error("所属グループの確認エラー:", error);
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({ error: "Failed to verify group membership" })
+    };
+  }
+
+  // Azure Storage接続文字列を取得
+  const connectionString = process.env.AZURE_STORAGE_CONNECTION_STRING ||
+                          process.env.AzureWebJobsStorage ||
+                          process.env.STORAGE_CONNECTION_STRING;
+
+  if (!connectionString) {
+    context.error("Azure Storage接続文字列が設定されていません");
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({ error: "ストレージ設定エラー: 接続文字列が設定されていません" })
+    };
+  }
+
+  try {
+    let blobServiceClient: BlobServiceClient;
+    if (connectionString === "UseDevelopmentStorage=true") {
+      // Azurite用の明示的な接続文字列を使用（SAS生成にはアカウントキーが必要）
+      const azuriteConnectionString = "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;";
+      blobServiceClient = BlobServiceClient.fromConnectionString(azuriteConnectionString);
+    } else {
+      blobServiceClient = BlobServiceClient.fromConnectionString(connectionString);
+    }
+
+    // 検証前のコンテナに発行する（CompleteUpload で確認してから保存先のコンテナへ移す）
+    const containerClient = blobServiceClient.getContainerClient(PENDING_UPLOAD_CONTAINER_NAME);
+    await containerClient.createIfNotExists();
+
+    // ファイル名を生成（UploadPhoto/UploadPdfと同じ命名規則）
+    const uniqueFileName = `${userId}/${groupId}/${uuidv4()}.${fileExtension}`;
+    const blockBlobClient = containerClient.getBlockBlobClient(uniqueFileName);
+
+    // 作成・書き込みのみ許可する短期SASを発行
+    const startsOn = new Date(Date.now() - 5 * 60 * 1000); // 時刻ずれを考慮して5分前から有効
+    const expiresOn = new Date(Date.now() + SAS_EXPIRY_MINUTES * 60 * 1000);
+    const uploadUrl = await blockBlobClient.generateSasUrl({
+      permissions: BlobSASPermissions.parse("cw"),
+      startsOn,
+      expiresOn,
+      contentType
+    });
+
+    context.log(`アップロード用SAS URLを発行しました: ${PENDING_UPLOAD_CONTAINER_NAME}/${uniqueFileName}`);
+
+    return {
+      status: 200,
+      headers,
+      body: JSON.stringify({
+        uploadUrl,
+        fileName: uniqueFileName,
+        expiresOn: expiresOn.toISOString(),
+        recommendedBlockSize: DEFAULT_BLOCK_SIZE,
+        maxBytes: target.maxBytes,
+        // アップロード後に fileType と fileName を送信して確定する
+        completeUrl: "/api/upload-sas-url/complete"
+      })
+    };
+  } catch (error) {
+    context.error("SAS URL発行エラー:", error);
+    return {
+      status: 500,
+      headers,
+      body: JSON.stringify({
+        error: "アップロード用URLの発行に失敗しました",
+        details: error instanceof Error ? error.message : "Unknown error"
+      })
+    };
+  }
+}
+
+export { GetUploadSasUrl };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { corsOrigins } from "../../config";
 
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -26,7 +26,7 @@ async function GetUserByEmail(request: HttpRequest, context: InvocationContext):
     }
 
     try {
-        const client = TableClient.fromConnectionString(connectionString, tableName);
+        const client = createTableClient(connectionString, tableName);
         
         // URLパラメータからemailを取得
         const email = request.params.email;
@@ -121,11 +121,4 @@ async function GetUserByEmail(request: HttpRequest, context: InvocationContext):
     }
 }
 
-app.http("GetUserByEmail", {
-    route: "users/email/{email}",
-    methods: ["GET", "OPTIONS"],
-    authLevel: "anonymous",
-    handler: GetUserByEmail
-});
-
 export { GetUserByEmail };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "UsersTable";
@@ -22,7 +22,7 @@ async function GetUserById(
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   try {
     const user = await client.getEntity(partitionKey, rowKey);
@@ -47,11 +47,4 @@ async function GetUserById(
   }
 }
 
-app.http("GetUserById", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "users/{id}",
-  handler: GetUserById,
-});
-
 export { GetUserById };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import { jwtSecret, corsOrigins } from "../../config";
 
@@ -30,7 +30,7 @@ async function getUser(
   }
 
   try {
-    const client = TableClient.fromConnectionString(connectionString, tableName);
+    const client = createTableClient(connectionString, tableName);
 
     // 認証情報から userId を取得（JWTより）
     const token = request.headers.get("Authorization")?.replace("Bearer ", "");
@@ -131,11 +131,4 @@ async function getUser(
   }
 }
 
-app.http("GetUserByJWT", {
-  route: "auth/getuserjwt",
-  methods: ["GET", "OPTIONS"],
-  authLevel: "anonymous",
-  handler: getUser
-});
-
 export { getUser as GetUserByJWT };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const userGroupTable = "UserGroupTable";
@@ -20,8 +20,8 @@ async function GetUserGroups(
     };
   }
 
-  const userGroupClient = TableClient.fromConnectionString(connectionString, userGroupTable);
-  const groupsClient = TableClient.fromConnectionString(connectionString, groupsTable);
+  const userGroupClient = createTableClient(connectionString, userGroupTable);
+  const groupsClient = createTableClient(connectionString, groupsTable);
 
   try {
     // ① ユーザーが所属する groupId を取得
@@ -76,11 +76,4 @@ function corsHeaders() {
   };
 }
 
-app.http("GetUserGroups", {
-  route: "users/{userId}/groups",
-  methods: ["GET"],
-  authLevel: "anonymous",
-  handler: GetUserGroups
-});
-
 export { GetUserGroups };
@@ -1,27 +1,8 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { authenticateJWT, JWTPayload } from "../../utils/auth";
 import { corsOrigins } from "../../config";
-
-const connectionString = process.env.AzureWebJobsStorage!;
-const productionSumTableName = "ProductionSumTable";
-const groupTableName = "GroupsTable";
-
-interface ProductionSumEntity {
-  partitionKey: string;
-  rowKey: string;
-  year: string;
-  groupId: string;
-  materialAmount: number;
-  charcoalProduced: number;
-  charcoalVolume: number;
-  co2Reduction: number;
-  carbonContent: number;
-  ipccLongTerm: number;
-  createdAt: string;
-  updatedAt: string;
-  [key: string]: any;
-}
+import { createGenerationETag, createJsonResponse, createNotModifiedResponse } from "../../utils/httpResponse";
+import { getRankingSnapshot } from "../../utils/rankingSnapshot";
 
 interface YearlyGroupRankingData {
   groupId: string;
@@ -53,7 +34,7 @@ async function GetYearlyGroupRankingFromSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Access-Control-Max-Age": "86400"
       }
     };
@@ -83,7 +64,7 @@ async function GetYearlyGroupRankingFromSum(
           "Access-Control-Allow-Origin": corsOrigin,
           "Access-Control-Allow-Credentials": "true",
           "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-          "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+          "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
           "Content-Type": "application/json"
         },
         body: JSON.stringify({ 
@@ -101,7 +82,7 @@ async function GetYearlyGroupRankingFromSum(
           "Access-Control-Allow-Origin": corsOrigin,
           "Access-Control-Allow-Credentials": "true",
           "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-          "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+          "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
           "Content-Type": "application/json"
         },
         body: JSON.stringify({ 
@@ -111,22 +92,26 @@ async function GetYearlyGroupRankingFromSum(
       };
     }
 
-    // グループ情報を取得
-    const groupClient = TableClient.fromConnectionString(connectionString, groupTableName);
-    const groupMap = new Map<string, { name: string; introductionPdfUrl?: string | null }>();
-    
-    for await (const group of groupClient.listEntities()) {
-      const groupId = group.rowKey as string;
-      const groupName = group.name as string;
-      const introductionPdfUrl = group.introductionPdfUrl as string | null | undefined;
-      groupMap.set(groupId, { name: groupName, introductionPdfUrl });
-    }
+    const responseHeaders = {
+      "Access-Control-Allow-Origin": corsOrigin,
+      "Access-Control-Allow-Credentials": "true",
+      "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+      "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match"
+    };
+
+    // インスタンス内で共有しているスナップショット（世代スタンプが変わった場合のみ再読み込み）
+    const snapshot = await getRankingSnapshot(context);
 
-    // ProductionSumTableから指定年のデータを取得
-    const productionSumClient = TableClient.fromConnectionString(connectionString, productionSumTableName);
-    const productionSumEntities = productionSumClient.listEntities<ProductionSumEntity>();
+    // ランキングの世代スタンプと対象年からETagを作り、変更がなければ集計せずに304を返す
+    const etag = snapshot.generation
+      ? createGenerationETag(snapshot.generation, "ranking/yearly", targetYear)
+      : undefined;
+    const notModified = etag ? createNotModifiedResponse(request, etag, responseHeaders) : null;
+    if (notModified) {
+      return notModified;
+    }
 
-    // グループ別のデータを集計
+    // 指定年のグループ別データを取得（スナップショットの年別合計を参照するためテーブルの走査は不要）
     const groupDataMap = new Map<string, {
       yearlyCharcoal: number;
       yearlyCharcoalVolume: number;
@@ -135,39 +120,23 @@ async function GetYearlyGroupRankingFromSum(
       yearlyCO2ReductionLongTerm: number;
     }>();
 
-    for await (const entity of productionSumEntities) {
-      const groupId = entity.groupId;
-      const year = parseInt(entity.year);
-      const charcoalProduced = entity.charcoalProduced || 0;
-      const charcoalVolume = entity.charcoalVolume || 0;
-      const co2Reduction = entity.co2Reduction || 0;
-      const ipccLongTerm = entity.ipccLongTerm || 0;
-
-      // 指定年のデータのみを処理
-      if (year === targetYear) {
-        if (!groupDataMap.has(groupId)) {
-          groupDataMap.set(groupId, {
-            yearlyCharcoal: 0,
-            yearlyCharcoalVolume: 0,
-            yearlyCO2Reduction: 0,
-            yearlyCO2ReductionShortTerm: 0,
-            yearlyCO2ReductionLongTerm: 0,
-          });
-        }
-
-        const groupData = groupDataMap.get(groupId)!;
-        groupData.yearlyCharcoal += charcoalProduced;
-        groupData.yearlyCharcoalVolume += charcoalVolume;
-        groupData.yearlyCO2Reduction += co2Reduction;
-        groupData.yearlyCO2ReductionShortTerm += co2Reduction;
-        groupData.yearlyCO2ReductionLongTerm += ipccLongTerm;
-      }
+    for (const [groupId, years] of snapshot.totals) {
+      const totals = years.get(targetYear);
+      if (!totals) continue;
+
+      groupDataMap.set(groupId, {
+        yearlyCharcoal: totals.charcoalProduced,
+        yearlyCharcoalVolume: totals.charcoalVolume,
+        yearlyCO2Reduction: totals.co2Reduction,
+        yearlyCO2ReductionShortTerm: totals.co2Reduction,
+        yearlyCO2ReductionLongTerm: totals.ipccLongTerm,
+      });
     }
 
     // 結果を配列に変換
     const result: YearlyGroupRankingData[] = [];
     for (const [groupId, data] of groupDataMap) {
-      const groupInfo = groupMap.get(groupId);
+      const groupInfo = snapshot.groups.get(groupId);
       const groupName = groupInfo?.name || "不明なグループ";
       const introductionPdfUrl = groupInfo?.introductionPdfUrl || null;
       
@@ -186,20 +155,11 @@ async function GetYearlyGroupRankingFromSum(
     // CO2削減量（短期）でソート（降順）
     result.sort((a, b) => b.yearlyCO2ReductionShortTerm - a.yearlyCO2ReductionShortTerm);
 
-    return {
-      status: 200,
-      headers: {
-        "Access-Control-Allow-Origin": corsOrigin,
-        "Access-Control-Allow-Credentials": "true",
-        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
-        "Content-Type": "application/json"
-      },
-      body: JSON.stringify({
-        year: targetYear,
-        data: result
-      })
-    };
+    // ETag/304と圧縮に対応したレスポンスを返す
+    return await createJsonResponse(request, {
+      year: targetYear,
+      data: result
+    }, responseHeaders, 200, etag);
 
   } catch (error) {
     context.log(`Error retrieving yearly group ranking data: ${error}`);
@@ -210,7 +170,7 @@ async function GetYearlyGroupRankingFromSum(
         "Access-Control-Allow-Origin": corsOrigin,
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, If-None-Match",
         "Content-Type": "application/json"
       },
       body: JSON.stringify({ 
@@ -221,11 +181,4 @@ async function GetYearlyGroupRankingFromSum(
   }
 }
 
-app.http("GetYearlyGroupRankingFromSum", {
-  methods: ["GET"],
-  route: "yearly-group-ranking-from-sum",
-  authLevel: "anonymous",
-  handler: GetYearlyGroupRankingFromSum
-});
-
 export { GetYearlyGroupRankingFromSum };
@@ -1,6 +1,57 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
-import { connectionString, tableName, partitionKey } from "../../config";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createGenerationETag, createJsonResponse, createNotModifiedResponse } from "../../utils/httpResponse";
+import { readProductionDataGeneration } from "../../utils/dataGeneration";
+import { toNumber } from "../../utils/productionColumns";
+import {
+  accumulateProductionYears,
+  ALL_GROUPS_PARTITION_KEY,
+  areRollupsReady,
+  getRollupClient,
+  readRollupRange,
+  RollupRow,
+} from "../../utils/productionRollups";
+import { coalesce, createCoalesceKey } from "../../utils/singleFlight";
+import { forEachShard } from "../../utils/shardMap";
+
+/**
+ * 指定年の生産記録を月別に集計する関数
+ * ProductionRollupTable の全グループ合計（"_all"）の月単位の行を読み込む（"_all" はストレージアカウントごとの合計のため全アカウントを合計する）
+ * ロールアップが作成済みでない間は、対象年の生産記録を走査して同じ行を作る
+ * @param year 対象年
+ * @returns 月別の合計（1月〜12月）
+ */
+async function aggregateMonthlyTotals(year: number) {
+  const monthlyTotals = Array.from({ length: 12 }, (_, i) => ({
+    month: i + 1,
+    totalBamboo: 0,
+    charcoalProduced: 0,
+    charcoalVolume: 0,
+    totalCO2Reduction: 0,
+  }));
+
+  let rows: RollupRow[];
+  if (await areRollupsReady()) {
+    rows = (await forEachShard(async (shard) =>
+      readRollupRange(await getRollupClient(shard), ALL_GROUPS_PARTITION_KEY, [
+        { level: "M", start: `${year}01`, end: `${year}12` },
+      ]))).flat();
+  } else {
+    rows = Array.from((await accumulateProductionYears([year])).values()).filter((row) =>
+      row.partitionKey === ALL_GROUPS_PARTITION_KEY && row.level === "M" && row.period.startsWith(String(year)));
+  }
+
+  // 材料別の行を月ごとに合計する（period は YYYYMM）
+  for (const row of rows) {
+    const month = Number(row.period.substring(4, 6)) - 1; // 0-based
+    if (!(month >= 0 && month < 12)) continue;
+    monthlyTotals[month].totalBamboo += toNumber(row.materialAmount);
+    monthlyTotals[month].charcoalProduced += toNumber(row.charcoalProduced);
+    monthlyTotals[month].charcoalVolume += toNumber(row.charcoalVolume);
+    monthlyTotals[month].totalCO2Reduction += toNumber(row.co2Reduction);
+  }
+
+  return monthlyTotals;
+}
 
 async function GetYearlyReport(
   request: HttpRequest,
@@ -9,7 +60,7 @@ async function GetYearlyReport(
   context.log("Processing GET /reports/yearly/:year");
 
   const yearParam = request.params.year;
-  if (!yearParam || isNaN(Number(yearParam))) {
+  if (!yearParam || !Number.isInteger(Number(yearParam))) {
     return {
       status: 400,
       body: "Invalid or missing year parameter",
@@ -17,43 +68,29 @@ async function GetYearlyReport(
   }
   const year = Number(yearParam);
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
-
-  const monthlyTotals = Array.from({ length: 12 }, (_, i) => ({
-    month: i + 1,
-    totalBamboo: 0,
-    charcoalProduced: 0,
-    charcoalVolume: 0,
-    totalCO2Reduction: 0,
-  }));
+  const headers = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Credentials": "true"
+  };
 
   try {
-    const entities = client.listEntities<Record<string, any>>({
-      queryOptions: {
-        filter: `PartitionKey eq '${partitionKey}'`,
-      },
-    });
-
-    for await (const entity of entities) {
-      const date = new Date(entity.date);
-      if (date.getFullYear() !== year) continue;
-
-      const month = date.getMonth(); // 0-based
-      monthlyTotals[month].totalBamboo += Number(entity.bambooAmount || 0);
-      monthlyTotals[month].charcoalProduced += Number(entity.charcoalProduced || 0);
-      monthlyTotals[month].charcoalVolume += Number(entity.charcoalVolume || 0);
-      monthlyTotals[month].totalCO2Reduction += Number(entity.co2Reduction || 0);
+    // 生産データの世代からETagを作り、変更がなければ集計せずに304を返す
+    const generation = await readProductionDataGeneration();
+    const etag = generation ? createGenerationETag(generation, "reports/yearly", year) : undefined;
+    const notModified = etag ? createNotModifiedResponse(request, etag, headers) : null;
+    if (notModified) {
+      return notModified;
     }
 
-    return {
-      status: 200,
-      headers: { 
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Credentials": "true",
-        "Content-Type": "application/json"
-        },
-      body: JSON.stringify(monthlyTotals),
-    };
+    // 同じ年のリクエストが同時に来た場合は1回の読み込みを共有し、結果を短時間キャッシュする
+    // （世代をキーに含め、他のインスタンスで更新された後に古い結果を新しいETagで返さないようにする）
+    const monthlyTotals = await coalesce(
+      createCoalesceKey("reports/yearly", { year, generation }),
+      () => aggregateMonthlyTotals(year)
+    );
+
+    // ETag/304と圧縮に対応したレスポンスを返す
+    return await createJsonResponse(request, monthlyTotals, headers, 200, etag);
   } catch (error: any) {
     context.log(`Error: ${error.message}`);
     return {
@@ -63,11 +100,4 @@ async function GetYearlyReport(
   }
 }
 
-app.http("GetYearlyReport", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "reports/yearly/{year}",
-  handler: GetYearlyReport,
-});
-
 export { GetYearlyReport };
@@ -1,4 +1,4 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 
 /**
  * ヘルスチェックAPI
@@ -59,12 +59,4 @@ async function HealthOptions(request: HttpRequest, context: InvocationContext):
     };
 }
 
-// HTTPエンドポイントの設定
-app.http('Health', {
-    methods: ['GET', 'OPTIONS'],
-    authLevel: 'anonymous', // 認証不要
-    route: 'health',
-    handler: Health
-});
-
 export { Health };
@@ -1,7 +1,12 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload, isAdminOrOperator } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { tryBumpRankingGeneration } from "../../utils/rankingSnapshot";
+import { toProductionEntity } from "../../utils/productionColumns";
+import { tryApplyProductionChange } from "../../utils/productionRollups";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import { getPrimaryShard, getShardTableClient, resolveGroupShardForWrite } from "../../utils/shardMap";
 
 // Azure Table Storage 接続設定
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -52,7 +57,7 @@ async function ImportData(request: HttpRequest, context: InvocationContext): Pro
         };
 
         // グループデータをインポート
-        const groupClient = TableClient.fromConnectionString(connectionString, groupTableName);
+        const groupClient = createTableClient(connectionString, groupTableName);
         for (const group of body.groups) {
             try {
                 // 既存のデータをチェック
@@ -72,7 +77,7 @@ async function ImportData(request: HttpRequest, context: InvocationContext): Pro
         }
 
         // ユーザーデータをインポート
-        const userClient = TableClient.fromConnectionString(connectionString, userTableName);
+        const userClient = createTableClient(connectionString, userTableName);
         for (const user of body.users) {
             try {
                 // 既存のデータをチェック
@@ -91,19 +96,27 @@ async function ImportData(request: HttpRequest, context: InvocationContext): Pro
             }
         }
 
-        // 生産データをインポート
-        const productionClient = TableClient.fromConnectionString(connectionString, productionTableName);
+        // 生産データをインポート（グループに割り当てられたストレージアカウントに保存し、移動中のグループの記録はエラーとする）
+        const changedGroupIds = new Set<unknown>();
         for (const production of body.productions) {
             try {
+                const shard = typeof production.groupId === "string" && production.groupId
+                    ? await resolveGroupShardForWrite(production.groupId)
+                    : getPrimaryShard();
+                const productionClient = getShardTableClient(shard, productionTableName);
                 // 既存のデータをチェック
                 const existingProduction = await productionClient.getEntity(production.partitionKey, production.rowKey);
                 if (existingProduction) {
                     // 既存データを更新
-                    await productionClient.updateEntity(production, "Replace");
+                    await productionClient.updateEntity(toProductionEntity(production), "Replace");
+                    await tryApplyProductionChange(context, existingProduction, production);
+                    changedGroupIds.add(existingProduction.groupId);
                 } else {
                     // 新規データを作成
-                    await productionClient.createEntity(production);
+                    await productionClient.createEntity(toProductionEntity(production));
+                    await tryApplyProductionChange(context, null, production);
                 }
+                changedGroupIds.add(production.groupId);
                 results.productions.imported++;
             } catch (error) {
                 context.log(`Error importing production ${production.rowKey}: ${error}`);
@@ -111,6 +124,14 @@ async function ImportData(request: HttpRequest, context: InvocationContext): Pro
             }
         }
 
+        // 生産データが変わったグループのダッシュボードを無効にする（次のリクエストで作り直される）
+        await invalidateDashboards(context, changedGroupIds);
+
+        // グループ情報が変わった可能性があるため、ランキングのスナップショットを無効化
+        if (results.groups.imported > 0) {
+            await tryBumpRankingGeneration(context, "ImportData");
+        }
+
         return {
             status: 200,
             body: JSON.stringify({
@@ -142,11 +163,4 @@ async function ImportData(request: HttpRequest, context: InvocationContext): Pro
     }
 }
 
-app.http('ImportData', {
-    methods: ['POST'],
-    authLevel: 'anonymous',
-    route: "import-data",
-    handler: ImportData
-});
-
 export { ImportData };
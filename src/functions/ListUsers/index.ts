@@ -1,7 +1,8 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import { jwtSecret, corsOrigins } from "../../config";
+import { InvalidContinuationTokenError, parsePaginationParams, readTablePage } from "../../utils/pagination";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "UsersTable";
@@ -87,17 +88,51 @@ async function ListUsers(
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  // ページング設定（pageSize / continuationToken、all=true で全件）
+  const pagination = parsePaginationParams(new URL(request.url));
+  if (!pagination.params) {
+    return {
+      status: 400,
+      headers: {
+        "Access-Control-Allow-Origin": corsOrigin,
+        "Access-Control-Allow-Credentials": "true",
+        "Content-Type": "application/json"
+      },
+      body: JSON.stringify({ error: pagination.error })
+    };
+  }
+  const { all, pageSize, continuationToken } = pagination.params;
+
+  const client = createTableClient(connectionString, tableName);
+  const filter = `PartitionKey eq '${partitionKey}'`;
 
   try {
-    const entities = client.listEntities({ queryOptions: { filter: `PartitionKey eq '${partitionKey}'` } });
+    if (all) {
+      // 従来どおり全件を返す
+      const entities = client.listEntities({ queryOptions: { filter } });
+
+      const users: any[] = [];
+      for await (const entity of entities) {
+        users.push(entity);
+      }
 
-    const users: any[] = [];
-    for await (const entity of entities) {
-      users.push(entity);
+      context.log("ListUsers: Found users count:", users.length); // デバッグ用
+
+      return {
+        status: 200,
+        headers: {
+          "Access-Control-Allow-Origin": corsOrigin,
+          "Access-Control-Allow-Credentials": "true",
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify(users),
+      };
     }
 
-    context.log("ListUsers: Found users count:", users.length); // デバッグ用
+    // Table Storageの継続トークンをそのまま使って1ページ分取得（RowKey順）
+    const page = await readTablePage(client, filter, pageSize, continuationToken);
+
+    context.log("ListUsers: Found users count:", page.items.length); // デバッグ用
 
     return {
       status: 200,
@@ -106,9 +141,24 @@ async function ListUsers(
         "Access-Control-Allow-Credentials": "true",
         "Content-Type": "application/json",
       },
-      body: JSON.stringify(users),
+      body: JSON.stringify({
+        items: page.items,
+        pageSize,
+        continuationToken: page.continuationToken ?? null
+      }),
     };
   } catch (error: any) {
+    if (error instanceof InvalidContinuationTokenError) {
+      return {
+        status: 400,
+        headers: {
+          "Access-Control-Allow-Origin": corsOrigin,
+          "Access-Control-Allow-Credentials": "true",
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({ error: error.message }),
+      };
+    }
     context.error(`List failed: ${error.message}`);
     return {
       status: 500,
@@ -122,11 +172,4 @@ async function ListUsers(
   }
 }
 
-app.http("ListUsers", {
-  methods: ["GET", "OPTIONS"],
-  authLevel: "anonymous",
-  route: "listusers",
-  handler: ListUsers,
-});
-
 export { ListUsers };
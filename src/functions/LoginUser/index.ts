@@ -4,7 +4,7 @@ import {
   HttpResponseInit,
   InvocationContext,
 } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { createTableClient } from "../../utils/tableClient";
 import bcrypt from "bcryptjs";
 import jwt from "jsonwebtoken";
 import { corsOrigins, jwtSecret } from "../../config";
@@ -59,7 +59,7 @@ async function loginUser(
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString as string, tableName);
+  const client = createTableClient(connectionString as string, tableName);
 
   try {
     const users = client.listEntities({
@@ -144,11 +144,4 @@ async function loginUser(
   }
 }
 
-app.http("LoginUser", {
-  route: "auth/login",
-  methods: ["POST", "OPTIONS"],
-  authLevel: "anonymous",
-  handler: loginUser,
-});
-
 export { loginUser as LoginUser };
@@ -34,11 +34,4 @@ async function logoutUser(
   };
 }
 
-app.http("LogoutUser", {
-  route: "auth/logout",
-  methods: ["POST", "OPTIONS"],
-  authLevel: "anonymous",
-  handler: logoutUser,
-});
-
 export { logoutUser as LogoutUser };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const userGroupTable = "UserGroupTable";
@@ -19,7 +19,7 @@ async function removeUserFromGroup(request: HttpRequest, context: InvocationCont
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, userGroupTable);
+  const client = createTableClient(connectionString, userGroupTable);
 
   context.log(`1.Removing user ${userId} from group ${groupId}`);
   try {
@@ -61,11 +61,4 @@ async function removeUserFromGroup(request: HttpRequest, context: InvocationCont
   }
 }
 
-app.http("RemoveUserFromGroup", {
-  route: "groups/{groupId}/users/{userId}",
-  methods: ["DELETE"],
-  authLevel: "anonymous",
-  handler: removeUserFromGroup,
-});
-
 export { removeUserFromGroup as RemoveUserFromGroup };
@@ -1,4 +1,4 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { BlobServiceClient } from "@azure/storage-blob";
 
 // 計算パラメータ用のインターフェース
@@ -223,11 +223,4 @@ async function streamToString(readableStream: NodeJS.ReadableStream): Promise<st
   });
 }
 
-app.http('SaveCalcSettings', {
-  methods: ['POST'],
-  authLevel: 'anonymous',
-  route: 'save-calc-settings',
-  handler: SaveCalcSettings
-});
-
 export { SaveCalcSettings };
@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 
 // 環境変数に設定された接続文字列とテーブル名
 const connectionString = process.env.AzureWebJobsStorage!;
@@ -22,7 +22,7 @@ async function AddUserGroup(
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   const entity = {
     partitionKey: userId,
@@ -57,11 +57,4 @@ function corsHeaders() {
   };
 }
 
-app.http("AddUserGroup", {
-  route: "groups/{groupId}/users/{userId}",
-  methods: ["POST"],
-  authLevel: "anonymous",
-  handler: AddUserGroup
-});
-
 export { AddUserGroup };
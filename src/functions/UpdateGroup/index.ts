@@ -4,9 +4,10 @@ import {
   HttpResponseInit,
   InvocationContext,
 } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { createTableClient } from "../../utils/tableClient";
 import { authenticateJWT, JWTPayload, isAdminOrOperator } from "../../utils/auth";
 import { corsOrigins } from "../../config";
+import { tryBumpRankingGeneration } from "../../utils/rankingSnapshot";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "GroupsTable";
@@ -74,7 +75,7 @@ async function UpdateGroup(
       body: "Missing id or request body",
     };
   }
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   try {
     // 既存データ取得
@@ -93,6 +94,8 @@ async function UpdateGroup(
     };
     // 更新処理
     await client.updateEntity(updated, "Merge");
+    // ランキングのスナップショットにはグループ名などが含まれるため世代を更新
+    await tryBumpRankingGeneration(context, "UpdateGroup");
     // 更新後のエンティティを取得
     const updatedEntity = await client.getEntity(partitionKey, id);
     // 取得したエンティティを返す
@@ -123,11 +126,4 @@ async function UpdateGroup(
   }
 }
 
-app.http("UpdateGroup", {
-  methods: ["PUT"],
-  authLevel: "anonymous",
-  route: "groups/{id}",
-  handler: UpdateGroup,
-});
-
 export { UpdateGroup };
@@ -1,10 +1,18 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createProductionKeys, getProductionId } from "../../utils/productionKeys";
+import { toProductionEntity } from "../../utils/productionColumns";
+import { tryApplyProductionChange } from "../../utils/productionRollups";
+import { invalidateDashboards } from "../../utils/dashboardDocuments";
+import {
+    createShardMovingResponse,
+    findProductionInShards,
+    getShardTableClient,
+    resolveGroupShardForWrite,
+    ShardMovingError,
+} from "../../utils/shardMap";
 
 // Azure Table Storage 接続設定
-const connectionString = process.env.AzureWebJobsStorage!;
 const tableName = "ProductionTable";
-const partitionKey = "Production"; // 固定値でもユーザー別でもOK
 
 interface UpdateProductionRequestBody {
     date: string;
@@ -93,26 +101,56 @@ async function UpdateProduction(request: HttpRequest, context: InvocationContext
         };
     }
 
-    const client = TableClient.fromConnectionString(connectionString, tableName);
-
     try {
-        // 既存のエンティティを取得
-        const existingEntity = await client.getEntity(partitionKey, id);
+        // 既存のエンティティを取得（グループを変更する場合は、変更前のグループをクエリパラメータ groupId で指定する）
+        // 見つからなければ他のストレージアカウントも検索する
+        const currentGroupId = new URL(request.url).searchParams.get("groupId") || groupId;
+        const found = await findProductionInShards(tableName, id, currentGroupId);
+        if (!found) {
+            return {
+                status: 404,
+                headers: {
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Methods": "GET, POST, PUT, OPTIONS",
+                    "Access-Control-Allow-Headers": "Content-Type",
+                    "Content-Type": "application/json",
+                },
+                body: "Production not found",
+            };
+        }
+
+        const existingEntity = found.entity;
+
+        // 変更前後のグループがどちらも移動中でないことを確認してから書き込む
+        if (typeof existingEntity.groupId === "string" && existingEntity.groupId !== groupId) {
+            await resolveGroupShardForWrite(existingEntity.groupId);
+        }
+        const targetShard = await resolveGroupShardForWrite(groupId);
+        const sourceClient = getShardTableClient(found.shard, tableName);
+        const targetClient = getShardTableClient(targetShard, tableName);
+
+        // グループや生産日の変更、旧キーからの移行によりキーが変わる場合がある
+        // （グループの変更で割り当てられたストレージアカウントが変わる場合も、新しい場所に作成してから削除する）
+        const productionId = getProductionId(existingEntity);
+        const { partitionKey, rowKey } = createProductionKeys(groupId, date, productionId);
+        const keysChanged = partitionKey !== existingEntity.partitionKey || rowKey !== existingEntity.rowKey
+            || targetShard !== found.shard;
 
         // 更新するエンティティを作成
         const updatedEntity = {
             partitionKey,
-            rowKey: id,
+            rowKey,
+            productionId,
             date,
             materialType,
-            materialAmount: materialAmount?.toString() || null,
-            charcoalProduced: charcoalProduced?.toString() || null,
-            charcoalVolume: charcoalVolume?.toString() || null,
+            materialAmount: materialAmount ?? null,
+            charcoalProduced: charcoalProduced ?? null,
+            charcoalVolume: charcoalVolume ?? null,
             charcoalScale: charcoalScale || null,
-            charcoalScaleInput: charcoalScaleInput?.toString() || null,
+            charcoalScaleInput: charcoalScaleInput ?? null,
             inputMethod: inputMethod || null,
             extinguishingMethod,
-            co2Reduction: co2Reduction?.toString() || null,
+            co2Reduction: co2Reduction ?? null,
             batchNumber: batchNumber || null,
             notes: notes || null,
             photoUrl: photoUrl || null,
@@ -122,8 +160,23 @@ async function UpdateProduction(request: HttpRequest, context: InvocationContext
             updatedAt: new Date().toISOString(),
         };
 
-        // エンティティを更新
-        await client.updateEntity(updatedEntity);
+        // 数値列は Edm.Double、生産日から year / yearMonth 列を付与して保存
+        const entityToSave = toProductionEntity(updatedEntity);
+
+        if (keysChanged) {
+            // キーは更新できないため、新しいキーで作成してから旧エンティティを削除する
+            await targetClient.upsertEntity(entityToSave, "Replace");
+            await sourceClient.deleteEntity(existingEntity.partitionKey!, existingEntity.rowKey!);
+            context.log(`Production moved: ${found.shard.name}:${existingEntity.partitionKey}/${existingEntity.rowKey} -> ${targetShard.name}:${partitionKey}/${rowKey}`);
+        } else {
+            // エンティティを更新
+            await targetClient.updateEntity(entityToSave);
+        }
+
+        // 期間別集計（日・月・年）から変更前の値を引き、変更後の値を加算
+        await tryApplyProductionChange(context, existingEntity, updatedEntity);
+        // 変更前後のグループのダッシュボードを無効にする（次のリクエストで作り直される）
+        await invalidateDashboards(context, [existingEntity.groupId, updatedEntity.groupId]);
 
         return {
             status: 200,
@@ -134,11 +187,19 @@ async function UpdateProduction(request: HttpRequest, context: InvocationContext
                 "Content-Type": "application/json",
             },
             body: JSON.stringify({ 
+                id: rowKey,
                 message: "Entity updated successfully",
                 production: updatedEntity
             })
         };
     } catch (error) {
+        if (error instanceof ShardMovingError) {
+            return createShardMovingResponse(error, {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, PUT, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type",
+            });
+        }
         if (error instanceof Error) {
             context.log(`Error: ${error.message}`);
             context.log(`Stack Trace: ${error.stack}`);
@@ -158,11 +219,4 @@ async function UpdateProduction(request: HttpRequest, context: InvocationContext
     }
 }
 
-app.http('UpdateProduction', {
-    methods: ['PUT'],
-    authLevel: 'anonymous',
-    route: "productions/{id}",
-    handler: UpdateProduction
-});
-
 export { UpdateProduction };
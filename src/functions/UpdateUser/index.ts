@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import { jwtSecret, corsOrigins } from "../../config";
 
@@ -114,7 +114,7 @@ async function UpdateUser(request: HttpRequest, context: InvocationContext): Pro
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   try {
     context.log("UpdateUser: Attempting to get entity with partitionKey:", partitionKey, "rowKey:", rowKey); // デバッグ用
@@ -169,11 +169,4 @@ async function UpdateUser(request: HttpRequest, context: InvocationContext): Pro
   }
 }
 
-app.http("UpdateUser", {
-  methods: ["PUT", "OPTIONS"],
-  authLevel: "anonymous",
-  route: "users/update/{id}",
-  handler: UpdateUser,
-});
-
 export { UpdateUser };
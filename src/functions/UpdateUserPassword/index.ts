@@ -1,5 +1,5 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
 import jwt from "jsonwebtoken";
 import bcrypt from "bcryptjs";
 import { jwtSecret, corsOrigins } from "../../config";
@@ -141,7 +141,7 @@ async function UpdateUserPassword(request: HttpRequest, context: InvocationConte
     };
   }
 
-  const client = TableClient.fromConnectionString(connectionString, tableName);
+  const client = createTableClient(connectionString, tableName);
 
   try {
     context.log("UpdateUserPassword: Attempting to get entity with partitionKey:", partitionKey, "rowKey:", rowKey);
@@ -229,11 +229,4 @@ async function UpdateUserPassword(request: HttpRequest, context: InvocationConte
   }
 }
 
-app.http("UpdateUserPassword", {
-  methods: ["PUT", "OPTIONS"],
-  authLevel: "anonymous",
-  route: "users/update-password/{id}",
-  handler: UpdateUserPassword,
-});
-
 export { UpdateUserPassword };
@@ -1,6 +1,12 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { BlobServiceClient } from "@azure/storage-blob";
 import { v4 as uuidv4 } from "uuid";
+import { uploadStreamInBlocks, UploadSizeLimitError } from "../../utils/blockUpload";
+import { getUploadExtension, isSafePathSegment } from "../../utils/uploadValidation";
+
+// ファイルサイズの上限（JSON/Base64形式は10MB、ストリーミング形式はメモリに保持しないため100MB）
+const MAX_PDF_SIZE_MB = 10;
+const MAX_STREAM_PDF_SIZE_MB = 100;
 
 interface UploadPdfRequest {
   fileName: string;
@@ -29,41 +35,95 @@ async function UploadPdf(request: HttpRequest, context: InvocationContext): Prom
       };
     }
 
-    // リクエストボディを取得
-    const body = await request.json() as UploadPdfRequest;
-    const { fileName, contentType, base64Data, userId, groupId } = body;
+    // アップロード形式の判定
+    // Content-Typeがapplication/pdfまたはapplication/octet-streamの場合は、ボディをそのままストリーミングで受け取る
+    // （fileName, userId, groupIdはクエリパラメータで指定）
+    const requestContentType = (request.headers.get('Content-Type') || '').split(';')[0].trim().toLowerCase();
+    const isStreamUpload = requestContentType === 'application/pdf' || requestContentType === 'application/octet-stream';
 
-    // バリデーション
-    if (!fileName || !contentType || !base64Data || !userId || !groupId) {
-      return {
-        status: 400,
-        headers,
-        body: JSON.stringify({
-          error: '必要なパラメータが不足しています'
-        })
-      };
+    let fileName: string | null;
+    let contentType: string | null;
+    let userId: string | null;
+    let groupId: string | null;
+    let buffer: Buffer | null = null;
+
+    if (isStreamUpload) {
+      const url = new URL(request.url);
+      fileName = url.searchParams.get('fileName');
+      userId = url.searchParams.get('userId');
+      groupId = url.searchParams.get('groupId');
+      contentType = 'application/pdf';
+
+      if (!fileName || !userId || !groupId || !request.body) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: '必要なパラメータが不足しています'
+          })
+        };
+      }
+    } else {
+      // リクエストボディを取得
+      const body = await request.json() as UploadPdfRequest;
+      ({ fileName, contentType, userId, groupId } = body);
+      const { base64Data } = body;
+
+      // バリデーション
+      if (!fileName || !contentType || !base64Data || !userId || !groupId) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: '必要なパラメータが不足しています'
+          })
+        };
+      }
+
+      // PDFファイルのバリデーション
+      if (contentType !== 'application/pdf') {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: 'PDFファイルのみアップロード可能です'
+          })
+        };
+      }
+
+      // ファイルサイズのバリデーション（10MB制限）
+      buffer = Buffer.from(base64Data, 'base64');
+      const fileSizeInMB = buffer.length / (1024 * 1024);
+      if (fileSizeInMB > MAX_PDF_SIZE_MB) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: 'ファイルサイズは10MB以下にしてください'
+          })
+        };
+      }
     }
 
-    // PDFファイルのバリデーション
-    if (contentType !== 'application/pdf') {
+    // userId / groupId はBlob名のパスに使うため、英数字・ハイフン・アンダースコアのみ許可する
+    if (!isSafePathSegment(userId) || !isSafePathSegment(groupId)) {
       return {
         status: 400,
         headers,
         body: JSON.stringify({
-          error: 'PDFファイルのみアップロード可能です'
+          error: 'userIdまたはgroupIdが不正です'
         })
       };
     }
 
-    // ファイルサイズのバリデーション（10MB制限）
-    const buffer = Buffer.from(base64Data, 'base64');
-    const fileSizeInMB = buffer.length / (1024 * 1024);
-    if (fileSizeInMB > 10) {
+    // 保存するファイルの拡張子（許可リストにない拡張子は受け付けない）
+    const fileExtension = getUploadExtension(fileName, 'pdf');
+    if (!fileExtension) {
       return {
         status: 400,
         headers,
         body: JSON.stringify({
-          error: 'ファイルサイズは10MB以下にしてください'
+          error: 'PDFファイル（.pdf）のみアップロード可能です'
         })
       };
     }
@@ -150,20 +210,38 @@ async function UploadPdf(request: HttpRequest, context: InvocationContext): Prom
     }
 
     // ファイル名を生成（重複を避けるためUUIDを使用）
-    const fileExtension = fileName.split('.').pop() || 'pdf';
     const uniqueFileName = `${userId}/${groupId}/${uuidv4()}.${fileExtension}`;
     const blockBlobClient = containerClient.getBlockBlobClient(uniqueFileName);
 
-    context.log(`PDFファイルアップロード開始: ${uniqueFileName}, サイズ: ${buffer.length} bytes`);
-
     // Blobにアップロード
     try {
-      await blockBlobClient.upload(buffer, buffer.length, {
-        blobHTTPHeaders: {
-          blobContentType: contentType,
-        }
-      });
+      if (buffer) {
+        context.log(`PDFファイルアップロード開始: ${uniqueFileName}, サイズ: ${buffer.length} bytes`);
+
+        await blockBlobClient.upload(buffer, buffer.length, {
+          blobHTTPHeaders: {
+            blobContentType: contentType,
+          }
+        });
+      } else {
+        context.log(`PDFファイルのストリーミングアップロード開始: ${uniqueFileName}`);
+
+        const result = await uploadStreamInBlocks(blockBlobClient, request.body!, {
+          contentType,
+          maxBytes: MAX_STREAM_PDF_SIZE_MB * 1024 * 1024
+        });
+        context.log(`ストリーミングアップロード完了: ${result.totalBytes} bytes, ${result.blockCount} blocks`);
+      }
     } catch (uploadError) {
+      if (uploadError instanceof UploadSizeLimitError) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: `ファイルサイズは${MAX_STREAM_PDF_SIZE_MB}MB以下にしてください`
+          })
+        };
+      }
       context.error('Blobアップロードエラー:', uploadError);
       return {
         status: 500,
@@ -206,11 +284,4 @@ async function UploadPdf(request: HttpRequest, context: InvocationContext): Prom
   }
 }
 
-app.http('UploadPdf', {
-  methods: ['POST'],
-  authLevel: 'anonymous',
-  route: 'upload-pdf',
-  handler: UploadPdf
-});
-
 export { UploadPdf };
@@ -1,6 +1,12 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
 import { BlobServiceClient } from "@azure/storage-blob";
 import { v4 as uuidv4 } from "uuid";
+import { uploadStreamInBlocks, UploadSizeLimitError } from "../../utils/blockUpload";
+import { createPhotoVariants, getVariantBlobName, PhotoVariantSize, PHOTO_VARIANT_CONTENT_TYPE } from "../../utils/photoVariants";
+import { getUploadExtension, isSafePathSegment, UPLOAD_FILE_TYPES } from "../../utils/uploadValidation";
+
+// ストリーミング形式のファイルサイズの上限
+const MAX_STREAM_PHOTO_BYTES = UPLOAD_FILE_TYPES.photo.maxBytes;
 
 interface UploadPhotoRequest {
   fileName: string;
@@ -29,17 +35,74 @@ async function UploadPhoto(request: HttpRequest, context: InvocationContext): Pr
       };
     }
 
-    // リクエストボディを取得
-    const body = await request.json() as UploadPhotoRequest;
-    const { fileName, contentType, base64Data, userId, groupId } = body;
+    // アップロード形式の判定
+    // Content-Typeがimage/*またはapplication/octet-streamの場合は、ボディをそのままストリーミングで受け取る
+    // （fileName, userId, groupIdはクエリパラメータで指定）
+    const requestContentType = (request.headers.get('Content-Type') || '').split(';')[0].trim().toLowerCase();
+    const isStreamUpload = requestContentType.startsWith('image/') || requestContentType === 'application/octet-stream';
+
+    let fileName: string | null;
+    let contentType: string | null;
+    let userId: string | null;
+    let groupId: string | null;
+    let buffer: Buffer | null = null;
+
+    if (isStreamUpload) {
+      const url = new URL(request.url);
+      fileName = url.searchParams.get('fileName');
+      userId = url.searchParams.get('userId');
+      groupId = url.searchParams.get('groupId');
+      contentType = requestContentType === 'application/octet-stream' ? 'image/jpeg' : requestContentType;
+
+      if (!fileName || !userId || !groupId || !request.body) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: '必要なパラメータが不足しています'
+          })
+        };
+      }
+    } else {
+      // リクエストボディを取得
+      const body = await request.json() as UploadPhotoRequest;
+      ({ fileName, contentType, userId, groupId } = body);
+      const { base64Data } = body;
+
+      // バリデーション
+      if (!fileName || !contentType || !base64Data || !userId || !groupId) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: '必要なパラメータが不足しています'
+          })
+        };
+      }
+
+      // Base64データをデコード
+      buffer = Buffer.from(base64Data, 'base64');
+    }
+
+    // userId / groupId はBlob名のパスに使うため、英数字・ハイフン・アンダースコアのみ許可する
+    if (!isSafePathSegment(userId) || !isSafePathSegment(groupId)) {
+      return {
+        status: 400,
+        headers,
+        body: JSON.stringify({
+          error: 'userIdまたはgroupIdが不正です'
+        })
+      };
+    }
 
-    // バリデーション
-    if (!fileName || !contentType || !base64Data || !userId || !groupId) {
+    // 保存するファイルの拡張子（許可リストにない拡張子は受け付けない）
+    const fileExtension = getUploadExtension(fileName, 'photo');
+    if (!fileExtension) {
       return {
         status: 400,
         headers,
         body: JSON.stringify({
-          error: '必要なパラメータが不足しています'
+          error: `拡張子は ${UPLOAD_FILE_TYPES.photo.extensions.join(', ')} のいずれかにしてください`
         })
       };
     }
@@ -126,23 +189,38 @@ async function UploadPhoto(request: HttpRequest, context: InvocationContext): Pr
     }
 
     // ファイル名を生成（重複を避けるためUUIDを使用）
-    const fileExtension = fileName.split('.').pop() || 'jpg';
     const uniqueFileName = `${userId}/${groupId}/${uuidv4()}.${fileExtension}`;
     const blockBlobClient = containerClient.getBlockBlobClient(uniqueFileName);
 
-    // Base64データをデコード
-    const buffer = Buffer.from(base64Data, 'base64');
-
-    context.log(`ファイルアップロード開始: ${uniqueFileName}, サイズ: ${buffer.length} bytes`);
-
     // Blobにアップロード
     try {
-      await blockBlobClient.upload(buffer, buffer.length, {
-        blobHTTPHeaders: {
-          blobContentType: contentType,
-        }
-      });
+      if (buffer) {
+        context.log(`ファイルアップロード開始: ${uniqueFileName}, サイズ: ${buffer.length} bytes`);
+
+        await blockBlobClient.upload(buffer, buffer.length, {
+          blobHTTPHeaders: {
+            blobContentType: contentType,
+          }
+        });
+      } else {
+        context.log(`ファイルのストリーミングアップロード開始: ${uniqueFileName}`);
+
+        const result = await uploadStreamInBlocks(blockBlobClient, request.body!, {
+          contentType,
+          maxBytes: MAX_STREAM_PHOTO_BYTES
+        });
+        context.log(`ストリーミングアップロード完了: ${result.totalBytes} bytes, ${result.blockCount} blocks`);
+      }
     } catch (uploadError) {
+      if (uploadError instanceof UploadSizeLimitError) {
+        return {
+          status: 400,
+          headers,
+          body: JSON.stringify({
+            error: `ファイルサイズは${MAX_STREAM_PHOTO_BYTES / (1024 * 1024)}MB以下にしてください`
+          })
+        };
+      }
       context.error('Blobアップロードエラー:', uploadError);
       return {
         status: 500,
@@ -159,13 +237,36 @@ async function UploadPhoto(request: HttpRequest, context: InvocationContext): Pr
 
     context.log(`写真がアップロードされました: ${photoUrl}`);
 
+    // 縮小版（サムネイル・中サイズ）を生成してオリジナルの隣に保存
+    // 失敗してもGetPhotoで遅延生成されるため、アップロード自体は成功扱いにする
+    // ストリーミング形式ではオリジナルをメモリに保持しないため、縮小版は初回取得時に生成する
+    const variants: Partial<Record<PhotoVariantSize, string>> = {};
+    if (buffer) {
+      try {
+        const variantBuffers = await createPhotoVariants(buffer);
+        for (const [size, variantBuffer] of variantBuffers) {
+          const variantFileName = getVariantBlobName(uniqueFileName, size);
+          await containerClient.getBlockBlobClient(variantFileName).upload(variantBuffer, variantBuffer.length, {
+            blobHTTPHeaders: {
+              blobContentType: PHOTO_VARIANT_CONTENT_TYPE,
+            }
+          });
+          variants[size] = variantFileName;
+          context.log(`縮小版を保存しました: ${variantFileName}, サイズ: ${variantBuffer.length} bytes`);
+        }
+      } catch (variantError) {
+        context.warn('縮小版の生成に失敗しました（取得時に再生成されます）:', variantError);
+      }
+    }
+
     return {
       status: 200,
       headers,
       body: JSON.stringify({
         success: true,
         photoUrl,
-        fileName: uniqueFileName
+        fileName: uniqueFileName,
+        variants
       })
     };
 
@@ -185,11 +286,4 @@ async function UploadPhoto(request: HttpRequest, context: InvocationContext): Pr
   }
 }
 
-app.http('UploadPhoto', {
-  methods: ['POST'],
-  authLevel: 'anonymous',
-  route: 'upload-photo',
-  handler: UploadPhoto
-});
-
 export { UploadPhoto };
@@ -1,5 +1,9 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
+import { getProductionPeriod, toNumber } from "../../utils/productionColumns";
+import { createProductionDeduper } from "../../utils/productionKeys";
+import { coalesce, createCoalesceKey } from "../../utils/singleFlight";
+import { createShardOwnershipFilter, forEachShard, getShardTableClient } from "../../utils/shardMap";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const productionTable = "ProductionTable";
@@ -17,58 +21,61 @@ interface GroupRankingData {
   introductionPdfUrl?: string | null;
 }
 
-async function getGroupRanking(
-  request: HttpRequest,
-  context: InvocationContext
-): Promise<HttpResponseInit> {
-  try {
-    const prodClient = TableClient.fromConnectionString(connectionString, productionTable);
-    const userGroupClient = TableClient.fromConnectionString(connectionString, userGroupTable);
-    const groupClient = TableClient.fromConnectionString(connectionString, groupTable);
-
-    // 現在の年月を取得
-    const now = new Date();
-    const currentYear = now.getFullYear();
-    const currentMonth = now.getMonth() + 1;
-
-    // グループ情報を取得
-    const groupMap = new Map<string, { name: string; introductionPdfUrl?: string | null }>();
-    for await (const group of groupClient.listEntities()) {
-      const groupId = group.rowKey as string;
-      const groupName = group.name as string;
-      const introductionPdfUrl = group.introductionPdfUrl as string | null | undefined;
-      groupMap.set(groupId, { name: groupName, introductionPdfUrl });
-    }
+/**
+ * グループ別の今月・今年・累積のCO2削減量を集計する関数
+ * @param currentYear 今年
+ * @param currentMonth 今月（1〜12）
+ * @returns 累積炭素固定量の降順に並べたランキング
+ */
+async function aggregateGroupRanking(currentYear: number, currentMonth: number): Promise<GroupRankingData[]> {
+  const userGroupClient = createTableClient(connectionString, userGroupTable);
+  const groupClient = createTableClient(connectionString, groupTable);
+
+  // グループ情報を取得
+  const groupMap = new Map<string, { name: string; introductionPdfUrl?: string | null }>();
+  for await (const group of groupClient.listEntities()) {
+    const groupId = group.rowKey as string;
+    const groupName = group.name as string;
+    const introductionPdfUrl = group.introductionPdfUrl as string | null | undefined;
+    groupMap.set(groupId, { name: groupName, introductionPdfUrl });
+  }
 
-    // userId -> groupId のマップを構築
-    const userToGroupMap = new Map<string, string>();
-    for await (const entity of userGroupClient.listEntities()) {
-      const userId = entity.partitionKey as string;
-      const groupId = entity.rowKey as string;
-      if (!userToGroupMap.has(userId)) {
-        userToGroupMap.set(userId, groupId);
-      }
+  // userId -> groupId のマップを構築
+  const userToGroupMap = new Map<string, string>();
+  for await (const entity of userGroupClient.listEntities()) {
+    const userId = entity.partitionKey as string;
+    const groupId = entity.rowKey as string;
+    if (!userToGroupMap.has(userId)) {
+      userToGroupMap.set(userId, groupId);
     }
+  }
 
-    // グループ別のデータを集計
-    const groupDataMap = new Map<string, {
-      thisMonthCharcoal: number;
-      thisMonthCO2Reduction: number;
-      thisYearCO2Reduction: number;
-      totalCO2ReductionShortTerm: number;
-      totalCO2ReductionLongTerm: number;
-    }>();
-
+  // グループ別のデータを集計
+  const groupDataMap = new Map<string, {
+    thisMonthCharcoal: number;
+    thisMonthCO2Reduction: number;
+    thisYearCO2Reduction: number;
+    totalCO2ReductionShortTerm: number;
+    totalCO2ReductionLongTerm: number;
+  }>();
+
+  // 生産記録は全ストレージアカウントを並列に走査する（移動中のグループのコピーは割り当て先のアカウントの行のみ数える）
+  // キー移行中に旧キーと新しいキーの両方にある記録は1件として数える
+  const isOwned = await createShardOwnershipFilter();
+  const isFirst = createProductionDeduper();
+  await forEachShard(async (shard) => {
+    const prodClient = getShardTableClient(shard, productionTable);
     for await (const record of prodClient.listEntities()) {
+      if (!isOwned(shard, record.groupId) || !isFirst(record)) continue;
       const userId = record.userId as string | undefined;
       const date = record.date as string;
-      const charcoalProduced = Number(record.charcoalProduced ?? 0);
-      const co2Reduction = Number(record.co2Reduction ?? 0);
+      const charcoalProduced = toNumber(record.charcoalProduced);
+      const co2Reduction = toNumber(record.co2Reduction);
 
       if (!userId || !date) continue;
 
       const groupId = userToGroupMap.get(userId) || "unknown";
-      
+    
       if (!groupDataMap.has(groupId)) {
         groupDataMap.set(groupId, {
           thisMonthCharcoal: 0,
@@ -81,10 +88,10 @@ async function getGroupRanking(
 
       const groupData = groupDataMap.get(groupId)!;
 
-      // 日付を解析
-      const recordDate = new Date(date);
-      const recordYear = recordDate.getFullYear();
-      const recordMonth = recordDate.getMonth() + 1;
+      // 年・月（yearMonth 列があれば日付文字列を解析しない）
+      const period = getProductionPeriod(record);
+      const recordYear = period?.year;
+      const recordMonth = period?.month;
 
       // 累積データ
       groupData.totalCO2ReductionShortTerm += co2Reduction;
@@ -101,28 +108,48 @@ async function getGroupRanking(
         groupData.thisMonthCO2Reduction += co2Reduction;
       }
     }
+  });
+
+  // 結果を配列に変換
+  const result: GroupRankingData[] = [];
+  for (const [groupId, data] of groupDataMap) {
+    const groupInfo = groupMap.get(groupId);
+    const groupName = groupInfo?.name || "不明なグループ";
+    const introductionPdfUrl = groupInfo?.introductionPdfUrl || null;
+    
+    result.push({
+      groupId,
+      groupName,
+      thisMonthCharcoal: data.thisMonthCharcoal,
+      thisMonthCO2Reduction: data.thisMonthCO2Reduction,
+      thisYearCO2Reduction: data.thisYearCO2Reduction,
+      totalCO2ReductionShortTerm: data.totalCO2ReductionShortTerm,
+      totalCO2ReductionLongTerm: data.totalCO2ReductionLongTerm,
+      introductionPdfUrl,
+    });
+  }
 
-    // 結果を配列に変換
-    const result: GroupRankingData[] = [];
-    for (const [groupId, data] of groupDataMap) {
-      const groupInfo = groupMap.get(groupId);
-      const groupName = groupInfo?.name || "不明なグループ";
-      const introductionPdfUrl = groupInfo?.introductionPdfUrl || null;
-      
-      result.push({
-        groupId,
-        groupName,
-        thisMonthCharcoal: data.thisMonthCharcoal,
-        thisMonthCO2Reduction: data.thisMonthCO2Reduction,
-        thisYearCO2Reduction: data.thisYearCO2Reduction,
-        totalCO2ReductionShortTerm: data.totalCO2ReductionShortTerm,
-        totalCO2ReductionLongTerm: data.totalCO2ReductionLongTerm,
-        introductionPdfUrl,
-      });
-    }
+  // 累積炭素固定量でソート（降順）
+  result.sort((a, b) => b.totalCO2ReductionShortTerm - a.totalCO2ReductionShortTerm);
 
-    // 累積炭素固定量でソート（降順）
-    result.sort((a, b) => b.totalCO2ReductionShortTerm - a.totalCO2ReductionShortTerm);
+  return result;
+}
+
+async function getGroupRanking(
+  request: HttpRequest,
+  context: InvocationContext
+): Promise<HttpResponseInit> {
+  try {
+    // 現在の年月を取得
+    const now = new Date();
+    const currentYear = now.getFullYear();
+    const currentMonth = now.getMonth() + 1;
+
+    // 同時に来たリクエストは1回の走査を共有し、結果を短時間キャッシュする（今年・今月の値を含むため年月をキーに含める）
+    const result = await coalesce(
+      createCoalesceKey("group-ranking", { year: currentYear, month: currentMonth }),
+      () => aggregateGroupRanking(currentYear, currentMonth)
+    );
 
     return {
       status: 200,
@@ -149,11 +176,4 @@ async function getGroupRanking(
   }
 }
 
-app.http("group-ranking", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "group-ranking",
-  handler: getGroupRanking,
-});
-
 export { getGroupRanking as GroupRanking };
@@ -1,16 +1,19 @@
-import { app, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
-import { TableClient } from "@azure/data-tables";
+import { HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { createTableClient } from "../../utils/tableClient";
+import { createProductionDeduper } from "../../utils/productionKeys";
+import { coalesce, createCoalesceKey } from "../../utils/singleFlight";
+import { createShardOwnershipFilter, forEachShard, getShardTableClient } from "../../utils/shardMap";
 
 const connectionString = process.env.AzureWebJobsStorage!;
 const productionTable = "ProductionTable";
 const userGroupTable = "UserGroupTable";
 
-async function getGroupRankings(
-  request: HttpRequest,
-  context: InvocationContext
-): Promise<HttpResponseInit> {
-  const prodClient = TableClient.fromConnectionString(connectionString, productionTable);
-  const userGroupClient = TableClient.fromConnectionString(connectionString, userGroupTable);
+/**
+ * グループ別の累積CO2削減量を集計する関数
+ * @returns CO2削減量の降順に並べたランキング
+ */
+async function aggregateGroupRankings(): Promise<{ groupId: string; totalCO2: number }[]> {
+  const userGroupClient = createTableClient(connectionString, userGroupTable);
 
   // userId -> groupId のマップを構築（複数グループ参加も考慮して最初の1件に限定）
   const userToGroupMap = new Map<string, string>();
@@ -27,26 +30,44 @@ async function getGroupRankings(
   // グループ別のCO2削減量を集計
   const groupCO2Map: Record<string, number> = {};
 
-  for await (const record of prodClient.listEntities()) {
-    const userId = record.userId as string | undefined;
-    const co2 = Number(record.co2Reduction ?? 0);
+  // 生産記録は全ストレージアカウントを並列に走査する（移動中のグループのコピーは割り当て先のアカウントの行のみ数える）
+  // キー移行中に旧キーと新しいキーの両方にある記録は1件として数える
+  const isOwned = await createShardOwnershipFilter();
+  const isFirst = createProductionDeduper();
+  await forEachShard(async (shard) => {
+    const prodClient = getShardTableClient(shard, productionTable);
+    for await (const record of prodClient.listEntities()) {
+      if (!isOwned(shard, record.groupId) || !isFirst(record)) continue;
+      const userId = record.userId as string | undefined;
+      const co2 = Number(record.co2Reduction ?? 0);
 
-    if (!userId) continue;
+      if (!userId) continue;
 
-    const groupId = userToGroupMap.get(userId) || "unknown";
+      const groupId = userToGroupMap.get(userId) || "unknown";
 
-    if (!groupCO2Map[groupId]) {
-      groupCO2Map[groupId] = 0;
-    }
+      if (!groupCO2Map[groupId]) {
+        groupCO2Map[groupId] = 0;
+      }
 
-    groupCO2Map[groupId] += co2;
-  }
+      groupCO2Map[groupId] += co2;
+    }
+  });
 
   // ランキングを降順で作成
   const rankings = Object.entries(groupCO2Map)
     .map(([groupId, totalCO2]) => ({ groupId, totalCO2 }))
     .sort((a, b) => b.totalCO2 - a.totalCO2);
 
+  return rankings;
+}
+
+async function getGroupRankings(
+  request: HttpRequest,
+  context: InvocationContext
+): Promise<HttpResponseInit> {
+  // 同時に来たリクエストは1回の走査を共有し、結果を短時間キャッシュする
+  const rankings = await coalesce(createCoalesceKey("group-rankings"), aggregateGroupRankings);
+
   return {
     status: 200,
     body: JSON.stringify(rankings),
@@ -59,11 +80,4 @@ async function getGroupRankings(
   };
 }
 
-app.http("group-rankings", {
-  methods: ["GET"],
-  authLevel: "anonymous",
-  route: "group-rankings",
-  handler: getGroupRankings,
-});
-
 export { getGroupRankings as GroupRankings };
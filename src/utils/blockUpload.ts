@@ -0,0 +1,128 @@
+import { BlockBlobClient } from "@azure/storage-blob";
+import { ReadableStream } from "stream/web";
+
+// ブロックサイズと同時ステージ数のデフォルト値（1アップロードあたりのメモリ上限は概ね blockSize × (concurrency + 1)）
+export const DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024;
+export const DEFAULT_UPLOAD_CONCURRENCY = 4;
+
+export interface StreamUploadOptions {
+  contentType: string;
+  blockSize?: number;
+  concurrency?: number;
+  maxBytes?: number;
+}
+
+export interface StreamUploadResult {
+  totalBytes: number;
+  blockCount: number;
+}
+
+/**
+ * アップロードサイズが上限を超えた場合のエラー
+ */
+export class UploadSizeLimitError extends Error {
+  constructor(public readonly maxBytes: number) {
+    super(`Upload exceeds the maximum size of ${maxBytes} bytes`);
+    this.name = "UploadSizeLimitError";
+  }
+}
+
+/**
+ * ブロックIDを生成する関数（同一Blob内のブロックIDはすべて同じ長さである必要がある）
+ * @param index ブロック番号
+ * @returns Base64エンコードされたブロックID
+ */
+function createBlockId(index: number): string {
+  return Buffer.from(`block-${index.toString().padStart(6, "0")}`).toString("base64");
+}
+
+/**
+ * リクエストボディのストリームをブロック単位でステージし、最後にコミットする関数
+ * ボディ全体をメモリに保持せず、並列数を制限してstageBlockを実行する
+ * 各ブロックの再試行はSDKのリトライポリシーが行うため、失敗時もそのブロックのみが再送される
+ * @param blockBlobClient アップロード先のBlockBlobClient
+ * @param body リクエストボディのストリーム
+ * @param options コンテンツタイプ、ブロックサイズ、並列数、サイズ上限
+ * @returns アップロードしたバイト数とブロック数
+ */
+export async function uploadStreamInBlocks(
+  blockBlobClient: BlockBlobClient,
+  body: ReadableStream<Uint8Array>,
+  options: StreamUploadOptions
+): Promise<StreamUploadResult> {
+  const blockSize = options.blockSize ?? DEFAULT_BLOCK_SIZE;
+  const concurrency = options.concurrency ?? DEFAULT_UPLOAD_CONCURRENCY;
+
+  const blockIds: string[] = [];
+  const pending = new Set<Promise<void>>();
+  let totalBytes = 0;
+  let bufferedChunks: Uint8Array[] = [];
+  let bufferedBytes = 0;
+
+  const stageBlock = async (data: Buffer): Promise<void> => {
+    // 同時実行数が上限に達している場合は、いずれかの完了を待つ
+    while (pending.size >= concurrency) {
+      await Promise.race(pending);
+    }
+
+    const blockId = createBlockId(blockIds.length);
+    blockIds.push(blockId);
+
+    const promise: Promise<void> = blockBlobClient
+      .stageBlock(blockId, data, data.length)
+      .then(() => {
+        pending.delete(promise);
+      });
+    // 失敗は次のPromise.race/Promise.allで検出するため、ここでは未処理扱いにしない
+    promise.catch(() => {});
+    pending.add(promise);
+  };
+
+  const reader = body.getReader();
+  try {
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      if (!value || value.length === 0) continue;
+
+      totalBytes += value.length;
+      if (options.maxBytes !== undefined && totalBytes > options.maxBytes) {
+        throw new UploadSizeLimitError(options.maxBytes);
+      }
+
+      bufferedChunks.push(value);
+      bufferedBytes += value.length;
+
+      // ブロックサイズ分たまったら切り出してステージ
+      while (bufferedBytes >= blockSize) {
+        const combined = Buffer.concat(bufferedChunks);
+        await stageBlock(combined.subarray(0, blockSize));
+        const rest = combined.subarray(blockSize);
+        bufferedChunks = rest.length > 0 ? [rest] : [];
+        bufferedBytes = rest.length;
+      }
+    }
+
+    // 残りのデータを最後のブロックとしてステージ
+    if (bufferedBytes > 0) {
+      await stageBlock(Buffer.concat(bufferedChunks));
+      bufferedChunks = [];
+      bufferedBytes = 0;
+    }
+
+    await Promise.all(pending);
+  } catch (error) {
+    // 実行中のステージ処理の完了を待ってからエラーを返す（未コミットのブロックはストレージ側で自動的に破棄される）
+    await Promise.allSettled(pending);
+    await reader.cancel().catch(() => {});
+    throw error;
+  }
+
+  await blockBlobClient.commitBlockList(blockIds, {
+    blobHTTPHeaders: {
+      blobContentType: options.contentType,
+    }
+  });
+
+  return { totalBytes, blockCount: blockIds.length };
+}
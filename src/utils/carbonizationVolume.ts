@@ -0,0 +1,135 @@
+// Constants for volume calculation for each device model
+export const DEVICE_CONSTANTS = {
+  L500: {
+    H: 44.0,   // height in cm
+    R: 73.5,   // top radius in cm
+    br: 48.0,  // bottom radius in cm
+  },
+  L180: {
+    H: 34.5,   // height in cm
+    R: 48.0,   // top radius in cm
+    br: 28.0,  // bottom radius in cm
+  },
+  L40: {
+    H: 22.0,   // height in cm
+    R: 28.0,   // top radius in cm
+    br: 15.5,  // bottom radius in cm
+  },
+} as const;
+
+export type DeviceModel = keyof typeof DEVICE_CONSTANTS;
+
+// Constants for calculations
+export const CHARCOAL_DENSITY = 0.11; // kg/L
+export const CARBON_CONTENT = 0.8;    // 80% of charcoal weight
+export const CO2_RATIO = 3.67;        // CO2/C ratio
+
+// Lookup table resolution: 0.01 cm steps
+const STEPS_PER_CM = 100;
+
+export interface CarbonizationResult {
+  model: DeviceModel;
+  height: number;
+  topRadius: number;        // 上面半径 (cm)
+  volumeLiters: number;     // 体積 (L)
+  charcoalWeight: number;   // 製炭量 (kg)
+  carbonWeight: number;     // 炭素量 (kg-C)
+  co2Sequestration: number; // 炭素固定量 (kg-CO2)
+}
+
+/**
+ * Check whether the given value is a supported device model
+ * @param model value from the request body
+ * @returns true if model is L500, L180 or L40
+ */
+export function isDeviceModel(model: unknown): model is DeviceModel {
+  return typeof model === 'string' && Object.prototype.hasOwnProperty.call(DEVICE_CONSTANTS, model);
+}
+
+/**
+ * Calculate radius and volume for given height and device model
+ * @param h height in cm
+ * @param model device model (L500, L180, L40)
+ * @returns [tr (top radius), volume_l (volume in liters)]
+ */
+export function volumeLiters(h: number, model: DeviceModel): [number, number] {
+  const constants = DEVICE_CONSTANTS[model];
+  const { H, R, br } = constants;
+
+  // Handle edge cases
+  if (h <= 0) {
+    return [0.0, 0.0];
+  }
+  if (h > H) {
+    h = H;
+  }
+
+  // Calculate top radius (tr)
+  const tr = br + (R - br) * (h / H);
+
+  // Calculate volume in cm^3 and convert to liters
+  const volumeL = (Math.PI * h / 3.0 * (tr * tr + tr * br + br * br)) / 1000.0;
+
+  return [tr, volumeL];
+}
+
+/**
+ * Precompute frustum volumes for every model at 0.01 cm resolution (evaluated once at module load)
+ */
+const VOLUME_TABLES: Record<DeviceModel, Float64Array> = (() => {
+  const tables = {} as Record<DeviceModel, Float64Array>;
+  for (const model of Object.keys(DEVICE_CONSTANTS) as DeviceModel[]) {
+    const steps = Math.round(DEVICE_CONSTANTS[model].H * STEPS_PER_CM);
+    const table = new Float64Array(steps + 1);
+    for (let i = 0; i <= steps; i++) {
+      table[i] = volumeLiters(i / STEPS_PER_CM, model)[1];
+    }
+    tables[model] = table;
+  }
+  return tables;
+})();
+
+/**
+ * Same result as volumeLiters, served from the precomputed table when the height is on the grid
+ * Off-grid heights fall back to the exact calculation
+ * @param h height in cm
+ * @param model device model (L500, L180, L40)
+ * @returns [tr (top radius), volume_l (volume in liters)]
+ */
+export function lookupVolumeLiters(h: number, model: DeviceModel): [number, number] {
+  const { H, R, br } = DEVICE_CONSTANTS[model];
+  const clamped = h > H ? H : h;
+  const index = Math.round(clamped * STEPS_PER_CM);
+
+  if (clamped > 0 && index / STEPS_PER_CM === clamped) {
+    const tr = br + (R - br) * (clamped / H);
+    return [tr, VOLUME_TABLES[model][index]];
+  }
+
+  return volumeLiters(h, model);
+}
+
+/**
+ * Calculate volume, charcoal weight and carbon sequestration for a single measurement
+ * @param model device model (L500, L180, L40)
+ * @param height height in cm
+ * @returns calculation result
+ */
+export function calculateCarbonization(model: DeviceModel, height: number): CarbonizationResult {
+  const [topRadius, volumeInLiters] = lookupVolumeLiters(height, model);
+
+  // Calculate charcoal production and carbon sequestration
+  const charcoalWeight = volumeInLiters * CHARCOAL_DENSITY;
+  const carbonWeight = charcoalWeight * CARBON_CONTENT;
+  const co2Sequestration = carbonWeight * CO2_RATIO;
+
+  return {
+    model,
+    height,
+    topRadius,
+    volumeLiters: volumeInLiters,
+    charcoalWeight,
+    carbonWeight,
+    co2Sequestration,
+  };
+}
@@ -0,0 +1,474 @@
+import { InvocationContext } from "@azure/functions";
+import { ContainerClient } from "@azure/storage-blob";
+import { promisify } from "util";
+import { gunzip, gzip } from "zlib";
+import { listGroupProductions } from "./productionKeys";
+import { toNumber } from "./productionColumns";
+import { areRollupsReady, getRollupClient, readRollupRange, RollupAccumulator, RollupRow } from "./productionRollups";
+import { trackStorageCall } from "./metrics";
+import { getShardBlobServiceClient, getShardTableClient, resolveGroupShard, StorageShard } from "./shardMap";
+
+/**
+ * グループ別ダッシュボードの事前計算（dashboards コンテナ）
+ *
+ * Dashboard のレスポンス（年指定なし）に、年別の月別CO2固定量を加えたドキュメントをグループごとに1つ保存する。
+ * 合計は ProductionRollupTable のグループの月・年単位の行から求め、生産記録は最近の5件を含む月のみ読み込む。
+ * ロールアップが作成済みでない間は、グループの全生産記録から同じ行を作る。
+ * - 生産記録の登録・更新・削除・インポート時に、そのグループのドキュメントを無効にする（書き込みのリクエスト内で行い、
+ *   次の Dashboard のリクエストが作り直して保存する）
+ * - 毎日の ProductionSum 再集計（CreateProductionSumTimer）で、生産記録のある全グループを作り直す
+ * - 今月・今年の値を含むため、作成した年月を period としてBlobのメタデータに保存し、年月が変わったドキュメントは使わない
+ * ドキュメントは gzip 圧縮して保存し、Dashboard はBlobをそのまま（gzip非対応のクライアントには展開して）返す。
+ * ドキュメントはグループの生産記録と同じストレージアカウント（shardMap.ts）の dashboards コンテナに保存する。
+ * 保存は作り直し前のBlobのETagを条件に行い、古いデータから作ったドキュメントで新しいドキュメントを上書きしない。
+ */
+
+const productionTableName = "ProductionTable";
+export const DASHBOARD_CONTAINER_NAME = "dashboards";
+
+// ドキュメントの形式が変わった場合に上げる（古い形式のドキュメントは使わない）
+export const DASHBOARD_DOCUMENT_VERSION = "2";
+
+// 全グループを作り直す際に同時に処理するグループ数
+const MATERIALIZE_PARALLELISM = 4;
+
+// 最近の生産記録として返す件数
+const RECENT_PRODUCTION_COUNT = 5;
+
+// 無効にしたドキュメント（空のBlob）のメタデータの version（openDashboardBlob は使わない）
+const INVALIDATED_DOCUMENT_VERSION = "invalidated";
+
+// 別の処理と同時に保存した場合にドキュメントを作り直す回数
+const MAX_SAVE_ATTEMPTS = 5;
+
+const gzipAsync = promisify(gzip);
+const gunzipAsync = promisify(gunzip);
+
+export interface MonthlyCO2Reduction {
+  month: number;
+  totalCO2Reduction: number;
+}
+
+export interface DashboardResponse {
+  groupId: string;
+  totalCO2Reduction: number;
+  currentMonth: { bamboo: number; charcoal: number; co2Reduction: number };
+  changes: { co2: number; bamboo: number; charcoal: number };
+  yearlyData: MonthlyCO2Reduction[];
+  efficiencyRate: number;
+  recentProductions: {
+    id: string;
+    date: string;
+    materialAmount: unknown;
+    charcoalProduced: unknown;
+    co2Reduction: number;
+  }[];
+}
+
+export interface DashboardDocument extends DashboardResponse {
+  // 作成した年月（YYYY-MM）。今月・今年の値はこの年月時点のもの
+  period: string;
+  generatedAt: string;
+  // 年 -> 年別の合計と月別CO2固定量（年指定のリクエストに使う）
+  years: Record<string, { totalCO2Reduction: number; yearlyData: MonthlyCO2Reduction[] }>;
+}
+
+// CO2固定量を計算する関数
+export function calculateCO2Reduction(charcoalWeight: number): number {
+  const carbonContent = charcoalWeight * 0.8;
+  return carbonContent * 3.67;
+}
+
+// 効率率を計算する関数
+function calculateEfficiency(bamboo: number, charcoal: number): number {
+  if (bamboo <= 0) return 0;
+  return (charcoal / bamboo) * 100;
+}
+
+// 生産記録のない年の月別CO2固定量
+function emptyYearlyData(): MonthlyCO2Reduction[] {
+  return Array.from({ length: 12 }, (_, i) => ({ month: i + 1, totalCO2Reduction: 0 }));
+}
+
+/**
+ * 年月を YYYY-MM 形式の文字列にする関数
+ * @param now 日時
+ * @returns 年月
+ */
+export function toDashboardPeriod(now: Date): string {
+  return `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, "0")}`;
+}
+
+export interface DashboardSource {
+  // グループの月単位（M）・年単位（Y）のロールアップ行
+  rollups: RollupRow[];
+  // 新しい順の生産記録（最大 RECENT_PRODUCTION_COUNT 件）
+  recentProductions: any[];
+}
+
+/**
+ * ダッシュボードの作成に必要なデータを読み込む関数
+ * 合計はグループの月・年単位のロールアップから求め、生産記録は最近の記録を含む月のみ読み込む
+ * @param groupId グループID
+ * @returns ロールアップ行と最近の生産記録
+ */
+export async function loadDashboardSource(groupId: string): Promise<DashboardSource> {
+  const shard = await resolveGroupShard(groupId);
+  const client = getShardTableClient(shard, productionTableName);
+
+  if (!(await areRollupsReady())) {
+    // ロールアップが作成されるまでは、グループの全生産記録から月・年単位の行を作る
+    const productions = await listGroupProductions<Record<string, any>>(client, groupId);
+    const accumulator = new RollupAccumulator();
+    for (const production of productions) {
+      accumulator.add(production);
+    }
+    productions.sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime());
+    return {
+      rollups: Array.from(accumulator.values()).filter((row) => row.partitionKey === groupId && row.level !== "D"),
+      recentProductions: productions.slice(0, RECENT_PRODUCTION_COUNT),
+    };
+  }
+
+  const rollups = await readRollupRange(await getRollupClient(shard), groupId, [
+    { level: "M", start: "000000", end: "999999" },
+    { level: "Y", start: "0000", end: "9999" },
+  ]);
+
+  // 生産記録のある月を新しい順にたどり、最近の記録の件数に達するまでの月を読み込む
+  const monthCounts = new Map<string, number>();
+  for (const row of rollups) {
+    if (row.level === "M") {
+      monthCounts.set(row.period, (monthCounts.get(row.period) ?? 0) + toNumber(row.count));
+    }
+  }
+  const months: string[] = [];
+  let count = 0;
+  for (const month of Array.from(monthCounts.keys()).sort().reverse()) {
+    if (count >= RECENT_PRODUCTION_COUNT) break;
+    months.push(month);
+    count += monthCounts.get(month)!;
+  }
+
+  const productions = (await Promise.all(months.map((month) =>
+    listGroupProductions<Record<string, any>>(client, groupId, { month })))).flat();
+  productions.sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime());
+
+  return { rollups, recentProductions: productions.slice(0, RECENT_PRODUCTION_COUNT) };
+}
+
+/**
+ * ロールアップと最近の生産記録からダッシュボードのドキュメントを作成する関数
+ * @param groupId グループID
+ * @param source loadDashboardSource で読み込んだデータ
+ * @param now 現在日時
+ * @returns ダッシュボードのドキュメント
+ */
+export function buildDashboardDocument(groupId: string, source: DashboardSource, now: Date = new Date()): DashboardDocument {
+  // 年月（YYYYMM）・年（YYYY）ごとの材料別の行を合計する
+  const monthly = new Map<string, { bamboo: number; charcoal: number }>();
+  const yearlyCharcoal = new Map<string, number>();
+  for (const row of source.rollups) {
+    if (row.level === "M") {
+      const total = monthly.get(row.period) ?? { bamboo: 0, charcoal: 0 };
+      total.bamboo += toNumber(row.materialAmount);
+      total.charcoal += toNumber(row.charcoalProduced);
+      monthly.set(row.period, total);
+    } else if (row.level === "Y") {
+      yearlyCharcoal.set(row.period, (yearlyCharcoal.get(row.period) ?? 0) + toNumber(row.charcoalProduced));
+    }
+  }
+
+  const years: DashboardDocument["years"] = {};
+  for (const [year, charcoal] of yearlyCharcoal) {
+    years[year] = {
+      totalCO2Reduction: calculateCO2Reduction(charcoal),
+      yearlyData: emptyYearlyData().map(({ month }) => ({
+        month,
+        totalCO2Reduction: calculateCO2Reduction(monthly.get(`${year}${String(month).padStart(2, "0")}`)?.charcoal ?? 0),
+      })),
+    };
+  }
+
+  const current = monthly.get(toDashboardPeriod(now).replace("-", "")) ?? { bamboo: 0, charcoal: 0 };
+  const currentMonthCO2Reduction = calculateCO2Reduction(current.charcoal);
+  const currentYear = years[now.getFullYear()] ?? { totalCO2Reduction: 0, yearlyData: emptyYearlyData() };
+
+  return {
+    groupId,
+    totalCO2Reduction: currentYear.totalCO2Reduction,
+    currentMonth: {
+      bamboo: current.bamboo,
+      charcoal: current.charcoal,
+      co2Reduction: currentMonthCO2Reduction
+    },
+    changes: {
+      co2: currentMonthCO2Reduction,
+      bamboo: current.bamboo,
+      charcoal: current.charcoal
+    },
+    yearlyData: currentYear.yearlyData,
+    efficiencyRate: calculateEfficiency(current.bamboo, current.charcoal),
+    recentProductions: source.recentProductions.map(production => ({
+      id: production.rowKey,
+      date: production.date,
+      materialAmount: production.materialAmount,
+      charcoalProduced: production.charcoalProduced,
+      co2Reduction: calculateCO2Reduction(toNumber(production.charcoalProduced))
+    })),
+    period: toDashboardPeriod(now),
+    generatedAt: now.toISOString(),
+    years,
+  };
+}
+
+/**
+ * ドキュメントから年指定のレスポンスを作成する関数（生産記録のない年は0）
+ * @param document ダッシュボードのドキュメント
+ * @param targetYear 対象年
+ * @returns ダッシュボードのレスポンス
+ */
+export function selectDashboardYear(document: DashboardDocument, targetYear: number): DashboardResponse {
+  const { period, generatedAt, years, ...response } = document;
+  const year = years[targetYear] ?? { totalCO2Reduction: 0, yearlyData: emptyYearlyData() };
+  return { ...response, totalCO2Reduction: year.totalCO2Reduction, yearlyData: year.yearlyData };
+}
+
+/**
+ * ドキュメントのBlob名を生成する関数
+ * @param groupId グループID
+ * @returns Blob名
+ */
+export function getDashboardBlobName(groupId: string): string {
+  return `${encodeURIComponent(groupId)}.json`;
+}
+
+// シャード名 → コンテナの作成の完了
+const containerReady = new Map<string, Promise<ContainerClient>>();
+
+/**
+ * dashboards コンテナのクライアントを取得する関数（シャードごとに初回のみコンテナを作成）
+ * @param shard シャード
+ * @returns ContainerClient
+ */
+export function getDashboardContainer(shard: StorageShard): Promise<ContainerClient> {
+  let ready = containerReady.get(shard.name);
+  if (!ready) {
+    ready = (async () => {
+      const containerClient = getShardBlobServiceClient(shard).getContainerClient(DASHBOARD_CONTAINER_NAME);
+      await containerClient.createIfNotExists();
+      return containerClient;
+    })();
+    containerReady.set(shard.name, ready);
+    ready.catch(() => {
+      containerReady.delete(shard.name);
+    });
+  }
+  return ready;
+}
+
+/**
+ * ドキュメントを gzip 圧縮してBlobに保存する関数
+ * 作成に使ったデータを読む前のBlobのETagを条件に書き込み、その後に別の処理が保存したドキュメントを上書きしない
+ * @param document ダッシュボードのドキュメント
+ * @param baseETag データを読む前のBlobのETag（Blobがなかった場合はnull）
+ * @throws 別の処理が先に保存した場合は statusCode 409 / 412 のエラー
+ */
+export async function saveDashboardDocument(document: DashboardDocument, baseETag: string | null): Promise<void> {
+  const body = await gzipAsync(Buffer.from(JSON.stringify(document), "utf8"), { level: 9 });
+  const containerClient = await getDashboardContainer(await resolveGroupShard(document.groupId));
+  await trackStorageCall("blob.upload", () =>
+    containerClient.getBlockBlobClient(getDashboardBlobName(document.groupId)).upload(body, body.length, {
+      blobHTTPHeaders: { blobContentType: "application/json", blobContentEncoding: "gzip" },
+      metadata: { period: document.period, version: DASHBOARD_DOCUMENT_VERSION },
+      conditions: baseETag ? { ifMatch: baseETag } : { ifNoneMatch: "*" },
+    }), () => body.length);
+}
+
+/**
+ * 保存済みのドキュメントのETagを取得する関数
+ * @param groupId グループID
+ * @returns BlobのETag（ドキュメントがない場合はnull）
+ */
+export async function readDashboardETag(groupId: string): Promise<string | null> {
+  const containerClient = await getDashboardContainer(await resolveGroupShard(groupId));
+  try {
+    const properties = await trackStorageCall("blob.getProperties", () =>
+      containerClient.getBlobClient(getDashboardBlobName(groupId)).getProperties());
+    return properties.etag ?? null;
+  } catch (error: any) {
+    if (error?.statusCode === 404) {
+      return null;
+    }
+    throw error;
+  }
+}
+
+function isSaveConflict(error: any): boolean {
+  return error?.statusCode === 409 || error?.statusCode === 412;
+}
+
+/**
+ * グループのドキュメントを作り直してBlobに保存する関数
+ * 保存前に別の処理がドキュメントを保存していた場合は、そのETagを読み直してから作り直す
+ * （保存されるドキュメントは、常に置き換えるドキュメントより後に読んだデータから作られる）
+ * @param groupId グループID
+ * @param now 現在日時
+ * @returns 作成したドキュメント
+ */
+export async function materializeDashboard(groupId: string, now: Date = new Date()): Promise<DashboardDocument> {
+  for (let attempt = 1; ; attempt++) {
+    const baseETag = await readDashboardETag(groupId);
+    const document = buildDashboardDocument(groupId, await loadDashboardSource(groupId), now);
+    try {
+      await saveDashboardDocument(document, baseETag);
+      return document;
+    } catch (error) {
+      if (!isSaveConflict(error) || attempt >= MAX_SAVE_ATTEMPTS) {
+        throw error;
+      }
+    }
+  }
+}
+
+// 重複・空値を除いたグループIDの配列
+function toGroupIdSet(groupIds: Iterable<unknown>): string[] {
+  return Array.from(new Set(
+    Array.from(groupIds).filter((groupId): groupId is string => typeof groupId === "string" && groupId !== "")
+  ));
+}
+
+/**
+ * ドキュメントの更新に失敗しても元の処理を失敗させないためのラッパー
+ * （Dashboard はドキュメントが古い・ない場合にロールアップから作成する）
+ * @param context 実行コンテキスト
+ * @param groupIds ドキュメントを作り直すグループID（重複・空値は無視）
+ */
+export async function tryMaterializeDashboards(context: InvocationContext, groupIds: Iterable<unknown>): Promise<void> {
+  const targets = toGroupIdSet(groupIds);
+
+  let next = 0;
+  let failed = 0;
+  const worker = async () => {
+    while (next < targets.length) {
+      const groupId = targets[next++];
+      try {
+        await materializeDashboard(groupId);
+      } catch (error) {
+        failed++;
+        context.warn(`Failed to materialize dashboard for group ${groupId}: ${error}`);
+      }
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(MATERIALIZE_PARALLELISM, targets.length) }, worker));
+
+  if (targets.length > 1) {
+    context.log(`Dashboard documents materialized: ${targets.length - failed}/${targets.length}`);
+  }
+}
+
+/**
+ * グループのドキュメントを無効にする関数（生産記録の書き込みのリクエストから、書き込みの後に呼び出す）
+ * ドキュメントを空のBlobで無条件に置き換え、次の Dashboard のリクエストがその時点のデータから作り直す
+ * （無効にする前のデータから作り直していた処理は、保存の条件のETagが一致しなくなるため、読み直して作り直す）
+ * Blobの書き込み1回のため、書き込みのレスポンスを待たせない。失敗しても元の処理は失敗させない
+ * （ドキュメントは毎日の ProductionSum 再集計で作り直される）
+ * @param context 実行コンテキスト
+ * @param groupIds ドキュメントを無効にするグループID（重複・空値は無視）
+ */
+export async function invalidateDashboards(context: InvocationContext, groupIds: Iterable<unknown>): Promise<void> {
+  await Promise.all(toGroupIdSet(groupIds).map(async (groupId) => {
+    try {
+      const containerClient = await getDashboardContainer(await resolveGroupShard(groupId));
+      await trackStorageCall("blob.upload", () =>
+        containerClient.getBlockBlobClient(getDashboardBlobName(groupId)).upload(Buffer.alloc(0), 0, {
+          metadata: { version: INVALIDATED_DOCUMENT_VERSION },
+        }), () => 0);
+    } catch (error) {
+      context.warn(`Failed to invalidate dashboard for group ${groupId}: ${error}`);
+    }
+  }));
+}
+
+export interface DashboardBlob {
+  // 304 の場合は true（body なし）
+  notModified: boolean;
+  // 展開後の表現のETag（gzip のまま返す場合は末尾に -gzip を付ける）
+  etag: string;
+  // gzip 圧縮されたドキュメントのストリーム
+  body?: NodeJS.ReadableStream;
+}
+
+/**
+ * レスポンス用のETagを生成する関数（同じBlobでも作成した年月・返す部分（年指定）が違えば別のETagとする）
+ * @param blobETag BlobのETag
+ * @param suffix 作成した年月（年指定の場合は「年月-y年」）
+ * @returns ETag
+ */
+function formatDashboardETag(blobETag: string, suffix: string): string {
+  return `"${blobETag.replace(/"/g, "")}-${suffix}"`;
+}
+
+/**
+ * 今月作成されたドキュメントを取得する関数
+ * If-None-Match が今月作成されたドキュメントのETagと一致すれば、本文を読まずに notModified を返す
+ * @param groupId グループID
+ * @param ifNoneMatch If-None-Matchヘッダーの値
+ * @param targetYear 年指定のリクエストの場合はその年（ETagを年ごとに分ける）
+ * @param now 現在日時
+ * @returns ドキュメント（ない・古い場合はnull）
+ */
+export async function openDashboardBlob(
+  groupId: string,
+  ifNoneMatch: string | null,
+  targetYear?: number,
+  now: Date = new Date()
+): Promise<DashboardBlob | null> {
+  const period = toDashboardPeriod(now);
+  const tagSuffix = targetYear === undefined ? period : `${period}-y${targetYear}`;
+  const containerClient = await getDashboardContainer(await resolveGroupShard(groupId));
+  const blobClient = containerClient.getBlobClient(getDashboardBlobName(groupId));
+
+  // クライアントが持っているのが今月のドキュメントの場合のみ、条件付きで取得する
+  const suffix = `-${tagSuffix}"`;
+  const cachedTag = ifNoneMatch
+    ?.split(",")
+    .map((tag) => tag.trim().replace(/^W\//, "").replace(/-(gzip|br)"$/, '"'))
+    .find((tag) => tag.endsWith(suffix));
+  const blobIfNoneMatch = cachedTag ? `"${cachedTag.slice(1, -suffix.length)}"` : undefined;
+
+  try {
+    const response = await trackStorageCall("blob.download", () =>
+      blobClient.download(0, undefined, { conditions: blobIfNoneMatch ? { ifNoneMatch: blobIfNoneMatch } : undefined }),
+      (result) => result.contentLength ?? 0);
+
+    if (response.metadata?.period !== period || response.metadata?.version !== DASHBOARD_DOCUMENT_VERSION) {
+      // 先月以前に作成された・形式の古い・無効にされたドキュメントは使わない
+      (response.readableStreamBody as any)?.destroy?.();
+      return null;
+    }
+    return { notModified: false, etag: formatDashboardETag(response.etag!, tagSuffix), body: response.readableStreamBody };
+  } catch (error: any) {
+    if (error?.statusCode === 304) {
+      return { notModified: true, etag: cachedTag! };
+    }
+    if (error?.statusCode === 404) {
+      return null;
+    }
+    throw error;
+  }
+}
+
+/**
+ * gzip 圧縮されたドキュメントのストリームを読み込んで解析する関数
+ * @param body ドキュメントのストリーム
+ * @returns ダッシュボードのドキュメント
+ */
+export async function readDashboardDocument(body: NodeJS.ReadableStream): Promise<DashboardDocument> {
+  const chunks: Buffer[] = [];
+  for await (const chunk of body) {
+    chunks.push(typeof chunk === "string" ? Buffer.from(chunk) : Buffer.from(chunk));
+  }
+  const json = await gunzipAsync(Buffer.concat(chunks));
+  return JSON.parse(json.toString("utf8"));
+}
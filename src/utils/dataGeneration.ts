@@ -0,0 +1,66 @@
+import { InvocationContext } from "@azure/functions";
+import { TableClient } from "@azure/data-tables";
+import { createTableClient } from "./tableClient";
+import { v4 as uuidv4 } from "uuid";
+
+/**
+ * 生産データの世代スタンプ
+ *
+ * 生産記録の作成・更新・削除・インポートとProductionSumの再集計のたびに更新する。
+ * 年次レポート・期間レポートはこのスタンプからETagを作るため、If-None-Match が一致すればテーブルを読まずに304を返せる。
+ * （ランキングの世代スタンプ（rankingSnapshot.ts）は ProductionSumTable の再集計時のみ更新されるため別の行とする）
+ */
+
+const connectionString = process.env.AzureWebJobsStorage!;
+const metaTableName = "ProductionSumMetaTable";
+const metaPartitionKey = "Meta";
+const productionDataRowKey = "productionData";
+
+let tableReady: Promise<void> | null = null;
+
+function getMetaClient(): TableClient {
+  return createTableClient(connectionString, metaTableName);
+}
+
+/**
+ * 生産データの世代スタンプを取得する関数
+ * @returns 世代スタンプ（未作成の場合はnull）
+ */
+export async function readProductionDataGeneration(): Promise<string | null> {
+  try {
+    const entity = await getMetaClient().getEntity<{ generation: string }>(metaPartitionKey, productionDataRowKey);
+    return entity.generation ?? null;
+  } catch (error: any) {
+    if (error?.statusCode === 404) {
+      return null;
+    }
+    throw error;
+  }
+}
+
+/**
+ * 生産データの世代スタンプを更新する関数
+ * 生産記録とロールアップの書き込みが終わってから呼び出す（スタンプを読んだ後の読み込みには変更が含まれる）
+ * @param context 実行コンテキスト
+ * @param reason 更新理由（ログ用）
+ */
+export async function tryBumpProductionDataGeneration(context: InvocationContext, reason: string): Promise<void> {
+  const client = getMetaClient();
+  try {
+    if (!tableReady) {
+      tableReady = client.createTable().catch(() => {
+        // 既に存在する場合は無視
+      });
+    }
+    await tableReady;
+    await client.upsertEntity({
+      partitionKey: metaPartitionKey,
+      rowKey: productionDataRowKey,
+      generation: `${new Date().toISOString()}_${uuidv4()}`,
+      reason,
+      updatedAt: new Date().toISOString(),
+    }, "Replace");
+  } catch (error) {
+    context.warn(`Failed to update production data generation (${reason}): ${error}`);
+  }
+}
@@ -0,0 +1,185 @@
+import { HttpRequest, HttpResponseInit } from "@azure/functions";
+import { createHash } from "crypto";
+import { promisify } from "util";
+import { brotliCompress, constants as zlibConstants, gzip } from "zlib";
+
+const gzipAsync = promisify(gzip);
+const brotliCompressAsync = promisify(brotliCompress);
+
+// このサイズ（バイト）未満のレスポンスは圧縮しない
+export const COMPRESSION_THRESHOLD_BYTES = 1024;
+
+type ContentEncoding = "br" | "gzip";
+
+/**
+ * Accept-Encodingヘッダーから使用する圧縮方式を選択する関数
+ * q=0 が指定された方式は使用しない。br と gzip の両方が使える場合は br を優先する
+ * @param acceptEncoding Accept-Encodingヘッダーの値
+ * @returns 圧縮方式（使用できない場合はnull）
+ */
+export function selectContentEncoding(acceptEncoding: string | null): ContentEncoding | null {
+  if (acceptsContentEncoding(acceptEncoding, "br")) return "br";
+  if (acceptsContentEncoding(acceptEncoding, "gzip")) return "gzip";
+  return null;
+}
+
+/**
+ * Accept-Encodingヘッダーで指定の圧縮方式が使えるかを判定する関数（q=0 の方式は使わない）
+ * @param acceptEncoding Accept-Encodingヘッダーの値
+ * @param encoding 圧縮方式
+ * @returns 使える場合true
+ */
+export function acceptsContentEncoding(acceptEncoding: string | null, encoding: ContentEncoding): boolean {
+  if (!acceptEncoding) return false;
+
+  const accepted = new Map<string, number>();
+  for (const part of acceptEncoding.split(",")) {
+    const [name, ...params] = part.trim().toLowerCase().split(";");
+    if (!name) continue;
+    const qParam = params.map((p) => p.trim()).find((p) => p.startsWith("q="));
+    const q = qParam ? Number(qParam.substring(2)) : 1;
+    accepted.set(name, isNaN(q) ? 0 : q);
+  }
+
+  return (accepted.get(encoding) ?? accepted.get("*") ?? 0) > 0;
+}
+
+/**
+ * 圧縮方式ごとのETagを生成する関数（圧縮後の表現はバイト列が異なるため別のETagとする）
+ * @param hash ボディのハッシュ値
+ * @param encoding 圧縮方式
+ * @returns ETag
+ */
+function formatETag(hash: string, encoding: ContentEncoding | null): string {
+  return encoding ? `"${hash}-${encoding}"` : `"${hash}"`;
+}
+
+/**
+ * If-None-MatchヘッダーがボディのハッシュとGETの弱い比較で一致するかを判定する関数
+ * 圧縮方式のサフィックスは無視する（同じデータであれば304を返してよい）
+ * @param ifNoneMatch If-None-Matchヘッダーの値
+ * @param hash ボディのハッシュ値
+ * @returns 一致する場合true
+ */
+function matchesIfNoneMatch(ifNoneMatch: string | null, hash: string): boolean {
+  if (!ifNoneMatch) return false;
+  if (ifNoneMatch.trim() === "*") return true;
+  return ifNoneMatch
+    .split(",")
+    .map((tag) => tag.trim().replace(/^W\//, "").replace(/-(br|gzip)"$/, '"'))
+    .includes(`"${hash}"`);
+}
+
+/**
+ * データの世代とリクエストのパラメータからETag（の値）を生成する関数
+ * 世代スタンプが変わらない限り同じ値となるため、データを読み込む前に If-None-Match と比較できる
+ * @param generation データの世代スタンプ
+ * @param parts レスポンスを決めるパラメータ（ルート名、年、groupId など）
+ * @returns ETagの値（引用符なし）
+ */
+export function createGenerationETag(generation: string, ...parts: unknown[]): string {
+  return createHash("sha256").update(JSON.stringify([generation, ...parts])).digest("hex").substring(0, 32);
+}
+
+/**
+ * If-None-Match が世代から作ったETagと一致する場合に304レスポンスを返す関数（データの読み込み前に呼び出す）
+ * @param request HTTPリクエスト
+ * @param etag createGenerationETag で生成したETagの値
+ * @param headers CORSなどの追加ヘッダー
+ * @returns 304レスポンス（一致しない場合はnull）
+ */
+export function createNotModifiedResponse(
+  request: HttpRequest,
+  etag: string,
+  headers: Record<string, string>
+): HttpResponseInit | null {
+  if (!matchesIfNoneMatch(request.headers.get("If-None-Match"), etag)) {
+    return null;
+  }
+  return {
+    status: 304,
+    headers: {
+      ...headers,
+      // 圧縮の有無にかかわらず同じデータのため、圧縮なしの表現のETagを返す
+      "ETag": formatETag(etag, null),
+      "Cache-Control": "private, no-cache",
+      "Vary": "Accept-Encoding, Origin",
+      "Access-Control-Expose-Headers": "ETag",
+    },
+  };
+}
+
+/**
+ * JSONレスポンスを生成する共通関数
+ * - ETagは etag（createGenerationETag で生成したデータの世代）を使い、指定がない場合はシリアライズ済みのボディから計算する
+ *   If-None-Matchが一致すれば304を返す（世代から作ったETagは createNotModifiedResponse でデータの読み込み前に判定する）
+ * - 一定サイズ以上のボディは Accept-Encoding に応じて brotli / gzip で圧縮する
+ * @param request HTTPリクエスト
+ * @param data レスポンスとして返すデータ
+ * @param headers CORSなどの追加ヘッダー
+ * @param status ステータスコード（既定値200）
+ * @param etag データの世代から生成したETagの値（任意）
+ * @returns HTTPレスポンス
+ */
+export async function createJsonResponse(
+  request: HttpRequest,
+  data: unknown,
+  headers: Record<string, string>,
+  status = 200,
+  etag?: string
+): Promise<HttpResponseInit> {
+  const body = Buffer.from(JSON.stringify(data), "utf8");
+  const hash = etag ?? createHash("sha256").update(body).digest("hex").substring(0, 32);
+  const encoding = body.length >= COMPRESSION_THRESHOLD_BYTES
+    ? selectContentEncoding(request.headers.get("Accept-Encoding"))
+    : null;
+
+  const responseHeaders: Record<string, string> = {
+    ...headers,
+    "Content-Type": "application/json",
+    "ETag": formatETag(hash, encoding),
+    // 毎回ETagで再検証させる（変更がなければ304のみ返る）
+    "Cache-Control": "private, no-cache",
+    "Vary": "Accept-Encoding, Origin",
+    "Access-Control-Expose-Headers": "ETag",
+  };
+
+  if (status === 200 && matchesIfNoneMatch(request.headers.get("If-None-Match"), hash)) {
+    delete responseHeaders["Content-Type"];
+    return {
+      status: 304,
+      headers: responseHeaders,
+    };
+  }
+
+  if (encoding === "br") {
+    const compressed = await brotliCompressAsync(body, {
+      params: {
+        [zlibConstants.BROTLI_PARAM_MODE]: zlibConstants.BROTLI_MODE_TEXT,
+        // 既定値（11）は遅いため、応答時間と圧縮率のバランスを取る
+        [zlibConstants.BROTLI_PARAM_QUALITY]: 5,
+        [zlibConstants.BROTLI_PARAM_SIZE_HINT]: body.length,
+      },
+    });
+    return {
+      status,
+      headers: { ...responseHeaders, "Content-Encoding": "br" },
+      body: compressed,
+    };
+  }
+
+  if (encoding === "gzip") {
+    const compressed = await gzipAsync(body, { level: 6 });
+    return {
+      status,
+      headers: { ...responseHeaders, "Content-Encoding": "gzip" },
+      body: compressed,
+    };
+  }
+
+  return {
+    status,
+    headers: responseHeaders,
+    body,
+  };
+}
@@ -0,0 +1,62 @@
+import { HttpHandler, InvocationContext, TimerHandler } from "@azure/functions";
+import { instrumentHandler } from "./metrics";
+
+/**
+ * ハンドラーの遅延読み込み
+ *
+ * 起動時は薄いスタブのみを登録し、ハンドラー本体（と @azure/data-tables などの依存ライブラリ）は初回呼び出し時に読み込む。
+ * 読み込みはインスタンス内で1回だけ行い、同時に来た初回リクエストは同じ読み込みを待つ。
+ * 読み込みに失敗した場合は次の呼び出しで再試行する。
+ */
+
+/**
+ * ハンドラーを初回のみ読み込む関数を作成する
+ * @param functionName 関数名（ログ用）
+ * @param load ハンドラーを読み込む関数
+ * @returns 読み込み済みのハンドラーを返す関数
+ */
+function createLoader<T>(functionName: string, load: () => Promise<T>): (context: InvocationContext) => Promise<T> {
+  let loading: Promise<T> | null = null;
+
+  return (context: InvocationContext) => {
+    if (!loading) {
+      const start = performance.now();
+      loading = load();
+      loading.then(
+        () => context.log(`${functionName}: handler loaded in ${Math.round(performance.now() - start)}ms`),
+        () => {
+          loading = null;
+        }
+      );
+    }
+    return loading;
+  };
+}
+
+/**
+ * 初回呼び出し時にハンドラーを読み込むHTTPハンドラーを作成する（計測は instrumentHandler で行う）
+ * @param functionName 関数名
+ * @param load ハンドラーを読み込む関数
+ * @returns HTTPハンドラー
+ */
+export function lazyHttpHandler(functionName: string, load: () => Promise<HttpHandler>): HttpHandler {
+  const getHandler = createLoader(functionName, load);
+  return instrumentHandler(functionName, async (request, context) => {
+    const handler = await getHandler(context);
+    return handler(request, context);
+  });
+}
+
+/**
+ * 初回呼び出し時にハンドラーを読み込むタイマーハンドラーを作成する
+ * @param functionName 関数名
+ * @param load ハンドラーを読み込む関数
+ * @returns タイマーハンドラー
+ */
+export function lazyTimerHandler(functionName: string, load: () => Promise<TimerHandler>): TimerHandler {
+  const getHandler = createLoader(functionName, load);
+  return async (timer, context) => {
+    const handler = await getHandler(context);
+    return handler(timer, context);
+  };
+}
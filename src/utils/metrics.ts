@@ -0,0 +1,292 @@
+import { HttpHandler, HttpRequest, HttpResponseInit, InvocationContext } from "@azure/functions";
+import { AsyncLocalStorage } from "async_hooks";
+
+/**
+ * 関数呼び出し単位のストレージ計測
+ *
+ * - app.http の登録時に instrumentHandler でハンドラーをラップし、実行時間・ストレージ呼び出し回数・走査エンティティ数・レスポンスサイズを記録する
+ * - Table Storageの呼び出しは tableClient.ts で作成したクライアントに追加する tableMetrics.ts のパイプラインポリシーで記録する（@azure/data-tables を読み込まないよう別モジュールにしている）
+ * - Blobの処理は trackStorageCall で明示的に計測する
+ * - 集計結果はヒストグラムとして保持し、管理者用のメトリクスAPIと構造化ログで確認できる
+ */
+
+// レイテンシ（ミリ秒）のヒストグラム境界
+const LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000];
+// 件数・回数のヒストグラム境界
+const COUNT_BUCKETS = [0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000];
+// バイト数のヒストグラム境界
+const BYTES_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216];
+
+export interface StorageCallRecord {
+  operation: string;
+  durationMs: number;
+  status?: number;
+  entities?: number;
+  bytes?: number;
+}
+
+interface InvocationMetrics {
+  functionName: string;
+  storageCalls: StorageCallRecord[];
+  entitiesScanned: number;
+  entitiesDiscarded: number;
+  storageBytes: number;
+}
+
+/**
+ * 固定境界のヒストグラム
+ */
+class Histogram {
+  private readonly counts: number[];
+  private count = 0;
+  private sum = 0;
+  private max = 0;
+
+  constructor(private readonly bounds: number[]) {
+    this.counts = new Array(bounds.length + 1).fill(0);
+  }
+
+  observe(value: number): void {
+    let index = this.bounds.findIndex((bound) => value <= bound);
+    if (index === -1) index = this.bounds.length;
+    this.counts[index]++;
+    this.count++;
+    this.sum += value;
+    if (value > this.max) this.max = value;
+  }
+
+  toJSON() {
+    const buckets: Record<string, number> = {};
+    this.bounds.forEach((bound, i) => {
+      buckets[`le_${bound}`] = this.counts[i];
+    });
+    buckets["le_inf"] = this.counts[this.bounds.length];
+    return {
+      count: this.count,
+      sum: Math.round(this.sum * 100) / 100,
+      avg: this.count > 0 ? Math.round((this.sum / this.count) * 100) / 100 : 0,
+      max: this.max,
+      buckets,
+    };
+  }
+}
+
+interface FunctionStats {
+  invocations: number;
+  errors: number;
+  wallTimeMs: Histogram;
+  storageTimeMs: Histogram;
+  storageCalls: Histogram;
+  entitiesScanned: Histogram;
+  entitiesDiscarded: Histogram;
+  responseBytes: Histogram;
+  operations: Map<string, Histogram>;
+}
+
+const invocationStore = new AsyncLocalStorage<InvocationMetrics>();
+const functionStats = new Map<string, FunctionStats>();
+const startedAt = new Date().toISOString();
+
+function getFunctionStats(functionName: string): FunctionStats {
+  let stats = functionStats.get(functionName);
+  if (!stats) {
+    stats = {
+      invocations: 0,
+      errors: 0,
+      wallTimeMs: new Histogram(LATENCY_BUCKETS_MS),
+      storageTimeMs: new Histogram(LATENCY_BUCKETS_MS),
+      storageCalls: new Histogram(COUNT_BUCKETS),
+      entitiesScanned: new Histogram(COUNT_BUCKETS),
+      entitiesDiscarded: new Histogram(COUNT_BUCKETS),
+      responseBytes: new Histogram(BYTES_BUCKETS),
+      operations: new Map(),
+    };
+    functionStats.set(functionName, stats);
+  }
+  return stats;
+}
+
+/**
+ * 現在の呼び出しにストレージ呼び出しを記録する関数（関数の外から呼ばれた場合は何もしない）
+ * @param record ストレージ呼び出しの記録
+ */
+export function recordStorageCall(record: StorageCallRecord): void {
+  const metrics = invocationStore.getStore();
+  if (!metrics) return;
+  metrics.storageCalls.push(record);
+  metrics.entitiesScanned += record.entities ?? 0;
+  metrics.storageBytes += record.bytes ?? 0;
+}
+
+/**
+ * 取得後にアプリケーション側で捨てたエンティティ数を記録する関数
+ * （例: 全件を取得してから年で絞り込む場合の対象外の件数）
+ * @param count 件数
+ */
+export function recordDiscarded(count = 1): void {
+  const metrics = invocationStore.getStore();
+  if (metrics) {
+    metrics.entitiesDiscarded += count;
+  }
+}
+
+/**
+ * Blobなど、パイプラインポリシーで計測できないストレージ処理を計測する関数
+ * @param operation 操作名（例: blob.download）
+ * @param fn 計測する処理
+ * @param getBytes 結果からバイト数を取得する関数（任意）
+ * @returns 処理の結果
+ */
+export async function trackStorageCall<T>(
+  operation: string,
+  fn: () => Promise<T>,
+  getBytes?: (result: T) => number
+): Promise<T> {
+  const start = performance.now();
+  try {
+    const result = await fn();
+    recordStorageCall({
+      operation,
+      durationMs: performance.now() - start,
+      bytes: getBytes ? getBytes(result) : undefined,
+    });
+    return result;
+  } catch (error: any) {
+    recordStorageCall({ operation, durationMs: performance.now() - start, status: error?.statusCode });
+    throw error;
+  }
+}
+
+/**
+ * レスポンスボディのバイト数を取得する関数
+ * @param response HTTPレスポンス
+ * @returns バイト数（ストリームなど不明な場合は0）
+ */
+function getResponseBytes(response: HttpResponseInit | undefined): number {
+  const body = response?.body;
+  if (typeof body === "string") return Buffer.byteLength(body);
+  if (body instanceof ArrayBuffer) return body.byteLength;
+  if (ArrayBuffer.isView(body)) return body.byteLength;
+  return 0;
+}
+
+/**
+ * 呼び出しの計測結果を集計し、構造化ログに出力する関数
+ */
+function finishInvocation(
+  metrics: InvocationMetrics,
+  context: InvocationContext,
+  wallTimeMs: number,
+  response: HttpResponseInit | undefined,
+  failed: boolean
+): void {
+  const stats = getFunctionStats(metrics.functionName);
+  const storageTimeMs = metrics.storageCalls.reduce((sum, call) => sum + call.durationMs, 0);
+  const responseBytes = getResponseBytes(response);
+
+  stats.invocations++;
+  if (failed || (response?.status ?? 200) >= 500) stats.errors++;
+  stats.wallTimeMs.observe(wallTimeMs);
+  stats.storageTimeMs.observe(storageTimeMs);
+  stats.storageCalls.observe(metrics.storageCalls.length);
+  stats.entitiesScanned.observe(metrics.entitiesScanned);
+  stats.entitiesDiscarded.observe(metrics.entitiesDiscarded);
+  stats.responseBytes.observe(responseBytes);
+
+  const callsByOperation: Record<string, number> = {};
+  for (const call of metrics.storageCalls) {
+    let histogram = stats.operations.get(call.operation);
+    if (!histogram) {
+      histogram = new Histogram(LATENCY_BUCKETS_MS);
+      stats.operations.set(call.operation, histogram);
+    }
+    histogram.observe(call.durationMs);
+    callsByOperation[call.operation] = (callsByOperation[call.operation] ?? 0) + 1;
+  }
+
+  context.log(JSON.stringify({
+    type: "invocationMetrics",
+    functionName: metrics.functionName,
+    invocationId: context.invocationId,
+    status: failed ? 500 : (response?.status ?? 200),
+    wallTimeMs: Math.round(wallTimeMs * 100) / 100,
+    storageTimeMs: Math.round(storageTimeMs * 100) / 100,
+    storageCalls: metrics.storageCalls.length,
+    callsByOperation,
+    entitiesScanned: metrics.entitiesScanned,
+    entitiesDiscarded: metrics.entitiesDiscarded,
+    storageBytes: metrics.storageBytes,
+    responseBytes,
+  }));
+}
+
+/**
+ * HTTPハンドラーを計測用にラップする関数
+ * @param functionName 関数名
+ * @param handler 元のハンドラー
+ * @returns 計測付きのハンドラー
+ */
+export function instrumentHandler(functionName: string, handler: HttpHandler): HttpHandler {
+  return async (request: HttpRequest, context: InvocationContext) => {
+    const metrics: InvocationMetrics = {
+      functionName,
+      storageCalls: [],
+      entitiesScanned: 0,
+      entitiesDiscarded: 0,
+      storageBytes: 0,
+    };
+    const start = performance.now();
+    let response: HttpResponseInit | undefined;
+    let failed = false;
+    try {
+      response = await invocationStore.run(metrics, () => handler(request, context)) as HttpResponseInit;
+      return response;
+    } catch (error) {
+      failed = true;
+      throw error;
+    } finally {
+      try {
+        finishInvocation(metrics, context, performance.now() - start, response, failed);
+      } catch {
+        // 計測の失敗でリクエストを失敗させない
+      }
+    }
+  };
+}
+
+/**
+ * 集計済みのメトリクスを取得する関数（メトリクスAPI用）
+ * @returns 関数別のヒストグラム
+ */
+export function getMetricsSnapshot() {
+  const functions: Record<string, unknown> = {};
+  for (const [name, stats] of functionStats) {
+    const operations: Record<string, unknown> = {};
+    for (const [operation, histogram] of stats.operations) {
+      operations[operation] = histogram.toJSON();
+    }
+    functions[name] = {
+      invocations: stats.invocations,
+      errors: stats.errors,
+      wallTimeMs: stats.wallTimeMs.toJSON(),
+      storageTimeMs: stats.storageTimeMs.toJSON(),
+      storageCalls: stats.storageCalls.toJSON(),
+      entitiesScanned: stats.entitiesScanned.toJSON(),
+      entitiesDiscarded: stats.entitiesDiscarded.toJSON(),
+      responseBytes: stats.responseBytes.toJSON(),
+      operations,
+    };
+  }
+  return {
+    instanceStartedAt: startedAt,
+    generatedAt: new Date().toISOString(),
+    functions,
+  };
+}
+
+/**
+ * 集計済みのメトリクスをリセットする関数
+ */
+export function resetMetrics(): void {
+  functionStats.clear();
+}
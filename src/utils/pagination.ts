@@ -0,0 +1,91 @@
+import { RestError, TableClient, TableEntityResult } from "@azure/data-tables";
+
+// 1ページあたりの件数のデフォルト値と上限（Table Storageの1回のクエリ上限は1000件）
+export const DEFAULT_PAGE_SIZE = 50;
+export const MAX_PAGE_SIZE = 1000;
+
+export interface PaginationParams {
+  all: boolean;
+  pageSize: number;
+  continuationToken?: string;
+}
+
+export interface TablePage<T extends object> {
+  items: TableEntityResult<T>[];
+  continuationToken?: string;
+}
+
+/**
+ * 継続トークンが不正な場合のエラー
+ */
+export class InvalidContinuationTokenError extends Error {
+  constructor() {
+    super("Invalid continuationToken");
+    this.name = "InvalidContinuationTokenError";
+  }
+}
+
+/**
+ * クエリパラメータからページング設定を取得する関数
+ * all=true を指定した場合は従来どおり全件を返す
+ * @param url リクエストURL
+ * @returns ページング設定、不正な値の場合はエラーメッセージ
+ */
+export function parsePaginationParams(url: URL): { params?: PaginationParams; error?: string } {
+  const all = url.searchParams.get("all") === "true";
+  const pageSizeParam = url.searchParams.get("pageSize");
+  const continuationToken = url.searchParams.get("continuationToken") || undefined;
+
+  let pageSize = DEFAULT_PAGE_SIZE;
+  if (pageSizeParam !== null) {
+    pageSize = Number(pageSizeParam);
+    if (!Number.isInteger(pageSize) || pageSize < 1 || pageSize > MAX_PAGE_SIZE) {
+      return { error: `pageSize must be an integer between 1 and ${MAX_PAGE_SIZE}` };
+    }
+  }
+
+  if (continuationToken !== undefined && !/^[A-Za-z0-9+/_=-]{1,2048}$/.test(continuationToken)) {
+    return { error: "Invalid continuationToken" };
+  }
+
+  return { params: { all, pageSize, continuationToken } };
+}
+
+/**
+ * Table Storageのクエリを1ページ分だけ取得する関数
+ * 継続トークンはTable Storageのものをそのまま受け渡す
+ * @param client TableClient
+ * @param filter ODataフィルタ
+ * @param pageSize 取得する最大件数
+ * @param continuationToken 前ページの継続トークン
+ * @returns エンティティと次ページの継続トークン
+ */
+export async function readTablePage<T extends object = Record<string, unknown>>(
+  client: TableClient,
+  filter: string,
+  pageSize: number,
+  continuationToken?: string
+): Promise<TablePage<T>> {
+  const pages = client
+    .listEntities<T>({ queryOptions: { filter } })
+    .byPage({ maxPageSize: pageSize, continuationToken });
+
+  let result;
+  try {
+    result = await pages.next();
+  } catch (error) {
+    // 継続トークンを復元できない場合はストレージへのリクエスト前に失敗する
+    if (continuationToken && !(error instanceof RestError)) {
+      throw new InvalidContinuationTokenError();
+    }
+    throw error;
+  }
+  if (result.done || !result.value) {
+    return { items: [] };
+  }
+
+  return {
+    items: [...result.value],
+    continuationToken: result.value.continuationToken,
+  };
+}
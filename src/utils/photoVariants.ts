@@ -0,0 +1,68 @@
+import sharp from "sharp";
+
+/**
+ * 写真のサイズバリアント定義
+ * 一覧表示用のサムネイルと詳細表示用の中サイズを、オリジナルと同じフォルダに保存する
+ */
+export const PHOTO_VARIANTS = {
+  thumbnail: { maxWidth: 320, maxHeight: 320, quality: 70 },
+  medium: { maxWidth: 1280, maxHeight: 1280, quality: 80 },
+} as const;
+
+export type PhotoVariantSize = keyof typeof PHOTO_VARIANTS;
+export type PhotoSize = PhotoVariantSize | "original";
+
+// バリアントは常にJPEGで再エンコードする
+export const PHOTO_VARIANT_CONTENT_TYPE = "image/jpeg";
+
+/**
+ * sizeパラメータが有効な値かどうかを判定する関数
+ * @param size クエリパラメータの値
+ * @returns 有効なサイズかどうか
+ */
+export function isPhotoSize(size: string): size is PhotoSize {
+  return size === "original" || Object.prototype.hasOwnProperty.call(PHOTO_VARIANTS, size);
+}
+
+/**
+ * オリジナルのBlob名からバリアントのBlob名を生成する関数
+ * 例: userId/groupId/uuid.png -> userId/groupId/uuid.thumbnail.jpg
+ * @param fileName オリジナルのBlob名
+ * @param size バリアントのサイズ
+ * @returns バリアントのBlob名
+ */
+export function getVariantBlobName(fileName: string, size: PhotoVariantSize): string {
+  const lastSlash = fileName.lastIndexOf("/");
+  const lastDot = fileName.lastIndexOf(".");
+  const baseName = lastDot > lastSlash ? fileName.substring(0, lastDot) : fileName;
+  return `${baseName}.${size}.jpg`;
+}
+
+/**
+ * 画像を指定サイズに縮小してJPEGに再エンコードする関数
+ * EXIFの向き情報を反映し、元画像より大きくは拡大しない
+ * @param source オリジナル画像のバッファ
+ * @param size バリアントのサイズ
+ * @returns 再エンコードされた画像のバッファ
+ */
+export async function createPhotoVariant(source: Buffer, size: PhotoVariantSize): Promise<Buffer> {
+  const { maxWidth, maxHeight, quality } = PHOTO_VARIANTS[size];
+  return sharp(source)
+    .rotate()
+    .resize({ width: maxWidth, height: maxHeight, fit: "inside", withoutEnlargement: true })
+    .jpeg({ quality, mozjpeg: true })
+    .toBuffer();
+}
+
+/**
+ * すべてのバリアントを生成する関数
+ * @param source オリジナル画像のバッファ
+ * @returns サイズごとの画像バッファ
+ */
+export async function createPhotoVariants(source: Buffer): Promise<Map<PhotoVariantSize, Buffer>> {
+  const variants = new Map<PhotoVariantSize, Buffer>();
+  for (const size of Object.keys(PHOTO_VARIANTS) as PhotoVariantSize[]) {
+    variants.set(size, await createPhotoVariant(source, size));
+  }
+  return variants;
+}
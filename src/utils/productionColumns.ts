@@ -0,0 +1,125 @@
+import { Edm } from "@azure/data-tables";
+import { toDatePrefix } from "./productionKeys";
+import type { ProductionRecord } from "./productionWrites";
+
+/**
+ * ProductionTable の型付き列
+ * - 数値列（materialAmount など）は Edm.Double で保存する
+ *   （JSの数値をそのまま渡すと整数値は Edm.Int32 になり、行ごとに型が揃わないため型を明示する）
+ * - 生産日から year（例: 2025）と yearMonth（例: 202510）を Edm.Int32 で保存し、年・月の絞り込みをサーバー側で行う
+ * 旧形式の行（数値が文字列、year/yearMonth なし）は scripts/migration/type_production_columns.py で変換する
+ * 変換前の行も読み込めるよう、読み取り側は toNumber / getProductionPeriod を使用する
+ */
+
+// Edm.Double で保存する数値列
+export const NUMERIC_PRODUCTION_FIELDS = [
+  "materialAmount",
+  "charcoalProduced",
+  "charcoalVolume",
+  "charcoalScaleInput",
+  "co2Reduction",
+] as const;
+
+// ProductionTable の列名（year / yearMonth を含む）
+export type ProductionColumn = Exclude<keyof ProductionRecord, "partitionKey" | "rowKey"> | "year" | "yearMonth";
+
+// select で取得した行の型（取得した列のみを持つ）
+export type ProductionColumns<K extends ProductionColumn> = { [P in K]?: unknown };
+
+/**
+ * select に指定する列の一覧を作成する関数
+ * 存在しない列名を指定すると値が常に空になり集計が0になるため、列名をコンパイル時に検証する
+ * @param columns 列名
+ * @returns 列名の配列
+ */
+export function selectProductionColumns<K extends ProductionColumn>(...columns: K[]): K[] {
+  return columns;
+}
+
+export interface ProductionPeriod {
+  year: number;
+  // 1〜12
+  month: number;
+  // YYYYMM
+  yearMonth: number;
+}
+
+/**
+ * 列の値を数値に変換する関数
+ * 型付きの行は既に数値のため変換せずに返し、旧形式の文字列の行のみ parseFloat する
+ * @param value 列の値（数値・文字列・Edm値）
+ * @returns 数値（値がない・解釈できない場合は0）
+ */
+export function toNumber(value: unknown): number {
+  if (typeof value === "number") {
+    return Number.isFinite(value) ? value : 0;
+  }
+  if (typeof value === "string") {
+    const parsed = parseFloat(value);
+    return isNaN(parsed) ? 0 : parsed;
+  }
+  if (value !== null && typeof value === "object" && "value" in value) {
+    return toNumber((value as { value: unknown }).value);
+  }
+  return 0;
+}
+
+/**
+ * 数値列を Edm.Double の値に変換する関数
+ * @param value リクエストや旧形式の行の値
+ * @returns Edm.Double の値（値がない・解釈できない場合はnull）
+ */
+export function toDouble(value: unknown): Edm<"Double"> | null {
+  if (value === null || value === undefined || value === "") {
+    return null;
+  }
+  const parsed = typeof value === "number" ? value : parseFloat(String(value));
+  return Number.isFinite(parsed) ? { value: parsed, type: "Double" } : null;
+}
+
+/**
+ * 生産日から年・月を求める関数（year/yearMonth 列があればそれを使い、日付文字列を解析しない）
+ * @param entity 生産記録
+ * @returns 年・月（日付が解釈できない場合はnull）
+ */
+export function getProductionPeriod(entity: { date?: unknown; yearMonth?: unknown }): ProductionPeriod | null {
+  if (typeof entity.yearMonth === "number" && entity.yearMonth > 0) {
+    const yearMonth = entity.yearMonth;
+    return { year: Math.floor(yearMonth / 100), month: yearMonth % 100, yearMonth };
+  }
+  const datePrefix = toDatePrefix(String(entity.date || ""));
+  if (datePrefix === "00000000") {
+    return null;
+  }
+  const yearMonth = Number(datePrefix.substring(0, 6));
+  return { year: Math.floor(yearMonth / 100), month: yearMonth % 100, yearMonth };
+}
+
+/**
+ * 生産記録を ProductionTable に保存する形式に変換する関数
+ * 数値列を Edm.Double にし、生産日から year / yearMonth 列を付与する
+ * @param production 生産記録（数値列は数値または文字列）
+ * @returns 保存用のエンティティ
+ */
+export function toProductionEntity<T extends { date?: unknown }>(production: T): T {
+  const entity: Record<string, unknown> = { ...production };
+  for (const field of NUMERIC_PRODUCTION_FIELDS) {
+    if (field in entity) {
+      entity[field] = toDouble(entity[field]);
+    }
+  }
+  const period = getProductionPeriod({ date: production.date });
+  entity.year = period ? period.year : null;
+  entity.yearMonth = period ? period.yearMonth : null;
+  return entity as T;
+}
+
+/**
+ * 指定した年の生産記録を取得するODataフィルタを生成する関数
+ * year 列で絞り込み、移行前の行（year 列なし）は生産日の文字列範囲で絞り込む
+ * @param year 年
+ * @returns ODataフィルタ
+ */
+export function buildProductionYearFilter(year: number): string {
+  return `(year eq ${year} or (date ge '${year}' and date lt '${year + 1}'))`;
+}
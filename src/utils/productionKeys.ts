@@ -0,0 +1,420 @@
+import { TableClient, TableEntityResult } from "@azure/data-tables";
+import { partitionKey as legacyPartitionKey, productionKeyScheme, productionDualRead } from "../config";
+import { InvalidContinuationTokenError, readTablePage } from "./pagination";
+
+/**
+ * ProductionTableのキー設計
+ * - legacy    : PartitionKey = "Production"（固定）、RowKey = uuid
+ * - group     : PartitionKey = groupId、RowKey = YYYYMMDD_uuid
+ * - groupYear : PartitionKey = groupId_YYYY、RowKey = YYYYMMDD_uuid
+ * RowKeyは生産日の昇順に並ぶため、パーティション内の範囲検索や日付順の取得に利用できる
+ * 新しいキーのエンティティには productionId 列（uuid）を保持する
+ */
+export type ProductionKeyScheme = "legacy" | "group" | "groupYear";
+
+export const PRODUCTION_KEY_SCHEME: ProductionKeyScheme =
+  productionKeyScheme === "legacy" || productionKeyScheme === "groupYear" ? productionKeyScheme : "group";
+
+// 移行期間中は旧パーティション（"Production"）も合わせて読み込む
+export const PRODUCTION_DUAL_READ: boolean = PRODUCTION_KEY_SCHEME !== "legacy" && productionDualRead;
+
+export const LEGACY_PRODUCTION_PARTITION_KEY: string = legacyPartitionKey || "Production";
+
+export interface ProductionKeys {
+  partitionKey: string;
+  rowKey: string;
+}
+
+/**
+ * OData文字列リテラル用にシングルクォートをエスケープする関数
+ * @param value 値
+ * @returns エスケープ済みの値
+ */
+export function escapeODataValue(value: string): string {
+  return value.replace(/'/g, "''");
+}
+
+/**
+ * 生産日からRowKeyの日付プレフィックス（YYYYMMDD）を生成する関数
+ * @param date 生産日（YYYY-MM-DD またはISO形式）
+ * @returns YYYYMMDD（解釈できない場合は 00000000）
+ */
+export function toDatePrefix(date: string): string {
+  const match = /^(\d{4})-(\d{2})-(\d{2})/.exec(date || "");
+  if (match) {
+    return `${match[1]}${match[2]}${match[3]}`;
+  }
+  const parsed = new Date(date);
+  if (isNaN(parsed.getTime())) {
+    return "00000000";
+  }
+  return parsed.toISOString().substring(0, 10).replace(/-/g, "");
+}
+
+/**
+ * 新しいキー体系のPartitionKeyを生成する関数
+ * @param groupId グループID
+ * @param year 年（groupYear方式でのみ使用）
+ * @returns PartitionKey
+ */
+export function getProductionPartitionKey(groupId: string, year: string | number): string {
+  if (PRODUCTION_KEY_SCHEME === "legacy") {
+    return LEGACY_PRODUCTION_PARTITION_KEY;
+  }
+  if (PRODUCTION_KEY_SCHEME === "groupYear") {
+    return `${groupId}_${year}`;
+  }
+  return groupId;
+}
+
+/**
+ * 生産記録のキーを生成する関数
+ * @param groupId グループID
+ * @param date 生産日
+ * @param productionId 生産記録のuuid
+ * @returns PartitionKeyとRowKey
+ */
+export function createProductionKeys(groupId: string, date: string, productionId: string): ProductionKeys {
+  if (PRODUCTION_KEY_SCHEME === "legacy") {
+    return { partitionKey: LEGACY_PRODUCTION_PARTITION_KEY, rowKey: productionId };
+  }
+  const datePrefix = toDatePrefix(date);
+  return {
+    partitionKey: getProductionPartitionKey(groupId, datePrefix.substring(0, 4)),
+    rowKey: `${datePrefix}_${productionId}`,
+  };
+}
+
+/**
+ * エンティティから生産記録のuuidを取得する関数（旧キーのエンティティはRowKeyがuuid）
+ * @param entity ProductionTableのエンティティ
+ * @returns productionId
+ */
+export function getProductionId(entity: { rowKey?: string; productionId?: unknown }): string {
+  return (entity.productionId as string) || entity.rowKey || "";
+}
+
+/**
+ * 同じ生産記録の重複（移行中の旧コピー）を除外する判定関数を生成する
+ * テーブル全体を走査する集計処理で使用する
+ * @returns 初出の場合にtrueを返す関数
+ */
+export function createProductionDeduper(): (entity: { rowKey?: string; productionId?: unknown }) => boolean {
+  const seen = new Set<string>();
+  return (entity) => {
+    const id = getProductionId(entity);
+    if (seen.has(id)) {
+      return false;
+    }
+    seen.add(id);
+    return true;
+  };
+}
+
+/**
+ * グループの生産記録を取得するためのフィルタを生成する関数（パーティション検索）
+ * @param groupId グループID
+ * @param year 年（groupYear方式で指定した場合はその年のパーティションのみ）
+ * @returns ODataフィルタ
+ */
+function buildGroupPartitionFilter(groupId: string, year?: number): string {
+  const escapedGroupId = escapeODataValue(groupId);
+  if (PRODUCTION_KEY_SCHEME === "groupYear") {
+    if (year !== undefined) {
+      return `PartitionKey eq '${escapedGroupId}_${year}'`;
+    }
+    // groupId_0000 〜 groupId_9999 の範囲（':' は '9' の次の文字）
+    return `PartitionKey ge '${escapedGroupId}_0' and PartitionKey lt '${escapedGroupId}_:'`;
+  }
+  return `PartitionKey eq '${escapedGroupId}'`;
+}
+
+/**
+ * グループの生産記録を取得するフィルタの一覧を生成する関数
+ * 新しいキー体系のパーティションを先に、移行期間中は旧パーティションを後に並べる
+ * @param groupId グループID
+ * @param year 年（groupYear方式で対象年のパーティションに絞り込む）
+ * @param month 年月（YYYYMM、指定した場合はその月の記録のみ。新しいキー体系はRowKey、旧パーティションは生産日の範囲で絞り込む）
+ * @returns ODataフィルタの配列
+ */
+function buildGroupProductionFilters(groupId: string, year?: number, month?: string): string[] {
+  // ':' は '9' の次の文字（YYYYMMDD_uuid / YYYY-MM-DD の月内をすべて含む上限）
+  const legacyMonthFilter = month
+    ? ` and date ge '${month.substring(0, 4)}-${month.substring(4, 6)}' and date lt '${month.substring(0, 4)}-${month.substring(4, 6)}:'`
+    : "";
+  const legacyFilter =
+    `PartitionKey eq '${escapeODataValue(LEGACY_PRODUCTION_PARTITION_KEY)}' and groupId eq '${escapeODataValue(groupId)}'${legacyMonthFilter}`;
+
+  if (PRODUCTION_KEY_SCHEME === "legacy") {
+    return [legacyFilter];
+  }
+
+  const monthFilter = month ? ` and RowKey ge '${month}' and RowKey lt '${month}:'` : "";
+  const filters = [`${buildGroupPartitionFilter(groupId, month ? Number(month.substring(0, 4)) : year)}${monthFilter}`];
+  if (PRODUCTION_DUAL_READ) {
+    filters.push(legacyFilter);
+  }
+  return filters;
+}
+
+/**
+ * グループの生産記録を取得する関数
+ * 新しいキー体系ではパーティション検索となり、移行期間中は旧パーティションも検索して重複を除外する
+ * @param client ProductionTableのTableClient
+ * @param groupId グループID
+ * @param options year: groupYear方式で対象年のパーティションに絞り込む / month: 年月（YYYYMM）の記録のみ取得する
+ * @returns 生産記録の配列
+ */
+export async function listGroupProductions<T extends object = Record<string, unknown>>(
+  client: TableClient,
+  groupId: string,
+  options: { year?: number; month?: string } = {}
+): Promise<TableEntityResult<T>[]> {
+  const filters = buildGroupProductionFilters(groupId, options.year, options.month);
+
+  // パーティションをまたぐOR条件はテーブル全体のスキャンになるため、フィルタごとに並列で検索する
+  const results = await Promise.all(filters.map(async (filter) => {
+    const entities: TableEntityResult<T>[] = [];
+    for await (const entity of client.listEntities<T>({ queryOptions: { filter } })) {
+      entities.push(entity);
+    }
+    return entities;
+  }));
+
+  const isFirst = createProductionDeduper();
+  return results.flat().filter((entity) => isFirst(entity));
+}
+
+/**
+ * 継続トークンを復元する関数
+ * @param continuationToken 前ページの継続トークン
+ * @returns 継続トークンの内容
+ */
+function decodePageToken(continuationToken: string): Record<string, unknown> {
+  try {
+    const decoded = JSON.parse(Buffer.from(continuationToken, "base64url").toString("utf8"));
+    if (decoded && typeof decoded === "object") {
+      return decoded;
+    }
+  } catch {
+    // 下で不正なトークンとして扱う
+  }
+  throw new InvalidContinuationTokenError();
+}
+
+function encodePageToken(value: Record<string, unknown>): string {
+  return Buffer.from(JSON.stringify(value), "utf8").toString("base64url");
+}
+
+/**
+ * 旧キーのエンティティを新しいキー体系のRowKey（YYYYMMDD_uuid）に対応する並び順のキーに変換する関数
+ * 移行済みのコピーは新しいキーのRowKeyと一致する
+ */
+function toProductionSortKey(entity: { rowKey?: string; productionId?: unknown; date?: unknown }): string {
+  return `${toDatePrefix(String(entity.date ?? ""))}_${getProductionId(entity)}`;
+}
+
+/**
+ * グループの生産記録を1ページ分取得する関数
+ * 新しいキー体系ではRowKey（YYYYMMDD_uuid）順、つまり生産日の昇順で返る
+ * 継続トークンは「検索中のフィルタ番号」と「Table Storageの継続トークン」を組み合わせたもの
+ * 移行期間中（PRODUCTION_DUAL_READ）は listGroupProductionsPageDualRead で旧パーティションの記録を生産日順に合わせて返す
+ * @param client ProductionTableのTableClient
+ * @param groupId グループID
+ * @param pageSize 1ページの最大件数
+ * @param continuationToken 前ページの継続トークン
+ * @returns 生産記録と次ページの継続トークン（最終ページの場合はnull）
+ */
+export async function listGroupProductionsPage<T extends object = Record<string, unknown>>(
+  client: TableClient,
+  groupId: string,
+  pageSize: number,
+  continuationToken?: string
+): Promise<{ items: TableEntityResult<T>[]; continuationToken: string | null }> {
+  if (PRODUCTION_DUAL_READ) {
+    return listGroupProductionsPageDualRead<T>(client, groupId, pageSize, continuationToken);
+  }
+
+  const filters = buildGroupProductionFilters(groupId);
+
+  let filterIndex = 0;
+  let storageToken: string | undefined;
+  if (continuationToken) {
+    const decoded = decodePageToken(continuationToken);
+    filterIndex = Number(decoded.f);
+    storageToken = typeof decoded.t === "string" && decoded.t ? decoded.t : undefined;
+    if (!Number.isInteger(filterIndex) || filterIndex < 0 || filterIndex >= filters.length) {
+      throw new InvalidContinuationTokenError();
+    }
+  }
+
+  const items: TableEntityResult<T>[] = [];
+  while (filterIndex < filters.length && items.length < pageSize) {
+    const page = await readTablePage<T>(client, filters[filterIndex], pageSize - items.length, storageToken);
+    items.push(...page.items);
+    if (page.continuationToken) {
+      storageToken = page.continuationToken;
+    } else {
+      filterIndex++;
+      storageToken = undefined;
+    }
+  }
+
+  const nextToken = filterIndex < filters.length ? encodePageToken({ f: filterIndex, t: storageToken ?? null }) : null;
+
+  return { items, continuationToken: nextToken };
+}
+
+/**
+ * 移行期間中のグループの生産記録を1ページ分取得する関数
+ * - 新しいキーの記録（RowKey順）と旧パーティションの記録（生産日 + uuid 順に並べ替え）を1つの並びに合わせて返す
+ * - 両方にある記録（移行済みのコピー）は並び順のキーが一致するため、新しいキーの記録のみを返す
+ * - 継続トークンは最後に返した記録の並び順のキー。新しいキーの記録は RowKey gt で続きから範囲検索する
+ * ※旧パーティションのグループの記録はページごとに全件読み込む（移行期間中のみ）
+ */
+async function listGroupProductionsPageDualRead<T extends object>(
+  client: TableClient,
+  groupId: string,
+  pageSize: number,
+  continuationToken?: string
+): Promise<{ items: TableEntityResult<T>[]; continuationToken: string | null }> {
+  let cursor = "";
+  if (continuationToken) {
+    const decoded = decodePageToken(continuationToken);
+    if (typeof decoded.k !== "string" || !decoded.k) {
+      throw new InvalidContinuationTokenError();
+    }
+    cursor = decoded.k;
+  }
+
+  // 旧パーティションのグループの記録（続きの位置より後のもの）を並び順のキーで並べる
+  const [, legacyFilter] = buildGroupProductionFilters(groupId);
+  const legacy: Array<{ key: string; entity: TableEntityResult<T> }> = [];
+  for await (const entity of client.listEntities<T>({ queryOptions: { filter: legacyFilter } })) {
+    const key = toProductionSortKey(entity as { rowKey?: string; productionId?: unknown; date?: unknown });
+    if (key > cursor) {
+      legacy.push({ key, entity });
+    }
+  }
+  legacy.sort((a, b) => (a.key < b.key ? -1 : a.key > b.key ? 1 : 0));
+
+  // 新しいキーの記録を続きの位置から最大 pageSize 件読み込む
+  let filter = buildGroupPartitionFilter(groupId);
+  if (cursor) {
+    const escapedGroupId = escapeODataValue(groupId);
+    if (PRODUCTION_KEY_SCHEME === "groupYear") {
+      // 続きの位置の年以降のパーティションのみ
+      filter = `PartitionKey ge '${escapedGroupId}_${cursor.substring(0, 4)}' and PartitionKey lt '${escapedGroupId}_:'`;
+    }
+    filter = `${filter} and RowKey gt '${escapeODataValue(cursor)}'`;
+  }
+  const current: TableEntityResult<T>[] = [];
+  let storageToken: string | undefined;
+  do {
+    const page = await readTablePage<T>(client, filter, pageSize - current.length, storageToken);
+    current.push(...page.items);
+    storageToken = page.continuationToken;
+  } while (storageToken && current.length < pageSize);
+  const currentExhausted = !storageToken;
+
+  // 2つの並びを合わせる（同じキーは新しいキーの記録を返し、旧コピーは読み飛ばす）
+  const isFirst = createProductionDeduper();
+  const items: TableEntityResult<T>[] = [];
+  let lastKey = cursor;
+  let i = 0;
+  let j = 0;
+  while (items.length < pageSize && (i < current.length || j < legacy.length)) {
+    // 読み込んでいない新しいキーの記録より後ろの旧キーの記録は次のページで返す
+    if (i >= current.length && !currentExhausted) {
+      break;
+    }
+    const currentKey = i < current.length ? current[i].rowKey ?? "" : null;
+    const legacyKey = j < legacy.length ? legacy[j].key : null;
+    let entity: TableEntityResult<T>;
+    if (currentKey !== null && (legacyKey === null || currentKey <= legacyKey)) {
+      if (currentKey === legacyKey) {
+        j++;
+      }
+      entity = current[i++];
+      lastKey = currentKey;
+    } else {
+      entity = legacy[j++].entity;
+      lastKey = legacyKey!;
+    }
+    if (isFirst(entity)) {
+      items.push(entity);
+    }
+  }
+
+  const hasMore = i < current.length || !currentExhausted || j < legacy.length;
+  return { items, continuationToken: hasMore ? encodePageToken({ k: lastKey }) : null };
+}
+
+/**
+ * 404エラーかどうかを判定する関数
+ * @param error エラー
+ * @returns 404の場合true
+ */
+function isNotFound(error: any): boolean {
+  return error?.statusCode === 404 || error?.code === "ResourceNotFound";
+}
+
+// 新しいキー体系のRowKey（YYYYMMDD_uuid）
+const PRODUCTION_ROW_KEY_PATTERN = /^(\d{4})\d{4}_/;
+
+/**
+ * IDから生産記録を検索するのに groupId が必要かどうかを判定する関数
+ * 新しいキー体系のRowKey（YYYYMMDD_uuid）はパーティションが groupId で決まるため、groupId なしでは検索しない
+ * @param id RowKey または productionId
+ * @returns groupId が必要な場合true
+ */
+export function isGroupIdRequiredForLookup(id: string): boolean {
+  return PRODUCTION_KEY_SCHEME !== "legacy" && PRODUCTION_ROW_KEY_PATTERN.test(id);
+}
+
+/**
+ * IDから生産記録を検索する関数（テーブル全体の走査は行わない）
+ * 1. groupIdとRowKey（YYYYMMDD_uuid）が分かる場合は新しいキー体系でポイント読み取り
+ * 2. 旧パーティション（RowKey = uuid）でポイント読み取り
+ * 3. groupIdとproductionId（uuid）が指定された場合は、そのグループのパーティション内を検索
+ * @param client ProductionTableのTableClient
+ * @param id RowKey または productionId
+ * @param groupId グループID（新しいキー体系の記録を検索する場合は必須）
+ * @returns 見つかったエンティティ、存在しない場合はnull
+ */
+export async function findProductionById<T extends object = Record<string, unknown>>(
+  client: TableClient,
+  id: string,
+  groupId?: string | null
+): Promise<TableEntityResult<T> | null> {
+  const candidates: ProductionKeys[] = [];
+  const match = PRODUCTION_ROW_KEY_PATTERN.exec(id);
+
+  if (groupId && PRODUCTION_KEY_SCHEME !== "legacy" && match) {
+    candidates.push({ partitionKey: getProductionPartitionKey(groupId, match[1]), rowKey: id });
+  }
+  candidates.push({ partitionKey: LEGACY_PRODUCTION_PARTITION_KEY, rowKey: id });
+
+  for (const keys of candidates) {
+    try {
+      return await client.getEntity<T>(keys.partitionKey, keys.rowKey);
+    } catch (error) {
+      if (!isNotFound(error)) {
+        throw error;
+      }
+    }
+  }
+
+  if (!groupId || PRODUCTION_KEY_SCHEME === "legacy" || match) {
+    return null;
+  }
+
+  // productionId（uuid）で指定された場合は、グループのパーティションのみを検索する
+  const entities = client.listEntities<T>({
+    queryOptions: { filter: `${buildGroupPartitionFilter(groupId)} and productionId eq '${escapeODataValue(id)}'` }
+  });
+  for await (const entity of entities) {
+    return entity;
+  }
+  return null;
+}
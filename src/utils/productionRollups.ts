@@ -0,0 +1,980 @@
+import { InvocationContext } from "@azure/functions";
+import { TableClient, TableTransaction } from "@azure/data-tables";
+import { v4 as uuidv4 } from "uuid";
+import { tableName as productionTableName } from "../config";
+import { createProductionDeduper, escapeODataValue, toDatePrefix } from "./productionKeys";
+import { buildProductionYearFilter, ProductionColumns, selectProductionColumns, toNumber } from "./productionColumns";
+import { invalidateCoalesced } from "./singleFlight";
+import { tryBumpProductionDataGeneration } from "./dataGeneration";
+import { recordDiscarded } from "./metrics";
+import { createTableClient } from "./tableClient";
+import {
+  createShardOwnershipFilter,
+  forEachShard,
+  getPrimaryShard,
+  getShardTableClient,
+  resolveGroupShard,
+  StorageShard,
+} from "./shardMap";
+
+/**
+ * 生産記録の期間別集計（ロールアップ）
+ *
+ * ProductionRollupTable にグループ・材料別の日・月・年単位の合計を保持する。
+ * - PartitionKey : groupId（全グループの合計は "_all"）
+ * - RowKey       : D_YYYYMMDD_材料 / M_YYYYMM_材料 / Y_YYYY_材料
+ * 生産記録の作成・更新・削除時に差分を加算し、ProductionSumの再集計時に全件から作り直す（差分の誤差や取りこぼしを解消する）。
+ * - グループの行への加算はリクエスト内で行い、ETagの競合は MAX_DELTA_ATTEMPTS 回・MAX_DELTA_WAIT_MS まで再試行する
+ *   （反映できなかった差分は保留行に記録して応答を返す）
+ * - 全グループの書き込みが集中する "_all" の行へは加算せず、常に保留行に記録する
+ * - 保留行は ApplyRollupDeltasTimer（drainPendingRollupDeltas）がまとめて加算する
+ * 保留行は RowKey が "~pending_" で始まる行で、ロールアップ行（D_ / M_ / Y_）より後ろに並ぶため期間の読み込みには含まれない。
+ * 作り直しは走査の前に読んだETagを条件に書き込み、走査中に差分が加算・保留された行は上書きしない。
+ * テーブルはグループの生産記録と同じシャードに置くため、"_all" はシャードごとの合計となる（全体の合計は全シャードの和）。
+ * 再集計で全シャードのロールアップを作り直すと ProductionSumMetaTable に作成済みの印（rollupsReady）を書き込む。
+ * 印がない間（導入直後など、ロールアップが書き込み時の差分しか持たない間）は、読み込み側が生産記録から直接集計する。
+ *
+ * 任意の期間は「年 → 月 → 日」の順に収まる最も粗い単位の組み合わせに分解して読み込むため、
+ * 期間の長さに関係なく読み込む行数は最大でも「端の日 約60 + 端の月 約22 + 年数」程度となる。
+ */
+
+const rollupTableName = "ProductionRollupTable";
+
+// 全グループ合計のPartitionKey
+export const ALL_GROUPS_PARTITION_KEY = "_all";
+
+// ロールアップの作成済みの印（ProductionSumMetaTable、dataGeneration.ts と同じパーティション）
+const metaTableName = "ProductionSumMetaTable";
+const metaPartitionKey = "Meta";
+const rollupsReadyRowKey = "rollupsReady";
+// 印がない場合に読み直すまでの時間
+const ROLLUPS_READY_RECHECK_MS = 60 * 1000;
+
+// 楽観的同時実行制御で競合した場合の再試行の待ち時間（指数バックオフ、ジッターあり）
+const RETRY_BASE_DELAY_MS = 10;
+const RETRY_MAX_DELAY_MS = 1000;
+
+// リクエスト内で差分を加算する試行回数と合計の待ち時間（超えた場合は保留行に記録する）
+const MAX_DELTA_ATTEMPTS = 4;
+const MAX_DELTA_WAIT_MS = 1000;
+
+// エンティティグループトランザクションの上限件数
+const MAX_BATCH_SIZE = 100;
+
+// 保留中の差分の行（RowKey: ~pending_<記録日時のミリ秒>_<uuid>、deltas に差分の配列をJSONで保持する）
+const PENDING_DELTA_PREFIX = "~pending_";
+// 保留中の差分があるグループのパーティションの印（"_all" パーティションに置く、RowKey: ~dirty_<groupId>）
+const DIRTY_PARTITION_PREFIX = "~dirty_";
+// 1行の保留行に記録する差分の件数（文字列プロパティの上限 64KiB に収める）
+const MAX_DELTAS_PER_PENDING_ROW = 50;
+
+export type RollupLevel = "D" | "M" | "Y";
+
+export interface RollupValues {
+  materialAmount: number;
+  charcoalProduced: number;
+  charcoalVolume: number;
+  co2Reduction: number;
+  count: number;
+}
+
+export interface RollupRow extends RollupValues {
+  partitionKey: string;
+  rowKey: string;
+  level: RollupLevel;
+  period: string;
+  groupId: string;
+  materialType: string;
+}
+
+export interface RangeSegment {
+  level: RollupLevel;
+  // 期間の開始・終了（level に応じて YYYYMMDD / YYYYMM / YYYY、両端を含む）
+  start: string;
+  end: string;
+}
+
+interface ProductionLike {
+  date?: unknown;
+  groupId?: unknown;
+  materialType?: unknown;
+  materialAmount?: unknown;
+  charcoalProduced?: unknown;
+  charcoalVolume?: unknown;
+  co2Reduction?: unknown;
+}
+
+// シャード名 → テーブル作成の完了
+const tableReady = new Map<string, Promise<void>>();
+
+/**
+ * ProductionRollupTable のクライアントを取得する関数（シャードごとに初回のみテーブルを作成する）
+ * @param shard シャード（省略時は primary）
+ * @returns TableClient
+ */
+export async function getRollupClient(shard: StorageShard = getPrimaryShard()): Promise<TableClient> {
+  const client = getShardTableClient(shard, rollupTableName);
+  let ready = tableReady.get(shard.name);
+  if (!ready) {
+    ready = client.createTable().catch(() => {
+      // 既に存在する場合は無視
+    });
+    tableReady.set(shard.name, ready);
+  }
+  await ready;
+  return client;
+}
+
+export function emptyValues(): RollupValues {
+  return { materialAmount: 0, charcoalProduced: 0, charcoalVolume: 0, co2Reduction: 0, count: 0 };
+}
+
+/**
+ * RowKeyに使用できない文字（/ \ # ?）を含む場合に備えて材料名をエンコードする
+ */
+function encodeMaterial(materialType: string): string {
+  return encodeURIComponent(materialType);
+}
+
+/**
+ * ロールアップ行のキーを生成する関数
+ * @param level 単位（D / M / Y）
+ * @param period 期間（YYYYMMDD / YYYYMM / YYYY）
+ * @param materialType 材料
+ * @returns RowKey
+ */
+export function createRollupRowKey(level: RollupLevel, period: string, materialType: string): string {
+  return `${level}_${period}_${encodeMaterial(materialType)}`;
+}
+
+/**
+ * 生産記録から、加算対象の行（日・月・年 × グループ別・全体）を生成する関数
+ * @param production 生産記録
+ * @param sign 加算（1）または減算（-1）
+ * @returns 行の配列（日付・グループ・材料がない場合は空）
+ */
+export function createRollupDeltas(production: ProductionLike, sign: 1 | -1): RollupRow[] {
+  const groupId = production.groupId as string | undefined;
+  const materialType = production.materialType as string | undefined;
+  const datePrefix = toDatePrefix(String(production.date || ""));
+  if (!groupId || !materialType || datePrefix === "00000000") {
+    return [];
+  }
+
+  const values: RollupValues = {
+    materialAmount: sign * toNumber(production.materialAmount),
+    charcoalProduced: sign * toNumber(production.charcoalProduced),
+    charcoalVolume: sign * toNumber(production.charcoalVolume),
+    co2Reduction: sign * toNumber(production.co2Reduction),
+    count: sign,
+  };
+
+  const periods: Array<[RollupLevel, string]> = [
+    ["D", datePrefix],
+    ["M", datePrefix.substring(0, 6)],
+    ["Y", datePrefix.substring(0, 4)],
+  ];
+
+  const rows: RollupRow[] = [];
+  for (const partitionKey of [groupId, ALL_GROUPS_PARTITION_KEY]) {
+    for (const [level, period] of periods) {
+      rows.push({
+        partitionKey,
+        rowKey: createRollupRowKey(level, period, materialType),
+        level,
+        period,
+        groupId: partitionKey,
+        materialType,
+        ...values,
+      });
+    }
+  }
+  return rows;
+}
+
+/**
+ * 競合後の再試行までの待ち時間（ミリ秒）
+ * @param attempt 試行回数（1から）
+ */
+function retryDelay(attempt: number): number {
+  const cap = Math.min(RETRY_MAX_DELAY_MS, RETRY_BASE_DELAY_MS * 2 ** (attempt - 1));
+  return cap / 2 + Math.random() * (cap / 2);
+}
+
+function isConflict(error: any): boolean {
+  // 409（同時に作成された）/ 412（ETag不一致）/ 404（同時に削除された）
+  return error?.statusCode === 409 || error?.statusCode === 412 || error?.statusCode === 404;
+}
+
+function addValues(target: RollupValues, delta: RollupValues): void {
+  target.materialAmount += delta.materialAmount;
+  target.charcoalProduced += delta.charcoalProduced;
+  target.charcoalVolume += delta.charcoalVolume;
+  target.co2Reduction += delta.co2Reduction;
+  target.count += delta.count;
+}
+
+function sleep(ms: number): Promise<void> {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+/**
+ * 差分の対象の行を読み込む関数（存在しない行はnull）
+ */
+async function readCurrentRows(client: TableClient, deltas: RollupRow[]) {
+  return Promise.all(deltas.map(async (delta) => {
+    try {
+      return await client.getEntity<RollupValues>(delta.partitionKey, delta.rowKey);
+    } catch (error: any) {
+      if (error?.statusCode === 404) return null;
+      throw error;
+    }
+  }));
+}
+
+/**
+ * 読み込んだ行に差分を加算する操作をトランザクションに追加する関数（読み込んだETagを条件にする）
+ */
+function addDeltaActions(
+  transaction: TableTransaction,
+  deltas: RollupRow[],
+  existing: Awaited<ReturnType<typeof readCurrentRows>>
+): void {
+  const updatedAt = new Date().toISOString();
+  deltas.forEach((delta, i) => {
+    const current = existing[i];
+    if (!current) {
+      if (delta.count > 0) {
+        transaction.createEntity({ ...delta, updatedAt });
+      }
+      return;
+    }
+    const count = toNumber(current.count) + delta.count;
+    if (count <= 0) {
+      // 対象の生産記録がなくなった行は削除する
+      transaction.deleteEntity(delta.partitionKey, delta.rowKey, { etag: current.etag });
+      return;
+    }
+    transaction.updateEntity({
+      ...delta,
+      materialAmount: toNumber(current.materialAmount) + delta.materialAmount,
+      charcoalProduced: toNumber(current.charcoalProduced) + delta.charcoalProduced,
+      charcoalVolume: toNumber(current.charcoalVolume) + delta.charcoalVolume,
+      co2Reduction: toNumber(current.co2Reduction) + delta.co2Reduction,
+      count,
+      updatedAt,
+    }, "Replace", { etag: current.etag });
+  });
+}
+
+/**
+ * 1つのパーティションの行に差分を加算する関数
+ * 読み込んだETagを条件にトランザクションで更新し、競合した場合は待ち時間を延ばしながら読み直して再試行する
+ * 再試行は MAX_DELTA_ATTEMPTS 回・MAX_DELTA_WAIT_MS までとし、リクエストの応答を待たせ続けない
+ * @param client ProductionRollupTableのTableClient
+ * @param deltas 同じパーティションの差分
+ * @returns 反映できた場合はtrue（競合が続いて反映できなかった場合はfalse）
+ */
+async function applyPartitionDeltas(client: TableClient, deltas: RollupRow[]): Promise<boolean> {
+  const deadline = Date.now() + MAX_DELTA_WAIT_MS;
+  for (let attempt = 1; attempt <= MAX_DELTA_ATTEMPTS; attempt++) {
+    const transaction = new TableTransaction();
+    addDeltaActions(transaction, deltas, await readCurrentRows(client, deltas));
+    if (transaction.actions.length === 0) return true;
+
+    try {
+      await client.submitTransaction(transaction.actions);
+      return true;
+    } catch (error: any) {
+      if (!isConflict(error)) {
+        throw error;
+      }
+    }
+    const delay = retryDelay(attempt);
+    if (attempt === MAX_DELTA_ATTEMPTS || Date.now() + delay > deadline) break;
+    await sleep(delay);
+  }
+  return false;
+}
+
+/**
+ * 差分を保留行に記録する関数（作成のみのため、同じパーティションへの書き込みが集中しても競合しない）
+ * グループのパーティションに記録した場合は "_all" に印を付け、drainPendingRollupDeltas が対象を見つけられるようにする
+ * @param client ProductionRollupTableのTableClient
+ * @param partitionKey 差分のパーティション（groupId または "_all"）
+ * @param deltas 同じパーティションの差分（最大100件）
+ */
+async function enqueuePendingDeltas(client: TableClient, partitionKey: string, deltas: RollupRow[]): Promise<void> {
+  const createdAt = new Date().toISOString();
+  const timestamp = String(Date.now()).padStart(13, "0");
+  const transaction = new TableTransaction();
+  for (let i = 0; i < deltas.length; i += MAX_DELTAS_PER_PENDING_ROW) {
+    transaction.createEntity({
+      partitionKey,
+      rowKey: `${PENDING_DELTA_PREFIX}${timestamp}_${uuidv4()}`,
+      deltas: JSON.stringify(deltas.slice(i, i + MAX_DELTAS_PER_PENDING_ROW)),
+      createdAt,
+    });
+  }
+  await client.submitTransaction(transaction.actions);
+
+  if (partitionKey !== ALL_GROUPS_PARTITION_KEY) {
+    // 印は保留行の後に書き込む（drain は印を読んでから保留行を読むため、印を削除しても保留行は取りこぼさない）
+    await client.upsertEntity({
+      partitionKey: ALL_GROUPS_PARTITION_KEY,
+      rowKey: `${DIRTY_PARTITION_PREFIX}${encodeURIComponent(partitionKey)}`,
+      target: partitionKey,
+      updatedAt: createdAt,
+    }, "Replace");
+  }
+}
+
+interface PendingDeltaEntity {
+  partitionKey: string;
+  rowKey: string;
+  etag: string;
+  deltas: string;
+}
+
+interface DirtyPartitionEntity {
+  partitionKey: string;
+  rowKey: string;
+  etag: string;
+  target: string;
+}
+
+async function listPendingDeltaRows(client: TableClient, partitionKey: string): Promise<PendingDeltaEntity[]> {
+  const rows: PendingDeltaEntity[] = [];
+  const entities = client.listEntities<PendingDeltaEntity>({
+    queryOptions: {
+      filter: `PartitionKey eq '${escapeODataValue(partitionKey)}'`
+        + ` and RowKey ge '${PENDING_DELTA_PREFIX}' and RowKey lt '${PENDING_DELTA_PREFIX.slice(0, -1)}\`'`,
+    },
+  });
+  for await (const entity of entities) {
+    rows.push(entity);
+  }
+  return rows;
+}
+
+async function listDirtyPartitions(client: TableClient): Promise<DirtyPartitionEntity[]> {
+  const rows: DirtyPartitionEntity[] = [];
+  const entities = client.listEntities<DirtyPartitionEntity>({
+    queryOptions: {
+      filter: `PartitionKey eq '${ALL_GROUPS_PARTITION_KEY}'`
+        + ` and RowKey ge '${DIRTY_PARTITION_PREFIX}' and RowKey lt '${DIRTY_PARTITION_PREFIX.slice(0, -1)}\`'`,
+    },
+  });
+  for await (const entity of entities) {
+    rows.push(entity);
+  }
+  return rows;
+}
+
+/**
+ * シャードの保留行をすべて取得する関数（"_all" と、印の付いたグループのパーティション）
+ */
+async function listAllPendingDeltaRows(client: TableClient): Promise<PendingDeltaEntity[]> {
+  const partitions = [ALL_GROUPS_PARTITION_KEY, ...(await listDirtyPartitions(client)).map((marker) => marker.target)];
+  return (await Promise.all(partitions.map((partitionKey) => listPendingDeltaRows(client, partitionKey)))).flat();
+}
+
+/**
+ * 1つのパーティションの保留行を加算する関数
+ * 保留行の差分を行ごとにまとめ、対象の行の更新と保留行の削除を同じトランザクションで行う（二重に加算しない）
+ * @param client ProductionRollupTableのTableClient
+ * @param partitionKey パーティション
+ * @returns 加算した保留行の件数と、すべて加算できたか
+ */
+async function drainPartition(client: TableClient, partitionKey: string): Promise<{ applied: number; complete: boolean }> {
+  const pendingRows = await listPendingDeltaRows(client, partitionKey);
+  let applied = 0;
+  let index = 0;
+  while (index < pendingRows.length) {
+    // 対象の行と保留行の削除がトランザクションの上限に収まる分をまとめる
+    const batch: PendingDeltaEntity[] = [];
+    const merged = new Map<string, RollupRow>();
+    while (index < pendingRows.length) {
+      const deltas: RollupRow[] = JSON.parse(pendingRows[index].deltas);
+      const added = new Set(deltas.map((delta) => delta.rowKey).filter((rowKey) => !merged.has(rowKey))).size;
+      if (batch.length > 0 && batch.length + 1 + merged.size + added > MAX_BATCH_SIZE) break;
+      batch.push(pendingRows[index++]);
+      for (const delta of deltas) {
+        const current = merged.get(delta.rowKey);
+        if (current) {
+          addValues(current, delta);
+        } else {
+          merged.set(delta.rowKey, { ...delta });
+        }
+      }
+    }
+
+    const deltas = [...merged.values()];
+    let done = false;
+    for (let attempt = 1; attempt <= MAX_DELTA_ATTEMPTS && !done; attempt++) {
+      const transaction = new TableTransaction();
+      addDeltaActions(transaction, deltas, await readCurrentRows(client, deltas));
+      for (const row of batch) {
+        transaction.deleteEntity(row.partitionKey, row.rowKey, { etag: row.etag });
+      }
+      try {
+        await client.submitTransaction(transaction.actions);
+        done = true;
+      } catch (error: any) {
+        if (!isConflict(error)) {
+          throw error;
+        }
+        await sleep(retryDelay(attempt));
+      }
+    }
+    if (!done) {
+      // 保留行が再集計で削除された場合も含め、次回の実行で読み直す
+      return { applied, complete: false };
+    }
+    applied += batch.length;
+  }
+  return { applied, complete: true };
+}
+
+/**
+ * 保留中の差分をロールアップに加算する関数（ApplyRollupDeltasTimer から呼び出す）
+ * 加算した場合はこのインスタンスのキャッシュを破棄し、生産データの世代スタンプを更新する
+ * @param context 実行コンテキスト
+ * @returns 加算した保留行の件数と、グループの行に加算したグループID（ダッシュボードを無効にする）
+ */
+export async function drainPendingRollupDeltas(context: InvocationContext): Promise<{ applied: number; groupIds: string[] }> {
+  const groupIds: string[] = [];
+  const counts = await forEachShard(async (shard) => {
+    const client = await getRollupClient(shard);
+    // 印を保留行より先に読む（enqueuePendingDeltas の書き込み順と対）
+    const markers = await listDirtyPartitions(client);
+    let { applied } = await drainPartition(client, ALL_GROUPS_PARTITION_KEY);
+    for (const marker of markers) {
+      const result = await drainPartition(client, marker.target);
+      applied += result.applied;
+      if (result.applied > 0) {
+        groupIds.push(marker.target);
+      }
+      if (!result.complete) continue;
+      try {
+        // 読んだ後に新しい差分が保留された場合はETagが変わっているため、印は残る
+        await client.deleteEntity(marker.partitionKey, marker.rowKey, { etag: marker.etag });
+      } catch (error: any) {
+        if (!isConflict(error)) {
+          throw error;
+        }
+      }
+    }
+    return applied;
+  });
+  const applied = counts.reduce((sum, count) => sum + count, 0);
+  if (applied > 0) {
+    context.log(`Applied ${applied} pending rollup delta rows`);
+    invalidateCoalesced();
+    await tryBumpProductionDataGeneration(context, "rollup deltas");
+  }
+  return { applied, groupIds };
+}
+
+export interface ProductionChange {
+  // 変更前の生産記録（作成時はnull）
+  before: ProductionLike | null;
+  // 変更後の生産記録（削除時はnull）
+  after: ProductionLike | null;
+}
+
+/**
+ * 生産記録の変更をロールアップに反映する関数
+ * 差分はそれぞれの生産記録のグループのシャードに加算する（グループの変更でシャードが変わる場合は両方を更新する）
+ * 複数の変更は同じ行への差分をまとめてから、パーティションごとに100件単位のトランザクションで加算する
+ * "_all" の差分と、競合が続いて加算できなかったグループの差分は保留行に記録する
+ * @param changes 生産記録の変更
+ */
+export async function applyProductionChanges(changes: ProductionChange[]): Promise<void> {
+  const shardOf = async (production: ProductionLike) =>
+    typeof production.groupId === "string" ? resolveGroupShard(production.groupId) : getPrimaryShard();
+  const tagged: Array<{ shard: StorageShard; delta: RollupRow }> = [];
+  for (const { before, after } of changes) {
+    if (before) {
+      const shard = await shardOf(before);
+      tagged.push(...createRollupDeltas(before, -1).map((delta) => ({ shard, delta })));
+    }
+    if (after) {
+      const shard = await shardOf(after);
+      tagged.push(...createRollupDeltas(after, 1).map((delta) => ({ shard, delta })));
+    }
+  }
+  if (tagged.length === 0) return;
+
+  // 同じ行への加算と減算（同じ日付・材料のまま値のみ更新した場合、同じ日の複数の記録など）をまとめる
+  const merged = new Map<string, { shard: StorageShard; row: RollupRow }>();
+  for (const { shard, delta } of tagged) {
+    const key = `${shard.name}\u0000${delta.partitionKey}\u0000${delta.rowKey}`;
+    const current = merged.get(key);
+    if (!current) {
+      merged.set(key, { shard, row: { ...delta } });
+      continue;
+    }
+    addValues(current.row, delta);
+  }
+
+  const byPartition = new Map<string, { shard: StorageShard; rows: RollupRow[] }>();
+  for (const { shard, row } of merged.values()) {
+    const key = `${shard.name}\u0000${row.partitionKey}`;
+    const partition = byPartition.get(key) ?? { shard, rows: [] };
+    partition.rows.push(row);
+    byPartition.set(key, partition);
+  }
+
+  const chunks: Array<{ shard: StorageShard; rows: RollupRow[] }> = [];
+  for (const { shard, rows } of byPartition.values()) {
+    for (let i = 0; i < rows.length; i += MAX_BATCH_SIZE) {
+      chunks.push({ shard, rows: rows.slice(i, i + MAX_BATCH_SIZE) });
+    }
+  }
+  await Promise.all(chunks.map(async ({ shard, rows }) => {
+    const client = await getRollupClient(shard);
+    const partitionKey = rows[0].partitionKey;
+    if (partitionKey === ALL_GROUPS_PARTITION_KEY || !(await applyPartitionDeltas(client, rows))) {
+      await enqueuePendingDeltas(client, partitionKey, rows);
+    }
+  }));
+}
+
+/**
+ * 1件の生産記録の変更をロールアップに反映する関数
+ * @param before 変更前の生産記録（作成時はnull）
+ * @param after 変更後の生産記録（削除時はnull）
+ */
+export async function applyProductionChange(before: ProductionLike | null, after: ProductionLike | null): Promise<void> {
+  await applyProductionChanges([{ before, after }]);
+}
+
+/**
+ * ロールアップの更新に失敗しても生産記録の処理を失敗させないためのラッパー
+ * （保留行にも記録できなかった差分は次回のProductionSum再集計で作り直される）
+ * 反映後に生産データの世代スタンプを更新する
+ * @param context 実行コンテキスト
+ * @param changes 生産記録の変更
+ */
+export async function tryApplyProductionChanges(context: InvocationContext, changes: ProductionChange[]): Promise<void> {
+  // このインスタンスでキャッシュしているレポートの結果を破棄する
+  invalidateCoalesced();
+  try {
+    await applyProductionChanges(changes);
+  } catch (error) {
+    context.warn(`Failed to update production rollups: ${error}`);
+  }
+  // レポートのETag（生産データの世代）を更新する
+  await tryBumpProductionDataGeneration(context, "production write");
+}
+
+/**
+ * 1件の生産記録の変更を反映する tryApplyProductionChanges
+ * @param context 実行コンテキスト
+ * @param before 変更前の生産記録
+ * @param after 変更後の生産記録
+ */
+export async function tryApplyProductionChange(
+  context: InvocationContext,
+  before: ProductionLike | null,
+  after: ProductionLike | null
+): Promise<void> {
+  await tryApplyProductionChanges(context, [{ before, after }]);
+}
+
+// ---------------------------------------------------------------------------
+// 作成済みの印と、印がない間の生産記録からの集計
+// ---------------------------------------------------------------------------
+
+// 印を確認できた場合はこのインスタンスでは以後読み込まない（印は削除しない）
+let rollupsReadyConfirmed = false;
+let rollupsReadyCheck: { checkedAt: number; ready: Promise<boolean> } | null = null;
+
+async function readRollupsReadyMarker(): Promise<boolean> {
+  try {
+    await createTableClient(process.env.AzureWebJobsStorage!, metaTableName).getEntity(metaPartitionKey, rollupsReadyRowKey);
+    return true;
+  } catch (error: any) {
+    if (error?.statusCode === 404) {
+      return false;
+    }
+    throw error;
+  }
+}
+
+/**
+ * ロールアップが全件から作成済みかを返す関数
+ * 未作成の間は ROLLUPS_READY_RECHECK_MS ごとに印を読み直す
+ * @returns 作成済みの場合はtrue（falseの場合は accumulateProductionYears などで生産記録から集計する）
+ */
+export async function areRollupsReady(): Promise<boolean> {
+  if (rollupsReadyConfirmed) {
+    return true;
+  }
+  if (!rollupsReadyCheck || Date.now() - rollupsReadyCheck.checkedAt >= ROLLUPS_READY_RECHECK_MS) {
+    rollupsReadyCheck = { checkedAt: Date.now(), ready: readRollupsReadyMarker() };
+  }
+  const check = rollupsReadyCheck;
+  try {
+    if (await check.ready) {
+      rollupsReadyConfirmed = true;
+    }
+  } catch (error) {
+    // 失敗した結果はキャッシュしない
+    if (rollupsReadyCheck === check) {
+      rollupsReadyCheck = null;
+    }
+    throw error;
+  }
+  return rollupsReadyConfirmed;
+}
+
+/**
+ * ロールアップの作成済みの印を書き込む関数（再集計で全シャードのロールアップを作り直した後に呼び出す）
+ * @param context 実行コンテキスト
+ */
+export async function markRollupsReady(context: InvocationContext): Promise<void> {
+  const client = createTableClient(process.env.AzureWebJobsStorage!, metaTableName);
+  try {
+    await client.createTable().catch(() => {
+      // 既に存在する場合は無視
+    });
+    await client.upsertEntity({
+      partitionKey: metaPartitionKey,
+      rowKey: rollupsReadyRowKey,
+      updatedAt: new Date().toISOString(),
+    }, "Replace");
+    rollupsReadyConfirmed = true;
+  } catch (error) {
+    context.warn(`Failed to mark production rollups as ready: ${error}`);
+  }
+}
+
+// 生産記録からロールアップ行を作るのに必要な列
+const ROLLUP_SOURCE_COLUMNS = selectProductionColumns(
+  "productionId", "groupId", "date", "materialType", "materialAmount", "charcoalProduced", "charcoalVolume", "co2Reduction"
+);
+
+/**
+ * 対象年の生産記録を全ストレージアカウントから走査し、ロールアップ行を集計する関数
+ * ロールアップの作成済みの印がない間、全グループの集計（年次レポート・期間レポート）の代わりに使う
+ * @param years 対象年
+ * @returns 集計器（"_all" とグループ別の日・月・年単位の行）
+ */
+export async function accumulateProductionYears(years: number[]): Promise<RollupAccumulator> {
+  const accumulator = new RollupAccumulator();
+  const isFirst = createProductionDeduper();
+  const isOwned = await createShardOwnershipFilter();
+
+  await forEachShard(async (shard) => {
+    const client = getShardTableClient(shard, productionTableName);
+    await Promise.all(years.map(async (year) => {
+      const entities = client.listEntities<ProductionColumns<typeof ROLLUP_SOURCE_COLUMNS[number]>>({
+        queryOptions: { filter: buildProductionYearFilter(year), select: ROLLUP_SOURCE_COLUMNS },
+      });
+      for await (const entity of entities) {
+        // 移動中のグループのコピーは割り当て先のアカウントの行のみ数える
+        if (!isOwned(shard, entity.groupId) || !isFirst(entity)) {
+          recordDiscarded();
+          continue;
+        }
+        accumulator.add(entity);
+      }
+    }));
+  });
+  return accumulator;
+}
+
+// ---------------------------------------------------------------------------
+// 再集計（全件からの作り直し）
+// ---------------------------------------------------------------------------
+
+/**
+ * 全件走査中に生産記録を受け取り、ロールアップ行を作成する集計器
+ */
+export class RollupAccumulator {
+  private readonly rows = new Map<string, RollupRow>();
+
+  add(production: ProductionLike): void {
+    for (const delta of createRollupDeltas(production, 1)) {
+      const key = `${delta.partitionKey}\u0000${delta.rowKey}`;
+      const current = this.rows.get(key);
+      if (!current) {
+        this.rows.set(key, delta);
+        continue;
+      }
+      addValues(current, delta);
+    }
+  }
+
+  get size(): number {
+    return this.rows.size;
+  }
+
+  values(): IterableIterator<RollupRow> {
+    return this.rows.values();
+  }
+
+  has(partitionKey: string, rowKey: string): boolean {
+    return this.rows.has(`${partitionKey}\u0000${rowKey}`);
+  }
+}
+
+// 作り直し前のロールアップ行のETag（PartitionKey + RowKey → ETag）
+export type RollupETags = Map<string, string>;
+
+/**
+ * ProductionRollupTable の全行のETagを取得する関数
+ * 作り直しの走査（ProductionTable）を始める前に読み、replaceRollups の書き込みの条件にする
+ * @param shard シャード（省略時は primary）
+ * @returns 行のキーとETag
+ */
+export async function readRollupETags(shard: StorageShard = getPrimaryShard()): Promise<RollupETags> {
+  const client = await getRollupClient(shard);
+  const etags: RollupETags = new Map();
+  for await (const entity of client.listEntities({ queryOptions: { select: ["PartitionKey", "RowKey"] } })) {
+    etags.set(`${entity.partitionKey}\u0000${entity.rowKey}`, entity.etag);
+  }
+  return etags;
+}
+
+type ReplaceOperation =
+  | { kind: "create"; row: RollupRow }
+  | { kind: "update"; row: RollupRow; etag: string }
+  | { kind: "delete"; partitionKey: string; rowKey: string; etag: string };
+
+function addOperation(transaction: TableTransaction, operation: ReplaceOperation, updatedAt: string): void {
+  switch (operation.kind) {
+    case "create":
+      transaction.createEntity({ ...operation.row, updatedAt });
+      break;
+    case "update":
+      transaction.updateEntity({ ...operation.row, updatedAt }, "Replace", { etag: operation.etag });
+      break;
+    case "delete":
+      transaction.deleteEntity(operation.partitionKey, operation.rowKey, { etag: operation.etag });
+      break;
+  }
+}
+
+/**
+ * 1件ずつ書き込む関数（トランザクションが競合で失敗した場合に、競合していない行のみ反映するために使う）
+ * @returns 競合して書き込まなかった件数
+ */
+async function applyOperationsIndividually(
+  client: TableClient,
+  operations: ReplaceOperation[],
+  updatedAt: string
+): Promise<number> {
+  let skipped = 0;
+  for (const operation of operations) {
+    try {
+      switch (operation.kind) {
+        case "create":
+          await client.createEntity({ ...operation.row, updatedAt });
+          break;
+        case "update":
+          await client.updateEntity({ ...operation.row, updatedAt }, "Replace", { etag: operation.etag });
+          break;
+        case "delete":
+          await client.deleteEntity(operation.partitionKey, operation.rowKey, { etag: operation.etag });
+          break;
+      }
+    } catch (error: any) {
+      if (!isConflict(error)) {
+        throw error;
+      }
+      skipped++;
+    }
+  }
+  return skipped;
+}
+
+/**
+ * 集計器の内容で ProductionRollupTable を作り直す関数
+ * パーティションごとに100件単位のトランザクションで書き込み、集計器にない既存の行を削除する
+ * 書き込みは走査前に読んだETagを条件にし（走査前になかった行は作成のみ）、走査中に差分が加算・作成・削除された行は上書きしない
+ * 走査前からある保留行は走査の結果に含まれるため削除し、走査が始まった後に保留された差分の対象の行は書き込まない
+ * （保留行は後で加算されるため、走査の結果で上書きすると二重に数える。その行の誤差は次回の再集計で解消される）
+ * 実行中は ApplyRollupDeltasTimer が保留行を加算しないため、保留行の削除と加算が重ならない
+ * @param context 実行コンテキスト
+ * @param accumulator 全件走査で作成した集計器（shard の生産記録のみ）
+ * @param etags 走査の前に readRollupETags で読んだETag
+ * @param parallelism 同時に送信するトランザクション数
+ * @param shard シャード（省略時は primary）
+ */
+export async function replaceRollups(
+  context: InvocationContext,
+  accumulator: RollupAccumulator,
+  etags: RollupETags,
+  parallelism: number,
+  shard: StorageShard = getPrimaryShard()
+): Promise<void> {
+  const client = await getRollupClient(shard);
+  const updatedAt = new Date().toISOString();
+
+  const deferred = new Set<string>();
+  for (const pendingRow of await listAllPendingDeltaRows(client)) {
+    if (etags.has(`${pendingRow.partitionKey}\u0000${pendingRow.rowKey}`)) continue;
+    for (const delta of JSON.parse(pendingRow.deltas) as RollupRow[]) {
+      deferred.add(`${delta.partitionKey}\u0000${delta.rowKey}`);
+    }
+  }
+
+  const batches: ReplaceOperation[][] = [];
+  const pending = new Map<string, ReplaceOperation[]>();
+  const addToBatch = (partitionKey: string, operation: ReplaceOperation) => {
+    let operations = pending.get(partitionKey);
+    if (!operations) {
+      operations = [];
+      pending.set(partitionKey, operations);
+    }
+    operations.push(operation);
+    if (operations.length >= MAX_BATCH_SIZE) {
+      batches.push(operations);
+      pending.delete(partitionKey);
+    }
+  };
+
+  let written = 0;
+  for (const row of accumulator.values()) {
+    const key = `${row.partitionKey}\u0000${row.rowKey}`;
+    if (deferred.has(key)) continue;
+    written++;
+    const etag = etags.get(key);
+    addToBatch(row.partitionKey, etag ? { kind: "update", row, etag } : { kind: "create", row });
+  }
+
+  // 生産記録がなくなった行を削除
+  let staleCount = 0;
+  for (const [key, etag] of etags) {
+    const [partitionKey, rowKey] = key.split("\u0000");
+    if (!accumulator.has(partitionKey, rowKey) && !deferred.has(key)) {
+      staleCount++;
+      addToBatch(partitionKey, { kind: "delete", partitionKey, rowKey, etag });
+    }
+  }
+  for (const operations of pending.values()) {
+    batches.push(operations);
+  }
+
+  let skipped = 0;
+  let next = 0;
+  const workers = Array.from({ length: Math.max(1, Math.min(parallelism, batches.length)) }, async () => {
+    while (next < batches.length) {
+      const operations = batches[next++];
+      const transaction = new TableTransaction();
+      for (const operation of operations) {
+        addOperation(transaction, operation, updatedAt);
+      }
+      try {
+        await client.submitTransaction(transaction.actions);
+      } catch (error: any) {
+        if (!isConflict(error)) {
+          throw error;
+        }
+        // 走査中に差分が反映された行を含むため、1件ずつ書き込んで競合した行のみ残す
+        skipped += await applyOperationsIndividually(client, operations, updatedAt);
+      }
+    }
+  });
+  await Promise.all(workers);
+
+  context.log(`Rebuilt production rollups (${shard.name}): ${written} rows written, ${staleCount} stale rows deleted, `
+    + `${skipped} rows left as updated during the scan, ${deferred.size} rows left for pending deltas (${batches.length} batches)`);
+}
+
+// ---------------------------------------------------------------------------
+// 期間の分解と読み込み
+// ---------------------------------------------------------------------------
+
+function formatDay(date: Date): string {
+  return date.toISOString().substring(0, 10).replace(/-/g, "");
+}
+
+function addDays(date: Date, days: number): Date {
+  return new Date(date.getTime() + days * 24 * 60 * 60 * 1000);
+}
+
+/**
+ * 期間を「年 → 月 → 日」の順に収まる最も粗い単位の連続区間に分解する関数
+ * 例: 2023-11-15〜2025-02-03 → 日(2023-11-15〜30) / 月(2023-12) / 年(2024) / 月(2025-01) / 日(2025-02-01〜03)
+ * @param from 開始日（UTC、この日を含む）
+ * @param to 終了日（UTC、この日を含む）
+ * @returns 区間の配列
+ */
+export function decomposeRange(from: Date, to: Date): RangeSegment[] {
+  const segments: RangeSegment[] = [];
+  const push = (level: RollupLevel, start: string, end: string) => {
+    const last = segments[segments.length - 1];
+    if (last && last.level === level) {
+      last.end = end;
+    } else {
+      segments.push({ level, start, end });
+    }
+  };
+
+  let cursor = new Date(Date.UTC(from.getUTCFullYear(), from.getUTCMonth(), from.getUTCDate()));
+  const last = new Date(Date.UTC(to.getUTCFullYear(), to.getUTCMonth(), to.getUTCDate()));
+
+  while (cursor <= last) {
+    const year = cursor.getUTCFullYear();
+    const month = cursor.getUTCMonth();
+    const day = cursor.getUTCDate();
+    const endOfYear = new Date(Date.UTC(year, 11, 31));
+    const endOfMonth = new Date(Date.UTC(year, month + 1, 0));
+
+    if (month === 0 && day === 1 && endOfYear <= last) {
+      push("Y", String(year), String(year));
+      cursor = new Date(Date.UTC(year + 1, 0, 1));
+    } else if (day === 1 && endOfMonth <= last) {
+      const period = formatDay(cursor).substring(0, 6);
+      push("M", period, period);
+      cursor = new Date(Date.UTC(year, month + 1, 1));
+    } else {
+      const period = formatDay(cursor);
+      push("D", period, period);
+      cursor = addDays(cursor, 1);
+    }
+  }
+  return segments;
+}
+
+/**
+ * 区間に含まれるロールアップ行を取得するフィルタを生成する関数
+ * RowKey は「単位_期間_材料」のため、終了期間の後ろに '_' の次の文字（'`'）を付けて上限とする
+ * @param partitionKey PartitionKey
+ * @param segment 区間
+ * @returns ODataフィルタ
+ */
+export function buildSegmentFilter(partitionKey: string, segment: RangeSegment): string {
+  return `PartitionKey eq '${escapeODataValue(partitionKey)}'`
+    + ` and RowKey ge '${segment.level}_${segment.start}_'`
+    + ` and RowKey lt '${segment.level}_${segment.end}\`'`;
+}
+
+/**
+ * パーティションの期間内のロールアップ行を取得する関数（区間ごとに並列でクエリする）
+ * @param client ProductionRollupTableのTableClient
+ * @param partitionKey groupId または "_all"
+ * @param segments decomposeRange で分解した区間
+ * @returns ロールアップ行
+ */
+export async function readRollupRange(
+  client: TableClient,
+  partitionKey: string,
+  segments: RangeSegment[]
+): Promise<RollupRow[]> {
+  const results = await Promise.all(segments.map(async (segment) => {
+    const rows: RollupRow[] = [];
+    const entities = client.listEntities<RollupRow>({
+      queryOptions: { filter: buildSegmentFilter(partitionKey, segment) },
+    });
+    for await (const entity of entities) {
+      rows.push(entity);
+    }
+    return rows;
+  }));
+  return results.flat();
+}
@@ -0,0 +1,503 @@
+import { InvocationContext } from "@azure/functions";
+import { TableClient } from "@azure/data-tables";
+import { productionSumScanParallelism } from "../config";
+import { createProductionDeduper, escapeODataValue, LEGACY_PRODUCTION_PARTITION_KEY, PRODUCTION_DUAL_READ, PRODUCTION_KEY_SCHEME } from "./productionKeys";
+import { toNumber } from "./productionColumns";
+import { markRollupsReady, readRollupETags, replaceRollups, RollupAccumulator, RollupETags } from "./productionRollups";
+import {
+  createShardOwnershipFilter,
+  forEachShard,
+  getPrimaryShard,
+  getShardBlobServiceClient,
+  getShardTableClient,
+  isShardingEnabled,
+  StorageShard,
+} from "./shardMap";
+
+/**
+ * ProductionSumTable の再集計（洗い替え）
+ * CreateProductionSum（手動実行）と CreateProductionSumTimer（毎日0:00）から productionSumRebuild.ts 経由で呼び出す（同時に1つのみ実行）
+ *
+ * ProductionTable の走査は、キー範囲で分割した複数のクエリを並列に実行する。
+ * - 新しいキー体系のエンティティは PartitionKey（groupId / groupId_YYYY、uuidの先頭文字）の範囲で分割する
+ * - 旧パーティション（"Production"）は1パーティションのため、RowKey（uuid）の範囲で分割する
+ * 範囲は重ならず、先頭と末尾の範囲は上限・下限を設けないため、すべてのキーがいずれか1つの範囲に含まれる
+ * 同じ走査で期間別集計（ProductionRollupTable）も作り直す
+ * 生産データを複数のストレージアカウントに分けている場合（shardMap.ts）は、アカウントごとに並列で再集計し、
+ * そのアカウントの ProductionSumTable / ProductionRollupTable を作り直す
+ */
+
+// Azure Table Storage 接続設定
+const productionTableName = "ProductionTable";
+const productionSumTableName = "ProductionSumTable";
+const partitionKey = "ProductionSum";
+
+// キー範囲の境界（uuidの先頭文字）。境界を増やすと範囲が細かくなる
+const SHARD_BOUNDARIES = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "a", "b", "c", "d", "e", "f"];
+
+// 集計に必要な列のみ取得する（RowKeyは常に返る）
+const PRODUCTION_SELECT = [
+  "productionId", "date", "year", "groupId", "materialType",
+  "materialAmount", "charcoalProduced", "charcoalVolume", "co2Reduction",
+];
+
+interface ProductionData {
+  partitionKey: string;
+  rowKey: string;
+  productionId?: string;
+  date: string;
+  // 型付きの行は Edm.Int32 / Edm.Double（移行前の行は year なし、数値は文字列）
+  year?: number;
+  materialType: string;
+  materialAmount?: number | string;
+  charcoalProduced?: number | string;
+  charcoalVolume?: number | string;
+  co2Reduction?: number | string;
+  groupId: string;
+}
+
+interface ProductionSumData {
+  partitionKey: string;
+  rowKey: string;
+  year: string;
+  groupId: string;
+  materialAmount: number;
+  charcoalProduced: number;
+  charcoalVolume: number;
+  co2Reduction: number;
+  carbonContent: number;
+  ipccLongTerm: number;
+  createdAt: string;
+  updatedAt: string;
+}
+
+interface CalcSettings {
+  carbonContentFactors: {
+    bamboo: number;
+    pruning: number;
+    herbaceous: number;
+    other: number;
+  };
+  co2ConversionFactor: number;
+  ipccLongTermFactors: {
+    bamboo: number;
+    pruning: number;
+    herbaceous: number;
+    other: number;
+  };
+}
+
+export interface ProductionSumGroup {
+  year: string;
+  groupId: string;
+  materialType: string;
+  materialAmount: number;
+  charcoalProduced: number;
+  charcoalVolume: number;
+  co2Reduction: number;
+  carbonContent: number;
+  ipccLongTerm: number;
+}
+
+export interface ScanShard {
+  name: string;
+  filter: string;
+}
+
+export interface ShardTiming {
+  name: string;
+  entities: number;
+  durationMs: number;
+}
+
+export interface ProductionSumRebuildResult {
+  groupedData: Map<string, ProductionSumGroup>;
+  shards: ShardTiming[];
+  scanDurationMs: number;
+  entitiesScanned: number;
+}
+
+const DEFAULT_CALC_SETTINGS: CalcSettings = {
+  carbonContentFactors: {
+    bamboo: 0.8,
+    pruning: 0.8,
+    herbaceous: 0.65,
+    other: 0.8
+  },
+  co2ConversionFactor: 3.67,
+  ipccLongTermFactors: {
+    bamboo: 0.8,
+    pruning: 0.8,
+    herbaceous: 0.65,
+    other: 0.8
+  }
+};
+
+// ストリームを文字列に変換するヘルパー関数
+async function streamToString(readableStream: NodeJS.ReadableStream): Promise<string> {
+  return new Promise((resolve, reject) => {
+    const chunks: Buffer[] = [];
+    readableStream.on('data', (data) => {
+      chunks.push(data instanceof Buffer ? data : Buffer.from(data));
+    });
+    readableStream.on('end', () => {
+      resolve(Buffer.concat(chunks).toString('utf8'));
+    });
+    readableStream.on('error', reject);
+  });
+}
+
+/**
+ * calc-settingsから設定値を取得する関数（取得できない場合は既定値）
+ * @param context 実行コンテキスト
+ * @returns 計算設定
+ */
+async function loadCalcSettings(context: InvocationContext): Promise<CalcSettings> {
+  try {
+    const blobServiceClient = getShardBlobServiceClient(getPrimaryShard());
+    const containerClient = blobServiceClient.getContainerClient("calc-settings");
+    const blobClient = containerClient.getBlobClient("setting.json");
+    const downloadResponse = await blobClient.download();
+    const settingsText = await streamToString(downloadResponse.readableStreamBody!);
+    return JSON.parse(settingsText);
+  } catch (error) {
+    context.log(`Warning: Could not load calc settings, using defaults: ${error}`);
+    return DEFAULT_CALC_SETTINGS;
+  }
+}
+
+/**
+ * 境界の一覧から、重ならずに全体を覆う範囲フィルタを生成する関数
+ * @param column 範囲で分割する列（PartitionKey / RowKey）
+ * @returns 範囲名とフィルタの配列
+ */
+function buildRangeFilters(column: string): ScanShard[] {
+  const ranges: ScanShard[] = [];
+  for (let i = 0; i <= SHARD_BOUNDARIES.length; i++) {
+    const lower = i > 0 ? SHARD_BOUNDARIES[i - 1] : null;
+    const upper = i < SHARD_BOUNDARIES.length ? SHARD_BOUNDARIES[i] : null;
+    const conditions: string[] = [];
+    if (lower !== null) conditions.push(`${column} ge '${lower}'`);
+    if (upper !== null) conditions.push(`${column} lt '${upper}'`);
+    ranges.push({ name: `${column}[${lower ?? ""},${upper ?? ""})`, filter: conditions.join(" and ") });
+  }
+  return ranges;
+}
+
+/**
+ * ProductionTable の走査範囲（シャード）を生成する関数
+ * @returns シャードの配列
+ */
+export function buildProductionScanShards(): ScanShard[] {
+  const legacyPartition = `PartitionKey eq '${escapeODataValue(LEGACY_PRODUCTION_PARTITION_KEY)}'`;
+  const shards: ScanShard[] = [];
+
+  if (PRODUCTION_KEY_SCHEME !== "legacy") {
+    for (const range of buildRangeFilters("PartitionKey")) {
+      shards.push({
+        name: range.name,
+        filter: `${range.filter} and PartitionKey ne '${escapeODataValue(LEGACY_PRODUCTION_PARTITION_KEY)}'`,
+      });
+    }
+  }
+
+  if (PRODUCTION_KEY_SCHEME === "legacy" || PRODUCTION_DUAL_READ) {
+    for (const range of buildRangeFilters("RowKey")) {
+      shards.push({
+        name: `${LEGACY_PRODUCTION_PARTITION_KEY}/${range.name}`,
+        filter: `${legacyPartition} and ${range.filter}`,
+      });
+    }
+  }
+
+  return shards;
+}
+
+/**
+ * 1つのシャードを走査し、年・groupId・materialType別の部分合計を作成する関数
+ * @param client ProductionTableのTableClient
+ * @param shard シャード
+ * @param isFirst 集計対象の判定関数（重複除外とストレージアカウントの割り当ての確認、全シャードで共有）
+ * @param rollups 期間別集計の集計器（全シャードで共有、任意）
+ * @returns 部分合計と走査件数
+ */
+async function scanShard(
+  client: TableClient,
+  shard: ScanShard,
+  isFirst: (entity: ProductionData) => boolean,
+  rollups?: RollupAccumulator
+): Promise<{ partial: Map<string, ProductionSumGroup>; entities: number }> {
+  const partial = new Map<string, ProductionSumGroup>();
+  let entities = 0;
+
+  const iterator = client.listEntities<ProductionData>({
+    queryOptions: { filter: shard.filter, select: PRODUCTION_SELECT },
+  });
+
+  for await (const entity of iterator) {
+    entities++;
+    if (!entity.date || !entity.groupId || !entity.materialType) continue;
+    if (!isFirst(entity)) continue;
+    rollups?.add(entity);
+
+    // 年（year 列がない移行前の行は日付から抽出）
+    const year = entity.year ? String(entity.year) : entity.date.split('-')[0];
+    const groupKey = `${year}-${entity.groupId}-${entity.materialType}`;
+
+    let group = partial.get(groupKey);
+    if (!group) {
+      group = {
+        year,
+        groupId: entity.groupId,
+        materialType: entity.materialType,
+        materialAmount: 0,
+        charcoalProduced: 0,
+        charcoalVolume: 0,
+        co2Reduction: 0,
+        carbonContent: 0,
+        ipccLongTerm: 0
+      };
+      partial.set(groupKey, group);
+    }
+
+    group.materialAmount += toNumber(entity.materialAmount);
+    group.charcoalProduced += toNumber(entity.charcoalProduced);
+    group.charcoalVolume += toNumber(entity.charcoalVolume);
+    group.co2Reduction += toNumber(entity.co2Reduction);
+  }
+
+  return { partial, entities };
+}
+
+/**
+ * シャードの部分合計を全体の合計にマージする関数
+ * @param target 全体の合計
+ * @param partial シャードの部分合計
+ */
+function mergePartial(target: Map<string, ProductionSumGroup>, partial: Map<string, ProductionSumGroup>): void {
+  for (const [groupKey, data] of partial) {
+    const group = target.get(groupKey);
+    if (!group) {
+      target.set(groupKey, data);
+      continue;
+    }
+    group.materialAmount += data.materialAmount;
+    group.charcoalProduced += data.charcoalProduced;
+    group.charcoalVolume += data.charcoalVolume;
+    group.co2Reduction += data.co2Reduction;
+  }
+}
+
+/**
+ * ProductionTable をシャードごとに並列で走査し、年・groupId・materialType別に合計する関数
+ * @param context 実行コンテキスト
+ * @param parallelism 同時に実行するシャード数
+ * @param rollups 期間別集計の集計器（任意）
+ * @param storageShard 走査するストレージアカウント（省略時は primary）
+ * @param isOwned 行のグループがこのアカウントに割り当てられているかの判定関数（移動中のコピーを除外する）
+ * @returns 合計とシャードごとの所要時間
+ */
+export async function aggregateProductions(
+  context: InvocationContext,
+  parallelism: number = productionSumScanParallelism,
+  rollups?: RollupAccumulator,
+  storageShard: StorageShard = getPrimaryShard(),
+  isOwned: (shard: StorageShard, groupId: unknown) => boolean = () => true
+): Promise<ProductionSumRebuildResult> {
+  const productionClient = getShardTableClient(storageShard, productionTableName);
+  const shards = buildProductionScanShards();
+  // 移行期間中に旧パーティションと新パーティションの両方に存在する記録は1件として扱う
+  // （シャードは同じイベントループ上で並行に動くため、1つの判定関数を共有できる）
+  const isFirst = createProductionDeduper();
+  const accept = (entity: ProductionData) => isOwned(storageShard, entity.groupId) && isFirst(entity);
+  // ストレージアカウントが複数ある場合はログのシャード名にアカウント名を付ける
+  const prefix = isShardingEnabled() ? `${storageShard.name}:` : "";
+
+  const groupedData = new Map<string, ProductionSumGroup>();
+  const timings: ShardTiming[] = [];
+  const scanStart = performance.now();
+  let next = 0;
+
+  // 最大 parallelism 個のワーカーが残りのシャードを順に取り出して走査する
+  const workers = Array.from({ length: Math.max(1, Math.min(parallelism, shards.length)) }, async () => {
+    while (next < shards.length) {
+      const shard = shards[next++];
+      const start = performance.now();
+      const { partial, entities } = await scanShard(productionClient, shard, accept, rollups);
+      mergePartial(groupedData, partial);
+      timings.push({ name: `${prefix}${shard.name}`, entities, durationMs: Math.round(performance.now() - start) });
+    }
+  });
+  await Promise.all(workers);
+
+  const scanDurationMs = Math.round(performance.now() - scanStart);
+  const entitiesScanned = timings.reduce((sum, timing) => sum + timing.entities, 0);
+  timings.sort((a, b) => b.durationMs - a.durationMs);
+
+  context.log(`Scanned ${entitiesScanned} production entities in ${scanDurationMs}ms (${prefix}${shards.length} shards, parallelism ${parallelism})`);
+  for (const timing of timings) {
+    context.log(`Shard ${timing.name}: ${timing.entities} entities in ${timing.durationMs}ms`);
+  }
+
+  return { groupedData, shards: timings, scanDurationMs, entitiesScanned };
+}
+
+/**
+ * 1つのストレージアカウントの ProductionSumTable / ProductionRollupTable を再集計する関数（洗い替え）
+ * @param context 実行コンテキスト
+ * @param storageShard ストレージアカウント
+ * @param calcSettingsPromise 計算設定（走査と並行して取得する）
+ * @param isOwned 行のグループがこのアカウントに割り当てられているかの判定関数
+ * @param signal 中止の通知（再集計のリースを失った場合）
+ * @returns 集計結果とシャードごとの所要時間（rollupsRebuilt は期間別集計を作り直せたか）
+ */
+async function rebuildShardProductionSums(
+  context: InvocationContext,
+  storageShard: StorageShard,
+  calcSettingsPromise: Promise<CalcSettings>,
+  isOwned: (shard: StorageShard, groupId: unknown) => boolean,
+  signal?: AbortSignal
+): Promise<ProductionSumRebuildResult & { rollupsRebuilt: boolean }> {
+  // 期間別集計の行のETagを走査の前に読み、走査中に差分が加算された行を作り直しで上書きしないようにする
+  let rollupETags: RollupETags | null = null;
+  try {
+    rollupETags = await readRollupETags(storageShard);
+  } catch (error) {
+    context.warn(`Failed to read production rollups; they will not be rebuilt (${storageShard.name}): ${error}`);
+  }
+
+  // calc-settingsの取得と ProductionTable の走査は独立しているため並行して行う
+  const rollups = new RollupAccumulator();
+  const [calcSettings, aggregated] = await Promise.all([
+    calcSettingsPromise,
+    aggregateProductions(context, productionSumScanParallelism, rollups, storageShard, isOwned),
+  ]);
+  const { groupedData } = aggregated;
+
+  // リースを失った場合は、リースを取得した別の再集計と洗い替えが重ならないよう、書き込みを始める前に中止する
+  signal?.throwIfAborted();
+
+  // 各グループの計算を実行
+  for (const [groupKey, data] of groupedData) {
+    // carbonContent量の計算
+    const carbonContentFactor = calcSettings.carbonContentFactors[data.materialType as keyof typeof calcSettings.carbonContentFactors] || calcSettings.carbonContentFactors.other;
+    data.carbonContent = data.charcoalProduced * carbonContentFactor;
+
+    // co2Reduction量の計算
+    data.co2Reduction = data.carbonContent * calcSettings.co2ConversionFactor;
+
+    // ipccLongTerm量の計算
+    const ipccLongTermFactor = calcSettings.ipccLongTermFactors[data.materialType as keyof typeof calcSettings.ipccLongTermFactors] || calcSettings.ipccLongTermFactors.other;
+    data.ipccLongTerm = data.co2Reduction * ipccLongTermFactor;
+  }
+
+  // ProductionSumテーブルの作成と既存データの削除（洗い替え）
+  const productionSumClient = getShardTableClient(storageShard, productionSumTableName);
+
+  try {
+    // テーブルが存在するかチェックし、存在しない場合は作成
+    await productionSumClient.createTable();
+    context.log(`Created ProductionSumTable (${storageShard.name})`);
+  } catch (error) {
+    // テーブルが既に存在する場合は無視
+    context.log(`ProductionSumTable already exists or creation failed (${storageShard.name}): ${error}`);
+  }
+
+  try {
+    // 既存のエンティティを取得して削除
+    const existingEntities = productionSumClient.listEntities<ProductionSumData>();
+    const deletePromises: Promise<void>[] = [];
+
+    for await (const entity of existingEntities) {
+      deletePromises.push(
+        productionSumClient.deleteEntity(entity.partitionKey, entity.rowKey).then(() => {})
+      );
+    }
+
+    await Promise.all(deletePromises);
+    context.log(`Deleted ${deletePromises.length} existing entities from ProductionSumTable (${storageShard.name})`);
+  } catch (error) {
+    context.log(`Warning: Could not delete existing entities: ${error}`);
+    // テーブルが存在しない場合は無視
+  }
+
+  // 新しいデータをProductionSumテーブルに保存
+  const savePromises: Promise<void>[] = [];
+  const currentTime = new Date().toISOString();
+
+  for (const [groupKey, data] of groupedData) {
+    const productionSumData: ProductionSumData = {
+      partitionKey,
+      rowKey: groupKey,
+      year: data.year,
+      groupId: data.groupId,
+      materialAmount: data.materialAmount,
+      charcoalProduced: data.charcoalProduced,
+      charcoalVolume: data.charcoalVolume,
+      co2Reduction: data.co2Reduction,
+      carbonContent: data.carbonContent,
+      ipccLongTerm: data.ipccLongTerm,
+      createdAt: currentTime,
+      updatedAt: currentTime
+    };
+
+    savePromises.push(
+      productionSumClient.createEntity(productionSumData).then(() => {})
+    );
+  }
+
+  await Promise.all(savePromises);
+
+  context.log(`Created ${savePromises.length} production sum entities (${storageShard.name})`);
+
+  // 期間別集計を全件から作り直す（書き込み時の差分更新の誤差や取りこぼしを解消する）
+  signal?.throwIfAborted();
+  let rollupsRebuilt = false;
+  try {
+    if (rollupETags) {
+      await replaceRollups(context, rollups, rollupETags, productionSumScanParallelism, storageShard);
+      rollupsRebuilt = true;
+    }
+  } catch (error) {
+    context.warn(`Failed to rebuild production rollups (${storageShard.name}): ${error}`);
+  }
+
+  return { ...aggregated, rollupsRebuilt };
+}
+
+/**
+ * ProductionSumTable を再集計する関数（洗い替え）
+ * ストレージアカウントごとに並列で再集計し、結果をまとめて返す
+ * @param context 実行コンテキスト
+ * @param signal 中止の通知（中止された場合は書き込みの前に signal.reason を送出する）
+ * @returns 集計結果とシャードごとの所要時間
+ */
+export async function rebuildProductionSums(context: InvocationContext, signal?: AbortSignal): Promise<ProductionSumRebuildResult> {
+  const calcSettingsPromise = loadCalcSettings(context);
+  const isOwned = await createShardOwnershipFilter();
+  const results = await forEachShard((storageShard) =>
+    rebuildShardProductionSums(context, storageShard, calcSettingsPromise, isOwned, signal));
+
+  // 全シャードのロールアップを作り直せた場合のみ、レポート・ダッシュボードがロールアップを読むようにする
+  if (results.every((result) => result.rollupsRebuilt)) {
+    await markRollupsReady(context);
+  }
+
+  if (results.length === 1) {
+    return results[0];
+  }
+
+  // グループは1つのアカウントにのみ割り当てられるため、groupKey（年-groupId-材料）はアカウント間で重ならない
+  const groupedData = new Map<string, ProductionSumGroup>();
+  for (const result of results) {
+    for (const [groupKey, data] of result.groupedData) {
+      groupedData.set(groupKey, data);
+    }
+  }
+  return {
+    groupedData,
+    shards: results.flatMap((result) => result.shards).sort((a, b) => b.durationMs - a.durationMs),
+    scanDurationMs: Math.max(...results.map((result) => result.scanDurationMs)),
+    entitiesScanned: results.reduce((sum, result) => sum + result.entitiesScanned, 0),
+  };
+}
@@ -0,0 +1,239 @@
+import { InvocationContext } from "@azure/functions";
+import { BlockBlobClient } from "@azure/storage-blob";
+import { v4 as uuidv4 } from "uuid";
+import { ProductionSumRebuildResult, rebuildProductionSums } from "./productionSum";
+import { tryBumpRankingGeneration } from "./rankingSnapshot";
+import { tryBumpProductionDataGeneration } from "./dataGeneration";
+import { tryMaterializeDashboards } from "./dashboardDocuments";
+import { getPrimaryShard, getShardBlobServiceClient } from "./shardMap";
+
+/**
+ * ProductionSum 再集計の排他制御
+ *
+ * CreateProductionSum（手動実行）と CreateProductionSumTimer（毎日0:00）は同じ洗い替えを行うため、
+ * 同時に実行するとテーブルの走査・書き込みが重複し、互いの結果を上書きし合う。
+ * - 再集計の間は primary の locks/production-sum-rebuild.json にリース（60秒、20秒ごとに更新）を取得する
+ * - 同じインスタンスで実行中の場合は、新しく実行せずにその再集計の結果を待つ
+ * - 別のインスタンスがリースを持っている場合は実行せず、Blobに記録された実行状況を返す（HTTPは202）
+ * - リースの更新に失敗し、リースを失った（別の実行に取られた・期間が切れる）場合は AbortSignal で再集計を中止し、
+ *   洗い替えの書き込みを始めない（実行状況は lostLease）
+ * - 実行状況（running / succeeded / failed / lostLease、開始・終了日時、グループ数）はリースを持つ実行がBlobに書き込む
+ *   リースがないのに running のままの記録は、途中で止まった実行（interrupted）として返す
+ */
+
+const LOCK_CONTAINER_NAME = "locks";
+const LOCK_BLOB_NAME = "production-sum-rebuild.json";
+
+// リースの期間（秒）と更新間隔（期間内に2回更新できなくてもリースが切れないようにする）
+const LEASE_DURATION_SECONDS = 60;
+const LEASE_RENEW_INTERVAL_MS = 20 * 1000;
+
+// 実行中の場合に返す Retry-After（秒）
+export const REBUILD_RETRY_AFTER_SECONDS = 30;
+
+export interface ProductionSumRebuildStatus {
+  state: "running" | "succeeded" | "failed" | "lostLease" | "interrupted";
+  runId: string;
+  // 実行した関数名（CreateProductionSum / CreateProductionSumTimer）
+  trigger: string;
+  startedAt: string;
+  finishedAt?: string;
+  durationMs?: number;
+  totalGroups?: number;
+  entitiesScanned?: number;
+  error?: string;
+}
+
+export type ProductionSumRebuildOutcome =
+  // このインスタンスで実行した（joined の場合は実行中の再集計の結果を待った）
+  | { kind: "completed"; joined: boolean; result: ProductionSumRebuildResult; status: ProductionSumRebuildStatus }
+  // 別のインスタンスで実行中
+  | { kind: "busy"; status: ProductionSumRebuildStatus | null };
+
+/**
+ * 再集計中にリースを失ったため中止した場合のエラー
+ */
+export class ProductionSumLeaseLostError extends Error {
+  constructor(public readonly status: ProductionSumRebuildStatus) {
+    super(`Production sum rebuild lost its lease and was aborted: ${status.error ?? "unknown"}`);
+    this.name = "ProductionSumLeaseLostError";
+  }
+}
+
+let running: Promise<ProductionSumRebuildOutcome> | null = null;
+let lockBlobReady: Promise<BlockBlobClient> | null = null;
+
+/**
+ * ロック用のBlobを取得する関数（コンテナとBlobがなければ作成する）
+ */
+function getLockBlob(): Promise<BlockBlobClient> {
+  if (!lockBlobReady) {
+    lockBlobReady = (async () => {
+      const container = getShardBlobServiceClient(getPrimaryShard()).getContainerClient(LOCK_CONTAINER_NAME);
+      await container.createIfNotExists();
+      const blob = container.getBlockBlobClient(LOCK_BLOB_NAME);
+      try {
+        await blob.upload("{}", 2, { conditions: { ifNoneMatch: "*" } });
+      } catch (error: any) {
+        // 既に存在する（409）・リース中（412）の場合はそのまま使う
+        if (error?.statusCode !== 409 && error?.statusCode !== 412) {
+          throw error;
+        }
+      }
+      return blob;
+    })();
+    lockBlobReady.catch(() => {
+      lockBlobReady = null;
+    });
+  }
+  return lockBlobReady;
+}
+
+async function writeStatus(blob: BlockBlobClient, status: ProductionSumRebuildStatus, leaseId: string): Promise<void> {
+  const body = JSON.stringify(status);
+  await blob.upload(body, Buffer.byteLength(body), {
+    conditions: { leaseId },
+    blobHTTPHeaders: { blobContentType: "application/json" },
+  });
+}
+
+/**
+ * 再集計の実行状況を取得する関数
+ * @returns 実行状況（一度も実行されていない場合はnull）
+ */
+export async function getProductionSumRebuildStatus(): Promise<ProductionSumRebuildStatus | null> {
+  const blob = await getLockBlob();
+  const response = await blob.download();
+  const chunks: Buffer[] = [];
+  for await (const chunk of response.readableStreamBody!) {
+    chunks.push(chunk instanceof Buffer ? chunk : Buffer.from(chunk));
+  }
+  const status = JSON.parse(Buffer.concat(chunks).toString("utf8") || "{}") as Partial<ProductionSumRebuildStatus>;
+  if (!status.runId) {
+    return null;
+  }
+  if (status.state === "running" && response.leaseState !== "leased") {
+    return { ...(status as ProductionSumRebuildStatus), state: "interrupted" };
+  }
+  return status as ProductionSumRebuildStatus;
+}
+
+/**
+ * リースを取得して再集計を実行する
+ */
+async function runWithLease(context: InvocationContext, trigger: string): Promise<ProductionSumRebuildOutcome> {
+  const blob = await getLockBlob();
+  const lease = blob.getBlobLeaseClient();
+  try {
+    await lease.acquireLease(LEASE_DURATION_SECONDS);
+  } catch (error: any) {
+    if (error?.statusCode === 409) {
+      context.log(`Production sum rebuild is running on another instance; skipped (${trigger})`);
+      return { kind: "busy", status: await getProductionSumRebuildStatus().catch(() => null) };
+    }
+    throw error;
+  }
+
+  const startedAt = Date.now();
+  const status: ProductionSumRebuildStatus = {
+    state: "running",
+    runId: uuidv4(),
+    trigger,
+    startedAt: new Date(startedAt).toISOString(),
+  };
+  const abortController = new AbortController();
+  let renewedAt = startedAt;
+  const renewTimer = setInterval(() => {
+    lease.renewLease().then(() => {
+      renewedAt = Date.now();
+    }).catch((error) => {
+      // 別の実行に取られた（409 / 412）か、次の更新の前にリースの期間が切れる場合は、リースを失ったものとして中止する
+      const expiresBeforeNextRenew = Date.now() + LEASE_RENEW_INTERVAL_MS - renewedAt >= LEASE_DURATION_SECONDS * 1000;
+      if (error?.statusCode === 409 || error?.statusCode === 412 || expiresBeforeNextRenew) {
+        context.error(`Lost production sum rebuild lease; aborting: ${error}`);
+        abortController.abort(new Error(`Failed to renew lease: ${error?.message ?? error}`));
+      } else {
+        context.warn(`Failed to renew production sum rebuild lease (will retry): ${error}`);
+      }
+    });
+  }, LEASE_RENEW_INTERVAL_MS);
+
+  const finish = async (finished: ProductionSumRebuildStatus) => {
+    try {
+      await writeStatus(blob, finished, lease.leaseId);
+    } catch (error) {
+      context.warn(`Failed to record production sum rebuild status: ${error}`);
+    }
+  };
+
+  try {
+    await writeStatus(blob, status, lease.leaseId);
+
+    // ProductionTableをキー範囲ごとに並列で走査して再集計し、ProductionSumTableを洗い替え
+    const result = await rebuildProductionSums(context, abortController.signal);
+
+    // 世代スタンプの更新とダッシュボードの作り直しは、リースを取得した実行に任せる
+    abortController.signal.throwIfAborted();
+
+    // 再集計の完了を世代スタンプに記録し、ランキングのスナップショットを再読み込みさせる
+    await tryBumpRankingGeneration(context, trigger);
+    await tryBumpProductionDataGeneration(context, trigger);
+
+    // 生産記録のある全グループのダッシュボードを作り直す（今月・今年の値を最新にする）
+    await tryMaterializeDashboards(context, Array.from(result.groupedData.values(), (data) => data.groupId));
+    abortController.signal.throwIfAborted();
+
+    const succeeded: ProductionSumRebuildStatus = {
+      ...status,
+      state: "succeeded",
+      finishedAt: new Date().toISOString(),
+      durationMs: Date.now() - startedAt,
+      totalGroups: result.groupedData.size,
+      entitiesScanned: result.entitiesScanned,
+    };
+    await finish(succeeded);
+    return { kind: "completed", joined: false, result, status: succeeded };
+  } catch (error) {
+    const lostLease = abortController.signal.aborted;
+    const failed: ProductionSumRebuildStatus = {
+      ...status,
+      state: lostLease ? "lostLease" : "failed",
+      finishedAt: new Date().toISOString(),
+      durationMs: Date.now() - startedAt,
+      error: error instanceof Error ? error.message : String(error),
+    };
+    // リースを失った場合はリースIDを条件にした書き込みが失敗することがある（Blobには running のまま残り、interrupted として返る）
+    await finish(failed);
+    throw lostLease ? new ProductionSumLeaseLostError(failed) : error;
+  } finally {
+    clearInterval(renewTimer);
+    try {
+      await lease.releaseLease();
+    } catch (error) {
+      // 解放できなくてもリースは期間が過ぎれば切れる
+      context.warn(`Failed to release production sum rebuild lease: ${error}`);
+    }
+  }
+}
+
+/**
+ * ProductionSum を再集計する関数（同時に1つのみ実行する）
+ * 再集計後にランキングの世代スタンプを更新し、全グループのダッシュボードを作り直す
+ * @param context 実行コンテキスト
+ * @param trigger 実行した関数名（ログ・実行状況に記録する）
+ * @returns 実行結果（別のインスタンスで実行中の場合は busy）
+ */
+export async function runProductionSumRebuild(context: InvocationContext, trigger: string): Promise<ProductionSumRebuildOutcome> {
+  if (running) {
+    context.log(`Joining the running production sum rebuild (${trigger})`);
+    const outcome = await running;
+    return outcome.kind === "completed" ? { ...outcome, joined: true } : outcome;
+  }
+
+  running = runWithLease(context, trigger);
+  try {
+    return await running;
+  } finally {
+    running = null;
+  }
+}
@@ -0,0 +1,321 @@
+import { TableClient, TableTransaction } from "@azure/data-tables";
+import { v4 as uuidv4 } from "uuid";
+import { createProductionKeys } from "./productionKeys";
+import { toProductionEntity } from "./productionColumns";
+import { getShardTableClient, resolveGroupShardForWrite, StorageShard } from "./shardMap";
+
+/**
+ * 生産記録の作成（1件・一括）
+ *
+ * - 入力の検証と保存するエンティティの作成は CreateProduction と CreateProductions（一括）で共有する
+ * - 一括作成はストレージアカウント・パーティションごとに最大100件のトランザクション（$batch）で書き込む
+ * - 1件の作成は、短い時間（PRODUCTION_WRITE_COALESCE_MS、既定値5ミリ秒）に同じパーティションへ届いた書き込みを
+ *   1回のトランザクションにまとめる（インスタンス内、0で無効）
+ * - トランザクションが失敗した場合は1件ずつ書き込み直し、失敗した記録のみエラーとする
+ *   （RowKey に新しい uuid を含むため、書き直しで 409 になる記録は失敗したトランザクションで既に書き込まれたもの）
+ */
+
+const productionTableName = "ProductionTable";
+
+// エンティティグループトランザクションの上限件数
+const MAX_BATCH_SIZE = 100;
+
+// 1件の作成をまとめる時間（ミリ秒）
+export const PRODUCTION_WRITE_COALESCE_MS = parseInt(process.env.PRODUCTION_WRITE_COALESCE_MS ?? "5") || 0;
+
+// 一括作成で同時に送信するトランザクション数
+const BULK_WRITE_PARALLELISM = 8;
+
+export interface ProductionInput {
+  date: string;
+  materialType: string;
+  materialAmount?: number;
+  charcoalProduced?: number;
+  charcoalVolume?: number;
+  charcoalScale?: string;
+  charcoalScaleInput?: number;
+  inputMethod?: string;
+  extinguishingMethod: string;
+  co2Reduction?: number;
+  batchNumber?: string;
+  notes?: string;
+  photoUrl?: string;
+  userId: string;
+  groupId: string;
+}
+
+export interface ProductionRecord {
+  partitionKey: string;
+  rowKey: string;
+  productionId: string;
+  date: string;
+  materialType: string;
+  materialAmount: number | null;
+  charcoalProduced: number | null;
+  charcoalVolume: number | null;
+  charcoalScale: string | null;
+  charcoalScaleInput: number | null;
+  inputMethod: string | null;
+  extinguishingMethod: string;
+  co2Reduction: number | null;
+  batchNumber: string | null;
+  notes: string | null;
+  photoUrl: string | null;
+  userId: string;
+  groupId: string;
+  createdAt: string;
+  updatedAt: string | null;
+}
+
+export interface ProductionWriteResult {
+  production: ProductionRecord;
+  // 書き込みに失敗した場合のエラー（移動中のグループは ShardMovingError）
+  error?: unknown;
+}
+
+// 生産日の形式（YYYY-MM-DD）
+const PRODUCTION_DATE_PATTERN = /^(\d{4})-(\d{2})-(\d{2})$/;
+
+// 数値で受け付ける列（省略・null は可）
+const NUMERIC_INPUT_FIELDS = ["materialAmount", "charcoalProduced", "charcoalVolume", "charcoalScaleInput", "co2Reduction"] as const;
+
+/**
+ * YYYY-MM-DD 形式の実在する日付かどうかを判定する関数（2025-02-30 などは不可）
+ * @param value 生産日
+ */
+function isValidProductionDate(value: unknown): boolean {
+  const match = typeof value === "string" ? PRODUCTION_DATE_PATTERN.exec(value) : null;
+  if (!match) return false;
+  const date = new Date(Date.UTC(Number(match[1]), Number(match[2]) - 1, Number(match[3])));
+  return date.toISOString().startsWith(value as string);
+}
+
+/**
+ * 生産記録の入力を検証する関数
+ * 必須項目、生産日（YYYY-MM-DD の実在する日付）、数値列（有限の数値）を確認する
+ * （生産日はキーとロールアップの期間に、数値列は集計に使うため、不正な値を保存しない）
+ * @param input リクエストの生産記録
+ * @returns エラーメッセージ（問題がない場合はnull）
+ */
+export function validateProductionInput(input: unknown): string | null {
+  if (!input || typeof input !== "object" || Array.isArray(input)) {
+    return "Invalid production";
+  }
+  const { date, materialType, extinguishingMethod, userId, groupId } = input as Partial<ProductionInput>;
+  if (!date || !materialType || !extinguishingMethod || !userId || !groupId) {
+    return "Missing required fields";
+  }
+  if (!isValidProductionDate(date)) {
+    return "date must be a valid date in YYYY-MM-DD format";
+  }
+  for (const field of NUMERIC_INPUT_FIELDS) {
+    const value = (input as Record<string, unknown>)[field];
+    if (value !== undefined && value !== null && !(typeof value === "number" && Number.isFinite(value))) {
+      return `${field} must be a finite number`;
+    }
+  }
+  return null;
+}
+
+/**
+ * 検証済みの入力から保存する生産記録を作成する関数
+ * PartitionKey = groupId（設定により groupId_年）、RowKey = 生産日_uuid
+ * @param input 検証済みの生産記録
+ * @returns 生産記録
+ */
+export function createProductionRecord(input: ProductionInput): ProductionRecord {
+  const productionId = uuidv4();
+  const { partitionKey, rowKey } = createProductionKeys(input.groupId, input.date, productionId);
+  return {
+    partitionKey,
+    rowKey,
+    productionId,
+    date: input.date,
+    materialType: input.materialType,
+    materialAmount: input.materialAmount ?? null,
+    charcoalProduced: input.charcoalProduced ?? null,
+    charcoalVolume: input.charcoalVolume ?? null,
+    charcoalScale: input.charcoalScale || null,
+    charcoalScaleInput: input.charcoalScaleInput ?? null,
+    inputMethod: input.inputMethod || null,
+    extinguishingMethod: input.extinguishingMethod,
+    co2Reduction: input.co2Reduction ?? null,
+    batchNumber: input.batchNumber || null,
+    notes: input.notes || null,
+    photoUrl: input.photoUrl || null,
+    userId: input.userId,
+    groupId: input.groupId,
+    createdAt: new Date().toISOString(),
+    updatedAt: null,
+  };
+}
+
+/**
+ * 同じパーティションの生産記録（100件以下）を1回のトランザクションで作成する関数
+ * @returns 記録ごとのエラー（成功した記録は undefined）
+ */
+async function insertChunk(client: TableClient, productions: ProductionRecord[]): Promise<unknown[]> {
+  const transaction = new TableTransaction();
+  for (const production of productions) {
+    // 数値列は Edm.Double、生産日から year / yearMonth 列を付与して保存
+    transaction.createEntity(toProductionEntity(production));
+  }
+  try {
+    await client.submitTransaction(transaction.actions);
+    return productions.map(() => undefined);
+  } catch (error) {
+    if (productions.length === 1) {
+      return [error];
+    }
+  }
+
+  // トランザクションは全件失敗するため、1件ずつ書き込み直して失敗した記録を特定する
+  return Promise.all(productions.map(async (production) => {
+    try {
+      await client.createEntity(toProductionEntity(production));
+      return undefined;
+    } catch (error: any) {
+      return error?.statusCode === 409 ? undefined : error;
+    }
+  }));
+}
+
+/**
+ * 生産記録をまとめて作成する関数
+ * グループのストレージアカウント・パーティションごとに100件単位のトランザクションで並列に書き込む
+ * @param productions createProductionRecord で作成した生産記録
+ * @returns 記録ごとの結果（入力と同じ順）
+ */
+export async function insertProductions(productions: ProductionRecord[]): Promise<ProductionWriteResult[]> {
+  const results: ProductionWriteResult[] = productions.map((production) => ({ production }));
+
+  // グループごとに書き込み先を解決する（移動中のグループの記録はエラー）
+  const shards = new Map<string, Promise<StorageShard>>();
+  const resolved = await Promise.all(productions.map(async (production) => {
+    let shard = shards.get(production.groupId);
+    if (!shard) {
+      shard = resolveGroupShardForWrite(production.groupId);
+      shards.set(production.groupId, shard);
+    }
+    try {
+      return await shard;
+    } catch (error) {
+      return error instanceof Error ? error : new Error(String(error));
+    }
+  }));
+
+  const partitions = new Map<string, { shard: StorageShard; indexes: number[] }>();
+  resolved.forEach((shard, index) => {
+    if (shard instanceof Error) {
+      results[index].error = shard;
+      return;
+    }
+    const key = `${shard.name}\u0000${productions[index].partitionKey}`;
+    const partition = partitions.get(key) ?? { shard, indexes: [] };
+    partition.indexes.push(index);
+    partitions.set(key, partition);
+  });
+
+  const chunks: Array<{ shard: StorageShard; indexes: number[] }> = [];
+  for (const { shard, indexes } of partitions.values()) {
+    for (let i = 0; i < indexes.length; i += MAX_BATCH_SIZE) {
+      chunks.push({ shard, indexes: indexes.slice(i, i + MAX_BATCH_SIZE) });
+    }
+  }
+
+  let next = 0;
+  const workers = Array.from({ length: Math.min(BULK_WRITE_PARALLELISM, chunks.length) }, async () => {
+    while (next < chunks.length) {
+      const { shard, indexes } = chunks[next++];
+      const client = getShardTableClient(shard, productionTableName);
+      const errors = await insertChunk(client, indexes.map((index) => productions[index]));
+      indexes.forEach((index, i) => {
+        if (errors[i] !== undefined) {
+          results[index].error = errors[i];
+        }
+      });
+    }
+  });
+  await Promise.all(workers);
+  return results;
+}
+
+// ---------------------------------------------------------------------------
+// 1件の作成のまとめ書き
+// ---------------------------------------------------------------------------
+
+interface PendingWrite {
+  production: ProductionRecord;
+  resolve: () => void;
+  reject: (error: unknown) => void;
+}
+
+interface PendingBatch {
+  shard: StorageShard;
+  writes: PendingWrite[];
+  timer: NodeJS.Timeout;
+}
+
+// シャード名 + PartitionKey -> 送信待ちの書き込み
+const pendingBatches = new Map<string, PendingBatch>();
+
+const coalesceStats = {
+  writes: 0,
+  transactions: 0,
+};
+
+function flushBatch(key: string): void {
+  const batch = pendingBatches.get(key);
+  if (!batch) return;
+  pendingBatches.delete(key);
+  clearTimeout(batch.timer);
+  coalesceStats.transactions++;
+
+  const client = getShardTableClient(batch.shard, productionTableName);
+  insertChunk(client, batch.writes.map((write) => write.production)).then(
+    (errors) => batch.writes.forEach((write, i) => (errors[i] === undefined ? write.resolve() : write.reject(errors[i]))),
+    (error) => batch.writes.forEach((write) => write.reject(error))
+  );
+}
+
+/**
+ * 生産記録を1件作成する関数
+ * PRODUCTION_WRITE_COALESCE_MS の間に同じパーティションへ届いた書き込みは1回のトランザクションで送信する
+ * @param production createProductionRecord で作成した生産記録
+ * @throws ShardMovingError グループが移動中の場合
+ */
+export async function insertProduction(production: ProductionRecord): Promise<void> {
+  // グループに割り当てられたストレージアカウントに保存する（移動中のグループは ShardMovingError）
+  const shard = await resolveGroupShardForWrite(production.groupId);
+  coalesceStats.writes++;
+
+  if (PRODUCTION_WRITE_COALESCE_MS <= 0) {
+    coalesceStats.transactions++;
+    await getShardTableClient(shard, productionTableName).createEntity(toProductionEntity(production));
+    return;
+  }
+
+  const key = `${shard.name}\u0000${production.partitionKey}`;
+  return new Promise<void>((resolve, reject) => {
+    let batch = pendingBatches.get(key);
+    if (!batch) {
+      batch = { shard, writes: [], timer: setTimeout(() => flushBatch(key), PRODUCTION_WRITE_COALESCE_MS) };
+      pendingBatches.set(key, batch);
+    }
+    batch.writes.push({ production, resolve, reject });
+    if (batch.writes.length >= MAX_BATCH_SIZE) {
+      flushBatch(key);
+    }
+  });
+}
+
+/**
+ * 1件の作成の書き込み数・トランザクション数を取得する関数（メトリクスAPI用）
+ */
+export function getProductionWriteStats() {
+  return {
+    ...coalesceStats,
+    pendingBatches: pendingBatches.size,
+    coalesceMs: PRODUCTION_WRITE_COALESCE_MS,
+  };
+}
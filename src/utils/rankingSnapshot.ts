@@ -0,0 +1,191 @@
+import { InvocationContext } from "@azure/functions";
+import { createTableClient } from "./tableClient";
+import { v4 as uuidv4 } from "uuid";
+import { createShardOwnershipFilter, forEachShard, getShardTableClient } from "./shardMap";
+
+const connectionString = process.env.AzureWebJobsStorage!;
+const productionSumTableName = "ProductionSumTable";
+const groupTableName = "GroupsTable";
+
+// 集計データの世代スタンプ（ProductionSumの再集計やグループ変更のたびに更新される）
+const metaTableName = "ProductionSumMetaTable";
+const metaPartitionKey = "Meta";
+const generationRowKey = "generation";
+
+// 世代スタンプを確認する間隔（この間はスタンプを読まずにスナップショットを使う）
+const GENERATION_CHECK_INTERVAL_MS = 10 * 1000;
+// 世代スタンプが存在しない場合でも、この時間を過ぎたらスナップショットを再読み込みする
+const MAX_SNAPSHOT_AGE_MS = 10 * 60 * 1000;
+
+export interface GroupYearTotals {
+  charcoalProduced: number;
+  charcoalVolume: number;
+  co2Reduction: number;
+  ipccLongTerm: number;
+}
+
+export interface GroupInfo {
+  name: string;
+  introductionPdfUrl?: string | null;
+}
+
+export interface RankingSnapshot {
+  generation: string | null;
+  loadedAt: number;
+  groups: Map<string, GroupInfo>;
+  // groupId -> 年 -> 年間合計
+  totals: Map<string, Map<number, GroupYearTotals>>;
+}
+
+let snapshot: RankingSnapshot | null = null;
+let lastGenerationCheck = 0;
+let loading: Promise<RankingSnapshot> | null = null;
+
+/**
+ * 世代スタンプを取得する関数
+ * @returns 世代スタンプ（未作成の場合はnull）
+ */
+async function readGeneration(): Promise<string | null> {
+  const client = createTableClient(connectionString, metaTableName);
+  try {
+    const entity = await client.getEntity<{ generation: string }>(metaPartitionKey, generationRowKey);
+    return entity.generation ?? null;
+  } catch (error: any) {
+    if (error?.statusCode === 404) {
+      return null;
+    }
+    throw error;
+  }
+}
+
+/**
+ * 集計データの世代スタンプを更新する関数
+ * ProductionSumTable の再集計後やグループ情報の変更後に呼び出し、各インスタンスのスナップショットを無効化する
+ * @param context 実行コンテキスト
+ * @param reason 更新理由（ログ用）
+ */
+export async function bumpRankingGeneration(context: InvocationContext, reason: string): Promise<void> {
+  const client = createTableClient(connectionString, metaTableName);
+  const generation = `${new Date().toISOString()}_${uuidv4()}`;
+  try {
+    await client.createTable();
+  } catch {
+    // 既に存在する場合は無視
+  }
+  await client.upsertEntity({
+    partitionKey: metaPartitionKey,
+    rowKey: generationRowKey,
+    generation,
+    reason,
+    updatedAt: new Date().toISOString(),
+  }, "Replace");
+  context.log(`Ranking generation updated (${reason}): ${generation}`);
+}
+
+/**
+ * 世代スタンプの更新に失敗しても元の処理を失敗させないためのラッパー
+ * @param context 実行コンテキスト
+ * @param reason 更新理由（ログ用）
+ */
+export async function tryBumpRankingGeneration(context: InvocationContext, reason: string): Promise<void> {
+  try {
+    await bumpRankingGeneration(context, reason);
+  } catch (error) {
+    context.warn(`Failed to update ranking generation (${reason}): ${error}`);
+  }
+}
+
+/**
+ * GroupsTable と（全ストレージアカウントの）ProductionSumTable を読み込み、グループ別・年別の合計を作成する関数
+ * @param generation 読み込み時点の世代スタンプ
+ * @returns スナップショット
+ */
+async function loadSnapshot(generation: string | null): Promise<RankingSnapshot> {
+  const groupClient = createTableClient(connectionString, groupTableName);
+  const isOwned = await createShardOwnershipFilter();
+
+  const groups = new Map<string, GroupInfo>();
+  const totals = new Map<string, Map<number, GroupYearTotals>>();
+
+  await Promise.all([
+    (async () => {
+      for await (const group of groupClient.listEntities()) {
+        groups.set(group.rowKey as string, {
+          name: group.name as string,
+          introductionPdfUrl: group.introductionPdfUrl as string | null | undefined,
+        });
+      }
+    })(),
+    // ProductionSumTable はストレージアカウントごとにあるため並列に読み込んで合計する
+    forEachShard(async (shard) => {
+      const productionSumClient = getShardTableClient(shard, productionSumTableName);
+      const entities = productionSumClient.listEntities<Record<string, any>>({
+        queryOptions: {
+          select: ["groupId", "year", "charcoalProduced", "charcoalVolume", "co2Reduction", "ipccLongTerm"],
+        },
+      });
+      for await (const entity of entities) {
+        const groupId = entity.groupId as string;
+        const year = parseInt(entity.year);
+        if (!groupId || isNaN(year)) continue;
+        // 移動中のグループのコピーを二重に数えない
+        if (!isOwned(shard, groupId)) continue;
+
+        let years = totals.get(groupId);
+        if (!years) {
+          years = new Map();
+          totals.set(groupId, years);
+        }
+        let yearTotals = years.get(year);
+        if (!yearTotals) {
+          yearTotals = { charcoalProduced: 0, charcoalVolume: 0, co2Reduction: 0, ipccLongTerm: 0 };
+          years.set(year, yearTotals);
+        }
+        yearTotals.charcoalProduced += entity.charcoalProduced || 0;
+        yearTotals.charcoalVolume += entity.charcoalVolume || 0;
+        yearTotals.co2Reduction += entity.co2Reduction || 0;
+        yearTotals.ipccLongTerm += entity.ipccLongTerm || 0;
+      }
+    }),
+  ]);
+
+  return { generation, loadedAt: Date.now(), groups, totals };
+}
+
+/**
+ * ランキング用のスナップショットを取得する関数（インスタンス内で共有）
+ * 世代スタンプが変わった場合のみ再読み込みし、同時に来たリクエストは1回の読み込みを共有する
+ * @param context 実行コンテキスト
+ * @returns スナップショット
+ */
+export async function getRankingSnapshot(context: InvocationContext): Promise<RankingSnapshot> {
+  const now = Date.now();
+  if (snapshot && now - lastGenerationCheck < GENERATION_CHECK_INTERVAL_MS) {
+    return snapshot;
+  }
+
+  if (loading) {
+    return loading;
+  }
+
+  loading = (async () => {
+    const generation = await readGeneration();
+    lastGenerationCheck = Date.now();
+
+    const isStale = !snapshot
+      || snapshot.generation !== generation
+      || (generation === null && Date.now() - snapshot.loadedAt > MAX_SNAPSHOT_AGE_MS);
+
+    if (isStale) {
+      context.log(`Reloading ranking snapshot (generation: ${generation ?? "none"})`);
+      snapshot = await loadSnapshot(generation);
+    }
+    return snapshot!;
+  })();
+
+  try {
+    return await loading;
+  } finally {
+    loading = null;
+  }
+}
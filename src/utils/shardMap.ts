@@ -0,0 +1,448 @@
+import { HttpResponseInit } from "@azure/functions";
+import { TableClient, TableEntityResult } from "@azure/data-tables";
+import { createTableClient } from "./tableClient";
+import { BlobServiceClient } from "@azure/storage-blob";
+import { productionShardPlacement, productionShards } from "../config";
+import { findProductionById } from "./productionKeys";
+
+/**
+ * 生産データのシャーディング（グループ → ストレージアカウント）
+ *
+ * 生産記録（ProductionTable）・期間別集計（ProductionRollupTable）・年別合計（ProductionSumTable）・
+ * ダッシュボードのドキュメント（dashboards コンテナ）は、グループごとに割り当てたストレージアカウント（シャード）に保存する。
+ * - シャードは設定（productionShards / PRODUCTION_SHARDS）で定義し、接続文字列はアプリ設定名で参照する
+ *   既定のアカウント（AzureWebJobsStorage）は常に primary として含まれる
+ * - グループの割り当ては primary の ShardMapTable に保持する
+ *   PartitionKey = "ShardMap"、RowKey = groupId、shard = シャード名、status = active / moving
+ * - 割り当てのないグループは primary に置く（シャーディング導入前のデータはそのまま読める）
+ * - 割り当てはインスタンスごとにキャッシュし、SHARD_MAP_REFRESH_MS（既定値30秒）ごとに読み直す
+ *   キャッシュにないグループ（他のインスタンスで作成された直後など）は、primary にフォールバックする前にその行をポイント読み取りする
+ * - 移動中（moving）のグループへの書き込みは ShardMovingError とし、APIは503を返す
+ *   （scripts/migration/move_group_shard.py が moving にしてから、キャッシュの有効期限が過ぎるのを待ってコピーする）
+ * グループ・ユーザーなど生産データ以外のテーブルと calc-settings は primary のまま。
+ * シャードが primary のみの場合は ShardMapTable を読まない。
+ */
+
+export const PRIMARY_SHARD_NAME = "primary";
+export const SHARD_MAP_TABLE_NAME = "ShardMapTable";
+export const SHARD_MAP_PARTITION_KEY = "ShardMap";
+
+// 割り当てを読み直す間隔（ミリ秒）
+export const SHARD_MAP_REFRESH_MS = parseInt(process.env.SHARD_MAP_REFRESH_MS || "30000") || 30000;
+
+// 移動中のグループへの書き込みに返す Retry-After（秒）
+const MOVING_RETRY_AFTER_SECONDS = 30;
+
+export interface StorageShard {
+  name: string;
+  connectionString: string;
+}
+
+export type ShardStatus = "active" | "moving";
+
+export interface ShardAssignment {
+  shard: string;
+  status: ShardStatus;
+}
+
+/**
+ * 移動中のグループに書き込もうとした場合のエラー
+ */
+export class ShardMovingError extends Error {
+  constructor(public readonly groupId: string) {
+    super(`Group ${groupId} is being moved to another shard`);
+    this.name = "ShardMovingError";
+  }
+}
+
+function loadShards(): StorageShard[] {
+  const shards: StorageShard[] = [{ name: PRIMARY_SHARD_NAME, connectionString: process.env.AzureWebJobsStorage! }];
+  for (const [name, setting] of Object.entries(productionShards)) {
+    if (name === PRIMARY_SHARD_NAME) continue;
+    const connectionString = process.env[setting];
+    if (!connectionString) {
+      // 接続文字列がないシャードに割り当てたグループは読み書きできないため、起動時に気付けるようにする
+      throw new Error(`Connection string setting ${setting} for production shard ${name} is not set`);
+    }
+    shards.push({ name, connectionString });
+  }
+  return shards;
+}
+
+const shards = loadShards();
+const shardsByName = new Map(shards.map((shard) => [shard.name, shard]));
+const placementShards = productionShardPlacement.length > 0
+  ? productionShardPlacement.map((name) => getShard(name))
+  : shards;
+
+// キャッシュした割り当て（observedAt は行を読んだ時刻。一覧の読み直しより後に得た割り当てを上書きしないために使う）
+interface CachedAssignment extends ShardAssignment {
+  observedAt: number;
+}
+
+let assignments = new Map<string, CachedAssignment>();
+// ポイント読み取りで割り当てがないことを確認したグループ（groupId → 確認した時刻）
+let unassigned = new Map<string, number>();
+let loadedAt = 0;
+let loading: Promise<Map<string, CachedAssignment>> | null = null;
+
+const stats = {
+  reloads: 0,
+  pointReads: 0,
+  movingRejections: 0,
+};
+
+/**
+ * シャードの一覧を取得する関数（先頭は primary）
+ */
+export function listShards(): StorageShard[] {
+  return shards;
+}
+
+/**
+ * primary 以外のシャードが設定されているかを返す関数
+ */
+export function isShardingEnabled(): boolean {
+  return shards.length > 1;
+}
+
+/**
+ * 名前からシャードを取得する関数
+ * @param name シャード名
+ * @returns シャード（設定にない名前の場合は例外）
+ */
+export function getShard(name: string): StorageShard {
+  const shard = shardsByName.get(name);
+  if (!shard) {
+    throw new Error(`Unknown production shard: ${name}`);
+  }
+  return shard;
+}
+
+export function getPrimaryShard(): StorageShard {
+  return shards[0];
+}
+
+/**
+ * シャードのテーブルのクライアントを取得する関数
+ * @param shard シャード
+ * @param tableName テーブル名
+ * @returns TableClient
+ */
+export function getShardTableClient(shard: StorageShard, tableName: string): TableClient {
+  return createTableClient(shard.connectionString, tableName);
+}
+
+/**
+ * シャードのBlobサービスのクライアントを取得する関数
+ * @param shard シャード
+ * @returns BlobServiceClient
+ */
+export function getShardBlobServiceClient(shard: StorageShard): BlobServiceClient {
+  return BlobServiceClient.fromConnectionString(shard.connectionString);
+}
+
+function getShardMapClient(): TableClient {
+  return getShardTableClient(getPrimaryShard(), SHARD_MAP_TABLE_NAME);
+}
+
+/**
+ * ShardMapTable の行を割り当てに変換する関数
+ * @param entity ShardMapTable の行
+ * @param observedAt 行を読んだ時刻
+ * @returns 割り当て（設定にないシャードの場合は例外）
+ */
+function toAssignment(entity: { rowKey?: string; shard: string; status?: string }, observedAt: number): CachedAssignment {
+  if (!shardsByName.has(entity.shard)) {
+    // 設定にないシャードへの割り当ては読み書きできないため、primary にフォールバックせずにエラーとする
+    throw new Error(`Group ${entity.rowKey} is assigned to unknown production shard: ${entity.shard}`);
+  }
+  return { shard: entity.shard, status: entity.status === "moving" ? "moving" : "active", observedAt };
+}
+
+/**
+ * ShardMapTable を読み込む関数（テーブルがない場合は空）
+ * @param observedAt 読み込みを開始した時刻
+ */
+async function readAssignments(observedAt: number): Promise<Map<string, CachedAssignment>> {
+  const client = getShardMapClient();
+  const result = new Map<string, CachedAssignment>();
+  try {
+    const entities = client.listEntities<{ shard: string; status?: string }>({
+      queryOptions: { filter: `PartitionKey eq '${SHARD_MAP_PARTITION_KEY}'`, select: ["RowKey", "shard", "status"] },
+    });
+    for await (const entity of entities) {
+      result.set(entity.rowKey!, toAssignment(entity, observedAt));
+    }
+  } catch (error: any) {
+    if (error?.statusCode !== 404) {
+      throw error;
+    }
+  }
+  return result;
+}
+
+/**
+ * グループの割り当ての一覧を取得する関数（インスタンス内でキャッシュし、同時に来た読み込みは共有する）
+ * @returns groupId → 割り当て
+ */
+async function getAssignments(): Promise<Map<string, CachedAssignment>> {
+  if (!isShardingEnabled()) {
+    return assignments;
+  }
+  if (Date.now() - loadedAt < SHARD_MAP_REFRESH_MS) {
+    return assignments;
+  }
+  if (!loading) {
+    loading = (async () => {
+      try {
+        const startedAt = Date.now();
+        const result = await readAssignments(startedAt);
+        // 一覧の読み込み中にポイント読み取り・割り当てで得た値は一覧より新しいため、置き換えずに残す
+        for (const [groupId, cached] of assignments) {
+          if (cached.observedAt > startedAt) {
+            result.set(groupId, cached);
+          }
+        }
+        const stillUnassigned = new Map<string, number>();
+        for (const [groupId, checkedAt] of unassigned) {
+          if (checkedAt > startedAt && !result.has(groupId)) {
+            stillUnassigned.set(groupId, checkedAt);
+          }
+        }
+        assignments = result;
+        unassigned = stillUnassigned;
+        loadedAt = Date.now();
+        stats.reloads++;
+        return assignments;
+      } finally {
+        loading = null;
+      }
+    })();
+  }
+  return loading;
+}
+
+/**
+ * グループの割り当てをポイント読み取りし、キャッシュに反映する関数
+ * @param groupId グループID
+ * @returns 割り当て（ShardMapTable に行がない場合はnull）
+ */
+async function readAssignment(groupId: string): Promise<CachedAssignment | null> {
+  const observedAt = Date.now();
+  stats.pointReads++;
+  try {
+    const entity = await getShardMapClient().getEntity<{ shard: string; status?: string }>(SHARD_MAP_PARTITION_KEY, groupId);
+    const assignment = toAssignment(entity, observedAt);
+    assignments.set(groupId, assignment);
+    unassigned.delete(groupId);
+    return assignment;
+  } catch (error: any) {
+    if (error?.statusCode !== 404) {
+      throw error;
+    }
+    unassigned.set(groupId, observedAt);
+    return null;
+  }
+}
+
+/**
+ * グループの割り当てを取得する関数
+ * キャッシュにない場合は、一覧を読み直すまで待たずにその行をポイント読み取りする
+ * （他のインスタンスで作成された直後のグループを primary と誤って扱わないため）
+ * @param groupId グループID
+ * @returns 割り当て（割り当てのないグループはnull）
+ */
+async function lookupAssignment(groupId: string): Promise<ShardAssignment | null> {
+  const cached = (await getAssignments()).get(groupId);
+  if (cached || !isShardingEnabled()) {
+    return cached ?? null;
+  }
+  const checkedAt = unassigned.get(groupId);
+  if (checkedAt !== undefined && Date.now() - checkedAt < SHARD_MAP_REFRESH_MS) {
+    return null;
+  }
+  return readAssignment(groupId);
+}
+
+/**
+ * グループの生産データを読み込むシャードを取得する関数
+ * 移動中のグループは、割り当てが切り替わるまで移動元のシャードから読み込む
+ * @param groupId グループID
+ * @returns シャード
+ */
+export async function resolveGroupShard(groupId: string): Promise<StorageShard> {
+  const assignment = await lookupAssignment(groupId);
+  return assignment ? getShard(assignment.shard) : getPrimaryShard();
+}
+
+/**
+ * グループの生産データを書き込むシャードを取得する関数
+ * @param groupId グループID
+ * @returns シャード（移動中のグループの場合は ShardMovingError）
+ */
+export async function resolveGroupShardForWrite(groupId: string): Promise<StorageShard> {
+  const assignment = await lookupAssignment(groupId);
+  if (assignment?.status === "moving") {
+    stats.movingRejections++;
+    throw new ShardMovingError(groupId);
+  }
+  return assignment ? getShard(assignment.shard) : getPrimaryShard();
+}
+
+/**
+ * グループのシャードのテーブルのクライアントを取得する関数（読み込み用）
+ * @param groupId グループID
+ * @param tableName テーブル名
+ * @returns TableClient
+ */
+export async function getGroupTableClient(groupId: string, tableName: string): Promise<TableClient> {
+  return getShardTableClient(await resolveGroupShard(groupId), tableName);
+}
+
+/**
+ * 全シャードを走査する処理で、シャードの行が割り当て先のものかを判定する関数を取得する
+ * 移動のコピー中（移動先にもコピーがある）や削除前（移動元に残っている）の行を二重に数えないために使う
+ * @returns (シャード, groupId) → 集計対象の場合にtrueを返す関数（groupIdのない行は常にtrue）
+ */
+export async function createShardOwnershipFilter(): Promise<(shard: StorageShard, groupId: unknown) => boolean> {
+  if (!isShardingEnabled()) {
+    return () => true;
+  }
+  const current = await getAssignments();
+  return (shard, groupId) => {
+    if (typeof groupId !== "string" || groupId === "") {
+      return true;
+    }
+    return (current.get(groupId)?.shard ?? PRIMARY_SHARD_NAME) === shard.name;
+  };
+}
+
+/**
+ * すべてのシャードで並列に処理を実行する関数
+ * @param fn シャードごとの処理
+ * @returns シャードの順（先頭は primary）に並べた結果
+ */
+export function forEachShard<T>(fn: (shard: StorageShard) => Promise<T>): Promise<T[]> {
+  return Promise.all(shards.map(fn));
+}
+
+/**
+ * groupId のハッシュ値（FNV-1a）
+ */
+function hashGroupId(groupId: string): number {
+  let hash = 0x811c9dc5;
+  for (let i = 0; i < groupId.length; i++) {
+    hash ^= groupId.charCodeAt(i);
+    hash = Math.imul(hash, 0x01000193);
+  }
+  return hash >>> 0;
+}
+
+/**
+ * 新しいグループをシャードに割り当てる関数（CreateGroup から呼び出す）
+ * 割り当て先は groupId のハッシュ値で決めるため、グループはシャード間に均等に分散する
+ * @param groupId グループID
+ * @returns 割り当てたシャード
+ */
+export async function assignGroupShard(groupId: string): Promise<StorageShard> {
+  if (!isShardingEnabled()) {
+    return getPrimaryShard();
+  }
+  const shard = placementShards[hashGroupId(groupId) % placementShards.length];
+  const client = getShardMapClient();
+  try {
+    await client.createTable();
+  } catch {
+    // 既に存在する場合は無視
+  }
+  try {
+    await client.createEntity({
+      partitionKey: SHARD_MAP_PARTITION_KEY,
+      rowKey: groupId,
+      shard: shard.name,
+      status: "active",
+      updatedAt: new Date().toISOString(),
+    });
+  } catch (error: any) {
+    // 既に割り当て済みの場合は、その行を読んで既存の割り当てを使う
+    if (error?.statusCode !== 409) {
+      throw error;
+    }
+    const existing = await readAssignment(groupId);
+    if (!existing) {
+      throw new Error(`Shard assignment for group ${groupId} conflicted but could not be read`);
+    }
+    return getShard(existing.shard);
+  }
+  assignments.set(groupId, { shard: shard.name, status: "active", observedAt: Date.now() });
+  unassigned.delete(groupId);
+  return shard;
+}
+
+/**
+ * IDから生産記録を検索する関数（シャードをまたいで検索する）
+ * groupId が分かる場合はそのグループのシャードを先に検索し、見つからない場合は他のシャードを並列に検索する
+ * 各シャードではポイント読み取り・グループのパーティション内の検索のみを行う（findProductionById）
+ * @param id RowKey または productionId
+ * @param groupId グループID（新しいキー体系の記録は必須、isGroupIdRequiredForLookup で確認する）
+ * @returns 見つかったエンティティとシャード、存在しない場合はnull
+ */
+export async function findProductionInShards<T extends object = Record<string, unknown>>(
+  tableName: string,
+  id: string,
+  groupId?: string | null
+): Promise<{ entity: TableEntityResult<T>; shard: StorageShard } | null> {
+  const first = groupId ? await resolveGroupShard(groupId) : getPrimaryShard();
+  const entity = await findProductionById<T>(getShardTableClient(first, tableName), id, groupId);
+  if (entity) {
+    return { entity, shard: first };
+  }
+
+  const others = await Promise.all(shards.filter((shard) => shard !== first).map(async (shard) => {
+    const found = await findProductionById<T>(getShardTableClient(shard, tableName), id, groupId);
+    return found ? { entity: found, shard } : null;
+  }));
+  return others.find((result) => result !== null) ?? null;
+}
+
+/**
+ * 移動中のグループへの書き込みに返すレスポンスを生成する関数
+ * @param error ShardMovingError
+ * @param headers CORSなどのヘッダー
+ * @returns 503レスポンス
+ */
+export function createShardMovingResponse(error: ShardMovingError, headers: Record<string, string>): HttpResponseInit {
+  return {
+    status: 503,
+    headers: {
+      ...headers,
+      "Content-Type": "application/json",
+      "Retry-After": String(MOVING_RETRY_AFTER_SECONDS),
+    },
+    body: JSON.stringify({ error: error.message }),
+  };
+}
+
+/**
+ * シャードの設定と割り当てのキャッシュの状態を取得する関数（メトリクスAPI用）
+ */
+export function getShardMapStats() {
+  let moving = 0;
+  const groupsPerShard: Record<string, number> = {};
+  for (const assignment of assignments.values()) {
+    groupsPerShard[assignment.shard] = (groupsPerShard[assignment.shard] ?? 0) + 1;
+    if (assignment.status === "moving") moving++;
+  }
+  return {
+    shards: shards.map((shard) => shard.name),
+    placement: placementShards.map((shard) => shard.name),
+    assignedGroups: assignments.size,
+    groupsPerShard,
+    movingGroups: moving,
+    unassignedGroups: unassigned.size,
+    loadedAt: loadedAt > 0 ? new Date(loadedAt).toISOString() : null,
+    refreshMs: SHARD_MAP_REFRESH_MS,
+    ...stats,
+  };
+}
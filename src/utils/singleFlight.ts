@@ -0,0 +1,144 @@
+/**
+ * 同じパラメータの集計処理をインスタンス内で共有するための仕組み
+ *
+ * - 同じキー（ルート + パラメータ）の処理が実行中であれば、新しく実行せずにその結果を待つ（single-flight）
+ * - 完了した結果は短時間（既定値10秒）キャッシュし、その間の同じキーのリクエストにはそのまま返す
+ * - 失敗した結果はキャッシュしない（待っていたリクエストには同じエラーを返す）
+ * - invalidateCoalesced はキーごとの世代を進め、破棄より前に始まった実行中の処理には合流させず（新しく実行する）、その結果もキャッシュしない
+ *
+ * ダッシュボードを開いた直後に同じ年のレポートへリクエストが集中しても、テーブルの走査は1回で済む。
+ * キャッシュはインスタンスごとのため、生産データの更新は tryApplyProductionChange から invalidateCoalesced で破棄する
+ * （他のインスタンスのキャッシュは有効期限で切れる）。
+ */
+
+// 結果をキャッシュする時間（ミリ秒）
+export const COALESCE_TTL_MS = parseInt(process.env.REPORT_CACHE_TTL_MS || "10000") || 0;
+// キャッシュするキーの上限（超えた場合は古いものから捨てる）
+const MAX_CACHED_KEYS = 200;
+
+interface CachedResult {
+  value: unknown;
+  expiresAt: number;
+}
+
+interface InFlightLoad {
+  promise: Promise<unknown>;
+  // 開始時のキーの世代
+  generation: number;
+}
+
+const inFlight = new Map<string, InFlightLoad>();
+// キーごとの世代（実行中の処理がある間のみ保持し、破棄のたびに進める）
+const generations = new Map<string, number>();
+// Map は挿入順を保持するため、先頭が最も古いエントリになる
+const results = new Map<string, CachedResult>();
+
+const stats = {
+  executions: 0,
+  sharedInFlight: 0,
+  // 破棄された実行中の処理に合流せずに新しく実行した回数
+  restartedStale: 0,
+  cacheHits: 0,
+};
+
+/**
+ * ルート名とパラメータからキーを生成する関数（パラメータはキー順に並べる）
+ * @param route ルート名（例: "reports/yearly"）
+ * @param params パラメータ
+ * @returns キー
+ */
+export function createCoalesceKey(route: string, params: Record<string, unknown> = {}): string {
+  const parts = Object.keys(params)
+    .sort()
+    .map((name) => `${name}=${String(params[name])}`);
+  return parts.length > 0 ? `${route}?${parts.join("&")}` : route;
+}
+
+/**
+ * 同じキーの処理を1回の実行で共有し、結果を短時間キャッシュする関数
+ * 返す値は複数のリクエストで共有されるため、呼び出し側で変更しないこと
+ * @param key createCoalesceKey で生成したキー
+ * @param compute 結果を計算する関数
+ * @param ttlMs 結果をキャッシュする時間（0の場合は実行中の共有のみ）
+ * @returns 計算結果
+ */
+export async function coalesce<T>(key: string, compute: () => Promise<T>, ttlMs = COALESCE_TTL_MS): Promise<T> {
+  const cached = results.get(key);
+  if (cached) {
+    if (cached.expiresAt > Date.now()) {
+      stats.cacheHits++;
+      return cached.value as T;
+    }
+    results.delete(key);
+  }
+
+  const currentGeneration = generations.get(key) ?? 0;
+  const running = inFlight.get(key);
+  if (running) {
+    if (running.generation === currentGeneration) {
+      stats.sharedInFlight++;
+      return running.promise as Promise<T>;
+    }
+    // 実行中の処理は破棄の前のデータを読んでいる可能性があるため、合流せずに新しく実行する
+    stats.restartedStale++;
+  }
+
+  stats.executions++;
+  // compute が同期的に失敗した場合も finally で取り除けるよう、開始する前に登録する
+  const load: InFlightLoad = { promise: Promise.resolve(), generation: currentGeneration };
+  inFlight.set(key, load);
+  load.promise = (async () => {
+    try {
+      const value = await compute();
+      // 新しい処理に置き換えられた・実行中に破棄された結果はキャッシュしない
+      if (ttlMs > 0 && inFlight.get(key) === load && (generations.get(key) ?? 0) === load.generation) {
+        results.set(key, { value, expiresAt: Date.now() + ttlMs });
+        while (results.size > MAX_CACHED_KEYS) {
+          results.delete(results.keys().next().value as string);
+        }
+      }
+      return value;
+    } finally {
+      if (inFlight.get(key) === load) {
+        inFlight.delete(key);
+        generations.delete(key);
+      }
+    }
+  })();
+  return load.promise as Promise<T>;
+}
+
+/**
+ * キャッシュした結果を破棄する関数
+ * 実行中の処理はキーの世代を進め、結果をキャッシュせず、以後のリクエストを合流させない
+ * @param route 破棄するルート名（省略時はすべて）
+ */
+export function invalidateCoalesced(route?: string): void {
+  const matches = (key: string) => route === undefined || key === route || key.startsWith(`${route}?`);
+  for (const key of inFlight.keys()) {
+    if (matches(key)) {
+      generations.set(key, (generations.get(key) ?? 0) + 1);
+    }
+  }
+  if (route === undefined) {
+    results.clear();
+    return;
+  }
+  for (const key of Array.from(results.keys())) {
+    if (matches(key)) {
+      results.delete(key);
+    }
+  }
+}
+
+/**
+ * 実行回数・共有回数・キャッシュヒット数を取得する関数（メトリクスAPI用）
+ */
+export function getCoalesceStats() {
+  return {
+    ...stats,
+    inFlight: inFlight.size,
+    cachedKeys: results.size,
+    ttlMs: COALESCE_TTL_MS,
+  };
+}
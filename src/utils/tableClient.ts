@@ -0,0 +1,33 @@
+import { TableClient, TableServiceClientOptions } from "@azure/data-tables";
+import { tableMetricsPolicy } from "./tableMetrics";
+
+/**
+ * TableClientの作成
+ * TableClientはすべてこのモジュールの関数で作成し、計測用のパイプラインポリシー（tableMetricsPolicy）を追加する
+ */
+
+/**
+ * TableClientに計測ポリシーを追加する関数
+ * new TableClient(url, tableName, credential) など、接続文字列以外から作成したクライアントにも使う
+ * @param client TableClient
+ * @returns 同じTableClient
+ */
+export function instrumentTableClient(client: TableClient): TableClient {
+  client.pipeline.addPolicy(tableMetricsPolicy);
+  return client;
+}
+
+/**
+ * 接続文字列からTableClientを作成する関数
+ * @param connectionString ストレージアカウントの接続文字列
+ * @param tableName テーブル名
+ * @param options クライアントオプション
+ * @returns 計測ポリシーを追加したTableClient
+ */
+export function createTableClient(
+  connectionString: string,
+  tableName: string,
+  options?: TableServiceClientOptions
+): TableClient {
+  return instrumentTableClient(TableClient.fromConnectionString(connectionString, tableName, options));
+}
@@ -0,0 +1,61 @@
+import { TableClient } from "@azure/data-tables";
+import { recordStorageCall } from "./metrics";
+
+/**
+ * Table Storageの呼び出しの計測
+ * tableClient.ts の createTableClient で作成したクライアントにパイプラインポリシーを追加し、リクエストごとのレイテンシとエンティティ数を記録する
+ */
+
+type PipelinePolicy = Parameters<TableClient["pipeline"]["addPolicy"]>[0];
+
+/**
+ * Table Storageのリクエストを操作名に分類する関数
+ * @param method HTTPメソッド
+ * @param url リクエストURL
+ * @returns 操作名
+ */
+function classifyTableRequest(method: string, url: string): string {
+  const path = new URL(url).pathname;
+  if (path.endsWith("$batch")) return "table.batch";
+  if (method === "GET") {
+    // エンティティのポイント読み取りは Table(PartitionKey='..',RowKey='..') の形式
+    return /\(PartitionKey=/.test(decodeURIComponent(path)) ? "table.get" : "table.query";
+  }
+  if (method === "POST") return "table.insert";
+  if (method === "PUT" || method === "MERGE" || method === "PATCH") return "table.update";
+  if (method === "DELETE") return "table.delete";
+  return `table.${method.toLowerCase()}`;
+}
+
+/**
+ * Table Storageのリクエストごとにレイテンシ・エンティティ数・バイト数を記録するパイプラインポリシー
+ */
+export const tableMetricsPolicy: PipelinePolicy = {
+  name: "tableMetricsPolicy",
+  async sendRequest(request, next) {
+    const start = performance.now();
+    const operation = classifyTableRequest(request.method, request.url);
+    try {
+      const response = await next(request);
+      const body = response.bodyAsText ?? "";
+      let entities = 0;
+      if (operation === "table.query") {
+        // クエリ結果の各エンティティには odata.etag が含まれる
+        entities = body.split('"odata.etag"').length - 1;
+      } else if (operation === "table.get" && response.status === 200) {
+        entities = 1;
+      }
+      recordStorageCall({
+        operation,
+        durationMs: performance.now() - start,
+        status: response.status,
+        entities,
+        bytes: Buffer.byteLength(body),
+      });
+      return response;
+    } catch (error: any) {
+      recordStorageCall({ operation, durationMs: performance.now() - start, status: error?.statusCode });
+      throw error;
+    }
+  },
+};
@@ -0,0 +1,150 @@
+import { createTableClient } from "./tableClient";
+import { BlobClient } from "@azure/storage-blob";
+import { JWTPayload, isAdminOrOperator } from "./auth";
+
+/**
+ * アップロードの検証
+ *
+ * - 保存するBlob名の拡張子はファイル種別ごとの許可リストから選ぶ（クライアントのファイル名をそのまま使わない）
+ * - SASの発行・ストリーミングアップロードは、本人かつ所属グループ（admin / operator は任意のユーザー・グループ）のみ許可する
+ * - SAS の contentType はダウンロード時のレスポンスヘッダーを決めるだけでアップロードを制限しないため、
+ *   直接アップロードされたBlobはサイズと先頭バイト（ファイル形式のシグネチャ）を確認してから保存先へ移す
+ */
+
+export const UPLOAD_FILE_TYPES = {
+  photo: {
+    containerName: "photos",
+    extensions: ["jpg", "jpeg", "png", "gif", "webp", "heic"],
+    defaultExtension: "jpg",
+    maxBytes: 20 * 1024 * 1024,
+    isAllowedContentType: (type: string) => type.startsWith("image/"),
+  },
+  pdf: {
+    containerName: "pdfs",
+    extensions: ["pdf"],
+    defaultExtension: "pdf",
+    maxBytes: 100 * 1024 * 1024,
+    isAllowedContentType: (type: string) => type === "application/pdf",
+  },
+} as const;
+
+export type UploadFileType = keyof typeof UPLOAD_FILE_TYPES;
+
+// SASで直接アップロードされたBlobを検証前に置くコンテナ
+export const PENDING_UPLOAD_CONTAINER_NAME = "uploads-pending";
+
+// 確定されなかった検証前のBlobを削除するまでの時間（CleanupPendingUploadsTimer）
+export const PENDING_UPLOAD_RETENTION_HOURS = parseInt(process.env.PENDING_UPLOAD_RETENTION_HOURS ?? "24") || 24;
+
+const userGroupTableName = "UserGroupTable";
+
+/**
+ * ファイル種別が有効な値かどうかを判定する関数
+ */
+export function isUploadFileType(fileType: unknown): fileType is UploadFileType {
+  return typeof fileType === "string" && Object.prototype.hasOwnProperty.call(UPLOAD_FILE_TYPES, fileType);
+}
+
+/**
+ * ファイル名から保存に使う拡張子を決める関数
+ * @param fileName クライアントのファイル名
+ * @param fileType ファイル種別
+ * @returns 許可リストにある小文字の拡張子（拡張子がない場合は既定の拡張子、許可されていない場合はnull）
+ */
+export function getUploadExtension(fileName: string, fileType: UploadFileType): string | null {
+  const target = UPLOAD_FILE_TYPES[fileType];
+  const lastDot = fileName.lastIndexOf(".");
+  if (lastDot < 0) {
+    return target.defaultExtension;
+  }
+  const extension = fileName.substring(lastDot + 1).toLowerCase();
+  return (target.extensions as readonly string[]).includes(extension) ? extension : null;
+}
+
+/**
+ * userId / groupId がBlob名のパス要素として安全な値かどうかを判定する関数
+ */
+export function isSafePathSegment(value: string): boolean {
+  return /^[A-Za-z0-9_-]{1,128}$/.test(value);
+}
+
+/**
+ * ユーザーがグループに所属しているかを UserGroupTable（PartitionKey = userId、RowKey = groupId）で確認する関数
+ */
+async function isGroupMember(userId: string, groupId: string): Promise<boolean> {
+  const connectionString = process.env.AzureWebJobsStorage!;
+  const client = createTableClient(connectionString, userGroupTableName);
+  try {
+    await client.getEntity(userId, groupId, { queryOptions: { select: ["RowKey"] } });
+    return true;
+  } catch (error: any) {
+    if (error?.statusCode === 404) {
+      return false;
+    }
+    throw error;
+  }
+}
+
+/**
+ * 呼び出し元が userId / groupId のファイルをアップロードできるかを判定する関数
+ * admin / operator は任意のユーザー・グループ、それ以外は本人かつ所属グループのみ
+ * @param payload JWTペイロード
+ * @param userId アップロード先のユーザーID
+ * @param groupId アップロード先のグループID
+ */
+export async function canUploadFor(payload: JWTPayload, userId: string, groupId: string): Promise<boolean> {
+  if (isAdminOrOperator(payload)) {
+    return true;
+  }
+  return payload.userId === userId && (await isGroupMember(userId, groupId));
+}
+
+/**
+ * 先頭バイトがファイル種別のシグネチャと一致するかを判定し、Content-Typeを返す関数
+ * @param head ファイルの先頭（16バイト以上）
+ * @param fileType ファイル種別
+ * @returns 判定したContent-Type（一致しない場合はnull）
+ */
+export function detectUploadContentType(head: Buffer, fileType: UploadFileType): string | null {
+  if (fileType === "pdf") {
+    return head.subarray(0, 5).toString("latin1") === "%PDF-" ? "application/pdf" : null;
+  }
+  if (head[0] === 0xff && head[1] === 0xd8 && head[2] === 0xff) return "image/jpeg";
+  if (head.subarray(0, 8).equals(Buffer.from([0x89, 0x50, 0x4e, 0x47, 0x0d, 0x0a, 0x1a, 0x0a]))) return "image/png";
+  if (head.subarray(0, 4).toString("latin1") === "GIF8") return "image/gif";
+  if (head.subarray(0, 4).toString("latin1") === "RIFF" && head.subarray(8, 12).toString("latin1") === "WEBP") return "image/webp";
+  if (head.subarray(4, 8).toString("latin1") === "ftyp" && ["heic", "heix", "mif1", "msf1"].includes(head.subarray(8, 12).toString("latin1"))) {
+    return "image/heic";
+  }
+  return null;
+}
+
+/**
+ * アップロードされたBlobのサイズと形式を確認する関数
+ * 先頭バイトは確認したサイズと同じ内容（ETag）から読み込む
+ * @param blobClient 確認するBlob
+ * @param fileType ファイル種別
+ * @returns 問題がない場合は判定したContent-Type・サイズ・確認した内容のETag、問題がある場合はエラーメッセージ
+ */
+export async function verifyUploadedBlob(
+  blobClient: BlobClient,
+  fileType: UploadFileType
+): Promise<{ contentType: string; size: number; etag: string } | { error: string }> {
+  const target = UPLOAD_FILE_TYPES[fileType];
+  const properties = await blobClient.getProperties();
+  const size = properties.contentLength ?? 0;
+  if (size === 0) {
+    return { error: "File is empty" };
+  }
+  if (size > target.maxBytes) {
+    return { error: `File exceeds the maximum size of ${target.maxBytes} bytes` };
+  }
+
+  const etag = properties.etag!;
+  const head = await blobClient.downloadToBuffer(0, Math.min(size, 16), { conditions: { ifMatch: etag } });
+  const contentType = detectUploadContentType(head, fileType);
+  if (!contentType) {
+    return { error: `File content is not a valid ${fileType}` };
+  }
+  return { contentType, size, etag };
+}